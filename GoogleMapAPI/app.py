@@ -1,6 +1,7 @@
-import requests
 import os
 from dotenv import load_dotenv
+from geocoding import geocode
+from traffic_sampling import TrafficSampler, sample_traffic
 
 # Load API keys from .env file
 load_dotenv()
@@ -8,43 +9,28 @@ GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 CITY = "Cluj-Napoca, str. Cetatii, Floresti"
 
 # Step 1: Get Coordinates of the City
-geocode_url = f"https://maps.googleapis.com/maps/api/geocode/json?address={CITY}&key={GOOGLE_API_KEY}"
-geo_response = requests.get(geocode_url).json()
+geo_response = geocode(CITY)  # served from geocoding_cache.json after the first run
 
 if geo_response["status"] == "OK":
-    location = geo_response["results"][0]["geometry"]["location"]
-    lat, lng = location["lat"], location["lng"]
+    lat, lng = geo_response["lat"], geo_response["lng"]
     print(f"📍 Coordinates of {CITY}: {lat}, {lng}\n")
 
-    # Step 2: Get Traffic Data in a 200m Area
-    origin = f"{lat},{lng}"
-    destination = f"{lat+0.0018},{lng}"  # ~200m north
-    traffic_url = f"https://maps.googleapis.com/maps/api/directions/json?origin={origin}&destination={destination}&departure_time=now&key={GOOGLE_API_KEY}"
+    # Step 2: Get Traffic Data on a ring of 200m probe segments around the point
+    # (one Distance Matrix request, cached per 15-minute bucket)
+    traffic = sample_traffic([(lat, lng)], TrafficSampler(radius_m=200))[0]
 
-    traffic_response = requests.get(traffic_url).json()
-
-    if traffic_response["status"] == "OK":
-        # Extract travel durations
-        route = traffic_response["routes"][0]["legs"][0]
-        duration = route["duration"]["value"]  # Normal duration (seconds)
-        duration_traffic = route.get("duration_in_traffic", {}).get("value", duration)  # Traffic duration
-
-        # Calculate traffic congestion level
-        delay = duration_traffic - duration
-        congestion_level = "🚗 Light Traffic"
-
-        if delay > duration * 0.5:  # If delay is 50% or more
-            congestion_level = "🚦 Heavy Traffic"
-        elif delay > duration * 0.2:  # If delay is 20% or more
-            congestion_level = "⛔ Moderate Traffic"
+    if traffic["congestion"]:
+        duration = int(traffic["duration_s"])  # Normal duration over all segments (seconds)
+        duration_traffic = int(traffic["duration_in_traffic_s"])  # Traffic duration
 
         # Print results
-        print(f"🚦 Normal Duration: {duration//60} min {duration%60} sec")
+        print(f"🚦 Normal Duration: {duration//60} min {duration%60} sec ({traffic['spokes_measured']} segments)")
         print(f"🛑 Duration in Traffic: {duration_traffic//60} min {duration_traffic%60} sec")
-        print(f"📊 Estimated Traffic Congestion: {congestion_level}")
+        print(f"📊 Estimated Traffic Congestion: {traffic['congestion']} "
+              f"({traffic['heavy_share']:.0%} of segments heavy)")
 
     else:
-        print("❌ Error fetching traffic data:", traffic_response["status"])
+        print("❌ Error fetching traffic data for", CITY)
 
 else:
     print("❌ Error fetching location:", geo_response["status"])
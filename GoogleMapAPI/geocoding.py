@@ -0,0 +1,255 @@
+"""
+Shared geocoding layer for the Google Maps scripts, with a persistent cache.
+
+Every script used to call the Geocoding API for the same fixed address on every run. Here
+each answer is stored in a JSON file and served from memory afterwards:
+
+    forward entries   keyed by the normalized address ("Floresti, Cetatii, 3A" and
+                      "floresti,  cetății , 3a" are the same key)
+    reverse entries   keyed by coordinates quantized to 4 decimals (~11 m)
+
+Entries expire after a TTL (30 days; 1 day for ZERO_RESULTS). Errors such as
+OVER_QUERY_LIMIT or a failed request are returned but never cached.
+
+    from geocoding import geocode, reverse_geocode, geocode_many
+    geo = geocode("Floresti, Cetatii, 3A")          # {"status": "OK", "lat": ..., "lng": ..., ...}
+    address = reverse_geocode(46.7446, 23.4959)     # {"status": "OK", "formatted_address": ...}
+    results = geocode_many(addresses, workers=8)    # same order as addresses
+
+geocode_many() de-duplicates the list by normalized key, answers cache hits directly and
+geocodes the misses concurrently; concurrent callers asking for the same missing key share
+one API request.
+
+Run `python geocoding.py "Floresti, Cetatii, 3A" "Cluj-Napoca, str. Cetatii, Floresti"`
+to geocode addresses and time the cached lookups.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+# Shared API base URLs live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gathering_data"))
+from api_endpoints import GOOGLE_MAPS_BASE_URL as MAPS_BASE_URL
+
+# Load API keys from .env file
+load_dotenv()
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+GEOCODE_URL = f"{MAPS_BASE_URL}/geocode/json"
+
+CACHE_PATH = os.getenv("geocoding_cache",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "geocoding_cache.json"))
+TTL_S = 30 * 86400  # addresses move rarely
+NEGATIVE_TTL_S = 86400  # ZERO_RESULTS may be fixed upstream
+COORD_DECIMALS = 4  # ~11 m: reverse lookups closer than that share an entry
+CACHEABLE_STATUSES = {"OK", "ZERO_RESULTS"}
+
+
+# -----------------------
+# Keys
+# -----------------------
+def normalize_address(address):
+    """Case-, accent-, whitespace- and comma-spacing-insensitive cache key for an address."""
+    text = unicodedata.normalize("NFKD", address)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    text = re.sub(r"\s*,\s*", ", ", text)
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" ,.")
+
+
+def quantize(lat, lng, decimals=COORD_DECIMALS):
+    """Cache key of a coordinate, rounded to `decimals` places."""
+    return f"{round(lat, decimals):.{decimals}f},{round(lng, decimals):.{decimals}f}"
+
+
+def slim_result(status, results):
+    """The fields the scripts use from a Geocoding API answer."""
+    entry = {"status": status}
+    if status == "OK" and results:
+        first = results[0]
+        location = first["geometry"]["location"]
+        entry.update({
+            "lat": location["lat"],
+            "lng": location["lng"],
+            "formatted_address": first.get("formatted_address"),
+            "place_id": first.get("place_id"),
+        })
+    return entry
+
+
+# -----------------------
+# Cache
+# -----------------------
+class GeocodingCache:
+    """Thread-safe, file-backed forward/reverse geocoding cache with single-flight misses."""
+
+    def __init__(self, path=CACHE_PATH, ttl_s=TTL_S, negative_ttl_s=NEGATIVE_TTL_S, api_key=None):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.negative_ttl_s = negative_ttl_s
+        self.api_key = api_key or GOOGLE_API_KEY
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "api_calls": 0, "errors": 0}
+        self._in_flight = {}
+        self._session = threading.local()
+        self.forward = {}
+        self.reverse = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.forward = data.get("forward", {})
+            self.reverse = data.get("reverse", {})
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            data = {"forward": self.forward, "reverse": self.reverse}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def _fresh(self, entry, now):
+        ttl = self.ttl_s if entry["status"] == "OK" else self.negative_ttl_s
+        return now - entry["fetched_at"] <= ttl
+
+    def _request(self, params):
+        if not hasattr(self._session, "session"):
+            self._session.session = requests.Session()
+        with self.lock:
+            self.stats["api_calls"] += 1
+        try:
+            response = self._session.session.get(GEOCODE_URL, params=dict(params, key=self.api_key), timeout=30)
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return {"status": "REQUEST_FAILED", "error": str(e)}
+        return slim_result(data.get("status", "UNKNOWN_ERROR"), data.get("results"))
+
+    def _lookup(self, table, key, params, save=True):
+        """Serve `key` from `table` or fetch it once, however many threads ask at the same time."""
+        now = time.time()
+        with self.lock:
+            entry = table.get(key)
+            if entry is not None and self._fresh(entry, now):
+                self.stats["hits"] += 1
+                return entry
+            self.stats["misses"] += 1
+            future = self._in_flight.get((id(table), key))
+            owner = future is None
+            if owner:
+                future = Future()
+                self._in_flight[(id(table), key)] = future
+        if not owner:
+            return future.result()
+
+        try:
+            entry = self._request(params)
+            entry["fetched_at"] = time.time()
+            if entry["status"] in CACHEABLE_STATUSES:
+                with self.lock:
+                    table[key] = entry
+                if save:
+                    self.save()
+            else:
+                with self.lock:
+                    self.stats["errors"] += 1
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self._in_flight.pop((id(table), key), None)
+
+    def geocode(self, address, save=True):
+        return self._lookup(self.forward, normalize_address(address), {"address": address}, save)
+
+    def reverse_geocode(self, lat, lng, save=True):
+        key = quantize(lat, lng)
+        return self._lookup(self.reverse, key, {"latlng": key}, save)
+
+    def geocode_many(self, addresses, workers=8):
+        """Geocode a list of addresses (results in input order), each distinct key at most once."""
+        unique = {}
+        for address in addresses:
+            unique.setdefault(normalize_address(address), address)
+        calls = self.stats["api_calls"]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            resolved = dict(zip(unique, pool.map(lambda a: self.geocode(a, save=False), unique.values())))
+        if self.stats["api_calls"] != calls:
+            self.save()
+        return [resolved[normalize_address(address)] for address in addresses]
+
+    def purge_expired(self):
+        """Drop expired entries; returns how many were removed."""
+        now = time.time()
+        removed = 0
+        with self.lock:
+            for table in (self.forward, self.reverse):
+                for key in [k for k, entry in table.items() if not self._fresh(entry, now)]:
+                    del table[key]
+                    removed += 1
+        if removed:
+            self.save()
+        return removed
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = GeocodingCache()
+        return _default_cache
+
+
+def geocode(address):
+    return default_cache().geocode(address)
+
+
+def reverse_geocode(lat, lng):
+    return default_cache().reverse_geocode(lat, lng)
+
+
+def geocode_many(addresses, workers=8):
+    return default_cache().geocode_many(addresses, workers)
+
+
+def main():
+    addresses = sys.argv[1:] or ["Floresti, Cetatii, 3A", "Cluj-Napoca, str. Cetatii, Floresti"]
+    cache = default_cache()
+    t0 = time.perf_counter()
+    results = cache.geocode_many(addresses)
+    elapsed = time.perf_counter() - t0
+    for address, geo in zip(addresses, results):
+        if geo["status"] == "OK":
+            print(f"📍 {address}: {geo['lat']}, {geo['lng']} ({geo['formatted_address']})")
+        else:
+            print(f"❌ {address}: {geo['status']}")
+    print(f"First pass: {elapsed * 1000:.1f} ms, {cache.stats['api_calls']} API call(s)")
+
+    calls = cache.stats["api_calls"]
+    rounds = 10000
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for address in addresses:
+            cache.geocode(address)
+    per_lookup = (time.perf_counter() - t0) / (rounds * len(addresses))
+    print(f"Cached lookups: {per_lookup * 1e6:.1f} µs each, {cache.stats['api_calls'] - calls} API call(s)")
+
+
+if __name__ == "__main__":
+    main()
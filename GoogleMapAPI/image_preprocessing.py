@@ -0,0 +1,142 @@
+"""
+Image preprocessing for vision inference: shrink map snapshots to what the model actually sees.
+
+LLaVA's vision encoder (CLIP ViT-L/14 at 336 px) looks at a 336x336 image; anything larger is
+resized by Ollama after it has been uploaded, base64-decoded and decoded again. Here the
+image is fitted to the model's input size (scaled down with Lanczos, center-cropped to the
+target aspect, which keeps the marker in the middle of the map) and re-encoded as JPEG or
+WebP before it is sent, so the request carries a few KB instead of the full PNG.
+
+The request body is streamed: request_body() yields the JSON prefix, then the base64 text of
+the image in pieces of `chunk_bytes`, then the closing brackets, so neither the base64 string
+nor a JSON document containing it is ever built in memory. requests sends such a generator
+with chunked transfer encoding.
+
+    spec = make_spec(format="WEBP", quality=80)                  # size 336, center crop
+    data = prepare_image("traffic_map.png", spec)                # encoded bytes
+    body = request_body({"model": "llava", "prompt": "..."}, data)
+    prepared = prepare_many(paths, spec, workers=4)              # thread pool, input order
+
+    python image_preprocessing.py traffic_map.png --format WEBP --quality 80
+"""
+import argparse
+import base64
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+MODEL_INPUT_SIZE = 336  # LLaVA 1.5 (CLIP ViT-L/14-336); use 672 for llava 1.6 high-resolution tiles
+CHUNK_BYTES = 48 * 1024  # multiple of 3, so every base64 piece is self-contained
+MEDIA_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}  # JPEG is accepted by every Ollama version
+
+# How an image is prepared; it is part of the inference cache key.
+# crop=False keeps the aspect ratio instead (longest side = size).
+DEFAULT_SPEC = {"size": MODEL_INPUT_SIZE, "format": "JPEG", "quality": 80, "crop": True}
+
+
+def make_spec(**overrides):
+    unknown = set(overrides) - set(DEFAULT_SPEC)
+    if unknown:
+        raise ValueError(f"Unknown preprocessing option(s): {', '.join(sorted(unknown))}")
+    spec = dict(DEFAULT_SPEC, **overrides)
+    spec["format"] = spec["format"].upper()
+    if spec["format"] not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported image format: {spec['format']}")
+    return spec
+
+
+def prepare_image(image_path, spec=DEFAULT_SPEC):
+    """Open, fit to the model's input size and re-encode an image; returns the encoded bytes."""
+    size = (spec["size"], spec["size"])
+    with Image.open(image_path) as image:
+        image.draft("RGB", size)  # JPEG sources decode directly at reduced scale
+        image = image.convert("RGB")
+        if spec["crop"]:
+            image = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+        elif max(image.size) > spec["size"]:
+            image.thumbnail(size, Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    if spec["format"] == "JPEG":
+        image.save(buffer, "JPEG", quality=spec["quality"], optimize=True)
+    else:
+        image.save(buffer, "WEBP", quality=spec["quality"], method=4)
+    return buffer.getvalue()
+
+
+def prepare_many(image_paths, spec=DEFAULT_SPEC, workers=4):
+    """prepare_image() over a thread pool (PIL releases the GIL while resizing and encoding)."""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda path: prepare_image(path, spec), image_paths))
+
+
+# -----------------------
+# Streaming request body
+# -----------------------
+def _check_chunk_bytes(chunk_bytes):
+    # Any other size puts "=" padding mid-string, which Go's base64 decoder (Ollama) rejects.
+    if chunk_bytes <= 0 or chunk_bytes % 3:
+        raise ValueError(f"chunk_bytes must be a positive multiple of 3, not {chunk_bytes}")
+
+
+def iter_base64(data, chunk_bytes=CHUNK_BYTES):
+    """Base64 text of `data` in pieces; concatenated they equal base64.b64encode(data)."""
+    _check_chunk_bytes(chunk_bytes)
+    view = memoryview(data)
+    return (base64.b64encode(view[start:start + chunk_bytes]) for start in range(0, len(view), chunk_bytes))
+
+
+def request_body(payload, image, chunk_bytes=CHUNK_BYTES):
+    """
+    Iterator over the JSON body of an Ollama /api/generate request with `image` streamed
+    into its "images" list. `image` is raw encoded bytes, or a str that is already base64.
+    chunk_bytes is checked here, before requests starts sending.
+    """
+    _check_chunk_bytes(chunk_bytes)
+    return _body_pieces(payload, image, chunk_bytes)
+
+
+def _body_pieces(payload, image, chunk_bytes):
+    head = json.dumps(payload)
+    yield (head[:-1] + (", " if payload else "") + '"images": ["').encode("utf-8")
+    if isinstance(image, str):
+        for start in range(0, len(image), chunk_bytes):
+            yield image[start:start + chunk_bytes].encode("ascii")
+    else:
+        yield from iter_base64(image, chunk_bytes)
+    yield b'"]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess map screenshots for vision inference and compare sizes.")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--size", type=int, default=MODEL_INPUT_SIZE)
+    parser.add_argument("--format", default="JPEG", choices=sorted(MEDIA_TYPES))
+    parser.add_argument("--quality", type=int, default=DEFAULT_SPEC["quality"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output-dir", default=None, help="Also write the prepared images here.")
+    args = parser.parse_args()
+
+    spec = make_spec(size=args.size, format=args.format, quality=args.quality)
+    t0 = time.perf_counter()
+    prepared = prepare_many(args.images, spec, args.workers)
+    elapsed = time.perf_counter() - t0
+    original = sum(os.path.getsize(path) for path in args.images)
+    new = sum(len(data) for data in prepared)
+    for path, data in zip(args.images, prepared):
+        print(f"📸 {path}: {os.path.getsize(path) / 1024:.1f} KB -> {len(data) / 1024:.1f} KB")
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+            stem = os.path.splitext(os.path.basename(path))[0]
+            with open(os.path.join(args.output_dir, f"{stem}.{args.format.lower()}"), "wb") as f:
+                f.write(data)
+    encoded = sum(4 * ((len(data) + 2) // 3) for data in prepared)
+    print(f"📊 {len(prepared)} images in {elapsed * 1000:.0f} ms: {original / 1024:.0f} KB -> {new / 1024:.0f} KB "
+          f"({new / original:.0%}), {encoded / 1024:.0f} KB as base64")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Persistent cache of LLaVA answers, keyed by what actually determines the answer.
+
+The same traffic_map.png with the same prompt used to be sent to Ollama on every run, and
+inference is by far the slowest step. An answer is stored under
+
+    SHA-256 of (image content hash, model, prompt, options as canonical JSON,
+                preprocessing spec when the image is resized before sending)
+
+so an unchanged image (same bytes under any file name, e.g. a snapshot served again from
+map_snapshots.py) is never inferred twice, while changing the model, the prompt or an
+option such as temperature gives a new key. Only successful answers are stored. The
+cache is bounded by entry count and total text size; when it grows past either bound the
+least recently used entries are dropped.
+
+    cache = InferenceCache()
+    client = VisionClient(cache=cache)
+    client.infer("traffic_map.png")      # inferred once, then served from inference_cache.json
+    print(cache.summary())               # hits, misses, hit rate, inference time saved
+
+File digests are memoized by (path, size, mtime), so repeated lookups of an unchanged file
+do not re-read it.
+
+    python inference_cache.py            # print the cache statistics
+    python inference_cache.py --clear
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+CACHE_PATH = os.getenv("inference_cache",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "inference_cache.json"))
+MAX_ENTRIES = 50000
+MAX_BYTES = 64 * 1024 * 1024  # total size of the cached answers
+STORED_FIELDS = ("text", "model", "tokens", "eval_count", "prompt_eval_count", "ttft_s", "total_s")
+
+
+def image_digest(image_path):
+    """SHA-256 of a file's bytes, read in blocks."""
+    with open(image_path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def cache_key(digest, model, prompt, options=None, preprocess=None):
+    """Key of an inference request: image hash, model, prompt, options and preprocessing (key order ignored)."""
+    parts = [digest, model, prompt, options or {}]
+    if preprocess:
+        parts.append(preprocess)
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class InferenceCache:
+    """Thread-safe, file-backed LRU cache of inference results with single-flight misses."""
+
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0, "saved_s": 0.0}
+        self._in_flight = {}
+        self._digests = {}
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        self.total_bytes = sum(self._size(entry) for entry in self.entries.values())
+
+    @staticmethod
+    def _size(entry):
+        return len(entry.get("text") or "") + 200  # text plus the fixed fields
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def digest(self, image_path):
+        """Content hash of an image file, memoized while the file's size and mtime are unchanged."""
+        st = os.stat(image_path)
+        memo_key = (os.path.abspath(image_path), st.st_size, st.st_mtime_ns)
+        digest = self._digests.get(memo_key)
+        if digest is None:
+            digest = self._digests[memo_key] = image_digest(image_path)
+        return digest
+
+    def key_for(self, image_path, model, prompt, options=None, preprocess=None):
+        return cache_key(self.digest(image_path), model, prompt, options, preprocess)
+
+    def contains(self, key):
+        with self.lock:
+            return key in self.entries
+
+    # -----------------------
+    # Lookup
+    # -----------------------
+    def lookup(self, key, infer, save=True):
+        """
+        Return (result, hit). On a miss `infer()` runs once, however many threads ask for the
+        same key at the same time; its result is stored unless result["error"] is set.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry["used_at"] = time.time()
+                entry["hits"] = entry.get("hits", 0) + 1
+                self.stats["hits"] += 1
+                self.stats["saved_s"] += entry.get("total_s") or 0.0
+                return dict(entry), True
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+            self.stats["misses" if owner else "hits"] += 1  # a waiter shares the owner's inference
+        if not owner:
+            return future.result(), True
+
+        try:
+            result = infer()
+            if not result.get("error"):
+                self._store(key, result)
+                if save:
+                    self.save()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self._in_flight.pop(key, None)
+
+    def _store(self, key, result):
+        now = time.time()
+        entry = {field: result.get(field) for field in STORED_FIELDS}
+        entry.update({"created_at": now, "used_at": now, "hits": 0})
+        with self.lock:
+            previous = self.entries.get(key)
+            if previous is not None:
+                self.total_bytes -= self._size(previous)
+            self.entries[key] = entry
+            self.total_bytes += self._size(entry)
+            self.stats["stored"] += 1
+            if len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                self._evict_locked()
+
+    def _evict_locked(self):
+        """Drop least recently used entries until both bounds hold (lock held)."""
+        for key, entry in sorted(self.entries.items(), key=lambda item: item[1]["used_at"]):
+            if len(self.entries) <= self.max_entries and self.total_bytes <= self.max_bytes:
+                break
+            del self.entries[key]
+            self.total_bytes -= self._size(entry)
+            self.stats["evicted"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+            self.total_bytes = 0
+        self.save()
+
+    def summary(self):
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "hits": self.stats["hits"],
+                "misses": self.stats["misses"],
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+                "stored": self.stats["stored"],
+                "evicted": self.stats["evicted"],
+                "inference_s_saved": round(self.stats["saved_s"], 2),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the LLaVA inference cache.")
+    parser.add_argument("--clear", action="store_true")
+    args = parser.parse_args()
+
+    cache = InferenceCache()
+    if args.clear:
+        cache.clear()
+        print(f"🧹 Cleared {cache.path}")
+        return
+    entries = list(cache.entries.values())
+    print(f"📊 {len(entries)} cached answers ({cache.total_bytes / 1024:.0f} KB) in {cache.path}")
+    if entries:
+        print(f"   served {sum(e.get('hits', 0) for e in entries)} times from the cache, saving "
+              f"{sum((e.get('total_s') or 0) * e.get('hits', 0) for e in entries):.1f}s of inference")
+        for model in sorted({e.get("model") for e in entries}, key=str):
+            print(f"   {model}: {sum(1 for e in entries if e.get('model') == model)} answers")
+
+
+if __name__ == "__main__":
+    main()
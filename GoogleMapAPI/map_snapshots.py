@@ -0,0 +1,248 @@
+"""
+Content-addressed store of Google Static Maps snapshots.
+
+location_screenshot.py and working_image_processing.py used to download the map, decode it
+with PIL, re-encode it to traffic_map.png and open a viewer on every run. Here the bytes
+from the API are written to disk exactly as received (no decode / re-encode), and each
+snapshot is addressed twice:
+
+    request key   center (5 decimals), zoom, size, maptype, marker  -> index entry
+    content hash  SHA-256 of the bytes  -> snapshots/<ab>/<sha256>.png
+
+so a repeated request is served from disk without a download, and identical images from
+different requests are stored once. Snapshots older than `max_age_s` are refetched, and
+evict() drops expired entries and then the least recently used ones until the store fits in
+`max_bytes`; blobs no entry points to are deleted.
+
+    store = MapSnapshotStore()
+    path = store.get(46.7446, 23.4959)                          # zoom 18, 600x600 roadmap, red marker
+    paths = store.get_many([(lat, lng), ...], workers=8)        # concurrent, de-duplicated
+    store.export(path, "traffic_map.png")                       # plain byte copy
+
+    python map_snapshots.py --point 46.7446,23.4959 --point 46.77,23.59
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+# Shared API base URLs live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gathering_data"))
+from api_endpoints import GOOGLE_MAPS_BASE_URL as MAPS_BASE_URL
+
+# Load API keys from .env file
+load_dotenv()
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+STATIC_MAP_URL = f"{MAPS_BASE_URL}/staticmap"
+
+STORE_DIR = os.getenv("map_snapshot_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots"))
+MAX_AGE_S = 7 * 86400  # road maps change slowly
+MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_ZOOM = 18  # Higher zoom = closer view (~50m)
+DEFAULT_SIZE = "600x600"
+DEFAULT_MAPTYPE = "roadmap"
+EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/gif": ".gif", "image/webp": ".webp"}
+
+
+def request_key(lat, lng, zoom=DEFAULT_ZOOM, size=DEFAULT_SIZE, maptype=DEFAULT_MAPTYPE, marker=True):
+    """Canonical description of a snapshot request (centers within ~1 m share a key)."""
+    return f"{lat:.5f},{lng:.5f}|z{zoom}|{size}|{maptype}|{'marker' if marker else 'plain'}"
+
+
+class MapSnapshotStore:
+    """Thread-safe store: JSON index of request keys -> content-addressed image files."""
+
+    def __init__(self, root=STORE_DIR, max_age_s=MAX_AGE_S, max_bytes=MAX_BYTES, api_key=None):
+        self.root = root
+        self.max_age_s = max_age_s
+        self.max_bytes = max_bytes
+        self.api_key = api_key or GOOGLE_API_KEY
+        self.index_path = os.path.join(root, "index.json")
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "downloads": 0, "bytes_downloaded": 0, "deduplicated": 0, "errors": 0}
+        self._in_flight = {}
+        self._local = threading.local()
+        self.entries = {}
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        with self.lock:
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(tmp_path, self.index_path)
+
+    def blob_path(self, digest, ext=".png"):
+        return os.path.join(self.root, digest[:2], digest + ext)
+
+    def _path_of(self, entry):
+        return self.blob_path(entry["hash"], entry.get("ext", ".png"))
+
+    def _fresh(self, entry, now):
+        return now - entry["fetched_at"] <= self.max_age_s and os.path.exists(self._path_of(entry))
+
+    # -----------------------
+    # Fetching
+    # -----------------------
+    def _download(self, lat, lng, zoom, size, maptype, marker):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        params = {"center": f"{lat},{lng}", "zoom": zoom, "size": size, "maptype": maptype, "key": self.api_key}
+        if marker:
+            params["markers"] = f"color:red|{lat},{lng}"
+        response = self._local.session.get(STATIC_MAP_URL, params=params, timeout=30)
+        content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+        if response.status_code != 200 or not content_type.startswith("image/"):
+            raise RuntimeError(f"HTTP {response.status_code} {content_type}: {response.text[:200]}")
+        return response.content, EXTENSIONS.get(content_type, ".img")
+
+    def _store_bytes(self, content, ext):
+        """Write bytes under their SHA-256 (once) and return the digest."""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(digest, ext)
+        if os.path.exists(path):
+            with self.lock:
+                self.stats["deduplicated"] += 1
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        return digest
+
+    def get(self, lat, lng, zoom=DEFAULT_ZOOM, size=DEFAULT_SIZE, maptype=DEFAULT_MAPTYPE, marker=True, save=True):
+        """Path of the snapshot for this request, downloading it only when missing or expired."""
+        key = request_key(lat, lng, zoom, size, maptype, marker)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._fresh(entry, now):
+                entry["used_at"] = now
+                self.stats["hits"] += 1
+                return self._path_of(entry)
+            event = self._in_flight.get(key)
+            owner = event is None
+            if owner:
+                event = self._in_flight[key] = threading.Event()
+        if not owner:
+            event.wait()
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry is None:
+                raise RuntimeError(f"Snapshot download failed for {key}")
+            return self._path_of(entry)
+
+        try:
+            content, ext = self._download(lat, lng, zoom, size, maptype, marker)
+            digest = self._store_bytes(content, ext)
+            with self.lock:
+                self.entries[key] = {"hash": digest, "ext": ext, "bytes": len(content),
+                                     "fetched_at": now, "used_at": now}
+                self.stats["downloads"] += 1
+                self.stats["bytes_downloaded"] += len(content)
+            if save:
+                self.save()
+            return self.blob_path(digest, ext)
+        except Exception:
+            with self.lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self.lock:
+                self._in_flight.pop(key, None)
+            event.set()
+
+    def get_many(self, points, workers=8, **options):
+        """Snapshot paths for [(lat, lng), ...] in input order (None where a download failed)."""
+
+        def fetch(point):
+            try:
+                return self.get(point[0], point[1], save=False, **options)
+            except (requests.exceptions.RequestException, RuntimeError, OSError) as e:
+                print(f"❌ Error fetching map image for {point[0]},{point[1]}: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            paths = list(pool.map(fetch, points))
+        self.save()
+        return paths
+
+    # -----------------------
+    # Eviction
+    # -----------------------
+    def evict(self):
+        """Drop expired entries, then least recently used ones over max_bytes; delete orphan blobs."""
+        now = time.time()
+        with self.lock:
+            for key in [k for k, e in self.entries.items() if now - e["fetched_at"] > self.max_age_s]:
+                del self.entries[key]
+            blobs = {}
+            for key, entry in self.entries.items():
+                blobs.setdefault(self._path_of(entry), []).append(key)
+            total = sum(self.entries[keys[0]]["bytes"] for keys in blobs.values())
+            for key, entry in sorted(self.entries.items(), key=lambda item: item[1]["used_at"]):
+                if total <= self.max_bytes:
+                    break
+                path = self._path_of(entry)
+                del self.entries[key]
+                blobs[path].remove(key)
+                if not blobs[path]:
+                    total -= entry["bytes"]
+            referenced = {path for path, keys in blobs.items() if keys}
+        removed = 0
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                if path != self.index_path and not name.endswith(".tmp") and path not in referenced:
+                    os.remove(path)
+                    removed += 1
+        self.save()
+        return removed
+
+    @staticmethod
+    def export(path, destination):
+        """Copy a snapshot's bytes to a fixed file name (e.g. traffic_map.png) without decoding."""
+        shutil.copyfile(path, destination)
+        return destination
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch static map snapshots into the content-addressed store.")
+    parser.add_argument("--point", action="append", default=[], help="lat,lng (repeatable).")
+    parser.add_argument("--zoom", type=int, default=DEFAULT_ZOOM)
+    parser.add_argument("--size", default=DEFAULT_SIZE)
+    parser.add_argument("--maptype", default=DEFAULT_MAPTYPE)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    points = [tuple(float(v) for v in point.split(",")) for point in args.point]
+    if not points:
+        print("No points given (use --point lat,lng).")
+        return
+    store = MapSnapshotStore()
+    t0 = time.perf_counter()
+    paths = store.get_many(points, workers=args.workers, zoom=args.zoom, size=args.size, maptype=args.maptype)
+    elapsed = time.perf_counter() - t0
+    for point, path in zip(points, paths):
+        print(f"📸 {point[0]},{point[1]}: {path}")
+    removed = store.evict()
+    print(f"{len(points)} snapshots in {elapsed:.2f}s: {store.stats['downloads']} downloaded "
+          f"({store.stats['bytes_downloaded'] / 1024:.0f} KB), {store.stats['hits']} from the store, "
+          f"{store.stats['deduplicated']} duplicate images, {removed} files evicted.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Traffic-congestion features around air-quality stations, sampled with Distance Matrix queries.
+
+app.py estimates congestion from one Directions request on a single 200 m segment north of
+one address. Here every station gets a ring of probe segments (spokes from the station to
+points `radius_m` away at evenly spaced bearings), so traffic is sampled in all directions:
+
+    station ----> ring point at bearing 0, 45, 90, ... (8 spokes of 300 m by default)
+
+Each station's spokes are one Distance Matrix request (1 origin x n destinations, with
+departure_time=now so the answer carries duration_in_traffic). Only the n wanted elements
+are billed: packing several stations into one matrix would also bill every cross pair.
+Requests for many stations run concurrently under the shared rate limiter and an element
+budget per cycle.
+
+Congestion uses the same delay-ratio classes as app.py, computed for all spokes at once:
+
+    delay = duration_in_traffic - duration
+    heavy if delay > 50% of duration, moderate if > 20%, else light
+
+Results are cached per 15-minute bucket (traffic_cache.json), so re-running within a bucket
+costs nothing and only new stations are queried. Each cycle's features can also be appended
+to the traffic sample table (traffic_samples/) that traffic_aq_features.py joins with the
+air-quality readings.
+
+    from traffic_sampling import sample_traffic
+    features = sample_traffic([(46.7446, 23.4959), (46.77, 23.59)])
+
+    python traffic_sampling.py --catalog ../gathering_data/station_catalog.bin --near 46.7446,23.4959 --k 200
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+# Shared helpers (rate limiter, station catalog, feature tables, API base URLs) live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gathering_data"))
+from rate_limiter import RateLimiter, rate_limited_get
+from traffic_aq_features import open_traffic_table
+from api_endpoints import GOOGLE_MAPS_BASE_URL as MAPS_BASE_URL
+
+# Load API keys from .env file
+load_dotenv()
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+DISTANCE_MATRIX_URL = f"{MAPS_BASE_URL}/distancematrix/json"
+DEFAULT_RATE = float(os.getenv("google_maps_rate_limit", "10.0"))
+
+CACHE_PATH = os.getenv("traffic_cache",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "traffic_cache.json"))
+SAMPLE_LOG = os.getenv("traffic_log", os.path.join(os.path.dirname(os.path.abspath(__file__)), "traffic_samples"))
+BUCKET_S = 15 * 60
+KEEP_BUCKETS = 4  # one hour of samples
+DEFAULT_SPOKES = 8
+DEFAULT_RADIUS_M = 300
+MAX_DESTINATIONS = 25  # Distance Matrix limit per request
+DEFAULT_MAX_ELEMENTS = 4000  # per sampling cycle
+
+EARTH_RADIUS_M = 6371000.0
+LIGHT, MODERATE, HEAVY = 0, 1, 2
+CONGESTION_LABELS = ["🚗 Light Traffic", "⛔ Moderate Traffic", "🚦 Heavy Traffic"]
+
+
+# -----------------------
+# Probe Rings
+# -----------------------
+def probe_rings(lats, lngs, radius_m=DEFAULT_RADIUS_M, spokes=DEFAULT_SPOKES):
+    """(ring_lats, ring_lngs) of shape (stations, spokes): points radius_m away at even bearings."""
+    lats = np.radians(np.asarray(lats, dtype=np.float64))[:, None]
+    lngs = np.radians(np.asarray(lngs, dtype=np.float64))[:, None]
+    bearings = np.radians(np.arange(spokes) * 360.0 / spokes)[None, :]
+    angular = radius_m / EARTH_RADIUS_M
+    ring_lats = np.arcsin(np.sin(lats) * np.cos(angular) + np.cos(lats) * np.sin(angular) * np.cos(bearings))
+    ring_lngs = lngs + np.arctan2(np.sin(bearings) * np.sin(angular) * np.cos(lats),
+                                  np.cos(angular) - np.sin(lats) * np.sin(ring_lats))
+    return np.degrees(ring_lats), (np.degrees(ring_lngs) + 540.0) % 360.0 - 180.0
+
+
+def congestion_classes(durations, durations_in_traffic):
+    """Delay-ratio congestion class per element (NaN inputs give LIGHT; mask them separately)."""
+    durations = np.asarray(durations, dtype=np.float64)
+    delay = np.asarray(durations_in_traffic, dtype=np.float64) - durations
+    with np.errstate(invalid="ignore"):
+        return np.select([delay > durations * 0.5, delay > durations * 0.2], [HEAVY, MODERATE], LIGHT)
+
+
+def station_key(lat, lng, radius_m, spokes):
+    return f"{lat:.5f},{lng:.5f}|{radius_m}|{spokes}"
+
+
+# -----------------------
+# Distance Matrix
+# -----------------------
+def query_spokes(lat, lng, ring_lats, ring_lngs, limiter=None, session=None):
+    """
+    One Distance Matrix request from a station to its ring points.
+    Returns (status, durations, durations_in_traffic) with NaN for elements without a route.
+    """
+    params = {
+        "origins": f"{lat},{lng}",
+        "destinations": "|".join(f"{a:.6f},{b:.6f}" for a, b in zip(ring_lats, ring_lngs)),
+        "departure_time": "now",
+        "key": GOOGLE_API_KEY,
+    }
+    n = len(ring_lats)
+    durations = np.full(n, np.nan)
+    in_traffic = np.full(n, np.nan)
+    try:
+        response = rate_limited_get(DISTANCE_MATRIX_URL, limiter=limiter, params=params, session=session)
+        data = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return f"REQUEST_FAILED: {e}", durations, in_traffic
+    if data.get("status") != "OK":
+        return data.get("status", "UNKNOWN_ERROR"), durations, in_traffic
+    elements = (data.get("rows") or [{}])[0].get("elements", [])
+    for i, element in enumerate(elements[:n]):
+        if element.get("status") == "OK":
+            durations[i] = element["duration"]["value"]
+            in_traffic[i] = element.get("duration_in_traffic", element["duration"])["value"]
+    return "OK", durations, in_traffic
+
+
+# -----------------------
+# Sampling
+# -----------------------
+class TrafficSampler:
+    """Concurrent ring sampling with a per-bucket file cache and an element budget."""
+
+    def __init__(self, path=CACHE_PATH, radius_m=DEFAULT_RADIUS_M, spokes=DEFAULT_SPOKES, rate=DEFAULT_RATE,
+                 workers=8, max_elements=DEFAULT_MAX_ELEMENTS):
+        if spokes > MAX_DESTINATIONS:
+            raise ValueError(f"At most {MAX_DESTINATIONS} spokes fit in one Distance Matrix request.")
+        self.path = path
+        self.radius_m = radius_m
+        self.spokes = spokes
+        self.limiter = RateLimiter(rate)
+        self.workers = workers
+        self.max_elements = max_elements
+        self.lock = threading.Lock()
+        self.stats = {"cached": 0, "queried": 0, "elements": 0, "errors": 0, "over_budget": 0}
+        self._local = threading.local()
+        self.buckets = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.buckets = json.load(f)
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            for bucket in sorted(self.buckets, key=int)[:-KEEP_BUCKETS]:
+                del self.buckets[bucket]
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.buckets, f)
+            os.replace(tmp_path, self.path)
+
+    def _query(self, job):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        lat, lng, ring_lats, ring_lngs = job
+        return query_spokes(lat, lng, ring_lats, ring_lngs, self.limiter, self._local.session)
+
+    def sample(self, stations, now=None):
+        """
+        Traffic samples for stations [(lat, lng), ...] in the current 15-minute bucket.
+        Returns (durations, durations_in_traffic) arrays of shape (stations, spokes), NaN
+        where nothing was measured (route missing, error or over budget).
+        """
+        now = time.time() if now is None else now
+        bucket = str(int(now // BUCKET_S))
+        lats = np.array([s[0] for s in stations], dtype=np.float64)
+        lngs = np.array([s[1] for s in stations], dtype=np.float64)
+        durations = np.full((len(stations), self.spokes), np.nan)
+        in_traffic = np.full((len(stations), self.spokes), np.nan)
+        if not len(stations):
+            return durations, in_traffic
+
+        cached = self.buckets.setdefault(bucket, {})
+        keys = [station_key(lat, lng, self.radius_m, self.spokes) for lat, lng in zip(lats, lngs)]
+        pending = {}
+        for i, key in enumerate(keys):
+            if key in cached:
+                durations[i], in_traffic[i] = cached[key]
+                self.stats["cached"] += 1
+            else:
+                pending.setdefault(key, []).append(i)
+
+        affordable = max(self.max_elements // self.spokes, 0)
+        todo = list(pending)[:affordable]
+        self.stats["over_budget"] += len(pending) - len(todo)
+        if todo:
+            first = np.array([pending[key][0] for key in todo])
+            ring_lats, ring_lngs = probe_rings(lats[first], lngs[first], self.radius_m, self.spokes)
+            jobs = [(lats[i], lngs[i], ring_lats[k], ring_lngs[k]) for k, i in enumerate(first)]
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(self._query, jobs))
+            for key, (status, d, t) in zip(todo, results):
+                self.stats["queried"] += 1
+                self.stats["elements"] += self.spokes
+                if status != "OK":
+                    self.stats["errors"] += 1
+                    print(f"❌ Error fetching traffic data for {key}: {status}")
+                    continue
+                cached[key] = [np.where(np.isnan(d), None, d).tolist(), np.where(np.isnan(t), None, t).tolist()]
+                for i in pending[key]:
+                    durations[i], in_traffic[i] = d, t
+            self.save()
+        return durations, in_traffic
+
+
+def traffic_features(durations, durations_in_traffic):
+    """Per-station congestion features from (stations, spokes) duration arrays, vectorized."""
+    durations = np.asarray(durations, dtype=np.float64)
+    in_traffic = np.asarray(durations_in_traffic, dtype=np.float64)
+    valid = ~(np.isnan(durations) | np.isnan(in_traffic))
+    classes = congestion_classes(durations, in_traffic)
+    measured = valid.sum(axis=1)
+    total = np.where(valid, durations, 0.0).sum(axis=1)
+    total_traffic = np.where(valid, in_traffic, 0.0).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delay_ratio = (total_traffic - total) / total
+        heavy_share = np.where(valid & (classes == HEAVY), 1, 0).sum(axis=1) / measured
+        moderate_share = np.where(valid & (classes == MODERATE), 1, 0).sum(axis=1) / measured
+    overall = congestion_classes(total, total_traffic)
+    return {
+        "spokes_measured": measured,
+        "duration_s": total,
+        "duration_in_traffic_s": total_traffic,
+        "delay_ratio": delay_ratio,
+        "heavy_share": heavy_share,
+        "moderate_share": moderate_share,
+        "congestion": np.where(measured > 0, overall, -1),
+    }
+
+
+def log_samples(table, stations, features, now):
+    """Append the measured stations' features to the traffic sample table, stamped with the bucket start."""
+    measured = features["spokes_measured"] > 0
+    if not measured.any():
+        return 0
+    n = int(measured.sum())
+    table.append({
+        "epoch": np.full(n, int(now // BUCKET_S) * BUCKET_S),
+        "lat": np.array([s[0] for s in stations], dtype=np.float64)[measured],
+        "lon": np.array([s[1] for s in stations], dtype=np.float64)[measured],
+        "delay_ratio": features["delay_ratio"][measured],
+        "heavy_share": features["heavy_share"][measured],
+        "moderate_share": features["moderate_share"][measured],
+        "congestion": features["congestion"][measured],
+        "spokes_measured": features["spokes_measured"][measured],
+    })
+    return n
+
+
+def sample_traffic(stations, sampler=None, now=None, log=None):
+    """
+    Traffic features for [(lat, lng), ...] as a list of dicts (one per station), with the
+    congestion class label of app.py ("🚗 Light Traffic", ...) or None when nothing was measured.
+    `log` (a traffic sample table) also receives the measured features.
+    """
+    sampler = sampler or TrafficSampler()
+    now = time.time() if now is None else now
+    features = traffic_features(*sampler.sample(stations, now))
+    if log is not None:
+        log_samples(log, stations, features, now)
+    records = []
+    for i, (lat, lng) in enumerate(stations):
+        measured = int(features["spokes_measured"][i])
+        code = int(features["congestion"][i])
+        records.append({
+            "lat": lat,
+            "lng": lng,
+            "spokes_measured": measured,
+            "duration_s": float(features["duration_s"][i]) if measured else None,
+            "duration_in_traffic_s": float(features["duration_in_traffic_s"][i]) if measured else None,
+            "delay_ratio": round(float(features["delay_ratio"][i]), 4) if measured else None,
+            "heavy_share": round(float(features["heavy_share"][i]), 3) if measured else None,
+            "moderate_share": round(float(features["moderate_share"][i]), 3) if measured else None,
+            "congestion": CONGESTION_LABELS[code] if code >= 0 else None,
+        })
+    return records
+
+
+# -----------------------
+# Main Workflow
+# -----------------------
+def load_stations(args):
+    stations = [tuple(float(v) for v in point.split(",")) for point in args.point]
+    if args.catalog:
+        from station_catalog import StationCatalog
+        catalog = StationCatalog.open(args.catalog)
+        if args.near:
+            lat, lng = (float(v) for v in args.near.split(","))
+            records = catalog.nearest(lat, lng, k=args.k)
+        else:
+            records = list(catalog.iter_stations())[:args.k]
+        stations += [(r["coordinates"]["latitude"], r["coordinates"]["longitude"]) for r in records]
+    return stations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sample traffic congestion around air-quality stations.")
+    parser.add_argument("--point", action="append", default=[], help="lat,lng of a station (repeatable).")
+    parser.add_argument("--catalog", help="Station catalog snapshot (station_catalog.bin).")
+    parser.add_argument("--near", help="lat,lng: use the --k catalog stations nearest to this point.")
+    parser.add_argument("--k", type=int, default=200)
+    parser.add_argument("--radius", type=int, default=DEFAULT_RADIUS_M, help="Spoke length (m).")
+    parser.add_argument("--spokes", type=int, default=DEFAULT_SPOKES)
+    parser.add_argument("--max-elements", type=int, default=DEFAULT_MAX_ELEMENTS, help="Element budget per cycle.")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Requests per second.")
+    parser.add_argument("--output", default="traffic_features.json")
+    parser.add_argument("--log", default=SAMPLE_LOG, help="Traffic sample table to append to.")
+    parser.add_argument("--no-log", action="store_true", help="Do not append to the traffic sample table.")
+    args = parser.parse_args()
+
+    stations = load_stations(args)
+    if not stations:
+        print("No stations to sample (use --point or --catalog).")
+        return
+    sampler = TrafficSampler(radius_m=args.radius, spokes=args.spokes, rate=args.rate, max_elements=args.max_elements)
+    t0 = time.perf_counter()
+    log = None if args.no_log else open_traffic_table(args.log)
+    records = sample_traffic(stations, sampler, log=log)
+    elapsed = time.perf_counter() - t0
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(records, f, indent=2, ensure_ascii=False)
+    counts = {label: sum(1 for r in records if r["congestion"] == label) for label in CONGESTION_LABELS}
+    print(f"📊 {len(records)} stations in {elapsed:.1f}s: " + ", ".join(f"{label} {n}" for label, n in counts.items()))
+    print(f"   {sampler.stats['queried']} matrix requests ({sampler.stats['elements']} elements), "
+          f"{sampler.stats['cached']} from the 15-minute cache, {sampler.stats['errors']} errors, "
+          f"{sampler.stats['over_budget']} over budget. Saved to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Streaming LLaVA (Ollama /api/generate) client for labelling map screenshots in bulk.
+
+send_image_to_ollama() used to wait for the whole streamed body, then split it into lines
+and join them, one image per run. This client reads Ollama's NDJSON stream line by line
+as it arrives, so tokens can be shown (or acted on) immediately, and records per request:
+
+    ttft_s       time to first token (upload + queueing in Ollama + prefill)
+    total_s      time until the final done=true line
+    tokens       streamed chunks; eval_count / prompt_eval_count as reported by Ollama
+
+Many images go through a bounded work queue served by `parallelism` worker threads (match
+it to OLLAMA_NUM_PARALLEL); the producer blocks when the queue is full, so only a bounded
+number of images is held in memory however long the list is. Every request has a connect
+/ read timeout (a stalled stream fails after `read_timeout_s` without data) and an overall
+deadline.
+
+Before sending, each image is fitted to the model's 336x336 input and re-encoded as JPEG
+(image_preprocessing.py; preprocess=None sends the file as is), and the request body is
+streamed: the base64 text is produced piece by piece while it is uploaded, never held as one
+string. In label_many() a small thread pool prepares the next images while the workers wait
+on Ollama.
+
+With an InferenceCache (inference_cache.py) an unchanged image is answered from the cache
+instead of Ollama; the result then has cached=True and on_token receives the whole text.
+
+    client = VisionClient(parallelism=2, cache=InferenceCache())
+    result = client.infer("traffic_map.png", on_token=lambda t: print(t, end="", flush=True))
+    for result in client.label_many(paths):          # results in completion order
+        print(result["image"], result["text"], result["ttft_s"])
+
+Test without a GPU against benchmarks/mock_ollama_server.py (ollama_url=http://127.0.0.1:11435):
+    python vision_client.py snapshots/*/*.png --parallel 2 --queue 8 [--no-cache] [--no-preprocess]
+"""
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from image_preprocessing import DEFAULT_SPEC, make_spec, prepare_image, request_body
+from inference_cache import InferenceCache
+
+# Shared API base URLs live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gathering_data"))
+from api_endpoints import OLLAMA_URL
+
+DEFAULT_MODEL = "llava"
+DEFAULT_PROMPT = "What do you see in this image?"
+CONNECT_TIMEOUT_S = 5
+READ_TIMEOUT_S = 60  # longest silence allowed while waiting for the next token
+DEADLINE_S = 300  # whole request, including the wait for a free slot in Ollama
+
+
+class InferenceError(Exception):
+    """The inference server answered with an error or the request timed out."""
+
+
+def read_image(image_path):
+    with open(image_path, "rb") as image_file:
+        return image_file.read()
+
+
+def stream_generate(image, prompt=DEFAULT_PROMPT, model=DEFAULT_MODEL, options=None, session=None,
+                    url=None, connect_timeout_s=CONNECT_TIMEOUT_S, read_timeout_s=READ_TIMEOUT_S,
+                    deadline_s=DEADLINE_S, metrics=None):
+    """
+    Yield response tokens from Ollama as they arrive. `image` is the encoded image bytes (or
+    a base64 str); it is base64-encoded into the request body while uploading. `metrics` (a
+    dict, if given) receives ttft_s, total_s, tokens, payload_bytes and Ollama's final
+    counters. Raises InferenceError.
+    """
+    metrics = {} if metrics is None else metrics
+    payload = {"model": model, "prompt": prompt, "stream": True}
+    if options:
+        payload["options"] = options
+    http = session or requests
+    t0 = time.perf_counter()
+    metrics.update({"ttft_s": None, "total_s": None, "tokens": 0, "payload_bytes": 0})
+
+    def body():
+        for piece in request_body(payload, image):
+            metrics["payload_bytes"] += len(piece)
+            yield piece
+
+    try:
+        with http.post(f"{url or OLLAMA_URL}/api/generate", data=body(), stream=True,
+                       headers={"Content-Type": "application/json"},
+                       timeout=(connect_timeout_s, read_timeout_s)) as response:
+            if response.status_code != 200:
+                raise InferenceError(f"HTTP {response.status_code}: {response.text[:200]}")
+            for line in response.iter_lines(chunk_size=None):
+                if not line:
+                    continue
+                if time.perf_counter() - t0 > deadline_s:
+                    raise InferenceError(f"deadline of {deadline_s}s exceeded")
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise InferenceError(chunk["error"])
+                token = chunk.get("response")
+                if token:
+                    if metrics["ttft_s"] is None:
+                        metrics["ttft_s"] = time.perf_counter() - t0
+                    metrics["tokens"] += 1
+                    yield token
+                if chunk.get("done"):
+                    for key in ("eval_count", "prompt_eval_count", "total_duration", "done_reason"):
+                        if key in chunk:
+                            metrics[key] = chunk[key]
+                    break
+            else:
+                raise InferenceError("stream ended without a done=true line")
+    except requests.exceptions.Timeout as e:
+        raise InferenceError(f"timeout: {e}") from e
+    except requests.exceptions.RequestException as e:
+        # A read timeout in the middle of the stream surfaces as a ConnectionError.
+        kind = "timeout" if "timed out" in str(e) else "request error"
+        raise InferenceError(f"{kind}: {e}") from e
+    except ValueError as e:
+        raise InferenceError(f"invalid stream line: {e}") from e
+    finally:
+        metrics["total_s"] = time.perf_counter() - t0
+
+
+class VisionClient:
+    """LLaVA inference over a bounded work queue with `parallelism` streaming workers, optionally cached."""
+
+    def __init__(self, model=DEFAULT_MODEL, prompt=DEFAULT_PROMPT, options=None, parallelism=1, queue_size=None,
+                 url=None, connect_timeout_s=CONNECT_TIMEOUT_S, read_timeout_s=READ_TIMEOUT_S, deadline_s=DEADLINE_S,
+                 cache=None, preprocess=DEFAULT_SPEC, prepare_workers=2):
+        self.model = model
+        self.prompt = prompt
+        self.options = options
+        self.parallelism = max(1, parallelism)
+        self.queue_size = queue_size or 2 * self.parallelism
+        self.url = url or OLLAMA_URL
+        self.timeouts = {"connect_timeout_s": connect_timeout_s, "read_timeout_s": read_timeout_s,
+                         "deadline_s": deadline_s}
+        self.cache = cache
+        self.preprocess = preprocess
+        self.prepare_workers = max(1, prepare_workers)
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def prepare(self, image_path):
+        """Bytes sent for an image: preprocessed, or the file itself when preprocess is None."""
+        if self.preprocess is None:
+            return read_image(image_path)
+        return prepare_image(image_path, self.preprocess)
+
+    def _cache_key(self, image_path, prompt):
+        return self.cache.key_for(image_path, self.model, prompt, self.options, self.preprocess)
+
+    def infer(self, image_path, on_token=None, prompt=None, save=True, prepared=None):
+        """
+        Run one image; returns a result dict (error is set instead of raising). `prepared`
+        may be the image's already prepared bytes, or a Future of them.
+        """
+        prompt = prompt or self.prompt
+        if self.cache is None:
+            return self._generate(image_path, on_token, prompt, prepared)
+        try:
+            key = self._cache_key(image_path, prompt)
+        except OSError as e:
+            return {"image": image_path, "model": self.model, "text": None, "error": str(e), "cached": False}
+        result, hit = self.cache.lookup(key, lambda: self._generate(image_path, on_token, prompt, prepared), save)
+        result = dict(result, image=image_path, cached=hit)
+        result.setdefault("error", None)
+        if hit and on_token is not None and result["text"]:
+            on_token(result["text"])
+        return result
+
+    def _generate(self, image_path, on_token, prompt, prepared=None):
+        result = {"image": image_path, "model": self.model, "text": None, "error": None, "cached": False}
+        metrics = {}
+        parts = []
+        t0 = time.perf_counter()
+        try:
+            if isinstance(prepared, Future):
+                prepared = prepared.result()
+            image = prepared if prepared is not None else self.prepare(image_path)
+        except Exception as e:  # not only OSError/ValueError, e.g. PIL's DecompressionBombError
+            result["error"] = str(e)
+            return result
+        result["prepare_s"] = time.perf_counter() - t0
+        try:
+            for token in stream_generate(image, prompt, self.model, self.options,
+                                         self._session(), self.url, metrics=metrics, **self.timeouts):
+                parts.append(token)
+                if on_token is not None:
+                    on_token(token)
+            result["text"] = "".join(parts).strip()
+        except (InferenceError, OSError, ValueError) as e:
+            result["error"] = str(e)
+        result.update(metrics)
+        return result
+
+    def label_many(self, image_paths, on_token=None):
+        """
+        Infer every image, yielding results as they complete. `on_token(image_path, token)`
+        sees the streamed tokens of all requests. At most queue_size images wait in the queue;
+        their preparation starts on a thread pool as soon as they are queued (skipped for images
+        the cache already answers).
+        """
+        work = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue()
+        stop = object()
+        pool = ThreadPoolExecutor(max_workers=self.prepare_workers)
+
+        def cached(path):
+            try:
+                return self.cache is not None and self.cache.contains(self._cache_key(path, self.prompt))
+            except OSError:
+                return False
+
+        def produce():
+            try:
+                for path in image_paths:
+                    prepared = None if cached(path) else pool.submit(self.prepare, path)
+                    work.put((path, prepared))  # blocks while the queue is full
+            finally:
+                for _ in range(self.parallelism):
+                    work.put(stop)
+
+        def consume():
+            # Every worker must put its stop marker, or the generator below waits forever.
+            try:
+                while True:
+                    item = work.get()
+                    if item is stop:
+                        return
+                    path, prepared = item
+                    callback = None if on_token is None else (lambda token, path=path: on_token(path, token))
+                    try:
+                        results.put(self.infer(path, callback, save=False, prepared=prepared))
+                    except Exception as e:  # e.g. a failing on_token callback
+                        results.put({"image": path, "model": self.model, "text": None, "error": str(e),
+                                     "cached": False})
+            finally:
+                results.put(stop)
+
+        threads = [threading.Thread(target=produce, daemon=True)]
+        threads += [threading.Thread(target=consume, daemon=True) for _ in range(self.parallelism)]
+        for thread in threads:
+            thread.start()
+        finished = 0
+        try:
+            while finished < self.parallelism:
+                item = results.get()
+                if item is stop:
+                    finished += 1
+                else:
+                    yield item
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+            if self.cache is not None:
+                self.cache.save()
+
+
+def summarize_results(results, elapsed_s=None):
+    """Counts and latency percentiles of a list of inference results."""
+    ok = [r for r in results if not r["error"]]
+    summary = {"images": len(results), "ok": len(ok), "errors": len(results) - len(ok),
+               "cached": sum(1 for r in ok if r.get("cached"))}
+    served = len(ok)
+    ok = [r for r in ok if not r.get("cached")]  # latency of actual inference only
+    if ok:
+        ttft = np.array([r["ttft_s"] for r in ok if r["ttft_s"] is not None])
+        total = np.array([r["total_s"] for r in ok])
+        if ttft.size:
+            summary["ttft_p50_s"] = round(float(np.percentile(ttft, 50)), 3)
+            summary["ttft_p95_s"] = round(float(np.percentile(ttft, 95)), 3)
+        summary["total_p50_s"] = round(float(np.percentile(total, 50)), 3)
+        summary["total_p95_s"] = round(float(np.percentile(total, 95)), 3)
+        tokens = sum(r["tokens"] for r in ok)
+        summary["payload_kb_per_image"] = round(sum(r.get("payload_bytes") or 0 for r in ok) / len(ok) / 1024, 1)
+        if elapsed_s:
+            summary["images_per_s"] = round(served / elapsed_s, 2)
+            summary["tokens_per_s"] = round(tokens / elapsed_s, 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label map screenshots with LLaVA through Ollama.")
+    parser.add_argument("images", nargs="+")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--prompt", default=DEFAULT_PROMPT)
+    parser.add_argument("--parallel", type=int, default=1, help="Concurrent requests (match OLLAMA_NUM_PARALLEL).")
+    parser.add_argument("--queue", type=int, default=None, help="Work queue size (default 2 x --parallel).")
+    parser.add_argument("--read-timeout", type=float, default=READ_TIMEOUT_S)
+    parser.add_argument("--deadline", type=float, default=DEADLINE_S)
+    parser.add_argument("--output", default=None, help="Write results as JSON lines to this file.")
+    parser.add_argument("--no-cache", action="store_true", help="Always run inference, bypassing inference_cache.json.")
+    parser.add_argument("--no-preprocess", action="store_true", help="Send the image files unchanged.")
+    parser.add_argument("--size", type=int, default=DEFAULT_SPEC["size"], help="Model input size in pixels.")
+    parser.add_argument("--format", default=DEFAULT_SPEC["format"], choices=["JPEG", "WEBP"])
+    parser.add_argument("--quality", type=int, default=DEFAULT_SPEC["quality"])
+    args = parser.parse_args()
+
+    client = VisionClient(args.model, args.prompt, parallelism=args.parallel, queue_size=args.queue,
+                          read_timeout_s=args.read_timeout, deadline_s=args.deadline,
+                          cache=None if args.no_cache else InferenceCache(),
+                          preprocess=None if args.no_preprocess else make_spec(size=args.size, format=args.format,
+                                                                               quality=args.quality))
+    results = []
+    t0 = time.perf_counter()
+    out = open(args.output, "a", encoding="utf-8") if args.output else None
+    try:
+        for result in client.label_many(args.images):
+            results.append(result)
+            if out:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            if result["error"]:
+                print(f"❌ {result['image']}: {result['error']}")
+            elif result["cached"]:
+                print(f"♻️ {result['image']} (cached): {result['text'][:80]}")
+            else:
+                print(f"🚀 {result['image']} (first token {result['ttft_s']:.2f}s, {result['total_s']:.2f}s): "
+                      f"{result['text'][:80]}")
+    finally:
+        if out:
+            out.close()
+    print(json.dumps(summarize_results(results, time.perf_counter() - t0)))
+    if client.cache is not None:
+        print(f"📊 Inference cache: {json.dumps(client.cache.summary())}")
+
+
+if __name__ == "__main__":
+    main()
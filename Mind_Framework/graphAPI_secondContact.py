@@ -1,23 +1,284 @@
-import requests
+"""
+Microsoft Graph fetcher: paged collections, JSON batching and delta sync, headless.
+
+    paging   get_all() follows @odata.nextLink with the largest page size ($top=999), so a
+             collection of N items takes about N / 999 requests
+    $batch   get_many() packs up to 20 GET calls into one POST /$batch; batches run on a
+             few threads, and members throttled with a 429 are retried in a later batch
+    delta    sync() pulls /{resource}/delta once in full, keeps the @odata.deltaLink in
+             graph_delta_state.json, and afterwards pulls only what changed, applying it
+             to a local mirror (graph_items/<resource>.json); a 410 (expired token)
+             falls back to a full resync
+
+Every request goes through the shared rate limiter and retries 429 / 5xx replies
+(honouring Retry-After). Plots are written to files with the Agg backend and never shown,
+so the script runs unattended.
+
+The access token comes from .env (graph_access_token); graph_base_url points the script
+at benchmarks/mock_graph_server.py for testing.
+
+    python graphAPI_secondContact.py                                 # /me -> graph_data.json, plot.png
+    python graphAPI_secondContact.py --sync users --sync groups      # delta sync into graph_items/
+    python graphAPI_secondContact.py --sync users --managers 200     # plus 200 managers via $batch
+"""
+import argparse
 import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")  # headless: figures are saved, never shown
 import matplotlib.pyplot as plt
+import requests
+from dotenv import load_dotenv
+
+# Shared helpers (rate limiter, API base URLs) live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "gathering_data"))
+from rate_limiter import RateLimiter, rate_limited_request
+from api_endpoints import GRAPH_BASE_URL
+
+# Load the access token from .env file
+load_dotenv()
+ACCESS_TOKEN = os.getenv("graph_access_token")
+
+DEFAULT_RATE = float(os.getenv("graph_rate_limit", "10.0"))
+STATE_PATH = os.getenv("graph_delta_state",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "graph_delta_state.json"))
+MIRROR_DIR = os.getenv("graph_mirror_dir", os.path.join(os.path.dirname(os.path.abspath(__file__)), "graph_items"))
+MAX_PAGE_SIZE = 999  # largest $top Graph accepts for directory objects
+MAX_BATCH = 20  # Graph's limit of requests per $batch
+MAX_BATCH_ROUNDS = 5
+
+
+class GraphError(Exception):
+    """A Graph request failed; `status` holds the HTTP status (None for connection errors)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+# -----------------------
+# Client
+# -----------------------
+class GraphClient:
+    """Thread-safe Graph client with paging, batching and a shared rate limiter."""
+
+    def __init__(self, access_token=None, base_url=None, rate=DEFAULT_RATE, workers=4):
+        self.access_token = access_token or ACCESS_TOKEN
+        self.base_url = (base_url or GRAPH_BASE_URL).rstrip("/")
+        self.limiter = RateLimiter(rate)
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "pages": 0, "batches": 0, "batched_calls": 0, "retried_calls": 0}
+        self._local = threading.local()
+
+    def _session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            self._local.session.headers.update({"Authorization": f"Bearer {self.access_token}",
+                                                "Accept": "application/json"})
+        return self._local.session
+
+    def _url(self, path):
+        return path if path.startswith("http") else f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, params=None, body=None):
+        """JSON body of a Graph reply; raises GraphError for error statuses."""
+        with self.lock:
+            self.stats["requests"] += 1
+        try:
+            response = rate_limited_request(method, self._url(path), self.limiter, params=params, json=body,
+                                            session=self._session())
+        except requests.exceptions.RequestException as e:
+            raise GraphError(f"{method} {path} failed: {e}") from e
+        if not response.ok:
+            raise GraphError(f"{method} {path}: {response.status_code} {response.text[:200]}", response.status_code)
+        return response.json() if response.content else {}
+
+    def get(self, path, params=None):
+        return self.request("GET", path, params)
+
+    # -----------------------
+    # Paging
+    # -----------------------
+    def iter_pages(self, path, params=None):
+        """Yield every page of a collection, following @odata.nextLink (which carries the query)."""
+        url, query = path, params
+        while url:
+            page = self.get(url, query)
+            with self.lock:
+                self.stats["pages"] += 1
+            yield page
+            url, query = page.get("@odata.nextLink"), None
+
+    def get_all(self, path, select=None, page_size=MAX_PAGE_SIZE, params=None):
+        """All items of a collection, `page_size` per request."""
+        params = dict(params or {}, **{"$top": page_size})
+        if select:
+            params["$select"] = ",".join(select)
+        items = []
+        for page in self.iter_pages(path, params):
+            items.extend(page.get("value", []))
+        return items
+
+    # -----------------------
+    # Batching
+    # -----------------------
+    def _post_batch(self, members):
+        """One POST /$batch for [(id, url), ...]; returns {id: response}."""
+        body = {"requests": [{"id": str(i), "method": "GET", "url": "/" + url.lstrip("/")} for i, url in members]}
+        with self.lock:
+            self.stats["batches"] += 1
+            self.stats["batched_calls"] += len(members)
+        reply = self.request("POST", "$batch", body=body)
+        return {int(r["id"]): r for r in reply.get("responses", [])}
 
+    def get_many(self, paths):
+        """
+        GET many relative paths through $batch (20 per request, batches in parallel). Returns
+        a list in input order of response bodies, or GraphError instances for failed calls.
+        """
+        results = [None] * len(paths)
+        pending = list(enumerate(paths))
+        for round_ in range(MAX_BATCH_ROUNDS):
+            groups = [pending[i:i + MAX_BATCH] for i in range(0, len(pending), MAX_BATCH)]
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                replies = list(pool.map(self._post_batch, groups))
+            retry, wait = [], 0.0
+            for group, reply in zip(groups, replies):
+                for index, path in group:
+                    response = reply.get(index)
+                    status = response["status"] if response else None
+                    if status == 429 and round_ < MAX_BATCH_ROUNDS - 1:
+                        retry.append((index, path))
+                        headers = response.get("headers") or {}
+                        wait = max(wait, float(headers.get("Retry-After", 1)))
+                    elif status is not None and 200 <= status < 300:
+                        results[index] = response.get("body")
+                    else:
+                        message = (response or {}).get("body", {}).get("error", {}).get("message", "no response")
+                        results[index] = GraphError(f"GET {path}: {status} {message}", status)
+            if not retry:
+                break
+            with self.lock:
+                self.stats["retried_calls"] += len(retry)
+            self.limiter.penalize(wait)
+            pending = retry
+        return results
 
-def fetch_graph_data(access_token):
+    # -----------------------
+    # Delta
+    # -----------------------
+    def delta(self, resource, delta_link=None, select=None):
+        """
+        (changes, new_delta_link, pages) for /{resource}/delta: everything when delta_link is
+        None, otherwise only what changed since that link was issued.
+        """
+        if delta_link:
+            url, params = delta_link, None
+        else:
+            url, params = f"{resource}/delta", {"$top": MAX_PAGE_SIZE}
+            if select:
+                params["$select"] = ",".join(select)
+        changes, new_link, pages = [], None, 0
+        for page in self.iter_pages(url, params):
+            pages += 1
+            changes.extend(page.get("value", []))
+            new_link = page.get("@odata.deltaLink", new_link)
+        if new_link is None:
+            raise GraphError(f"{resource}/delta ended without an @odata.deltaLink")
+        return changes, new_link, pages
+
+
+# -----------------------
+# Delta State and Local Mirror
+# -----------------------
+class DeltaState:
+    """Delta links per resource, persisted to a JSON file."""
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.links = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.links = json.load(f)
+
+    def get(self, resource):
+        entry = self.links.get(resource)
+        return entry["delta_link"] if entry else None
+
+    def set(self, resource, delta_link):
+        with self.lock:
+            self.links[resource] = {"delta_link": delta_link, "synced_at": time.time()}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.links, f, indent=1)
+            os.replace(tmp_path, self.path)
+
+
+def mirror_path(resource, mirror_dir=MIRROR_DIR):
+    return os.path.join(mirror_dir, resource.replace("/", "_") + ".json")
+
+
+def load_mirror(resource, mirror_dir=MIRROR_DIR):
+    path = mirror_path(resource, mirror_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def apply_changes(items, changes):
+    """Apply delta changes to {id: item}: @removed entries are dropped, others merged."""
+    removed = 0
+    for change in changes:
+        if "@removed" in change:
+            removed += items.pop(change["id"], None) is not None
+        else:
+            items[change["id"]] = {**items.get(change["id"], {}), **change}
+    return removed
+
+
+def sync(client, resource, state, mirror_dir=MIRROR_DIR, select=None):
+    """Bring the local mirror of a resource up to date; returns a summary dict."""
+    link = state.get(resource)
+    full = link is None
+    try:
+        changes, new_link, pages = client.delta(resource, link, select)
+    except GraphError as e:
+        if e.status != 410:  # 410 Gone: the delta token expired, start over
+            raise
+        full = True
+        changes, new_link, pages = client.delta(resource, None, select)
+    items = {} if full else load_mirror(resource, mirror_dir)
+    removed = apply_changes(items, changes)
+
+    os.makedirs(mirror_dir, exist_ok=True)
+    path = mirror_path(resource, mirror_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(items, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    state.set(resource, new_link)  # only after the mirror holds the changes
+    return {"resource": resource, "full": full, "changes": len(changes), "removed": removed, "items": len(items),
+            "requests": pages}
+
+
+# -----------------------
+# Output
+# -----------------------
+def fetch_graph_data(access_token=None, client=None):
     """
     Fetch data from a Graph API.
     For this example, we use the Microsoft Graph API endpoint for the signed-in user.
     """
-    url = "https://graph.microsoft.com/v1.0/me"
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json"
-    }
-    response = requests.get(url, headers=headers)
-    if response.ok:
-        return response.json()
-    else:
-        raise Exception(f"Failed to fetch data: {response.status_code} {response.text}")
+    client = client or GraphClient(access_token)
+    return client.get("me")
 
 
 def save_data_to_file(data, filename="graph_data.json"):
@@ -29,9 +290,9 @@ def save_data_to_file(data, filename="graph_data.json"):
     print(f"Data saved to {filename}")
 
 
-def create_plot(data):
+def create_plot(data, filename="plot.png"):
     """
-    Create a plot based on the received data.
+    Create a plot based on the received data and save it (the figure is never shown).
 
     For demonstration, we assume that the data might contain a key 'numbers' with a list of numeric values.
     If not, we simulate some numeric data.
@@ -49,26 +310,62 @@ def create_plot(data):
     plt.xlabel("Index")
     plt.ylabel("Value")
     plt.grid(True)
-    plt.savefig("plot.png")
-    print("Plot saved as plot.png")
-    plt.show()
+    plt.savefig(filename)
+    plt.close()
+    print(f"Plot saved as {filename}")
+
+
+def fetch_managers(client, user_ids):
+    """Managers of many users through $batch: {user_id: manager or None}."""
+    bodies = client.get_many([f"users/{user_id}/manager" for user_id in user_ids])
+    return {user_id: (None if isinstance(body, GraphError) else body) for user_id, body in zip(user_ids, bodies)}
 
 
 def main():
-    # Replace with your actual access token for the Graph API
-    access_token = "EwBIBMl6BAAUBKgm8k1UswUNwklmy2v7U/S+1fEAAWcPMHMrkFZLdS7/AzZIlrBXsNxqOU+ny1FgdGQ8V5FmltD9mo+rRQ8oOfc4EIYmKMbmFS6L55ILUiAUwrURAAYDXbrAi824trYuw8UcE1iLmZz6kL1AeSzOLZqJEOTURjq9ujQ4Dq0KgIcJ2dTGsDes8o68Zprdu9aGh270UkKk4kTz2IvxiEHhj7sjDU61up9cYn5lyNFZvPX0bWMkDKTLLCyDSJnQfE+i34gzyLEUgTSmJ/2tLcyLD9xzdxWe4C6FNAuU0AFdhs4lvdWPRa1gZdzdPzojVhUQuv/54JEClwPJcYh79JbRlYSdejUPXbuhwIb1ZmuYErO7S+sQ6DsQZgAAECuk+U5Y8tyUjRsil6InDfUQA+REEeJCZLKnY149iVRKmu51GscoHLwWqslcixTzrnW+eTc0EHETyVBWo4evpMqSYF/4IznYK0Jitcf020BsJXcLgKTAkVkklHQde61+is7TT4s/k5fhLHFQH6GMIgjDEDQd3ML/0fUDPul+7ZFpKvWPZVBn5Lx6TJFgplEzxd0RGgjs811xZlh9c1NNTU7WjP17f2yFvFtGPsdZE8aSe/lYjJMtOwoe3hj+R/IpsmN+M2ewmDtbJ68MXMhTiMl4OZ6hz8lcjTilq1OlCaembwQONnaH1FrYwu2ks6eOgHvxOy3F4eRFvqwowBDwRxq/M0mgEfa/IbMhJkDHBoI9ArNS4cF7PMRoWA5KUoNJgZkxa3WsTQhdMSGGEiFcFCbzILPiKpZB5LpP96+xuJqoIKSq03R8CgxtBlwb+N62472mBBoZup700vWsRQCqDR759mhNia/syqZYcBiilBGCI5FzorM1mXzWSdkQ+Mm/YmY5DtjezEXgXVi4vj8C/i62pBO9URapGkAyHKKlf+hjvfgrbweS4N86sXDvNlrdNLux4tXjMj1/yNOhEgoBI1Xde3z/BxUy7bXV5lx8VU0Oyybg6GkJVV0RvNQnjcXpOUazniZ4kQlY1tlih6mBDQKkCFNcsERSp9pnPDu2j2n5RKU2oGWJtvRDBg9ILs6F2DzlQfXOdeXg8Dr4B1rLyKZyTB0Mf5Er0RsU5XCeWSShyfJim8nrk2ouicfz4V4wERZtJJTc0FzrR/5XWljhF7mKyua7gwzJMXvKzXrUvS5xgqpXMY5HlSd2vL9WbMOpklX0Muyx95rvsP6YxfTkHTYDtafUTY3BC2IK00/2BXE/G9/j+O4Zr9SQDFAUaTLWaNVXBBZbxsT1n57qRJNS0oNYVXnnIkTtjjneui7S45H4zT+WL+1a3ytOp/V6vo+/srGNc5sEtT+Sp+Rw9R47z7HlSiufC1eLQGaEZ3BWj3bhxNHq1t4HTWAvnkB7/KU0lKxwZA3UGXgKF4Rhrf4X7D6JdcKw/VJ/90zKOUuP2x9mLthFAw=="
+    parser = argparse.ArgumentParser(description="Fetch Microsoft Graph data: /me, delta-synced collections, batches.")
+    parser.add_argument("--sync", action="append", default=[], help="Resource to delta-sync (users, groups).")
+    parser.add_argument("--select", default=None, help="Comma-separated properties to request.")
+    parser.add_argument("--managers", type=int, default=0, help="Fetch managers of this many mirrored users via $batch.")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Requests per second.")
+    args = parser.parse_args()
+
+    if not ACCESS_TOKEN:
+        print("An error occurred: graph_access_token is not set (add it to .env).")
+        return
+    client = GraphClient(rate=args.rate)
+    select = args.select.split(",") if args.select else None
 
     try:
-        # Fetch the data from the API
-        data = fetch_graph_data(access_token)
+        if not args.sync:
+            # Fetch the data from the API
+            data = fetch_graph_data(client=client)
+
+            # Save the data to a JSON file
+            save_data_to_file(data)
+
+            # Create a plot based on the data (saved, not displayed)
+            create_plot(data)
+            return
 
-        # Save the data to a JSON file
-        save_data_to_file(data)
+        state = DeltaState()
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(args.sync)) as pool:
+            summaries = list(pool.map(lambda resource: sync(client, resource, state, select=select), args.sync))
+        for s in summaries:
+            kind = "full sync" if s["full"] else "delta"
+            print(f"📊 {s['resource']}: {kind}, {s['changes']} changes ({s['removed']} removed) in "
+                  f"{s['requests']} requests -> {s['items']} items in {mirror_path(s['resource'])}")
 
-        # Create and display a plot based on the data
-        create_plot(data)
+        if args.managers:
+            user_ids = list(load_mirror("users"))[:args.managers]
+            managers = fetch_managers(client, user_ids)
+            found = sum(1 for m in managers.values() if m)
+            save_data_to_file(managers, "graph_managers.json")
+            print(f"👥 {found} of {len(user_ids)} managers in {client.stats['batches']} $batch requests")
+        print(f"Done in {time.perf_counter() - t0:.2f}s: {client.stats['requests']} requests, "
+              f"{client.stats['pages']} pages, {client.stats['retried_calls']} batched calls retried.")
 
-    except Exception as e:
+    except GraphError as e:
         print("An error occurred:", e)
 
 
@@ -0,0 +1,418 @@
+"""
+Offline benchmark for the OpenAQ / WAQI data-gathering pipeline.
+
+Recorded API responses in benchmarks/fixtures/ are replayed underneath the real
+`requests` transport (HTTPAdapter.send), so the code paths being measured are exactly
+the ones the scripts use in production - only the network is simulated, with a
+configurable latency and jitter.
+
+Usage (from the repository root):
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --iterations 100 --concurrency 8 --latency-ms 40
+    python benchmarks/bench_pipeline.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json --fail-on-regression
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import random
+import re
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# -----------------------
+# Configuration
+# -----------------------
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+
+# The scripts refuse to import without tokens; the replayed transport never sends them anywhere.
+os.environ.setdefault("openaq_token", "benchmark-token")
+os.environ.setdefault("aqi_cn_token", "benchmark-token")
+
+# URL path pattern -> fixture file. A sensor-specific file such as
+# "openaq_sensor_hours_7774317.json" takes precedence over the generic one when present.
+ROUTES = [
+    (re.compile(r"/sensors/(\d+)/hours/?$"), "openaq_sensor_hours"),
+    (re.compile(r"/sensors/(\d+)/measurements/?$"), "openaq_sensor_measurements"),
+    (re.compile(r"/locations(?:/(\d+))?/?$"), "openaq_locations"),
+    (re.compile(r"/map/bounds/?$"), "waqi_map_bounds"),
+    (re.compile(r"/feed/@(\d+)/?$"), "waqi_feed"),
+]
+
+# Example inputs, taken from the scripts' own main() functions.
+CJ3_LOCATION = {
+    "id": 2163127,
+    "name": "CJ-3",
+    "coordinates": {"latitude": 46.765425, "longitude": 23.550258},
+    "sensors": [
+        {"id": 11438933, "name": "co µg/m³"},
+        {"id": 9020849, "name": "no2 µg/m³"},
+        {"id": 9020848, "name": "o3 µg/m³"},
+        {"id": 7774317, "name": "pm10 µg/m³"},
+        {"id": 7773481, "name": "pm25 µg/m³"},
+        {"id": 7774375, "name": "so2 µg/m³"}
+    ]
+}
+START_DATE = "2025-02-01T00:00:00Z"
+END_DATE = "2025-02-02T00:00:00Z"
+HOME_LAT, HOME_LON = 46.7445701195037, 23.49587497922032
+
+
+# -----------------------
+# Replay Transport
+# -----------------------
+class FixtureReplay:
+    """
+    Serves recorded responses in place of HTTPAdapter.send, sleeping for a simulated
+    network latency before each reply. Counts every request it answers.
+    """
+
+    def __init__(self, fixtures_dir, latency_ms=20.0, jitter_ms=5.0, seed=0):
+        self.fixtures_dir = fixtures_dir
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.unmatched = []
+        self._cache = {}
+        self._original_send = None
+
+    def _fixture_bytes(self, name):
+        if name not in self._cache:
+            path = os.path.join(self.fixtures_dir, f"{name}.json")
+            if not os.path.exists(path):
+                self._cache[name] = None
+            else:
+                with open(path, "rb") as f:
+                    self._cache[name] = f.read()
+        return self._cache[name]
+
+    def _resolve(self, path):
+        for pattern, name in ROUTES:
+            match = pattern.search(path)
+            if match:
+                key = match.group(1) if match.groups() else None
+                if key:
+                    body = self._fixture_bytes(f"{name}_{key}")
+                    if body is not None:
+                        return body
+                return self._fixture_bytes(name)
+        return None
+
+    def _sleep(self):
+        with self.lock:
+            delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def send(self, adapter, request, **kwargs):
+        path = requests.utils.urlparse(request.url).path
+        body = self._resolve(path)
+        self._sleep()
+
+        response = requests.models.Response()
+        response.url = request.url
+        response.request = request
+        response.encoding = "utf-8"
+        response.headers["Content-Type"] = "application/json"
+        if body is None:
+            response.status_code = 404
+            response._content = b'{"detail": "no fixture recorded for this endpoint"}'
+            with self.lock:
+                self.unmatched.append(request.url)
+        else:
+            response.status_code = 200
+            response._content = body
+        with self.lock:
+            self.request_count += 1
+        return response
+
+    def __enter__(self):
+        replay = self
+        self._original_send = requests.adapters.HTTPAdapter.send
+
+        def patched_send(adapter, request, **kwargs):
+            return replay.send(adapter, request, **kwargs)
+
+        requests.adapters.HTTPAdapter.send = patched_send
+        return self
+
+    def __exit__(self, *exc):
+        requests.adapters.HTTPAdapter.send = self._original_send
+        return False
+
+
+# -----------------------
+# Helper Functions
+# -----------------------
+def load_module(relative_path, module_name):
+    """Import one of the repo's scripts by file path (its directory goes on sys.path for sibling imports)."""
+    path = os.path.join(REPO_ROOT, relative_path)
+    module_dir = os.path.dirname(path)
+    if module_dir not in sys.path:
+        sys.path.insert(0, module_dir)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def reset_peak_rss():
+    """Reset the kernel's RSS high-water mark (Linux only) so each scenario reports its own peak."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def read_peak_rss_mb():
+    """Peak resident set size in MB, from /proc (VmHWM) when available, else getrusage."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+# -----------------------
+# Scenarios
+# -----------------------
+def build_scenarios():
+    """
+    Return {name: callable}. Each callable runs one unit of work through the real code path.
+    Modules are imported lazily so a single scenario can be benchmarked without loading the rest.
+    """
+    def live_process_location():
+        module = load_module("gathering_data/openaq/fetch_live_or_latest_data.py", "bench_fetch_live")
+        return lambda: module.process_location(CJ3_LOCATION)
+
+    def hourly_process_location():
+        module = load_module("gathering_data/openaq/fetch_live_or_latest_data_latest_method.py",
+                             "bench_fetch_live_hours")
+        return lambda: module.process_location(CJ3_LOCATION)
+
+    def time_range_process_location():
+        module = load_module("gathering_data/openaq/fetch_latest_time_range.py", "bench_time_range")
+        return lambda: module.process_location(CJ3_LOCATION, START_DATE, END_DATE)
+
+    def filtering_time_range():
+        module = load_module("gathering_data/openaq/filtering_api_data.py", "bench_filtering")
+        return lambda: module.process_location(CJ3_LOCATION, START_DATE, END_DATE)
+
+    def near_locations():
+        module = load_module("gathering_data/openaq/fetch_live_or_latest_data.py", "bench_fetch_live")
+        return lambda: module.get_near_locations(HOME_LAT, HOME_LON, radius=12000, limit=10)
+
+    def locations_near_records():
+        module = load_module("gathering_data/openaq/first_contact/get_live_measurements_for_location.py",
+                             "bench_first_contact_live")
+        return lambda: module.get_locations_near(HOME_LAT, HOME_LON, radius=12000, limit=10)
+
+    def nearest_aqi_points():
+        module = load_module("gathering_data/aqi_cn/second_contact/geolocation_nearest_3_stations.py",
+                             "bench_waqi_nearest")
+        token = os.environ["aqi_cn_token"]
+
+        def run():
+            points = module.get_nearest_aqi_points(HOME_LAT, HOME_LON, token, num_points=1)
+            for point in points:
+                module.get_station_feed(point.get("uid"), token)
+            return points
+        return run
+
+    return {
+        "openaq_live_process_location": live_process_location,
+        "openaq_hours_process_location": hourly_process_location,
+        "openaq_time_range_process_location": time_range_process_location,
+        "openaq_filtering_time_range": filtering_time_range,
+        "openaq_near_locations": near_locations,
+        "openaq_locations_near_records": locations_near_records,
+        "waqi_nearest_aqi_points": nearest_aqi_points,
+    }
+
+
+def run_scenario(name, factory, replay, iterations, concurrency, warmup=1):
+    """Run one scenario and return its metrics dict."""
+    run_once = factory()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            run_once()
+
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def timed_call(_):
+        t0 = time.perf_counter()
+        run_once()
+        elapsed = time.perf_counter() - t0
+        with latencies_lock:
+            latencies.append(elapsed)
+
+    reset_peak_rss()
+    requests_before = replay.request_count
+    sink = open(os.devnull, "w")
+    wall_start = time.perf_counter()
+    with contextlib.redirect_stdout(sink):
+        if concurrency <= 1:
+            for i in range(iterations):
+                timed_call(i)
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                list(pool.map(timed_call, range(iterations)))
+    wall = time.perf_counter() - wall_start
+    sink.close()
+    http_requests = replay.request_count - requests_before
+
+    latencies.sort()
+    return {
+        "calls": iterations,
+        "http_requests": http_requests,
+        "wall_s": round(wall, 4),
+        "calls_per_s": round(iterations / wall, 2) if wall else None,
+        "requests_per_s": round(http_requests / wall, 2) if wall else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "peak_rss_mb": round(read_peak_rss_mb(), 1),
+    }
+
+
+# -----------------------
+# Baseline Comparison
+# -----------------------
+# metric -> True when a higher value is better
+COMPARED_METRICS = {
+    "requests_per_s": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "peak_rss_mb": False,
+}
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Print the relative change of every metric against the baseline and return the list of
+    (scenario, metric, change) that regressed by more than `tolerance` (a fraction, e.g. 0.15).
+    """
+    regressions = []
+    print(f"\nComparison against baseline (tolerance {tolerance:.0%}):")
+    for name, metrics in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            print(f"  {name}: no baseline entry, skipped")
+            continue
+        print(f"  {name}:")
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = base.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > tolerance:
+                flag = "  <-- REGRESSION"
+                regressions.append((name, metric, change))
+            elif -worse > tolerance:
+                flag = "  (improved)"
+            print(f"    {metric:>15}: {old:>10} -> {new:>10} ({change:+.1%}){flag}")
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'scenario':<38}{'req/s':>10}{'calls/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'RSS MB':>9}")
+    for name, m in results.items():
+        print(f"{name:<38}{m['requests_per_s']:>10}{m['calls_per_s']:>10}"
+              f"{m['p50_ms']:>10}{m['p95_ms']:>10}{m['p99_ms']:>10}{m['peak_rss_mb']:>9}")
+
+
+# -----------------------
+# Main Workflow
+# -----------------------
+def main(argv=None):
+    scenarios = build_scenarios()
+    parser = argparse.ArgumentParser(description="Replay recorded OpenAQ/WAQI responses through the pipeline.")
+    parser.add_argument("--scenarios", default=",".join(scenarios),
+                        help="Comma-separated scenario names (default: all).")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Simulated network latency per request.")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare the results against this JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    selected = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in selected if s not in scenarios]
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(unknown)}. Available: {', '.join(scenarios)}")
+
+    settings = {
+        "iterations": args.iterations,
+        "concurrency": args.concurrency,
+        "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "python": sys.version.split()[0],
+    }
+    print(f"Benchmark settings: {settings}")
+
+    results = {}
+    with FixtureReplay(args.fixtures, args.latency_ms, args.jitter_ms, args.seed) as replay:
+        for name in selected:
+            print(f"Running {name} ...")
+            results[name] = run_scenario(name, scenarios[name], replay, args.iterations, args.concurrency)
+        if replay.unmatched:
+            print(f"Warning: {len(replay.unmatched)} request(s) had no fixture, e.g. {replay.unmatched[0]}")
+
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"settings": settings, "scenarios": results}, f, indent=2)
+        print(f"\nSaved baseline to '{args.save_baseline}'.")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("settings", {}).get("latency_ms") != args.latency_ms:
+            print("Note: baseline was recorded with a different simulated latency.")
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions and args.fail_on_regression:
+            print(f"\n{len(regressions)} metric(s) regressed beyond tolerance.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
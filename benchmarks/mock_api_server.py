@@ -0,0 +1,649 @@
+"""
+Local stand-in for the OpenAQ v3 and WAQI APIs, for load testing without burning quota.
+
+The server generates a deterministic synthetic world (countries, monitoring locations,
+sensors with hourly series, WAQI stations - partly co-located with the OpenAQ ones) and
+serves the endpoints this repository calls. Latency, 5xx errors and 429s can be injected.
+
+Start it:
+    python benchmarks/mock_api_server.py --stations 20000 --latency-ms 30 --error-rate 0.01 --rps-limit 60
+
+Point the scripts at it through the base-URL overrides (in .env or the environment):
+    openaq_base_url=http://127.0.0.1:8765/v3
+    aqi_cn_base_url=http://127.0.0.1:8765
+
+Served endpoints:
+    /v3/locations, /v3/locations/{id}, /v3/countries, /v3/countries/{id},
+    /v3/sensors/{id}, /v3/sensors/{id}/hours, /v3/sensors/{id}/measurements,
+    /feed/{city}/, /feed/@{uid}/, /feed/geo:{lat};{lon}/, /search/,
+    /map/bounds, /v2/map/bounds
+    /__stats  (request counters of the mock itself)
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import radians, sin, cos, sqrt, atan2
+from urllib.parse import urlparse, parse_qs
+
+# -----------------------
+# Synthetic World Definition
+# -----------------------
+# id, code, name, bbox (min_lon, min_lat, max_lon, max_lat); ids follow the ones noted in fetch_countries.py
+COUNTRIES = [
+    (74, "RO", "Romania", (20.3, 43.7, 29.6, 48.2)),
+    (22, "FR", "France", (-4.7, 42.4, 8.2, 51.0)),
+    (111, "TH", "Thailand", (97.4, 5.7, 105.6, 20.4)),
+    (155, "US", "United States", (-124.7, 25.1, -67.0, 49.3)),
+    (79, "GB", "United Kingdom", (-8.1, 50.0, 1.7, 58.6)),
+    (9, "DE", "Germany", (5.9, 47.3, 15.0, 55.0)),
+    (58, "IN", "India", (68.2, 8.1, 97.4, 35.5)),
+    (45, "PL", "Poland", (14.1, 49.0, 24.1, 54.8)),
+]
+
+# id, name, units, displayName, typical value, amplitude of the daily cycle
+PARAMETERS = [
+    (4, "co", "µg/m³", "CO mass", 400.0, 150.0),
+    (5, "no2", "µg/m³", "NO₂ mass", 25.0, 15.0),
+    (3, "o3", "µg/m³", "O₃ mass", 60.0, 30.0),
+    (1, "pm10", "µg/m³", "PM10", 30.0, 15.0),
+    (2, "pm25", "µg/m³", "PM2.5", 15.0, 8.0),
+    (6, "so2", "µg/m³", "SO₂ mass", 8.0, 4.0),
+]
+
+WAQI_POLLUTANTS = ["pm25", "pm10", "o3", "no2", "so2", "co"]
+
+GRID_DEG = 1.0  # spatial index cell size
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Calculate the great-circle distance (in meters) between two points on Earth."""
+    R = 6371000  # Earth's radius in meters
+    phi1, phi2 = radians(lat1), radians(lat2)
+    delta_phi = radians(lat2 - lat1)
+    delta_lambda = radians(lon2 - lon1)
+    a = sin(delta_phi / 2) ** 2 + cos(phi1) * cos(phi2) * sin(delta_lambda / 2) ** 2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return R * c
+
+
+def iso_utc(epoch):
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_iso(value):
+    """Parse the ISO timestamps the scripts send (with 'Z' or an explicit offset) to epoch seconds."""
+    dt = datetime.fromisoformat(value.strip().replace("Z", "+00:00").replace(" ", "+"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+class SyntheticWorld:
+    """
+    Deterministic set of locations, sensors and WAQI stations. Everything is derived from
+    the seed, so two servers started with the same arguments serve identical data.
+    """
+
+    def __init__(self, stations=2000, waqi_stations=None, overlap=0.6, stale_fraction=0.15,
+                 daily_fraction=0.1, history_days=730, seed=42):
+        self.seed = seed
+        rng = random.Random(seed)
+        now_hour = int(time.time() // 3600 * 3600)
+        self.now_hour = now_hour
+
+        self.countries = [{"id": cid, "code": code, "name": name, "bbox": bbox}
+                          for cid, code, name, bbox in COUNTRIES]
+        self.locations = []
+        self.locations_by_id = {}
+        self.sensors = {}
+        self.grid = {}
+
+        sensor_id = 100000
+        for i in range(stations):
+            country = self.countries[i % len(self.countries)]
+            min_lon, min_lat, max_lon, max_lat = country["bbox"]
+            lat = rng.uniform(min_lat, max_lat)
+            lon = rng.uniform(min_lon, max_lon)
+            location_id = 1000000 + i
+            first_epoch = now_hour - rng.randint(30, history_days) * 86400
+
+            sensors = []
+            for param in rng.sample(PARAMETERS, rng.randint(2, len(PARAMETERS))):
+                pid, pname, units, display, typical, amplitude = param
+                sensor_id += 1
+                roll = rng.random()
+                if roll < stale_fraction:
+                    # Dead sensor: stopped reporting weeks or months ago.
+                    cadence = 3600
+                    last_epoch = now_hour - rng.randint(7, 200) * 86400
+                elif roll < stale_fraction + daily_fraction:
+                    cadence = 86400
+                    # Daily averages are published once the day is complete.
+                    last_epoch = now_hour - now_hour % 86400 - 86400
+                else:
+                    cadence = 3600
+                    # Most hourly sensors publish with a delay of 0-3 hours.
+                    last_epoch = now_hour - rng.choice([0, 0, 0, 1, 1, 2, 3]) * 3600
+                sensor = {
+                    "id": sensor_id,
+                    "name": f"{pname} {units}",
+                    "parameter": {"id": pid, "name": pname, "units": units, "displayName": display},
+                }
+                sensors.append(sensor)
+                self.sensors[sensor_id] = {
+                    "sensor": sensor,
+                    "location_id": location_id,
+                    "typical": typical,
+                    "amplitude": amplitude,
+                    "cadence": cadence,
+                    "first_epoch": first_epoch - first_epoch % cadence,
+                    "last_epoch": last_epoch,
+                }
+
+            last_location_epoch = max(self.sensors[s["id"]]["last_epoch"] for s in sensors)
+            location = {
+                "id": location_id,
+                "name": f"{country['code']}-{i:05d}",
+                "locality": f"Synthetic City {i % 97}",
+                "timezone": "UTC",
+                "country": {"id": country["id"], "code": country["code"], "name": country["name"]},
+                "owner": {"id": 4, "name": "Synthetic Owner"},
+                "provider": {"id": 193, "name": "Mock Provider"},
+                "isMobile": False,
+                "isMonitor": True,
+                "instruments": [{"id": 2, "name": "Government Monitor"}],
+                "sensors": sensors,
+                "coordinates": {"latitude": lat, "longitude": lon},
+                "licenses": [],
+                "bounds": [lon, lat, lon, lat],
+                "datetimeFirst": {"utc": iso_utc(first_epoch), "local": iso_utc(first_epoch)},
+                "datetimeLast": {"utc": iso_utc(last_location_epoch), "local": iso_utc(last_location_epoch)},
+            }
+            self.locations.append(location)
+            self.locations_by_id[location_id] = location
+            self.grid.setdefault(self._cell(lat, lon), []).append(location)
+
+        # WAQI stations: part co-located (within ~50 m) with OpenAQ locations, the rest independent.
+        if waqi_stations is None:
+            waqi_stations = stations
+        self.waqi = []
+        self.waqi_by_uid = {}
+        self.waqi_grid = {}
+        for j in range(waqi_stations):
+            if self.locations and rng.random() < overlap:
+                source = self.locations[rng.randrange(len(self.locations))]
+                lat = source["coordinates"]["latitude"] + rng.uniform(-0.0004, 0.0004)
+                lon = source["coordinates"]["longitude"] + rng.uniform(-0.0004, 0.0004)
+                pollutants = [s["parameter"]["name"] for s in source["sensors"]]
+                name = f"{source['locality']}, {source['name']}"
+            else:
+                country = self.countries[j % len(self.countries)]
+                min_lon, min_lat, max_lon, max_lat = country["bbox"]
+                lat = rng.uniform(min_lat, max_lat)
+                lon = rng.uniform(min_lon, max_lon)
+                pollutants = rng.sample(WAQI_POLLUTANTS, rng.randint(2, len(WAQI_POLLUTANTS)))
+                name = f"Station {j}, {country['name']}"
+            station = {"uid": 5000 + j, "lat": lat, "lon": lon, "name": name, "pollutants": pollutants}
+            self.waqi.append(station)
+            self.waqi_by_uid[station["uid"]] = station
+            self.waqi_grid.setdefault(self._cell(lat, lon), []).append(station)
+
+    # -----------------------
+    # Spatial helpers
+    # -----------------------
+    @staticmethod
+    def _cell(lat, lon):
+        return int(lat // GRID_DEG), int(lon // GRID_DEG)
+
+    def _in_box(self, grid, min_lat, min_lon, max_lat, max_lon):
+        for cell_lat in range(int(min_lat // GRID_DEG), int(max_lat // GRID_DEG) + 1):
+            for cell_lon in range(int(min_lon // GRID_DEG), int(max_lon // GRID_DEG) + 1):
+                yield from grid.get((cell_lat, cell_lon), ())
+
+    def locations_in_box(self, min_lat, min_lon, max_lat, max_lon):
+        return [loc for loc in self._in_box(self.grid, min_lat, min_lon, max_lat, max_lon)
+                if min_lat <= loc["coordinates"]["latitude"] <= max_lat
+                and min_lon <= loc["coordinates"]["longitude"] <= max_lon]
+
+    def locations_near(self, lat, lon, radius):
+        delta = radius / 111000.0 + 0.01
+        lon_delta = delta / max(cos(radians(lat)), 0.01)
+        candidates = self.locations_in_box(lat - delta, lon - lon_delta, lat + delta, lon + lon_delta)
+        return [loc for loc in candidates
+                if haversine(lat, lon, loc["coordinates"]["latitude"], loc["coordinates"]["longitude"]) <= radius]
+
+    def waqi_in_box(self, min_lat, min_lon, max_lat, max_lon):
+        return [s for s in self._in_box(self.waqi_grid, min_lat, min_lon, max_lat, max_lon)
+                if min_lat <= s["lat"] <= max_lat and min_lon <= s["lon"] <= max_lon]
+
+    def waqi_nearest(self, lat, lon):
+        return min(self.waqi, key=lambda s: haversine(lat, lon, s["lat"], s["lon"]), default=None)
+
+    # -----------------------
+    # Values
+    # -----------------------
+    def value_at(self, sensor_id, epoch):
+        """Deterministic value of a sensor for the period starting at `epoch` (daily cycle plus noise)."""
+        info = self.sensors[sensor_id]
+        rng = random.Random(sensor_id * 1000003 + int(epoch // 3600))
+        hour = (epoch // 3600) % 24
+        cycle = sin((hour - 8) / 24.0 * 2 * 3.141592653589793)
+        return round(max(0.0, info["typical"] + info["amplitude"] * cycle + rng.gauss(0, info["amplitude"] / 3)), 3)
+
+    def series_epochs(self, sensor_id, date_from=None, date_to=None):
+        """Start epochs of every period the sensor has data for within [date_from, date_to]."""
+        info = self.sensors[sensor_id]
+        cadence = info["cadence"]
+        start = info["first_epoch"]
+        end = info["last_epoch"]
+        if date_from is not None:
+            start = max(start, date_from - (date_from - info["first_epoch"]) % cadence)
+            if start < date_from:
+                start += cadence
+        if date_to is not None:
+            end = min(end, date_to)
+        if end < start:
+            return range(0)
+        return range(int(start), int(end) + 1, cadence)
+
+    def aqi_for(self, station):
+        rng = random.Random(station["uid"] * 7919 + self.now_hour // 3600)
+        return rng.randint(10, 160)
+
+
+# -----------------------
+# Response Builders
+# -----------------------
+def openaq_meta(page, limit, found):
+    return {"name": "openaq-api", "website": "/", "page": page, "limit": limit, "found": found}
+
+
+def measurement_record(world, sensor_id, epoch, label):
+    info = world.sensors[sensor_id]
+    cadence = info["cadence"]
+    period_from = {"utc": iso_utc(epoch), "local": iso_utc(epoch)}
+    period_to = {"utc": iso_utc(epoch + cadence), "local": iso_utc(epoch + cadence)}
+    interval = "01:00:00" if cadence == 3600 else "24:00:00"
+    return {
+        "value": world.value_at(sensor_id, epoch),
+        "flagInfo": {"hasFlags": False},
+        "parameter": dict(info["sensor"]["parameter"], displayName=None),
+        "period": {"label": label, "interval": interval, "datetimeFrom": period_from, "datetimeTo": period_to},
+        "coordinates": None,
+        "summary": None,
+        "coverage": {
+            "expectedCount": 1, "expectedInterval": interval, "observedCount": 1,
+            "observedInterval": interval, "percentComplete": 100.0, "percentCoverage": 100.0,
+            "datetimeFrom": period_from, "datetimeTo": period_to,
+        },
+    }
+
+
+def waqi_feed(world, station):
+    aqi = world.aqi_for(station)
+    now = world.now_hour
+    iaqi = {}
+    for k, name in enumerate(station["pollutants"]):
+        rng = random.Random(station["uid"] * 31 + k + now // 3600)
+        iaqi[name] = {"v": round(rng.uniform(5, aqi), 1)}
+    iaqi.update({"t": {"v": 12.0}, "h": {"v": 60.0}, "p": {"v": 1012.0}, "w": {"v": 2.0}})
+    forecast = {}
+    for p, name in enumerate(("o3", "pm10", "pm25", "uvi")):
+        days = []
+        for d in range(-2, 7):
+            rng = random.Random(station["uid"] * 131 + p * 17 + d)
+            avg = rng.randint(5, 80)
+            day = datetime.fromtimestamp(now + d * 86400, tz=timezone.utc).strftime("%Y-%m-%d")
+            days.append({"avg": avg, "day": day, "max": avg + rng.randint(0, 20), "min": max(0, avg - rng.randint(0, 10))})
+        forecast[name] = days
+    return {
+        "aqi": aqi,
+        "idx": station["uid"],
+        "attributions": [{"url": "https://waqi.info/", "name": "World Air Quality Index Project"}],
+        "city": {"geo": [station["lat"], station["lon"]], "name": station["name"], "url": "", "location": ""},
+        "dominentpol": station["pollutants"][0] if station["pollutants"] else "pm25",
+        "iaqi": iaqi,
+        "time": {"s": iso_utc(now).replace("T", " ").rstrip("Z"), "tz": "+00:00", "v": now, "iso": iso_utc(now)},
+        "forecast": {"daily": forecast},
+        "debug": {"sync": iso_utc(now)},
+    }
+
+
+# -----------------------
+# HTTP Handler
+# -----------------------
+class MockAPIHandler(BaseHTTPRequestHandler):
+    server_version = "MockAirQualityAPI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    ROUTES = [
+        (re.compile(r"^/v3/locations/?$"), "openaq_locations"),
+        (re.compile(r"^/v3/locations/(\d+)/?$"), "openaq_location"),
+        (re.compile(r"^/v3/countries/?$"), "openaq_countries"),
+        (re.compile(r"^/v3/countries/(\d+)/?$"), "openaq_country"),
+        (re.compile(r"^/v3/sensors/(\d+)/?$"), "openaq_sensor"),
+        (re.compile(r"^/v3/sensors/(\d+)/(hours|measurements)/?$"), "openaq_sensor_series"),
+        (re.compile(r"^(?:/v2)?/map/bounds/?$"), "waqi_bounds"),
+        (re.compile(r"^/feed/@(\d+)/?$"), "waqi_feed_uid"),
+        (re.compile(r"^/feed/geo:([-\d.]+);([-\d.]+)/?$"), "waqi_feed_geo"),
+        (re.compile(r"^/feed/([^/]+)/?$"), "waqi_feed_city"),
+        (re.compile(r"^/search/?$"), "waqi_search"),
+        (re.compile(r"^/__stats/?$"), "stats"),
+    ]
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    # -----------------------
+    # Plumbing
+    # -----------------------
+    def _send_json(self, status, payload, extra_headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        if status == 200 and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            self.server.count("304")
+            return
+        encoding = None
+        if len(body) > 1024 and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            body = gzip.compress(body, compresslevel=5)
+            encoding = "gzip"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        if status == 200:
+            self.send_header("ETag", etag)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(str(status))
+
+    def _query(self):
+        return {k: v[-1] for k, v in parse_qs(urlparse(self.path).query).items()}
+
+    def do_GET(self):
+        server = self.server
+        path = urlparse(self.path).path
+        is_openaq = path.startswith("/v3/")
+
+        if server.latency_ms or server.jitter_ms:
+            delay = server.latency_ms + server.random_uniform(-server.jitter_ms, server.jitter_ms)
+            if delay > 0:
+                time.sleep(delay / 1000.0)
+
+        for pattern, handler_name in self.ROUTES:
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            return self._send_json(404, {"detail": "Not Found"})
+
+        if handler_name == "stats":
+            return self._send_json(200, server.snapshot_stats())
+
+        # Authentication: OpenAQ uses the X-API-Key header, WAQI a token query parameter.
+        query = self._query()
+        api_key = self.headers.get("X-API-Key") if is_openaq else query.get("token")
+        if not api_key:
+            if is_openaq:
+                return self._send_json(401, {"detail": "Unauthorized. A valid API key must be provided."})
+            return self._send_json(200, {"status": "error", "data": "Invalid key"})
+
+        if not server.allow(api_key):
+            return self._send_json(429, {"detail": "Too many requests"}, {"Retry-After": "1"})
+        roll = server.random_uniform(0, 1)
+        if roll < server.throttle_rate:
+            return self._send_json(429, {"detail": "Too many requests"}, {"Retry-After": "1"})
+        if roll < server.throttle_rate + server.error_rate:
+            return self._send_json(500, {"detail": "Internal Server Error (injected)"})
+
+        try:
+            return getattr(self, handler_name)(query, *match.groups())
+        except (ValueError, KeyError) as e:
+            return self._send_json(422, {"detail": f"Invalid request: {e}"})
+
+    # -----------------------
+    # OpenAQ endpoints
+    # -----------------------
+    def _paged(self, query, items, default_limit=100):
+        limit = min(int(query.get("limit", default_limit)), 1000)
+        page = max(int(query.get("page", 1)), 1)
+        start = (page - 1) * limit
+        return page, limit, items[start:start + limit]
+
+    def openaq_locations(self, query):
+        world = self.server.world
+        if "coordinates" in query:
+            lat, lon = (float(v) for v in query["coordinates"].split(","))
+            radius = min(float(query.get("radius", 1000)), 25000)
+            items = world.locations_near(lat, lon, radius)
+        elif "bbox" in query:
+            min_lon, min_lat, max_lon, max_lat = (float(v) for v in query["bbox"].split(","))
+            items = world.locations_in_box(min_lat, min_lon, max_lat, max_lon)
+        else:
+            items = world.locations
+        if "countries_id" in query:
+            wanted = {int(v) for v in query["countries_id"].split(",")}
+            items = [loc for loc in items if loc["country"]["id"] in wanted]
+        if "iso" in query:
+            items = [loc for loc in items if loc["country"]["code"] == query["iso"].upper()]
+        items = sorted(items, key=lambda loc: loc["id"])
+        page, limit, results = self._paged(query, items)
+        return self._send_json(200, {"meta": openaq_meta(page, limit, len(items)), "results": results})
+
+    def openaq_location(self, query, location_id):
+        location = self.server.world.locations_by_id.get(int(location_id))
+        if location is None:
+            return self._send_json(404, {"detail": "Location not found"})
+        return self._send_json(200, {"meta": openaq_meta(1, 100, 1), "results": [location]})
+
+    def _country_record(self, country):
+        return {"id": country["id"], "code": country["code"], "name": country["name"],
+                "datetimeFirst": "2016-01-30T01:00:00Z", "datetimeLast": iso_utc(self.server.world.now_hour),
+                "parameters": [{"id": p[0], "name": p[1], "units": p[2], "displayName": p[3]} for p in PARAMETERS]}
+
+    def openaq_countries(self, query):
+        items = [self._country_record(c) for c in self.server.world.countries]
+        page, limit, results = self._paged(query, items)
+        return self._send_json(200, {"meta": openaq_meta(page, limit, len(items)), "results": results})
+
+    def openaq_country(self, query, country_id):
+        for country in self.server.world.countries:
+            if country["id"] == int(country_id):
+                return self._send_json(200, {"meta": openaq_meta(1, 100, 1), "results": [self._country_record(country)]})
+        return self._send_json(404, {"detail": "Country not found"})
+
+    def openaq_sensor(self, query, sensor_id):
+        world = self.server.world
+        info = world.sensors.get(int(sensor_id))
+        if info is None:
+            return self._send_json(404, {"detail": "Sensor not found"})
+        record = dict(info["sensor"])
+        record["datetimeFirst"] = {"utc": iso_utc(info["first_epoch"]), "local": iso_utc(info["first_epoch"])}
+        record["datetimeLast"] = {"utc": iso_utc(info["last_epoch"]), "local": iso_utc(info["last_epoch"])}
+        record["latest"] = {"datetime": record["datetimeLast"], "value": world.value_at(int(sensor_id), info["last_epoch"]),
+                            "coordinates": world.locations_by_id[info["location_id"]]["coordinates"]}
+        return self._send_json(200, {"meta": openaq_meta(1, 100, 1), "results": [record]})
+
+    def openaq_sensor_series(self, query, sensor_id, kind):
+        world = self.server.world
+        sensor_id = int(sensor_id)
+        if sensor_id not in world.sensors:
+            return self._send_json(404, {"detail": "Sensor not found"})
+        date_from = parse_iso(query["date_from"]) if "date_from" in query else None
+        date_to = parse_iso(query["date_to"]) if "date_to" in query else None
+        epochs = world.series_epochs(sensor_id, date_from, date_to)
+        limit = min(int(query.get("limit", 100)), 1000)
+        page = max(int(query.get("page", 1)), 1)
+        found = len(epochs)
+        if query.get("sort", "asc") == "desc":
+            epochs = epochs[::-1]
+        selected = epochs[(page - 1) * limit:page * limit]
+        label = "1hour" if kind == "hours" else "raw"
+        results = [measurement_record(world, sensor_id, epoch, label) for epoch in selected]
+        return self._send_json(200, {"meta": openaq_meta(page, limit, found), "results": results})
+
+    # -----------------------
+    # WAQI endpoints
+    # -----------------------
+    def waqi_bounds(self, query):
+        world = self.server.world
+        lat1, lng1, lat2, lng2 = (float(v) for v in query["latlng"].split(","))
+        stations = world.waqi_in_box(min(lat1, lat2), min(lng1, lng2), max(lat1, lat2), max(lng1, lng2))
+        cap = self.server.bounds_cap
+        if cap and len(stations) > cap:
+            # Like the real endpoint, an oversized box silently returns only part of its stations.
+            stations = sorted(stations, key=lambda s: s["uid"])[:cap]
+        data = [{"lat": s["lat"], "lon": s["lon"], "uid": s["uid"], "aqi": str(world.aqi_for(s)),
+                 "station": {"name": s["name"], "time": iso_utc(world.now_hour)}} for s in stations]
+        return self._send_json(200, {"status": "ok", "data": data})
+
+    def waqi_feed_uid(self, query, uid):
+        station = self.server.world.waqi_by_uid.get(int(uid))
+        if station is None:
+            return self._send_json(200, {"status": "error", "data": "Unknown station"})
+        return self._send_json(200, {"status": "ok", "data": waqi_feed(self.server.world, station)})
+
+    def waqi_feed_geo(self, query, lat, lon):
+        station = self.server.world.waqi_nearest(float(lat), float(lon))
+        if station is None:
+            return self._send_json(200, {"status": "error", "data": "Unknown station"})
+        return self._send_json(200, {"status": "ok", "data": waqi_feed(self.server.world, station)})
+
+    def waqi_feed_city(self, query, city):
+        keyword = city.lower()
+        for station in self.server.world.waqi:
+            if keyword in station["name"].lower():
+                return self._send_json(200, {"status": "ok", "data": waqi_feed(self.server.world, station)})
+        return self._send_json(200, {"status": "error", "data": "Unknown station"})
+
+    def waqi_search(self, query):
+        world = self.server.world
+        keyword = query.get("keyword", "").lower()
+        matches = [s for s in world.waqi if keyword in s["name"].lower()][:50]
+        data = [{"uid": s["uid"], "aqi": str(world.aqi_for(s)),
+                 "time": {"tz": "+00:00", "stime": iso_utc(world.now_hour), "vtime": world.now_hour},
+                 "station": {"name": s["name"], "geo": [s["lat"], s["lon"]], "url": ""}} for s in matches]
+        return self._send_json(200, {"status": "ok", "data": data})
+
+
+class MockAPIServer(ThreadingHTTPServer):
+    """HTTP server holding the synthetic world, the failure-injection settings and request counters."""
+    daemon_threads = True
+
+    def __init__(self, address, world, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, throttle_rate=0.0,
+                 rps_limit=0.0, bounds_cap=0, seed=0, verbose=False):
+        super().__init__(address, MockAPIHandler)
+        self.world = world
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rps_limit = rps_limit
+        self.bounds_cap = bounds_cap
+        self.verbose = verbose
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._counts = {}
+        self._started = time.time()
+
+    def random_uniform(self, a, b):
+        with self._lock:
+            return self._random.uniform(a, b)
+
+    def allow(self, api_key):
+        """Token bucket per API key: `rps_limit` requests per second with a burst of the same size."""
+        if not self.rps_limit:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(api_key, (self.rps_limit, now))
+            tokens = min(self.rps_limit, tokens + (now - last) * self.rps_limit)
+            if tokens < 1:
+                self._buckets[api_key] = (tokens, now)
+                return False
+            self._buckets[api_key] = (tokens - 1, now)
+            return True
+
+    def count(self, status):
+        with self._lock:
+            self._counts[status] = self._counts.get(status, 0) + 1
+
+    def snapshot_stats(self):
+        with self._lock:
+            total = sum(self._counts.values())
+            return {"uptime_s": round(time.time() - self._started, 1), "requests": total,
+                    "by_status": dict(self._counts), "locations": len(self.world.locations),
+                    "sensors": len(self.world.sensors), "waqi_stations": len(self.world.waqi)}
+
+
+def start_server(host="127.0.0.1", port=0, **kwargs):
+    """
+    Build a world and start the server on a background thread (port 0 picks a free port).
+    Returns (server, thread); the base URLs are http://host:server.server_port[/v3].
+    """
+    world_keys = ("stations", "waqi_stations", "overlap", "stale_fraction", "daily_fraction", "history_days", "seed")
+    world = SyntheticWorld(**{k: kwargs.pop(k) for k in world_keys if k in kwargs})
+    server = MockAPIServer((host, port), world, seed=world.seed, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+# -----------------------
+# Main Workflow
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAQ v3 / WAQI API server for load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stations", type=int, default=2000, help="Number of synthetic OpenAQ locations.")
+    parser.add_argument("--waqi-stations", type=int, default=None, help="Number of WAQI stations (default: same).")
+    parser.add_argument("--overlap", type=float, default=0.6, help="Fraction of WAQI stations co-located with OpenAQ.")
+    parser.add_argument("--stale-fraction", type=float, default=0.15, help="Fraction of sensors that stopped reporting.")
+    parser.add_argument("--history-days", type=int, default=730)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with a 429.")
+    parser.add_argument("--rps-limit", type=float, default=0.0, help="Per-key requests/second before 429s (0 = off).")
+    parser.add_argument("--bounds-cap", type=int, default=400, help="Max stations per map/bounds reply (0 = off).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    world = SyntheticWorld(stations=args.stations, waqi_stations=args.waqi_stations, overlap=args.overlap,
+                           stale_fraction=args.stale_fraction, history_days=args.history_days, seed=args.seed)
+    print(f"Generated {len(world.locations)} locations, {len(world.sensors)} sensors and "
+          f"{len(world.waqi)} WAQI stations in {time.perf_counter() - t0:.1f}s")
+    server = MockAPIServer((args.host, args.port), world, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           error_rate=args.error_rate, throttle_rate=args.throttle_rate, rps_limit=args.rps_limit,
+                           bounds_cap=args.bounds_cap, seed=args.seed, verbose=args.verbose)
+    print(f"Mock API listening on http://{args.host}:{server.server_port}")
+    print(f"  openaq_base_url=http://{args.host}:{server.server_port}/v3")
+    print(f"  aqi_cn_base_url=http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Local stand-in for the Microsoft Graph v1.0 endpoints used by Mind_Framework/graphAPI_secondContact.py.
+
+It serves a synthetic tenant (users, groups, the signed-in user's messages) with Graph's
+paging, JSON batching and delta query semantics:
+
+    paging   collections return at most $top items (default 100, max 999) and an
+             @odata.nextLink carrying a $skiptoken
+    $batch   POST /v1.0/$batch with up to 20 requests; more is a 400 like the real service
+    delta    /users/delta and /groups/delta page through everything, then end with an
+             @odata.deltaLink; calling it later returns only the items changed since,
+             deleted ones as {"id": ..., "@removed": {"reason": "deleted"}}
+
+Every item carries a version; POST /__mutate?count=N changes N random items (and deletes
+or adds a few) so delta syncs have something to pick up. 429s with Retry-After can be
+injected. Any bearer token is accepted, but one is required.
+
+Start it:
+    python benchmarks/mock_graph_server.py --port 8766 --users 20000 --latency-ms 20
+
+Point the script at it:
+    graph_base_url=http://127.0.0.1:8766/v1.0
+
+Served endpoints:
+    /v1.0/me, /v1.0/me/messages, /v1.0/users, /v1.0/users/{id}, /v1.0/users/{id}/manager,
+    /v1.0/users/delta, /v1.0/groups, /v1.0/groups/{id}, /v1.0/groups/delta,
+    POST /v1.0/$batch, POST /__mutate, GET /__stats
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+DEFAULT_PAGE = 100
+MAX_PAGE = 999
+MAX_BATCH = 20
+FIRST_NAMES = ["Ana", "Mihai", "Elena", "Andrei", "Ioana", "Radu", "Maria", "Vlad", "Irina", "Dan"]
+LAST_NAMES = ["Pop", "Ionescu", "Popescu", "Stan", "Dumitru", "Matei", "Rusu", "Marin", "Toma", "Lazar"]
+DEPARTMENTS = ["Research", "Operations", "Field Sensors", "Data", "Sales", "Support"]
+
+
+# -----------------------
+# Synthetic Tenant
+# -----------------------
+class Tenant:
+    """Users, groups and messages with a global change counter (the delta token)."""
+
+    def __init__(self, users=5000, groups=300, messages=2000, seed=0):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.version = 0
+        self.collections = {"users": {}, "groups": {}, "messages": {}}
+        self.removed = {"users": {}, "groups": {}, "messages": {}}  # id -> version of the deletion
+        for i in range(users):
+            self._put("users", self._user(i))
+        for i in range(groups):
+            self._put("groups", {"id": f"g-{i:06d}", "displayName": f"{self.rng.choice(DEPARTMENTS)} team {i}",
+                                 "mailEnabled": self.rng.random() < 0.5, "securityEnabled": True})
+        start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for i in range(messages):
+            received = start + timedelta(minutes=37 * i)
+            self._put("messages", {"id": f"m-{i:07d}", "subject": f"Sensor report #{i}",
+                                   "receivedDateTime": received.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                                   "isRead": self.rng.random() < 0.7})
+        self.me = dict(self.collections["users"]["u-000000"])
+        self.next_user = users
+
+    def _user(self, i):
+        first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+        return {"id": f"u-{i:06d}", "displayName": f"{first} {last}", "givenName": first, "surname": last,
+                "mail": f"{first}.{last}.{i}@contoso.example".lower(), "jobTitle": "Engineer",
+                "department": self.rng.choice(DEPARTMENTS), "manager": f"u-{i // 10:06d}" if i else None}
+
+    def _put(self, collection, item):
+        self.version += 1
+        item["_version"] = self.version
+        self.collections[collection][item["id"]] = item
+        self.removed[collection].pop(item["id"], None)
+
+    def mutate(self, count):
+        """Update `count` random users/groups, delete and add a few; returns what changed."""
+        with self.lock:
+            changed = {"updated": 0, "deleted": 0, "added": 0}
+            for _ in range(count):
+                collection = "users" if self.rng.random() < 0.8 else "groups"
+                items = self.collections[collection]
+                if not items:
+                    continue
+                item_id = self.rng.choice(list(items))
+                roll = self.rng.random()
+                if roll < 0.05:
+                    del items[item_id]
+                    self.version += 1
+                    self.removed[collection][item_id] = self.version
+                    changed["deleted"] += 1
+                elif roll < 0.1 and collection == "users":
+                    self._put("users", self._user(self.next_user))
+                    self.next_user += 1
+                    changed["added"] += 1
+                else:
+                    item = dict(items[item_id])
+                    if collection == "users":
+                        item["department"] = self.rng.choice(DEPARTMENTS)
+                    else:
+                        item["displayName"] = item["displayName"].split(" (")[0] + f" (v{self.version})"
+                    self._put(collection, item)
+                    changed["updated"] += 1
+            return changed
+
+    def listing(self, collection):
+        with self.lock:
+            return sorted(self.collections[collection].values(), key=lambda item: item["id"])
+
+    def changes_since(self, collection, version, until):
+        """Items changed or removed after `version`, up to and including `until`."""
+        with self.lock:
+            items = [item for item in self.collections[collection].values() if version < item["_version"] <= until]
+            items.sort(key=lambda item: item["_version"])
+            removed = [{"id": item_id, "@removed": {"reason": "deleted"}}
+                       for item_id, v in sorted(self.removed[collection].items()) if version < v <= until]
+            return items + removed
+
+
+def public(item, select=None):
+    """An item as the API returns it: internal fields dropped, $select applied."""
+    if "@removed" in item:
+        return item
+    fields = {k: v for k, v in item.items() if not k.startswith("_")}
+    if select:
+        fields = {k: v for k, v in fields.items() if k == "id" or k in select}
+    return fields
+
+
+# -----------------------
+# HTTP Handler
+# -----------------------
+class MockGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    def _send_json(self, status, payload, extra_headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(str(status))
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _admit(self):
+        """Auth and throttling shared by GET and POST; returns an error reply or None."""
+        if self.server.latency_ms:
+            time.sleep(self.server.latency_ms / 1000)
+        if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+            return 401, {"error": {"code": "InvalidAuthenticationToken", "message": "Access token is empty."}}, None
+        if self.server.random_uniform(0, 1) < self.server.throttle_rate:
+            return 429, {"error": {"code": "TooManyRequests", "message": "Throttled (injected)"}}, {"Retry-After": "1"}
+        return None
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/__stats":
+            return self._send_json(200, self.server.snapshot_stats())
+        denied = self._admit()
+        if denied:
+            return self._send_json(*denied)
+        status, payload = self.server.route("GET", self.path)
+        return self._send_json(status, payload)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            body = self._read_json()  # read before any reply, or the kept-alive connection desyncs
+        except ValueError:
+            return self._send_json(400, {"error": {"code": "BadRequest", "message": "Invalid JSON body"}})
+        if url.path == "/__mutate":
+            count = int(parse_qs(url.query).get("count", ["100"])[0])
+            return self._send_json(200, self.server.tenant.mutate(count))
+        denied = self._admit()
+        if denied:
+            return self._send_json(*denied)
+        if url.path.rstrip("/") != "/v1.0/$batch":
+            return self._send_json(405, {"error": {"code": "BadRequest", "message": "Unsupported POST"}})
+        requests_ = body.get("requests") or []
+        if len(requests_) > MAX_BATCH:
+            return self._send_json(400, {"error": {"code": "BadRequest",
+                                                   "message": f"A batch may hold at most {MAX_BATCH} requests."}})
+        responses = []
+        for request in requests_:
+            headers = {"Content-Type": "application/json"}
+            if self.server.random_uniform(0, 1) < self.server.throttle_rate:
+                status, reply = 429, {"error": {"code": "TooManyRequests", "message": "Throttled (injected)"}}
+                headers["Retry-After"] = "1"
+            else:
+                status, reply = self.server.route(request.get("method", "GET"), "/v1.0/" + request["url"].lstrip("/"))
+            responses.append({"id": request.get("id"), "status": status, "headers": headers, "body": reply})
+        self.server.count_batched(len(requests_))
+        return self._send_json(200, {"responses": responses})
+
+
+class MockGraphServer(ThreadingHTTPServer):
+    """HTTP server holding the tenant, the failure settings and counters."""
+    daemon_threads = True
+
+    def __init__(self, address, tenant, latency_ms=0.0, throttle_rate=0.0, seed=0, verbose=False):
+        super().__init__(address, MockGraphHandler)
+        self.tenant = tenant
+        self.latency_ms = latency_ms
+        self.throttle_rate = throttle_rate
+        self.verbose = verbose
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._batched = 0
+        self._started = time.time()
+
+    def random_uniform(self, a, b):
+        with self._lock:
+            return self._random.uniform(a, b)
+
+    def count(self, status):
+        with self._lock:
+            self._counts[status] = self._counts.get(status, 0) + 1
+
+    def count_batched(self, n):
+        with self._lock:
+            self._batched += n
+
+    def snapshot_stats(self):
+        with self._lock:
+            return {"uptime_s": round(time.time() - self._started, 1), "by_status": dict(self._counts),
+                    "requests": sum(self._counts.values()), "batched_requests": self._batched}
+
+    # -----------------------
+    # Routing
+    # -----------------------
+    def base(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1.0"
+
+    def _page(self, path, items, query, extra=None):
+        top = min(int(query.get("$top", [DEFAULT_PAGE])[0]), MAX_PAGE)
+        skip = int(query.get("$skiptoken", ["0"])[0])
+        select = set(query["$select"][0].split(",")) if "$select" in query else None
+        page = {"value": [public(item, select) for item in items[skip:skip + top]]}
+        if skip + top < len(items):
+            params = {k: v[0] for k, v in query.items()}
+            params["$skiptoken"] = str(skip + top)
+            page["@odata.nextLink"] = f"{self.base()}/{path}?{urlencode(params)}"
+        elif extra:
+            page.update(extra)
+        return page
+
+    def route(self, method, raw_path):
+        """(status, body) for a Graph URL; used for direct requests and for $batch members."""
+        url = urlparse(raw_path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")[1:]  # drop "v1.0"
+        tenant = self.tenant
+        if method != "GET":
+            return 405, {"error": {"code": "BadRequest", "message": f"{method} is not supported"}}
+        if parts == ["me"]:
+            return 200, public(tenant.me)
+        if parts == ["me", "messages"]:
+            return 200, self._page("me/messages", tenant.listing("messages"), query)
+        if len(parts) >= 1 and parts[0] in ("users", "groups"):
+            collection = parts[0]
+            if len(parts) == 1:
+                return 200, self._page(collection, tenant.listing(collection), query)
+            if parts[1] == "delta":
+                return self._delta(collection, query)
+            item = tenant.collections[collection].get(parts[1])
+            if item is None:
+                return 404, {"error": {"code": "Request_ResourceNotFound", "message": f"{parts[1]} not found"}}
+            if len(parts) == 2:
+                select = set(query["$select"][0].split(",")) if "$select" in query else None
+                return 200, public(item, select)
+            if parts[2] == "manager" and collection == "users":
+                manager = tenant.collections["users"].get(item.get("manager") or "")
+                if manager is None:
+                    return 404, {"error": {"code": "Request_ResourceNotFound", "message": "No manager"}}
+                return 200, public(manager)
+        return 404, {"error": {"code": "BadRequest", "message": f"Unsupported path {url.path}"}}
+
+    def _delta(self, collection, query):
+        # Pages of one delta round are pinned to the version at its first page ($snapshot), so
+        # changes made while paging show up in the next round instead of shifting the pages.
+        try:
+            since = int(query["$deltatoken"][0]) if "$deltatoken" in query else None
+            with self.tenant.lock:
+                snapshot = int(query["$snapshot"][0]) if "$snapshot" in query else self.tenant.version
+        except ValueError:
+            return 410, {"error": {"code": "resyncRequired", "message": "The delta token is invalid or expired."}}
+        if since is not None:
+            items = self.tenant.changes_since(collection, since, snapshot)
+        else:
+            items = [item for item in self.tenant.listing(collection) if item["_version"] <= snapshot]
+        page_query = dict(query, **{"$snapshot": [str(snapshot)]})
+        delta_params = {k: v[0] for k, v in query.items() if k not in ("$skiptoken", "$deltatoken", "$snapshot")}
+        delta_params["$deltatoken"] = str(snapshot)
+        return 200, self._page(f"{collection}/delta", items, page_query,
+                               {"@odata.deltaLink": f"{self.base()}/{collection}/delta?{urlencode(delta_params)}"})
+
+
+def start_server(host="127.0.0.1", port=0, tenant=None, **kwargs):
+    """Start the stand-in on a background thread (port 0 picks a free port). Returns (server, thread)."""
+    server = MockGraphServer((host, port), tenant or Tenant(), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+# -----------------------
+# Main Workflow
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Mock Microsoft Graph server for testing the Graph fetcher.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--groups", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with a 429.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    tenant = Tenant(args.users, args.groups, args.messages, args.seed)
+    server = MockGraphServer((args.host, args.port), tenant, latency_ms=args.latency_ms,
+                             throttle_rate=args.throttle_rate, seed=args.seed, verbose=args.verbose)
+    print(f"Mock Graph listening on http://{args.host}:{server.server_port}")
+    print(f"  graph_base_url=http://{args.host}:{server.server_port}/v1.0")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
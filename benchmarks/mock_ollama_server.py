@@ -0,0 +1,232 @@
+"""
+Local stand-in for the Ollama /api/generate endpoint, for testing the vision pipeline
+without a GPU.
+
+It accepts the same JSON body as Ollama (model, prompt, images as base64, options, stream)
+and streams NDJSON chunks the way Ollama does: one {"response": "<token>", "done": false}
+line per token, then a final line with done=true and the timing counters. Request bodies
+may be sent with Content-Length or chunked transfer encoding.
+
+Timing is simulated: a prefill delay (a fixed part plus a part proportional to the image
+payload) before the first token, then a fixed delay per token. Only `--parallel` requests
+generate at once (like OLLAMA_NUM_PARALLEL); the others wait for a slot. Errors and stalled
+streams can be injected to exercise client timeouts.
+
+Start it:
+    python benchmarks/mock_ollama_server.py --port 11435 --parallel 2 --prefill-ms 300 --token-ms 20
+
+Point the scripts at it:
+    ollama_url=http://127.0.0.1:11435
+
+Served endpoints:
+    POST /api/generate, GET /api/tags, GET /__stats
+"""
+import argparse
+import base64
+import binascii
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the image shows a street map with a red marker near an intersection , surrounded by residential "
+         "blocks , a main road running north to south , several side streets , a small park and parking areas "
+         ". traffic appears light on the visible roads .").split()
+
+
+def fake_answer(image_bytes, prompt, n_tokens):
+    """Deterministic token list for an image: same image and prompt give the same answer."""
+    seed = int(hashlib.sha256(image_bytes + prompt.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    start = rng.randrange(len(WORDS))
+    return [(" " if i else "") + WORDS[(start + i) % len(WORDS)] for i in range(n_tokens)]
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+    # -----------------------
+    # Plumbing
+    # -----------------------
+    def _read_body(self):
+        if "chunked" in (self.headers.get("Transfer-Encoding") or "").lower():
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(parts)
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(str(status))
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    # -----------------------
+    # Endpoints
+    # -----------------------
+    def do_GET(self):
+        if self.path.rstrip("/") == "/api/tags":
+            return self._send_json(200, {"models": [{"name": "llava:latest", "model": "llava:latest"}]})
+        if self.path.rstrip("/") == "/__stats":
+            return self._send_json(200, self.server.snapshot_stats())
+        return self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        server = self.server
+        received = time.perf_counter()
+        body = self._read_body()
+        if self.path.rstrip("/") != "/api/generate":
+            return self._send_json(404, {"error": "not found"})
+        try:
+            request = json.loads(body)
+            images = [base64.b64decode(image, validate=True) for image in request.get("images") or []]
+        except (ValueError, binascii.Error) as e:
+            return self._send_json(400, {"error": f"invalid request: {e}"})
+        server.record_payload(len(body))
+        if server.random_uniform(0, 1) < server.error_rate:
+            return self._send_json(500, {"error": "model runner crashed (injected)"})
+
+        model = request.get("model", "llava")
+        prompt = request.get("prompt", "")
+        n_tokens = int((request.get("options") or {}).get("num_predict") or server.tokens)
+        n_tokens = max(1, min(n_tokens, server.tokens))
+        tokens = fake_answer(b"".join(images), prompt, n_tokens)
+        stall = server.random_uniform(0, 1) < server.stall_rate
+
+        with server.slots:
+            started = time.perf_counter()
+            prefill_s = (server.prefill_ms + server.prefill_ms_per_kb * sum(len(i) for i in images) / 1024) / 1000
+            time.sleep(prefill_s)
+            if request.get("stream", True) is False:
+                time.sleep(server.token_ms * n_tokens / 1000)
+                return self._send_json(200, {"model": model, "response": "".join(tokens), "done": True,
+                                             "eval_count": n_tokens})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for i, token in enumerate(tokens):
+                    if stall and i == len(tokens) // 2:
+                        time.sleep(server.stall_s)
+                    self._write_chunk({"model": model, "created_at": datetime.now(timezone.utc).isoformat(),
+                                       "response": token, "done": False})
+                    time.sleep(server.token_ms / 1000)
+                total_ns = int((time.perf_counter() - received) * 1e9)
+                self._write_chunk({"model": model, "created_at": datetime.now(timezone.utc).isoformat(),
+                                   "response": "", "done": True, "done_reason": "stop",
+                                   "total_duration": total_ns, "load_duration": int((started - received) * 1e9),
+                                   "prompt_eval_count": len(re.findall(r"\w+", prompt)) + 576 * len(images),
+                                   "prompt_eval_duration": int(prefill_s * 1e9),
+                                   "eval_count": n_tokens, "eval_duration": int(server.token_ms * n_tokens * 1e6)})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+                server.count("200")
+            except (BrokenPipeError, ConnectionResetError):
+                server.count("client_closed")
+
+
+class MockOllamaServer(ThreadingHTTPServer):
+    """HTTP server holding the timing / failure settings, generation slots and counters."""
+    daemon_threads = True
+
+    def __init__(self, address, parallel=1, prefill_ms=300.0, prefill_ms_per_kb=0.5, token_ms=20.0, tokens=40,
+                 error_rate=0.0, stall_rate=0.0, stall_s=30.0, seed=0, verbose=False):
+        super().__init__(address, MockOllamaHandler)
+        self.slots = threading.Semaphore(parallel)
+        self.prefill_ms = prefill_ms
+        self.prefill_ms_per_kb = prefill_ms_per_kb
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_s = stall_s
+        self.verbose = verbose
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._payload_bytes = 0
+        self._started = time.time()
+
+    def random_uniform(self, a, b):
+        with self._lock:
+            return self._random.uniform(a, b)
+
+    def count(self, status):
+        with self._lock:
+            self._counts[status] = self._counts.get(status, 0) + 1
+
+    def record_payload(self, size):
+        with self._lock:
+            self._payload_bytes += size
+
+    def snapshot_stats(self):
+        with self._lock:
+            return {"uptime_s": round(time.time() - self._started, 1), "by_status": dict(self._counts),
+                    "requests": sum(self._counts.values()), "payload_bytes": self._payload_bytes}
+
+
+def start_server(host="127.0.0.1", port=0, **kwargs):
+    """Start the stand-in on a background thread (port 0 picks a free port). Returns (server, thread)."""
+    server = MockOllamaServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+# -----------------------
+# Main Workflow
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Mock Ollama /api/generate server for testing vision inference.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--parallel", type=int, default=1, help="Requests generating at once.")
+    parser.add_argument("--prefill-ms", type=float, default=300.0, help="Delay before the first token.")
+    parser.add_argument("--prefill-ms-per-kb", type=float, default=0.5, help="Extra prefill per KB of image data.")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="Delay between tokens.")
+    parser.add_argument("--tokens", type=int, default=40, help="Tokens per answer.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 500.")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of streams that stall mid-answer.")
+    parser.add_argument("--stall-s", type=float, default=30.0, help="How long a stalled stream hangs.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    server = MockOllamaServer((args.host, args.port), parallel=args.parallel, prefill_ms=args.prefill_ms,
+                              prefill_ms_per_kb=args.prefill_ms_per_kb, token_ms=args.token_ms, tokens=args.tokens,
+                              error_rate=args.error_rate, stall_rate=args.stall_rate, stall_s=args.stall_s,
+                              seed=args.seed, verbose=args.verbose)
+    print(f"Mock Ollama listening on http://{args.host}:{server.server_port}")
+    print(f"  ollama_url=http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down.")
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+Base URLs of the APIs the scripts talk to, defined once for every script.
+
+Each one can be overridden from the environment (.env) to target a mock server, e.g.
+benchmarks/mock_api_server.py prints the openaq_base_url / aqi_cn_base_url lines to use.
+
+Scripts outside gathering_data/ add this directory to sys.path to import it, e.g.:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from api_endpoints import OPENAQ_BASE_URL
+"""
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OPENAQ_BASE_URL = os.getenv("openaq_base_url", "https://api.openaq.org/v3")
+WAQI_BASE_URL = os.getenv("aqi_cn_base_url", "https://api.waqi.info")
+GOOGLE_MAPS_BASE_URL = os.getenv("google_maps_base_url", "https://maps.googleapis.com/maps/api")
+GRAPH_BASE_URL = os.getenv("graph_base_url", "https://graph.microsoft.com/v1.0")
+OLLAMA_URL = os.getenv("ollama_url", "http://localhost:11434")
@@ -1,9 +1,17 @@
+import argparse
 import requests
 import os
 import json
+import sys
 import matplotlib.pyplot as plt
 from dotenv import load_dotenv
 
+# The forecast store, the region sweep and the API base URLs live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from waqi_forecasts import FORECAST_STORE, open_forecast_table, store_feeds
+from waqi_sweep import DEFAULT_RESULT_CAP, DEFAULT_TILE_DEG, REGIONS, run_sweep
+from api_endpoints import WAQI_BASE_URL
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -12,19 +20,35 @@ API_TOKEN = os.getenv("aqi_cn_token")
 if not API_TOKEN:
     raise ValueError("API token not found. Ensure 'aqi_cn_token' is set in the .env file.")
 
+parser = argparse.ArgumentParser(description="WAQI data around the home location, or every station of a region.")
+parser.add_argument("--sweep", metavar="REGION",
+                    help=f"Snapshot every station of a region ({', '.join(REGIONS)} or a GeoJSON file) instead.")
+parser.add_argument("--out", default=None, help="Sweep snapshot path (default: waqi_stations_<region>.json).")
+parser.add_argument("--workers", type=int, default=8)
+parser.add_argument("--tile-deg", type=float, default=DEFAULT_TILE_DEG)
+parser.add_argument("--cap", type=int, default=DEFAULT_RESULT_CAP)
+args = parser.parse_args()
+
+# ----------------------------
+# Sweep mode: tiled map/bounds requests over a whole region
+# ----------------------------
+if args.sweep:
+    run_sweep(args.sweep, API_TOKEN, args.out, args.workers, tile_deg=args.tile_deg, cap=args.cap)
+    sys.exit(0)
+
 # User's coordinates (home location)
 latitude = 46.7445701195037
 longitude = 23.49587497922032
 
 # API URLs
-geo_url = f"https://api.waqi.info/feed/geo:{latitude};{longitude}/?token={API_TOKEN}"
+geo_url = f"{WAQI_BASE_URL}/feed/geo:{latitude};{longitude}/?token={API_TOKEN}"
 
 # Expanding the boundary (increase from 0.1 to 0.5 for a wider area)
 lat_min = latitude - 0.3
 lat_max = latitude + 0.3
 lng_min = longitude - 0.3
 lng_max = longitude + 0.3
-map_url = f"https://api.waqi.info/map/bounds?token={API_TOKEN}&latlng={lat_min},{lng_min},{lat_max},{lng_max}"
+map_url = f"{WAQI_BASE_URL}/map/bounds?token={API_TOKEN}&latlng={lat_min},{lng_min},{lat_max},{lng_max}"
 
 # Making API requests
 geo_response = requests.get(geo_url)
@@ -53,6 +77,14 @@ with open("map_data.json", "w") as map_file:
     json.dump(map_data, map_file, indent=4)
 print("Air Quality Stations data saved to map_data.json")
 
+# Keep every pollutant's forecast from the feed, not just the PM10 plotted below
+if geo_data and isinstance(geo_data.get("data"), dict):
+    new_issues, rows = store_feeds(open_forecast_table(), [geo_data["data"]])
+    if new_issues:
+        print(f"Stored {rows} forecast rows (pm10, pm25, o3, uvi) in {FORECAST_STORE}")
+    else:
+        print("Forecast for this issue date is already stored")
+
 # ----------------------------
 # Plotting Forecast Data for PM10
 # ----------------------------
@@ -1,7 +1,12 @@
 import requests
 import os
+import sys
 from dotenv import load_dotenv
 
+# Shared API base URLs live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from api_endpoints import WAQI_BASE_URL
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -10,7 +15,7 @@ API_TOKEN = os.getenv("aqi_cn_token")
 CITY = "Cluj"
 
 # API URL
-url = f"https://api.waqi.info/feed/{CITY}/?token={API_TOKEN}"
+url = f"{WAQI_BASE_URL}/feed/{CITY}/?token={API_TOKEN}"
 
 # Make Request
 response = requests.get(url)
@@ -29,7 +34,7 @@ else:
 
 
 # API URL to get stations
-stations_url = f"https://api.waqi.info/search/?token={API_TOKEN}&keyword={CITY}"
+stations_url = f"{WAQI_BASE_URL}/search/?token={API_TOKEN}&keyword={CITY}"
 
 # Make Request
 stations_response = requests.get(stations_url)
@@ -7,6 +7,15 @@ from dotenv import load_dotenv
 import requests
 import math
 import json
+import sys
+
+# Shared helpers (fast JSON decoding, AQI engine, interpolation, change capture, API base URLs) live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from fast_json import compressed_headers, decode_response, describe_payload, WAQI_FEED_RESPONSE, WAQI_MAP_RESPONSE
+from aqi_engine import US_EPA, category, category_name, concentration_from_sub_index
+from spatial_interpolation import bbox_around, interpolate, readings_from_waqi_points
+from change_capture import emit_changes, write_if_changed
+from api_endpoints import WAQI_BASE_URL
 
 # Load environment variables from .env file
 load_dotenv()
@@ -44,12 +53,12 @@ def get_nearest_aqi_points(latitude, longitude, token, num_points=10, initial_ra
 
         # Use the map/bounds endpoint from documentation
         map_url = (
-            f"https://api.waqi.info/v2/map/bounds?"
+            f"{WAQI_BASE_URL}/v2/map/bounds?"
             f"latlng={lat_min},{lng_min},{lat_max},{lng_max}&networks=all&token={token}"
         )
-        response = requests.get(map_url)
-        data = response.json()
-        print("Response: ", data)  # Debug: print raw API response
+        response = requests.get(map_url, headers=compressed_headers())
+        data = decode_response(response, WAQI_MAP_RESPONSE, label="Response")  # print_api_responses=1 dumps it
+        print(f"Map bounds response within {radius_km} km: {describe_payload(data, 'data')}")
 
         if data.get("status") != "ok":
             raise Exception("Error fetching data from API: " + str(data.get("data", "Unknown error")))
@@ -77,6 +86,9 @@ def get_nearest_aqi_points(latitude, longitude, token, num_points=10, initial_ra
 def extract_relevant_data(points):
     """
     Extracts station name and the last measures for O₃, PM₁₀, PM₂.₅, NO₂, and CO₂.
+    WAQI reports each pollutant as a US EPA sub-index, not a concentration, so the entry also
+    carries the overall AQI, its category and the equivalent concentrations in µg/m³
+    (comparable with OpenAQ readings).
     """
     extracted_data = []
     for point in points:
@@ -90,6 +102,15 @@ def extract_relevant_data(points):
             "NO2": iaqi.get("no2", {}).get("v") if "no2" in iaqi else None,
             "CO2": iaqi.get("co2", {}).get("v") if "co2" in iaqi else None
         }
+        sub_indices = {p: iaqi[p].get("v") for p in US_EPA if isinstance(iaqi.get(p, {}).get("v"), (int, float))}
+        if sub_indices:
+            dominant = max(sub_indices, key=sub_indices.get)
+            data_entry["AQI"] = sub_indices[dominant]
+            data_entry["category"] = category_name(category(sub_indices[dominant]))
+            data_entry["dominant_pollutant"] = dominant
+            data_entry["concentrations_ugm3"] = {
+                p: round(float(concentration_from_sub_index(v, p, "µg/m³")), 1) for p, v in sub_indices.items()
+            }
         extracted_data.append(data_entry)
     return extracted_data
 
@@ -99,10 +120,10 @@ def get_station_feed(station_id, token):
     Retrieves the real-time feed data for a given station using its ID.
     The feed endpoint expects an id prefixed with '@'.
     """
-    feed_url = f"https://api.waqi.info/feed/@{station_id}/?token={token}"
-    response = requests.get(feed_url)
-    feed_data = response.json()
-    print(f"Feed response for station id '@{station_id}':", feed_data)  # Debug: print feed response
+    feed_url = f"{WAQI_BASE_URL}/feed/@{station_id}/?token={token}"
+    response = requests.get(feed_url, headers=compressed_headers())
+    feed_data = decode_response(response, WAQI_FEED_RESPONSE,
+                                label=f"Feed response for station id '@{station_id}'")  # print_api_responses=1 dumps it
     if feed_data.get("status") != "ok":
         print(f"Error retrieving feed data for station id '@{station_id}': {feed_data.get('data')}")
         return None
@@ -124,6 +145,16 @@ if __name__ == "__main__":
             json.dump(basic_data, f, indent=4)
         print("Basic station data saved to aqi_data.json")
 
+        # Interpolate an AQI surface (100 m cells) from the stations instead of only reporting
+        # the station values, and read it at the home location.
+        lats, lons, values = readings_from_waqi_points(nearest_points)
+        if values.size:
+            radius_m = 1000 * max(p["distance"] for p in nearest_points)
+            surface = interpolate(lats, lons, values, bbox_around(latitude, longitude, radius_m), resolution_m=100)
+            surface.save("aqi_surface.npz")
+            print(f"Interpolated AQI at home: {surface.value_at(latitude, longitude):.0f} "
+                  f"(surface of {surface.grid.shape[0]}x{surface.grid.shape[1]} cells saved to aqi_surface.npz)")
+
         # For each of the nearest stations, get detailed feed data using station id
         detailed_feeds = []
         for point in nearest_points:
@@ -137,8 +168,16 @@ if __name__ == "__main__":
                     "data": feed
                 })
 
-        with open("aqi_feed_data.json", "w") as f:
-            json.dump(detailed_feeds, f, indent=4)
-        print("Detailed station feed data saved to aqi_feed_data.json")
+        # Publish only stations whose feed has a new observation time or revised values;
+        # the snapshot is rewritten only when its content changed.
+        emit_changes("waqi", detailed_feeds, key="id",
+                     time=lambda feed: (feed["data"].get("time") or {}).get("iso"),
+                     value=lambda feed: {"aqi": feed["data"].get("aqi"),
+                                         "iaqi": {p: v.get("v") for p, v in (feed["data"].get("iaqi") or {}).items()}},
+                     record=lambda feed: {"station": feed["station"], "id": feed["id"]})
+        if write_if_changed("aqi_feed_data.json", detailed_feeds, indent=4):
+            print("Detailed station feed data saved to aqi_feed_data.json")
+        else:
+            print("aqi_feed_data.json already holds this snapshot; left unchanged.")
     except Exception as e:
         print("Error:", e)
@@ -0,0 +1,305 @@
+"""
+Batch air quality index computation (US EPA AQI and EU CAQI).
+
+Concentrations are converted to sub-indices with the published breakpoint tables, fully
+vectorized, so one call handles arrays of any shape, e.g. stations x pollutants x hours:
+
+    conc = np.array(...)                                   # (stations, 6, hours)
+    overall, dominant = aqi(conc, ["pm25", "pm10", "o3", "no2", "so2", "co"],
+                            units="µg/m³", scale="us_epa", axis=1)
+    codes = category(overall)                              # 0 = Good ... 5 = Hazardous
+
+Units: OpenAQ sensors are named like "pm25 µg/m³" / "o3 ppm" (see parse_sensor_name). Gas
+concentrations are converted between µg/m³, mg/m³, ppb and ppm at 25 °C and 1 atm, so each
+scale receives the units its table is defined in.
+
+Averaging periods are the caller's choice: the EPA tables are defined for 24-hour PM, 8-hour
+O3/CO and 1-hour NO2/SO2 averages (hourly_aggregation.py computes those), while WAQI and
+CAQI apply them to hourly values. WAQI's `iaqi.*.v` values are already US EPA sub-indices,
+not concentrations; concentration_from_sub_index() inverts them.
+
+Run `python aqi_engine.py --stations 2000 --hours 720` for a throughput check.
+"""
+import argparse
+import time
+
+import numpy as np
+
+POLLUTANTS = ("pm25", "pm10", "o3", "no2", "so2", "co")
+
+# Molecular weights (g/mol) for ppb <-> µg/m³ at 25 °C, 1 atm (molar volume 24.45 L).
+MOLAR_VOLUME = 24.45
+MOLECULAR_WEIGHT = {"o3": 48.00, "no2": 46.01, "so2": 64.07, "co": 28.01}
+
+UNIT_ALIASES = {
+    "µg/m³": "ug/m3", "μg/m³": "ug/m3", "ug/m3": "ug/m3", "ug/m³": "ug/m3", "µg/m3": "ug/m3",
+    "mg/m³": "mg/m3", "mg/m3": "mg/m3",
+    "ppb": "ppb", "ppm": "ppm",
+}
+PARAMETER_ALIASES = {"pm2.5": "pm25", "pm2_5": "pm25", "pm25": "pm25", "pm10": "pm10",
+                     "o3": "o3", "no2": "no2", "so2": "so2", "co": "co"}
+
+
+# -----------------------
+# Breakpoint Tables
+# -----------------------
+# US EPA (2024 PM2.5 revision). Each row: (C_low, C_high, I_low, I_high); the unit and the
+# truncation precision the EPA applies before the lookup are given per pollutant.
+US_EPA = {
+    "pm25": ("ug/m3", 1, [(0.0, 9.0, 0, 50), (9.1, 35.4, 51, 100), (35.5, 55.4, 101, 150),
+                          (55.5, 125.4, 151, 200), (125.5, 225.4, 201, 300), (225.5, 325.4, 301, 500)]),
+    "pm10": ("ug/m3", 0, [(0, 54, 0, 50), (55, 154, 51, 100), (155, 254, 101, 150),
+                          (255, 354, 151, 200), (355, 424, 201, 300), (425, 604, 301, 500)]),
+    "o3": ("ppm", 3, [(0.000, 0.054, 0, 50), (0.055, 0.070, 51, 100), (0.071, 0.085, 101, 150),
+                      (0.086, 0.105, 151, 200), (0.106, 0.200, 201, 300)]),
+    "co": ("ppm", 1, [(0.0, 4.4, 0, 50), (4.5, 9.4, 51, 100), (9.5, 12.4, 101, 150),
+                      (12.5, 15.4, 151, 200), (15.5, 30.4, 201, 300), (30.5, 50.4, 301, 500)]),
+    "so2": ("ppb", 0, [(0, 35, 0, 50), (36, 75, 51, 100), (76, 185, 101, 150),
+                       (186, 304, 151, 200), (305, 604, 201, 300), (605, 1004, 301, 500)]),
+    "no2": ("ppb", 0, [(0, 53, 0, 50), (54, 100, 51, 100), (101, 360, 101, 150),
+                       (361, 649, 151, 200), (650, 1249, 201, 300), (1250, 2049, 301, 500)]),
+}
+US_EPA_CATEGORIES = ((50, "Good"), (100, "Moderate"), (150, "Unhealthy for Sensitive Groups"),
+                     (200, "Unhealthy"), (300, "Very Unhealthy"), (500, "Hazardous"))
+
+# EU Common Air Quality Index (hourly "roadside/background" grid), all in µg/m³. The index
+# is piecewise linear between the grid points and continues past 100 on the last slope.
+EU_CAQI = {
+    "pm25": ("ug/m3", [0, 15, 30, 55, 110]),
+    "pm10": ("ug/m3", [0, 25, 50, 90, 180]),
+    "o3": ("ug/m3", [0, 60, 120, 180, 240]),
+    "no2": ("ug/m3", [0, 50, 100, 200, 400]),
+    "so2": ("ug/m3", [0, 50, 100, 350, 500]),
+    "co": ("ug/m3", [0, 5000, 7500, 10000, 20000]),
+}
+EU_CAQI_LEVELS = (0, 25, 50, 75, 100)
+EU_CAQI_CATEGORIES = ((25, "Very low"), (50, "Low"), (75, "Medium"), (100, "High"), (np.inf, "Very high"))
+
+SCALES = ("us_epa", "eu_caqi")
+
+
+def _compile_epa(table):
+    units, decimals, rows = table
+    rows = np.asarray(rows, dtype=np.float64)
+    return {"units": units, "decimals": decimals, "c_low": rows[:, 0], "c_high": rows[:, 1],
+            "i_low": rows[:, 2], "i_high": rows[:, 3]}
+
+
+_EPA = {p: _compile_epa(t) for p, t in US_EPA.items()}
+_CAQI = {p: {"units": u, "c": np.asarray(c, dtype=np.float64)} for p, (u, c) in EU_CAQI.items()}
+_CAQI_LEVELS = np.asarray(EU_CAQI_LEVELS, dtype=np.float64)
+
+
+# -----------------------
+# Units
+# -----------------------
+def normalize_parameter(name):
+    return PARAMETER_ALIASES.get((name or "").strip().lower())
+
+
+def normalize_units(units):
+    key = (units or "").strip()
+    return UNIT_ALIASES.get(key, UNIT_ALIASES.get(key.lower()))
+
+
+def parse_sensor_name(sensor_name):
+    """'pm25 µg/m³' -> ('pm25', 'ug/m3'); unknown parts come back as None."""
+    parts = (sensor_name or "").split(None, 1)
+    parameter = normalize_parameter(parts[0]) if parts else None
+    units = normalize_units(parts[1]) if len(parts) > 1 else None
+    return parameter, units
+
+
+def convert_units(values, pollutant, from_units, to_units):
+    """Convert concentrations between ug/m3, mg/m3, ppb and ppm (gases only for mixing ratios)."""
+    values = np.asarray(values, dtype=np.float64)
+    src, dst = normalize_units(from_units), normalize_units(to_units)
+    if src is None or dst is None:
+        raise ValueError(f"unsupported units: {from_units!r} -> {to_units!r}")
+    if src == dst:
+        return values
+    # Go through ug/m3.
+    if src == "mg/m3":
+        ug = values * 1000.0
+    elif src == "ug/m3":
+        ug = values
+    else:
+        if pollutant not in MOLECULAR_WEIGHT:
+            raise ValueError(f"{pollutant} has no mixing-ratio units")
+        ppb = values * (1000.0 if src == "ppm" else 1.0)
+        ug = ppb * MOLECULAR_WEIGHT[pollutant] / MOLAR_VOLUME
+    if dst == "ug/m3":
+        return ug
+    if dst == "mg/m3":
+        return ug / 1000.0
+    if pollutant not in MOLECULAR_WEIGHT:
+        raise ValueError(f"{pollutant} has no mixing-ratio units")
+    ppb = ug * MOLAR_VOLUME / MOLECULAR_WEIGHT[pollutant]
+    return ppb / 1000.0 if dst == "ppm" else ppb
+
+
+# -----------------------
+# Sub-indices
+# -----------------------
+def _epa_sub_index(values, pollutant):
+    t = _EPA[pollutant]
+    scale = 10.0 ** t["decimals"]
+    # The EPA truncates (not rounds) to the table's precision; the epsilon keeps 9.0 from
+    # becoming 8.9 through float error.
+    c = np.floor(values * scale + 1e-9) / scale
+    segment = np.clip(np.searchsorted(t["c_low"], c, side="right") - 1, 0, len(t["c_low"]) - 1)
+    c_low, c_high = t["c_low"][segment], t["c_high"][segment]
+    i_low, i_high = t["i_low"][segment], t["i_high"][segment]
+    index = (i_high - i_low) / (c_high - c_low) * (np.minimum(c, c_high) - c_low) + i_low
+    index = np.where(c > t["c_high"][-1], t["i_high"][-1], index)  # beyond the table
+    return np.where(np.isfinite(values) & (values >= 0), np.rint(index), np.nan)
+
+
+def _caqi_sub_index(values, pollutant):
+    grid = _CAQI[pollutant]["c"]
+    index = np.interp(values, grid, _CAQI_LEVELS)
+    slope = (_CAQI_LEVELS[-1] - _CAQI_LEVELS[-2]) / (grid[-1] - grid[-2])
+    index = np.where(values > grid[-1], _CAQI_LEVELS[-1] + (values - grid[-1]) * slope, index)
+    return np.where(np.isfinite(values) & (values >= 0), index, np.nan)
+
+
+def table_units(pollutant, scale="us_epa"):
+    """The units a scale's table for `pollutant` is defined in."""
+    return (_EPA if scale == "us_epa" else _CAQI)[pollutant]["units"]
+
+
+def sub_index(values, pollutant, units="µg/m³", scale="us_epa"):
+    """
+    Sub-index of one pollutant for an array of concentrations in `units` (any shape).
+    NaN or negative concentrations give NaN.
+    """
+    pollutant = normalize_parameter(pollutant)
+    if scale not in SCALES:
+        raise ValueError(f"unknown scale {scale!r}; expected one of {SCALES}")
+    tables = _EPA if scale == "us_epa" else _CAQI
+    if pollutant not in tables:
+        raise ValueError(f"no {scale} breakpoints for {pollutant!r}")
+    values = convert_units(values, pollutant, units, tables[pollutant]["units"])
+    if scale == "us_epa":
+        return _epa_sub_index(values, pollutant)
+    return _caqi_sub_index(values, pollutant)
+
+
+def sub_indices(concentrations, pollutants, units="µg/m³", scale="us_epa", axis=1):
+    """
+    Sub-indices for an array whose `axis` runs over `pollutants` (e.g. stations x pollutants
+    x hours with axis=1). `units` is one unit for all pollutants or a list, one per pollutant.
+    """
+    concentrations = np.asarray(concentrations, dtype=np.float64)
+    axis = axis % concentrations.ndim
+    if concentrations.shape[axis] != len(pollutants):
+        raise ValueError("the pollutant axis length does not match `pollutants`")
+    unit_list = [units] * len(pollutants) if isinstance(units, str) else list(units)
+    moved = np.moveaxis(concentrations, axis, 0)
+    result = np.empty(moved.shape)
+    for i, pollutant in enumerate(pollutants):
+        result[i] = sub_index(moved[i], pollutant, unit_list[i], scale)
+    return np.moveaxis(result, 0, axis)
+
+
+def aqi(concentrations, pollutants, units="µg/m³", scale="us_epa", axis=1):
+    """
+    Overall index (the highest sub-index) and the dominant pollutant's position along `axis`
+    (-1 where every pollutant is missing). Both have the input shape with `axis` removed.
+    """
+    subs = sub_indices(concentrations, pollutants, units, scale, axis)
+    overall = np.fmax.reduce(subs, axis=axis)
+    dominant = np.argmax(np.where(np.isnan(subs), -np.inf, subs), axis=axis)
+    return overall, np.where(np.isnan(overall), -1, dominant)
+
+
+# -----------------------
+# Categories and inversion
+# -----------------------
+def _categories(scale):
+    return US_EPA_CATEGORIES if scale == "us_epa" else EU_CAQI_CATEGORIES
+
+
+def category(index, scale="us_epa"):
+    """Category code per index value (0 = best band), -1 for NaN."""
+    index = np.asarray(index, dtype=np.float64)
+    upper = np.asarray([u for u, _ in _categories(scale)], dtype=np.float64)
+    codes = np.minimum(np.searchsorted(upper, index, side="left"), len(upper) - 1)
+    return np.where(np.isnan(index), -1, codes)
+
+
+def category_name(code, scale="us_epa"):
+    names = [n for _, n in _categories(scale)]
+    return names[int(code)] if 0 <= int(code) < len(names) else None
+
+
+def concentration_from_sub_index(index, pollutant, units="µg/m³"):
+    """
+    Invert US EPA sub-indices (e.g. WAQI iaqi.*.v) back to concentrations in `units`.
+    The result is the low end of the concentration range that maps to each index.
+    """
+    pollutant = normalize_parameter(pollutant)
+    t = _EPA[pollutant]
+    index = np.asarray(index, dtype=np.float64)
+    segment = np.clip(np.searchsorted(t["i_low"], index, side="right") - 1, 0, len(t["i_low"]) - 1)
+    i_low, i_high = t["i_low"][segment], t["i_high"][segment]
+    c_low, c_high = t["c_low"][segment], t["c_high"][segment]
+    c = (np.minimum(index, i_high) - i_low) * (c_high - c_low) / (i_high - i_low) + c_low
+    return convert_units(np.where(index >= 0, c, np.nan), pollutant, t["units"], units)
+
+
+def good_range(pollutant, units="µg/m³", scale="us_epa"):
+    """(0, upper) concentration range of the best category, in `units`."""
+    pollutant = normalize_parameter(pollutant)
+    if scale == "us_epa":
+        upper = _EPA[pollutant]["c_high"][0]
+    else:
+        upper = _CAQI[pollutant]["c"][1]
+    return 0.0, float(convert_units(upper, pollutant, table_units(pollutant, scale), units))
+
+
+def sensor_aqi(sensor_name, value, scale="us_epa"):
+    """
+    (sub_index, category name) for one reading of an OpenAQ sensor named like 'pm25 µg/m³';
+    (None, None) for parameters without a breakpoint table.
+    """
+    pollutant, units = parse_sensor_name(sensor_name)
+    if pollutant is None or units is None or value is None:
+        return None, None
+    index = float(sub_index(value, pollutant, units, scale))
+    if np.isnan(index):
+        return None, None
+    return index, category_name(category(index, scale), scale)
+
+
+# -----------------------
+# Benchmark
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Time AQI computation on synthetic station-hours.")
+    parser.add_argument("--stations", type=int, default=2000)
+    parser.add_argument("--hours", type=int, default=720)
+    parser.add_argument("--scale", choices=SCALES, default="us_epa")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    typical = np.array([15, 30, 60, 40, 10, 400], dtype=np.float64)  # µg/m³ per POLLUTANTS
+    conc = rng.gamma(2.0, 1.0, size=(args.stations, len(POLLUTANTS), args.hours)) * typical[None, :, None] / 2
+    conc[rng.random(conc.shape) < 0.05] = np.nan
+
+    t0 = time.perf_counter()
+    overall, dominant = aqi(conc, POLLUTANTS, units="µg/m³", scale=args.scale, axis=1)
+    codes = category(overall, args.scale)
+    elapsed = time.perf_counter() - t0
+
+    station_hours = args.stations * args.hours
+    print(f"{station_hours:,} station-hours x {len(POLLUTANTS)} pollutants in {elapsed * 1000:.0f} ms "
+          f"({station_hours / elapsed / 1e6:.1f} M station-hours/s)")
+    for code, (_, name) in enumerate(_categories(args.scale)):
+        print(f"  {name:<32} {np.count_nonzero(codes == code) / station_hours:6.1%}")
+    counts = np.bincount(dominant[dominant >= 0].ravel(), minlength=len(POLLUTANTS))
+    print("  dominant:", {p: int(c) for p, c in zip(POLLUTANTS, counts)})
+
+
+if __name__ == "__main__":
+    main()
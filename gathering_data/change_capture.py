@@ -0,0 +1,326 @@
+"""
+Change-data capture for fetched readings: emit only what is new or changed.
+
+Each run of a fetch script used to rewrite its whole snapshot even when nothing changed
+since the last hour. ChangeCapture keeps the last (timestamp, value) seen per key (e.g.
+OpenAQ sensor id, WAQI station uid) in a small state file and compares each new reading
+against it:
+
+    insert   key never seen before
+    update   newer timestamp, or same timestamp with a revised value
+    (none)   same or older timestamp with the same value: nothing is emitted
+
+Changes are written as NDJSON lines to an append-only file or a local socket, each with a
+sequence number so consumers can resume and de-duplicate:
+
+    {"seq": 42, "op": "update", "source": "openaq", "key": "7773481", "time": "2025-02-01T12:00:00Z",
+     "value": 31.2, "previous": {"time": "2025-02-01T11:00:00Z", "value": 28.9}, "record": {...}}
+
+    capture = ChangeCapture()                                   # sink from env change_stream
+    changes = capture.capture("openaq", sensor_entries, key="sensor_id",
+                              time="measurement_datetime", value="measurement_value")
+
+Targets: a file path (default changes.ndjson next to this module), tcp://127.0.0.1:9000 or unix:///tmp/aq.sock.
+The state is only committed after the sink accepted the changes, so a failed write means
+the same changes are emitted again next run (at-least-once delivery).
+
+Run `python change_capture.py --listen tcp://127.0.0.1:9000` to print a socket stream.
+"""
+import argparse
+import json
+import os
+import socket
+import time
+from datetime import datetime, timezone
+
+# Anchored here (like polling_state.json), so runs from any directory share one state.
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+STREAM_TARGET = os.getenv("change_stream", os.path.join(MODULE_DIR, "changes.ndjson"))
+STATE_PATH = os.getenv("change_state", os.path.join(MODULE_DIR, "change_state.json"))
+
+
+def to_epoch(value):
+    """Epoch seconds of a timestamp (epoch number, or ISO-8601 with Z or an offset), or None."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, dict):
+        value = value.get("utc") or value.get("iso")
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def fingerprint(value):
+    """Canonical JSON of a value, so equal readings compare equal after a state round trip."""
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def write_if_changed(path, document, **dump_options):
+    """
+    Write `document` as JSON to `path` unless the file already holds exactly that output.
+    Returns True when the file was (re)written. The decision depends only on the file, not
+    on the change state, which other scripts and queries share.
+    """
+    encoded = json.dumps(document, **dump_options).encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == encoded:
+                return False
+    except OSError:
+        pass
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encoded)
+    os.replace(tmp_path, path)
+    return True
+
+
+def _field(record, spec):
+    return spec(record) if callable(spec) else record.get(spec)
+
+
+# -----------------------
+# Sinks
+# -----------------------
+class FileSink:
+    """Append-only NDJSON file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, lines):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def close(self):
+        pass
+
+
+class SocketSink:
+    """NDJSON over a local TCP (tcp://host:port) or unix (unix:///path) stream socket."""
+
+    def __init__(self, target, timeout=5.0):
+        self.target = target
+        self.timeout = timeout
+        self.sock = None
+
+    def _connect(self):
+        if self.target.startswith("unix://"):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.target[len("unix://"):])
+        else:
+            host, port = self.target[len("tcp://"):].rsplit(":", 1)
+            sock = socket.create_connection((host, int(port)), timeout=self.timeout)
+        return sock
+
+    def write(self, lines):
+        payload = "".join(lines).encode("utf-8")
+        for attempt in range(2):
+            try:
+                if self.sock is None:
+                    self.sock = self._connect()
+                self.sock.sendall(payload)
+                return
+            except OSError:
+                self.close()
+                if attempt == 1:
+                    raise
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+
+def open_sink(target=STREAM_TARGET):
+    if target.startswith(("tcp://", "unix://")):
+        return SocketSink(target)
+    return FileSink(target)
+
+
+# -----------------------
+# Change Capture
+# -----------------------
+class ChangeCapture:
+    """Last-seen state per (source, key) and an append-only change stream."""
+
+    def __init__(self, sink=None, state_path=STATE_PATH):
+        self.sink = open_sink(sink or STREAM_TARGET) if sink is None or isinstance(sink, str) else sink
+        self.state_path = state_path
+        self.seq = 0
+        self.last = {}
+        if state_path and os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.seq = data.get("seq", 0)
+            self.last = data.get("last", {})
+
+    def save(self):
+        if not self.state_path:
+            return
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"seq": self.seq, "last": self.last}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def diff(self, source, records, key, time, value, record=None):
+        """
+        Changes for `records` against the stored state, without committing them. `key`,
+        `time` and `value` are field names or callables extracting them from a record;
+        `record` optionally slims what is attached to each change (default: the whole record).
+        Several readings of one key are compared in time order.
+        """
+        rows = []
+        for item in records:
+            k = _field(item, key)
+            t = _field(item, time)
+            if k is None or t is None:
+                continue
+            rows.append((to_epoch(t) or 0.0, str(k), t, _field(item, value), item if record is None else record(item)))
+        rows.sort(key=lambda row: row[0])
+
+        changes = []
+        seen = {}
+        seq = self.seq
+        for epoch, k, t, v, attached in rows:
+            state_key = f"{source}:{k}"
+            previous = seen.get(state_key) or self.last.get(state_key)
+            fp = fingerprint(v)
+            if previous is None:
+                op = "insert"
+            elif epoch > previous["epoch"] or (epoch == previous["epoch"] and fp != previous["fp"]):
+                op = "update"
+            else:
+                continue
+            seq += 1
+            change = {"seq": seq, "op": op, "source": source, "key": k, "time": t, "value": v}
+            if previous is not None:
+                change["previous"] = {"time": previous["time"], "value": previous["value"]}
+            change["record"] = attached
+            changes.append(change)
+            seen[state_key] = {"epoch": epoch, "time": t, "value": v, "fp": fp}
+        return changes
+
+    def commit(self, changes):
+        for change in changes:
+            self.last[f"{change['source']}:{change['key']}"] = {
+                "epoch": to_epoch(change["time"]) or 0.0, "time": change["time"], "value": change["value"],
+                "fp": fingerprint(change["value"]),
+            }
+            self.seq = max(self.seq, change["seq"])
+        self.save()
+
+    def capture(self, source, records, key, time, value, record=None):
+        """Emit the inserts/updates among `records` to the sink and commit them. Returns the changes."""
+        changes = self.diff(source, records, key, time, value, record)
+        if changes:
+            emitted_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            lines = [json.dumps(dict(change, emitted_at=emitted_at), ensure_ascii=False, default=str) + "\n"
+                     for change in changes]
+            self.sink.write(lines)
+            self.commit(changes)
+        return changes
+
+    def close(self):
+        self.sink.close()
+
+
+def emit_changes(source, records, key, time, value, record=None, sink=None, state_path=STATE_PATH):
+    """
+    One-shot capture for fetch scripts: emit the changes and print a summary. Returns the
+    changes, or None when the sink could not be written (nothing is committed then).
+    """
+    capture = ChangeCapture(sink, state_path)
+    try:
+        changes = capture.capture(source, records, key, time, value, record)
+    except OSError as e:
+        print(f"Error writing change stream: {e}")
+        return None
+    finally:
+        capture.close()
+    print(f"Change stream: {summarize_changes(changes)}")
+    return changes
+
+
+def read_changes(path=STREAM_TARGET, after_seq=0):
+    """Changes from an NDJSON stream file with seq > after_seq (for file-based consumers)."""
+    changes = []
+    if not os.path.exists(path):
+        return changes
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                change = json.loads(line)
+                if change.get("seq", 0) > after_seq:
+                    changes.append(change)
+    return changes
+
+
+def summarize_changes(changes):
+    inserts = sum(1 for c in changes if c["op"] == "insert")
+    return f"{len(changes)} change(s): {inserts} insert(s), {len(changes) - inserts} update(s)"
+
+
+# -----------------------
+# Socket Listener
+# -----------------------
+def listen(target):
+    """Accept producers on a local socket and print every change line they send."""
+    if target.startswith("unix://"):
+        path = target[len("unix://"):]
+        if os.path.exists(path):
+            os.remove(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+    else:
+        host, port = target[len("tcp://"):].rsplit(":", 1)
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, int(port)))
+    server.listen()
+    print(f"Listening for changes on {target} (Ctrl+C to stop)...")
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile("r", encoding="utf-8") as stream:
+                for line in stream:
+                    change = json.loads(line)
+                    print(f"{time.strftime('%H:%M:%S')} #{change['seq']} {change['op']} {change['source']}:"
+                          f"{change['key']} {change['time']} -> {change['value']}")
+    except KeyboardInterrupt:
+        print("Stopping.")
+    finally:
+        server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Listen to or read a change stream.")
+    parser.add_argument("--listen", help="tcp://host:port or unix:///path to accept producers on.")
+    parser.add_argument("--read", help="NDJSON stream file to print.")
+    parser.add_argument("--after", type=int, default=0, help="Only changes with seq greater than this.")
+    args = parser.parse_args()
+    if args.listen:
+        listen(args.listen)
+    elif args.read:
+        changes = read_changes(args.read, args.after)
+        for change in changes:
+            print(json.dumps(change, ensure_ascii=False))
+        print(summarize_changes(changes))
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
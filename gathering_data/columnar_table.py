@@ -0,0 +1,175 @@
+"""
+Append-only columnar table on disk: one .npy file per column per appended part.
+
+Feature tables for model training grow by a batch at a time (every sampling cycle, every
+pipeline run) and are read back a few columns at a time, so rows are never rewritten:
+
+    <root>/_manifest.json          schema, parts (name, rows, min/max of the time column), meta
+    <root>/part-000001/<col>.npy   one array per column
+    <root>/part-000002/<col>.npy   ...
+
+append() writes a new part under a temporary name and renames it before the manifest is
+replaced, so a crash never leaves a half-written part in the table. read() memory-maps the
+column files and concatenates only the requested columns of the parts overlapping the
+requested time range (parts are pruned with the min/max kept in the manifest). `meta` is a
+small JSON dict stored with the manifest, e.g. the watermark of an incremental job.
+
+    table = ColumnarTable("traffic_samples", schema={"epoch": "int64", "lat": "float64", ...},
+                          time_column="epoch")
+    table.append({"epoch": epochs, "lat": lats, ...})
+    columns = table.read(["epoch", "delay_ratio"], start=t0, end=t1)   # {name: array}
+    table.compact()                                                      # merge small parts
+"""
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+
+MANIFEST = "_manifest.json"
+
+
+class ColumnarTable:
+    """Append-only table of equally long typed columns, stored as .npy parts."""
+
+    def __init__(self, root, schema=None, time_column=None):
+        self.root = root
+        self.lock = threading.Lock()
+        self.manifest_path = os.path.join(root, MANIFEST)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as f:
+                self.manifest = json.load(f)
+            if schema is not None and dict(schema) != self.manifest["schema"]:
+                raise ValueError(f"{root} has schema {self.manifest['schema']}, not {dict(schema)}")
+        elif schema is None:
+            raise FileNotFoundError(f"No table at {root} (a schema is needed to create one)")
+        else:
+            os.makedirs(root, exist_ok=True)
+            self.manifest = {"schema": dict(schema), "time_column": time_column, "parts": [], "next_part": 1,
+                             "meta": {}}
+            self._write_manifest()
+
+    @property
+    def schema(self):
+        return self.manifest["schema"]
+
+    @property
+    def meta(self):
+        return self.manifest["meta"]
+
+    def __len__(self):
+        return sum(part["rows"] for part in self.manifest["parts"])
+
+    def _write_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+
+    def save_meta(self, **values):
+        """Update `meta` (e.g. a watermark) and persist it."""
+        with self.lock:
+            self.manifest["meta"].update(values)
+            self._write_manifest()
+
+    # -----------------------
+    # Writing
+    # -----------------------
+    def _coerce(self, columns):
+        missing = set(self.schema) - set(columns)
+        extra = set(columns) - set(self.schema)
+        if missing or extra:
+            raise ValueError(f"Columns do not match the schema (missing {sorted(missing)}, extra {sorted(extra)})")
+        arrays = {name: np.ascontiguousarray(columns[name], dtype=dtype) for name, dtype in self.schema.items()}
+        lengths = {array.shape[0] for array in arrays.values()}
+        if len(lengths) != 1:
+            raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+        return arrays, lengths.pop()
+
+    def append(self, columns, meta=None):
+        """Append {column: array} as a new part (and update `meta` in the same manifest write)."""
+        arrays, rows = self._coerce(columns)
+        if rows == 0:
+            if meta:
+                self.save_meta(**meta)
+            return None
+        with self.lock:
+            return self._append_part(arrays, rows, meta)
+
+    def _append_part(self, arrays, rows, meta=None):
+        # Caller holds self.lock.
+        name = f"part-{self.manifest['next_part']:06d}"
+        self.manifest["next_part"] += 1
+        tmp_dir = os.path.join(self.root, name + ".tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        for column, array in arrays.items():
+            np.save(os.path.join(tmp_dir, column + ".npy"), array)
+        os.replace(tmp_dir, os.path.join(self.root, name))
+        part = {"name": name, "rows": rows}
+        time_column = self.manifest.get("time_column")
+        if time_column:
+            part["min"] = arrays[time_column].min().item()
+            part["max"] = arrays[time_column].max().item()
+        self.manifest["parts"].append(part)
+        if meta:
+            self.manifest["meta"].update(meta)
+        self._write_manifest()
+        return name
+
+    # -----------------------
+    # Reading
+    # -----------------------
+    def _parts_between(self, start, end):
+        parts = self.manifest["parts"]
+        if start is None and end is None:
+            return parts
+        if not self.manifest.get("time_column"):
+            raise ValueError("Time-range reads need a table created with time_column")
+        return [part for part in parts
+                if (start is None or part["max"] >= start) and (end is None or part["min"] < end)]
+
+    def read(self, columns=None, start=None, end=None):
+        """
+        {column: array} for the requested columns (default: all), optionally limited to rows
+        whose time column lies in [start, end). Column files are memory-mapped, not parsed.
+        """
+        columns = list(self.schema) if columns is None else list(columns)
+        time_column = self.manifest.get("time_column")
+        needed = columns + ([time_column] if (start is not None or end is not None) and time_column not in columns
+                            else [])
+        pieces = {name: [] for name in needed}
+        for part in self._parts_between(start, end):
+            for name in needed:
+                pieces[name].append(np.load(os.path.join(self.root, part["name"], name + ".npy"), mmap_mode="r"))
+        result = {}
+        for name in needed:
+            if pieces[name]:
+                result[name] = np.concatenate(pieces[name])
+            else:
+                result[name] = np.empty(0, dtype=self.schema[name])
+        if start is not None or end is not None:
+            times = result[time_column]
+            keep = np.ones(times.shape[0], dtype=bool)
+            if start is not None:
+                keep &= times >= start
+            if end is not None:
+                keep &= times < end
+            result = {name: result[name][keep] for name in columns}
+        return result
+
+    def compact(self):
+        """
+        Merge all parts into one (reads everything once); returns the number of parts merged.
+        Appends from other threads wait until the merged part is in the manifest.
+        """
+        with self.lock:
+            parts = list(self.manifest["parts"])
+            if len(parts) < 2:
+                return 0
+            arrays, rows = self._coerce(self.read())
+            self.manifest["parts"] = []
+            self._append_part(arrays, rows)
+        for part in parts:
+            shutil.rmtree(os.path.join(self.root, part["name"]), ignore_errors=True)
+        return len(parts)
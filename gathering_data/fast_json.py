@@ -0,0 +1,209 @@
+"""
+Compressed transport and fast JSON decoding for the OpenAQ and WAQI responses.
+
+The 1000-row /hours replies and the WAQI map/bounds payloads are large and mostly made of
+fields the scripts never read. This module:
+
+  * asks for brotli-compressed bodies (`br`, then gzip/deflate). requests already asks
+    for gzip/deflate by itself, so the saving over plain requests comes from `br` and
+    needs the brotli package from requirements.txt;
+  * decodes `response.content` once, with the fastest decoder available:
+      - msgspec (requirements.txt): decodes straight into the TypedDict schemas below, so only the
+        fields the pipeline reads (`period.datetimeFrom.utc`, `value`, `parameter.units`,
+        `coordinates`, `iaqi.*.v`, ...) are ever materialised. Still plain dicts, so the
+        existing `.get()` code works unchanged.
+      - orjson (requirements.txt): full documents, decoded several times faster than the stdlib.
+      - json: the stdlib fallback, for environments installed without them.
+  * only dumps full payloads when `print_api_responses=1` is set, instead of printing every
+    decoded response (which used to cost more than the decode itself).
+
+Usage (scripts outside gathering_data/ add it to sys.path first):
+    from fast_json import compressed_headers, decode_response, MEASUREMENTS_RESPONSE
+    response = requests.get(url, headers=compressed_headers(headers), params=params)
+    payload = decode_response(response, MEASUREMENTS_RESPONSE)
+"""
+import json
+import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, TypedDict, Union
+
+try:
+    import orjson
+except ImportError:  # listed in requirements.txt; stdlib json otherwise
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # listed in requirements.txt; no typed decoding otherwise
+    msgspec = None
+
+
+def _has_brotli():
+    for name in ("brotli", "brotlicffi"):
+        try:
+            __import__(name)
+            return True
+        except ImportError:
+            pass
+    return False
+
+
+# urllib3 transparently inflates gzip/deflate, and br when a brotli package is importable.
+ACCEPT_ENCODING = "br, gzip, deflate" if _has_brotli() else "gzip, deflate"
+PRINT_API_RESPONSES = os.getenv("print_api_responses", "0") == "1"
+
+
+# -----------------------
+# Response Schemas (only the fields the scripts read)
+# -----------------------
+class DateTimeValue(TypedDict, total=False):
+    utc: Optional[str]
+    local: Optional[str]
+
+
+class Period(TypedDict, total=False):
+    label: Optional[str]
+    interval: Optional[str]
+    datetimeFrom: Union[DateTimeValue, str, None]
+    datetimeTo: Union[DateTimeValue, str, None]
+
+
+class Parameter(TypedDict, total=False):
+    id: Optional[int]
+    name: Optional[str]
+    units: Optional[str]
+
+
+class Coordinates(TypedDict, total=False):
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+
+class Measurement(TypedDict, total=False):
+    value: Optional[float]
+    parameter: Parameter
+    period: Period
+    coordinates: Optional[Coordinates]
+    datetime: Any  # older payloads carried a top-level datetime
+
+
+class MeasurementsResponse(TypedDict, total=False):
+    results: List[Measurement]
+
+
+class Sensor(TypedDict, total=False):
+    id: int
+    name: Optional[str]
+    parameter: Parameter
+
+
+class Location(TypedDict, total=False):
+    id: int
+    name: Optional[str]
+    locality: Optional[str]
+    country: Any
+    coordinates: Optional[Coordinates]
+    sensors: List[Sensor]
+    datetimeLast: Any
+
+
+class LocationsResponse(TypedDict, total=False):
+    meta: Any
+    results: List[Location]
+
+
+class IaqiValue(TypedDict, total=False):
+    v: Optional[float]
+
+
+class WaqiStationInfo(TypedDict, total=False):
+    name: Optional[str]
+    time: Optional[str]
+
+
+class WaqiPoint(TypedDict, total=False):
+    lat: float
+    lon: float
+    uid: int
+    aqi: Any  # a number as a string, or "-"
+    station: WaqiStationInfo
+    iaqi: Dict[str, IaqiValue]
+
+
+class WaqiMapResponse(TypedDict, total=False):
+    status: str
+    data: Union[List[WaqiPoint], str]
+
+
+class WaqiCity(TypedDict, total=False):
+    name: Optional[str]
+    geo: Optional[List[float]]
+
+
+class WaqiFeed(TypedDict, total=False):
+    idx: Any
+    aqi: Any
+    dominentpol: Optional[str]
+    city: WaqiCity
+    iaqi: Dict[str, IaqiValue]
+    time: Any
+    forecast: Any
+
+
+class WaqiFeedResponse(TypedDict, total=False):
+    status: str
+    data: Union[WaqiFeed, str]
+
+
+MEASUREMENTS_RESPONSE = MeasurementsResponse
+LOCATIONS_RESPONSE = LocationsResponse
+WAQI_MAP_RESPONSE = WaqiMapResponse
+WAQI_FEED_RESPONSE = WaqiFeedResponse
+
+
+# -----------------------
+# Decoding
+# -----------------------
+@lru_cache(maxsize=None)
+def _typed_decoder(schema):
+    return msgspec.json.Decoder(schema)
+
+
+def decode(content, schema=None):
+    """
+    Decode a JSON body (bytes or str). With msgspec installed and a `schema` given, only the
+    schema's fields are decoded; a payload that does not match the schema falls back to a
+    full decode rather than failing.
+    """
+    if schema is not None and msgspec is not None:
+        try:
+            return _typed_decoder(schema).decode(content)
+        except msgspec.ValidationError:
+            pass
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def decode_response(response, schema=None, label=None):
+    """decode() a requests.Response body, optionally dumping it when print_api_responses=1."""
+    payload = decode(response.content, schema)
+    if PRINT_API_RESPONSES and label:
+        print(f"{label}:")
+        print(payload)
+    return payload
+
+
+def compressed_headers(headers=None):
+    """Copy of `headers` that asks the API for a compressed body."""
+    merged = dict(headers or {})
+    merged["Accept-Encoding"] = ACCEPT_ENCODING
+    return merged
+
+
+def describe_payload(payload, key="results"):
+    """Short summary for logs instead of printing whole payloads."""
+    items = payload.get(key) if isinstance(payload, dict) else None
+    if isinstance(items, list):
+        return f"{len(items)} {key}"
+    return f"{type(items).__name__} {key}"
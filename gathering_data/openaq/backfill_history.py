@@ -0,0 +1,304 @@
+"""
+Resumable historical backfill of OpenAQ hourly data for many sensors and many years.
+
+The requested range is split into date windows per sensor; each (sensor, window) is one
+task that pages through /sensors/{id}/hours and writes its rows to a CSV file. Tasks run
+on a pool of processes with a thread pool inside each, and every request in every process
+goes through ONE shared rate limiter (hosted by a multiprocessing manager), so adding
+workers never exceeds the API budget.
+
+A window's file is written under a temporary name and renamed when complete, so its
+presence marks the task as done: re-running the same command skips finished windows and
+retries failed ones (idempotent and resumable). progress.jsonl logs every attempt.
+
+Examples:
+    python backfill_history.py --location CJ-3 --near 46.765425,23.550258 --start 2022-01-01 --end 2025-01-01
+    python backfill_history.py --sensor 7773481 --sensor 7774317 --start 2020-01-01 --end 2025-01-01 \\
+        --processes 4 --threads 4 --rate 1.0 --output history
+
+Output layout:
+    <output>/<sensor_id>/<YYYYMMDD>_<YYYYMMDD>.csv    datetime_utc,value,units
+    <output>/progress.jsonl
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+# Shared helpers (rate limiter, fast JSON decoding, API base URLs) live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rate_limiter import RateLimiter, rate_limited_get, DEFAULT_OPENAQ_RATE
+from fast_json import compressed_headers, decode, MEASUREMENTS_RESPONSE
+from sensor_metadata_cache import SensorMetadataCache
+from api_endpoints import OPENAQ_BASE_URL as BASE_URL
+
+# Load environment variables from .env file
+load_dotenv()
+
+# API Token from .env
+API_KEY = os.getenv("openaq_token")
+
+headers = {"X-API-Key": API_KEY}
+
+PAGE_SIZE = 1000
+DEFAULT_WINDOW_DAYS = 30  # 720 hourly rows: one page per window in the common case
+DEFAULT_OUTPUT_DIR = "history"
+
+
+# -----------------------
+# Windows and Storage
+# -----------------------
+def parse_date(value):
+    """'2024-01-01' or an ISO timestamp -> aware UTC datetime."""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def split_windows(start, end, window_days=DEFAULT_WINDOW_DAYS):
+    """[(window_start, window_end), ...] covering [start, end) in steps of window_days."""
+    windows = []
+    current = start
+    while current < end:
+        upper = min(current + timedelta(days=window_days), end)
+        windows.append((current, upper))
+        current = upper
+    return windows
+
+
+def window_path(output_dir, sensor_id, window):
+    start, end = window
+    return os.path.join(output_dir, str(sensor_id), f"{start:%Y%m%d}_{end:%Y%m%d}.csv")
+
+
+def write_window(path, rows):
+    """Write rows atomically: the final name only appears once the window is complete."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["datetime_utc", "value", "units"])
+        writer.writerows(rows)
+    os.replace(tmp_path, path)
+
+
+def load_sensor_history(output_dir, sensor_id):
+    """(epochs int64, values float64) of every backfilled row of a sensor, sorted and de-duplicated."""
+    times, values = [], []
+    for path in sorted(glob.glob(os.path.join(output_dir, str(sensor_id), "*.csv"))):
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                times.append(row[0][:19])
+                values.append(float(row[1]) if row[1] else np.nan)
+    if not times:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    epochs = np.asarray(times, dtype="datetime64[s]").astype(np.int64)
+    epochs, first = np.unique(epochs, return_index=True)
+    return epochs, np.asarray(values)[first]
+
+
+# -----------------------
+# Fetching (runs inside worker processes)
+# -----------------------
+_worker = threading.local()
+_limiter = None
+
+
+def _init_worker(limiter):
+    global _limiter
+    _limiter = limiter
+
+
+def _session():
+    if not hasattr(_worker, "session"):
+        _worker.session = requests.Session()
+    return _worker.session
+
+
+def fetch_window(sensor_id, window):
+    """All hourly rows of one sensor in one window, following pagination."""
+    start, end = window
+    url = f"{BASE_URL}/sensors/{sensor_id}/hours"
+    rows = []
+    page = 1
+    while True:
+        params = {"date_from": start.strftime("%Y-%m-%dT%H:%M:%SZ"), "date_to": end.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                  "limit": PAGE_SIZE, "page": page}
+        response = rate_limited_get(url, limiter=_limiter, headers=compressed_headers(headers), params=params,
+                                    session=_session())
+        if response.status_code == 404:
+            return rows  # unknown sensor: nothing to backfill
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        results = decode(response.content, MEASUREMENTS_RESPONSE).get("results", [])
+        for record in results:
+            period = record.get("period") or {}
+            dt = period.get("datetimeFrom")
+            if isinstance(dt, dict):
+                dt = dt.get("utc")
+            if dt is None:
+                continue
+            units = (record.get("parameter") or {}).get("units") or ""
+            rows.append((dt, record.get("value"), units))
+        if len(results) < PAGE_SIZE:
+            return rows
+        page += 1
+
+
+def run_task(task):
+    """Fetch and store one (sensor, window); returns a progress record."""
+    sensor_id, window, path = task
+    t0 = time.perf_counter()
+    try:
+        rows = fetch_window(sensor_id, window)
+        write_window(path, rows)
+        status, error = "done", None
+    except Exception as e:
+        rows, status, error = [], "failed", str(e)
+    return {"sensor_id": sensor_id, "window": [f"{window[0]:%Y-%m-%d}", f"{window[1]:%Y-%m-%d}"],
+            "status": status, "rows": len(rows), "error": error, "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def run_batch(tasks, threads):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(run_task, tasks))
+
+
+# -----------------------
+# Shared Rate Limiter
+# -----------------------
+class LimiterManager(BaseManager):
+    """Hosts one RateLimiter that every worker process reaches through a proxy."""
+
+
+LimiterManager.register("RateLimiter", RateLimiter)
+
+
+# -----------------------
+# Backfill
+# -----------------------
+def plan_tasks(sensor_ids, start, end, output_dir, window_days=DEFAULT_WINDOW_DAYS):
+    """(pending tasks, number already done) for every (sensor, window)."""
+    tasks, done = [], 0
+    for sensor_id in sensor_ids:
+        for window in split_windows(start, end, window_days):
+            path = window_path(output_dir, sensor_id, window)
+            if os.path.exists(path):
+                done += 1
+            else:
+                tasks.append((sensor_id, window, path))
+    return tasks, done
+
+
+def backfill(sensor_ids, start, end, output_dir=DEFAULT_OUTPUT_DIR, window_days=DEFAULT_WINDOW_DAYS,
+             processes=1, threads=4, rate=DEFAULT_OPENAQ_RATE):
+    """
+    Backfill [start, end) for the given sensors. With processes > 1 the tasks are spread over
+    a process pool (threads per process) sharing one rate limiter. Returns a summary dict.
+    """
+    tasks, already_done = plan_tasks(sensor_ids, start, end, output_dir, window_days)
+    total = len(tasks) + already_done
+    print(f"{total} (sensor, window) tasks: {already_done} already done, {len(tasks)} to fetch.")
+    summary = {"done": already_done, "failed": 0, "rows": 0, "total": total}
+    if not tasks:
+        return summary
+
+    os.makedirs(output_dir, exist_ok=True)
+    progress_path = os.path.join(output_dir, "progress.jsonl")
+    t0 = time.perf_counter()
+
+    def record(result, progress):
+        progress.write(json.dumps(result) + "\n")
+        progress.flush()
+        if result["status"] == "done":
+            summary["done"] += 1
+            summary["rows"] += result["rows"]
+        else:
+            summary["failed"] += 1
+            print(f"  sensor {result['sensor_id']} {result['window'][0]}..{result['window'][1]} failed: "
+                  f"{result['error']}")
+        finished = summary["done"] + summary["failed"]
+        if finished % 25 == 0 or finished == total:
+            elapsed = time.perf_counter() - t0
+            print(f"  {finished}/{total} windows, {summary['rows']} rows, {elapsed:.1f}s")
+
+    with open(progress_path, "a", encoding="utf-8") as progress:
+        if processes <= 1:
+            _init_worker(RateLimiter(rate))
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                for future in as_completed([pool.submit(run_task, task) for task in tasks]):
+                    record(future.result(), progress)
+        else:
+            with LimiterManager() as manager:
+                limiter = manager.RateLimiter(rate)
+                batch_size = threads * 4
+                batches = [tasks[i:i + batch_size] for i in range(0, len(tasks), batch_size)]
+                with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                         initargs=(limiter,)) as pool:
+                    futures = [pool.submit(run_batch, batch, threads) for batch in batches]
+                    for future in as_completed(futures):
+                        for result in future.result():
+                            record(result, progress)
+    return summary
+
+
+def resolve_sensors(locations, sensors, near=None):
+    """Sensor ids from explicit ids plus every sensor of the given location ids / names."""
+    sensor_ids = [int(s) for s in sensors]
+    if locations:
+        cache = SensorMetadataCache()
+        for location in locations:
+            for sensor in cache.sensors_for(location, near):
+                if sensor["id"] not in sensor_ids:
+                    sensor_ids.append(sensor["id"])
+        cache.close()
+    return sensor_ids
+
+
+# -----------------------
+# Main Workflow
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Backfill OpenAQ hourly history into local CSV files.")
+    parser.add_argument("--location", action="append", default=[], help="Location id or name (repeatable).")
+    parser.add_argument("--near", help="lat,lon hint for resolving location names.")
+    parser.add_argument("--sensor", action="append", default=[], help="Sensor id (repeatable).")
+    parser.add_argument("--start", required=True, help="Start date (inclusive), e.g. 2022-01-01.")
+    parser.add_argument("--end", default=None, help="End date (exclusive); defaults to now.")
+    parser.add_argument("--window-days", type=int, default=DEFAULT_WINDOW_DAYS)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--processes", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=4, help="Threads per process.")
+    parser.add_argument("--rate", type=float, default=DEFAULT_OPENAQ_RATE, help="Requests per second, all workers together.")
+    args = parser.parse_args()
+
+    near = tuple(float(v) for v in args.near.split(",")) if args.near else None
+    sensor_ids = resolve_sensors(args.location, args.sensor, near)
+    if not sensor_ids:
+        print("No sensors to backfill (use --sensor or --location).")
+        return
+    start = parse_date(args.start)
+    end = parse_date(args.end) if args.end else datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+    t0 = time.perf_counter()
+    summary = backfill(sensor_ids, start, end, args.output, args.window_days, args.processes, args.threads, args.rate)
+    print(f"Backfill finished in {time.perf_counter() - t0:.1f}s: {summary['done']}/{summary['total']} windows done, "
+          f"{summary['failed']} failed, {summary['rows']} rows written to '{args.output}'.")
+    if summary["failed"]:
+        print("Re-run the same command to retry the failed windows.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
 import requests
 import json
+import sys
 from datetime import datetime, timedelta, timezone
 from math import radians, sin, cos, sqrt, atan2
 import matplotlib.pyplot as plt
 import os
 from dotenv import load_dotenv
 
+# Shared helpers (fast JSON decoding, AQI engine, change capture, API base URLs) live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fast_json import compressed_headers, decode_response, describe_payload, LOCATIONS_RESPONSE, MEASUREMENTS_RESPONSE
+from aqi_engine import POLLUTANTS, category, category_name, good_range, parse_sensor_name, sensor_aqi
+from change_capture import emit_changes, write_if_changed
+from api_endpoints import OPENAQ_BASE_URL as BASE_URL
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -15,7 +23,6 @@ API_KEY = os.getenv("openaq_token")
 # -----------------------
 # Configuration and API URLs
 # -----------------------
-BASE_URL = "https://api.openaq.org/v3"
 LOCATIONS_API_URL = f"{BASE_URL}/locations"
 MEASUREMENTS_API_URL = f"{BASE_URL}/sensors"  # We'll append /{sensor_id}/measurements
 headers = {"X-API-Key": API_KEY}
@@ -41,9 +48,9 @@ def get_near_locations(lat, lon, radius=12000, limit=10):
     and compute the distance of each location from (lat, lon).
     """
     url = f"{LOCATIONS_API_URL}?coordinates={lat},{lon}&radius={radius}&limit={limit}"
-    response = requests.get(url, headers=headers)
+    response = requests.get(url, headers=compressed_headers(headers))
     if response.status_code == 200:
-        data = response.json()["results"]
+        data = decode_response(response, LOCATIONS_RESPONSE)["results"]
         # Compute distance for each location.
         for loc in data:
             coords = loc.get("coordinates", {})
@@ -77,11 +84,11 @@ def get_latest_measurement_for_sensor(sensor_id):
         "order_by": "datetimeFrom.utc",
         "sort": "desc"
     }
-    response = requests.get(url, headers=headers, params=params)
-    print("Full Get_Latest_Hours API response for sensor", sensor_id)
-    json_response = response.json()
-    print(json_response)
+    response = requests.get(url, headers=compressed_headers(headers), params=params)
     if response.status_code == 200:
+        json_response = decode_response(response, MEASUREMENTS_RESPONSE,
+                                        label=f"Full Get_Latest_Hours API response for sensor {sensor_id}")
+        print(f"Get_Latest_Hours API response for sensor {sensor_id}: {describe_payload(json_response)}")
         results = json_response.get("results", [])
         if not results:
             print(f"No hourly measurement results for sensor {sensor_id}.")
@@ -167,33 +174,42 @@ def process_location(location):
 def plot_sensor_measurements(sensor_measurements, location_id):
     """
     Create a scatter plot of sensor measurement values.
-    Each parameter is plotted on the x-axis (as discrete points) with a green shaded healthy range.
+    Each parameter is plotted on the x-axis (as discrete points) with a green shaded healthy range
+    (the US EPA "Good" band, AQI 0-50) and its AQI sub-index.
     The plot is saved with the location ID appended to the filename.
     """
-    healthy_ranges = {
-        "co µg/m³": (0, 500),
-        "no2 µg/m³": (0, 40),
-        "o3 µg/m³": (0, 100),
-        "pm10 µg/m³": (0, 50),
-        "pm25 µg/m³": (0, 12),
-        "so2 µg/m³": (0, 20)
-    }
     unique_params = []
     for meas in sensor_measurements:
         param = meas["parameter"]
         if param not in unique_params:
             unique_params.append(param)
     param_to_index = {param: i for i, param in enumerate(unique_params)}
+
+    # Healthy range = concentrations with a US EPA AQI of 0-50, in each sensor's own units.
+    healthy_ranges = {}
+    for param in unique_params:
+        pollutant, units = parse_sensor_name(param)
+        if pollutant in POLLUTANTS and units:
+            healthy_ranges[param] = good_range(pollutant, units)
     plt.figure(figsize=(10, 6))
+    sub_indices = []
     for meas in sensor_measurements:
         param = meas["parameter"]
         x = param_to_index[param]
         y = meas["measurement_value"]
+        index, _ = sensor_aqi(param, y)
+        if index is not None:
+            sub_indices.append((index, param))
+        label = f"{y:.1f}" if index is None else f"{y:.1f} (AQI {index:.0f})"
         plt.scatter(x, y, s=100, color="blue", zorder=3)
-        plt.text(x, y, f"{y:.1f}", fontsize=9, ha="center", va="bottom")
+        plt.text(x, y, label, fontsize=9, ha="center", va="bottom")
     plt.xticks(range(len(unique_params)), unique_params, fontsize=10)
     plt.ylabel("Measurement Value", fontsize=12)
-    plt.title("Sensor Measurements", fontsize=14)
+    title = "Sensor Measurements"
+    if sub_indices:
+        overall, dominant = max(sub_indices)
+        title += f" - US AQI {overall:.0f} ({category_name(category(overall))}, {dominant})"
+    plt.title(title, fontsize=14)
     for param, x in param_to_index.items():
         if param in healthy_ranges:
             low, high = healthy_ranges[param]
@@ -263,10 +279,15 @@ def main():
         "candidate_locations": output_candidates
     }
 
+    # Publish only the new or changed readings; the snapshot is rewritten only when its content changed.
+    all_measurements = [m for candidate in candidate_locations for m in candidate["sensor_measurements"]]
+    emit_changes("openaq", all_measurements, key="sensor_id",
+                 time="measurement_datetime", value="measurement_value")
     json_filename = "latest_air_quality_data.json"
-    with open(json_filename, "w", encoding="utf-8") as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
-    print(f"Saved structured air quality data to '{json_filename}'.")
+    if write_if_changed(json_filename, output, indent=2, ensure_ascii=False):
+        print(f"Saved structured air quality data to '{json_filename}'.")
+    else:
+        print(f"'{json_filename}' already holds this snapshot; left unchanged.")
 
 
 if __name__ == "__main__":
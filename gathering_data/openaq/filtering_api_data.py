@@ -1,16 +1,24 @@
 import os
 import requests
 import json
+import sys
 from datetime import datetime, timedelta, timezone
 from math import radians, sin, cos, sqrt, atan2
 import matplotlib.pyplot as plt
 import os
 from dotenv import load_dotenv
 
+# Shared helpers (fast JSON decoding, API base URLs) live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from fast_json import compressed_headers, decode_response, describe_payload, MEASUREMENTS_RESPONSE
+
+from hourly_aggregation import summarize_series
+from sensor_metadata_cache import SensorMetadataCache
+from api_endpoints import OPENAQ_BASE_URL as BASE_URL
+
 # -----------------------
 # Configuration and API URLs
 # -----------------------
-BASE_URL = "https://api.openaq.org/v3"
 # Load environment variables from .env file
 load_dotenv()
 # API Token from .env
@@ -37,7 +45,7 @@ def haversine(lat1, lon1, lat2, lon2):
 # -----------------------
 # Revised Measurement Retrieval Function with Date Range Filtering
 # -----------------------
-def get_latest_measurement_for_sensor(sensor_id, start_date, end_date):
+def get_latest_measurement_for_sensor(sensor_id, start_date, end_date, series=None):
     """
     Retrieve the most recent hourly measurement for the given sensor_id
     that falls between the provided ISO-formatted start_date and end_date.
@@ -45,6 +53,9 @@ def get_latest_measurement_for_sensor(sensor_id, start_date, end_date):
     We call the /sensors/{sensor_id}/hours endpoint and then explicitly filter
     the returned measurements by the parsed timestamp.
 
+    If a `series` dict is given, every hourly record inside the window is kept in
+    series[sensor_id] (for hourly_aggregation) instead of being thrown away.
+
     Example:
       start_date = "2025-02-01T00:00:00Z"
       end_date   = "2025-02-02T00:00:00Z"
@@ -58,15 +69,15 @@ def get_latest_measurement_for_sensor(sensor_id, start_date, end_date):
         "sort": "desc"
     }
 
-    response = requests.get(url, headers=headers, params=params)
-    print(f"Full Get_Latest_Hours API response for sensor {sensor_id}:")
-    json_response = response.json()
-    print(json_response)
-
+    response = requests.get(url, headers=compressed_headers(headers), params=params)
     if response.status_code != 200:
         print(f"Error fetching data for sensor {sensor_id}: {response.status_code} {response.text}")
         return None
 
+    json_response = decode_response(response, MEASUREMENTS_RESPONSE,
+                                    label=f"Full Get_Latest_Hours API response for sensor {sensor_id}")
+    print(f"Get_Latest_Hours API response for sensor {sensor_id}: {describe_payload(json_response)}")
+
     results = json_response.get("results", [])
     if not results:
         print(f"No data returned for sensor {sensor_id} in the requested window.")
@@ -103,6 +114,9 @@ def get_latest_measurement_for_sensor(sensor_id, start_date, end_date):
         print(f"No measurement for sensor {sensor_id} falls within {start_date} to {end_date}.")
         return None
 
+    if series is not None:
+        series[sensor_id] = [meas for _, meas in valid_results]
+
     # Select the measurement with the latest datetime among valid ones.
     latest_dt, latest_meas = max(valid_results, key=lambda x: x[0])
     print(f"Latest measurement for sensor {sensor_id}: {latest_meas}")
@@ -112,11 +126,12 @@ def get_latest_measurement_for_sensor(sensor_id, start_date, end_date):
 # -----------------------
 # Process Location Function
 # -----------------------
-def process_location(location, start_date, end_date):
+def process_location(location, start_date, end_date, series=None):
     """
     For a given location dictionary, iterate through its sensors and retrieve
     the hourly measurement (using get_latest_measurement_for_sensor) within the
     specified date range. Returns a list of sensor measurement entries.
+    Pass a `series` dict to also collect each sensor's full hourly series.
     """
     sensors = location.get("sensors", [])
     sensor_entries = []
@@ -129,7 +144,7 @@ def process_location(location, start_date, end_date):
         if not sensor_id:
             continue
         print(f"  Fetching measurement for sensor: {sensor_id} - {sensor_name}")
-        meas = get_latest_measurement_for_sensor(sensor_id, start_date, end_date)
+        meas = get_latest_measurement_for_sensor(sensor_id, start_date, end_date, series)
         if meas:
             period = meas.get("period", {})
             measurement_datetime = None
@@ -156,42 +171,33 @@ def process_location(location, start_date, end_date):
 # -----------------------
 def main():
     # CJ-3 location details.
-    # Based on your Excel data, CJ-3 (location_id 2163127) has the following coordinates:
-    #   latitude: 46.765425, longitude: 23.550258
-    # Include all six sensors of interest:
-    #   1. Sensor for "co µg/m³": 11438933
-    #   2. Sensor for "no2 µg/m³": 9020849
-    #   3. Sensor for "o3 µg/m³": 9020848
-    #   4. Sensor for "pm10 µg/m³": 7774317
-    #   5. Sensor for "pm25 µg/m³": 7773481
-    #   6. Sensor for "so2 µg/m³": 7774375
-    selected_location = {
-        "id": 2163127,
-        "name": "CJ-3",
-        "coordinates": {"latitude": 46.765425, "longitude": 23.550258},
-        "sensors": [
-            {"id": 11438933, "name": "co µg/m³"},
-            {"id": 9020849, "name": "no2 µg/m³"},
-            {"id": 9020848, "name": "o3 µg/m³"},
-            {"id": 7774317, "name": "pm10 µg/m³"},
-            {"id": 7773481, "name": "pm25 µg/m³"},
-            {"id": 7774375, "name": "so2 µg/m³"}
-        ]
-    }
+    # Its sensors (co, no2, o3, pm10, pm25, so2) are resolved from the OpenAQ metadata and kept in
+    # sensor_metadata_cache.json, so newly added or retired sensors are picked up automatically.
+    # CJ-3 (location_id 2163127) is at latitude 46.765425, longitude 23.550258.
+    cache = SensorMetadataCache()
+    selected_location = cache.get_location("CJ-3", near=(46.765425, 23.550258))
+    if selected_location is None:
+        print("Could not resolve the CJ-3 location; aborting.")
+        return
 
     # Set the custom date range to match your Excel file.
     # For example: 2025-02-01T00:00:00Z to 2025-02-02T00:00:00Z.
     start_date = "2025-02-01T00:00:00Z"
     end_date = "2025-02-02T00:00:00Z"
 
-    # Process the location using the custom date range.
-    sensor_measurements = process_location(selected_location, start_date, end_date)
+    # Process the location using the custom date range, keeping the hourly series.
+    series = {}
+    sensor_measurements = process_location(selected_location, start_date, end_date, series)
+
+    # Daily means, 8/24-hour rolling means and percentiles over the whole window.
+    aggregates = summarize_series(series, start_date, end_date)
 
     # Structure the output.
     output = {
         "location": selected_location,
         "date_range": {"date_from": start_date, "date_to": end_date},
-        "sensor_measurements": sensor_measurements
+        "sensor_measurements": sensor_measurements,
+        "aggregates": aggregates
     }
 
     json_filename = "latest_air_quality_data.json"
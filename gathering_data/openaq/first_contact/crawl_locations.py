@@ -0,0 +1,446 @@
+"""
+Resumable, parallel crawler for every OpenAQ location (and its sensors) of one country or of all countries.
+
+Pages of /locations are fetched concurrently under a shared rate limiter. Each page is
+written to its own JSONL files as soon as it arrives and progress is checkpointed, so an
+interrupted crawl picks up where it stopped when run again with the same output directory.
+
+Examples:
+    python crawl_locations.py --country RO
+    python crawl_locations.py --all --workers 8 --rate 1.5 --output crawl_output
+    python crawl_locations.py --all --max-age-hours 20     # nightly refresh
+    python crawl_locations.py --country 74 --restart
+
+Refreshing: a complete country older than the max age is crawled again into
+<output>/.refresh/ (resumable, with its own checkpoint). Its previous output stays in
+place, and is only replaced, by renaming directories, once the new crawl of that country
+is complete; a failed refresh keeps the old catalog.
+
+Output layout:
+    <output>/checkpoint.json
+    <output>/<COUNTRY>/locations_p00001.jsonl   one location record per line
+    <output>/<COUNTRY>/sensors_p00001.jsonl     one flattened sensor record per line
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from dotenv import load_dotenv
+
+# Shared helpers (rate limiter, API base URLs) live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from rate_limiter import RateLimiter, rate_limited_get, DEFAULT_OPENAQ_RATE
+from fetch_countries import fetch_all_countries
+from api_endpoints import OPENAQ_BASE_URL as BASE_URL
+
+# Load environment variables from .env file
+load_dotenv()
+
+# API Token from .env
+API_KEY = os.getenv("openaq_token")
+
+LOCATIONS_API_URL = f"{BASE_URL}/locations"
+
+# Headers required for authentication
+headers = {"X-API-Key": API_KEY}
+
+PAGE_SIZE = 1000  # the largest page /locations serves
+DEFAULT_OUTPUT_DIR = "crawl_output"
+REFRESH_DIR = ".refresh"  # hidden, so glob("<output>/*/locations_p*.jsonl") skips it
+
+
+# -----------------------
+# Checkpoint
+# -----------------------
+class CrawlCheckpoint:
+    """
+    Progress of a crawl, persisted as JSON after every page. Per country it records the
+    reported result count, the number of pages, and the record count of each finished page.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.state = json.load(f)
+        else:
+            self.state = {"countries": {}}
+
+    def country(self, key):
+        with self.lock:
+            return self.state["countries"].setdefault(key, {
+                "found": None,
+                "total_pages": None,
+                "pages": {},
+                "failed_pages": [],
+                "complete": False,
+                "locations": 0,
+                "sensors": 0,
+            })
+
+    def update(self, key, **fields):
+        with self.lock:
+            self.state["countries"][key].update(fields)
+            self._save()
+
+    def mark_page(self, key, page, location_count, sensor_count):
+        with self.lock:
+            entry = self.state["countries"][key]
+            if str(page) not in entry["pages"]:
+                entry["locations"] += location_count
+                entry["sensors"] += sensor_count
+            entry["pages"][str(page)] = location_count
+            if page in entry["failed_pages"]:
+                entry["failed_pages"].remove(page)
+            self._save()
+
+    def replace(self, key, entry):
+        with self.lock:
+            self.state["countries"][key] = entry
+            self._save()
+
+    def remove(self, key):
+        with self.lock:
+            entry = self.state["countries"].pop(key, None)
+            self._save()
+            return entry
+
+    def mark_failed(self, key, page):
+        with self.lock:
+            entry = self.state["countries"][key]
+            if page not in entry["failed_pages"]:
+                entry["failed_pages"].append(page)
+            self._save()
+
+    def _save(self):
+        # Write-then-rename, so a crash never leaves a truncated checkpoint behind.
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# -----------------------
+# Helper Functions
+# -----------------------
+def country_key(country):
+    """Directory / checkpoint key for a country given as ISO code ("RO") or OpenAQ id (74)."""
+    return str(country).upper()
+
+
+def country_params(country):
+    """Query parameters selecting a country: numeric ids use countries_id, codes use iso."""
+    if isinstance(country, int) or str(country).isdigit():
+        return {"countries_id": int(country)}
+    return {"iso": str(country).upper()}
+
+
+def flatten_sensors(location):
+    """One record per sensor of a location, with the location's id, coordinates and country."""
+    coords = location.get("coordinates") or {}
+    country = location.get("country") or {}
+    records = []
+    for sensor in location.get("sensors", []):
+        parameter = sensor.get("parameter") or {}
+        records.append({
+            "sensor_id": sensor.get("id"),
+            "location_id": location.get("id"),
+            "name": sensor.get("name"),
+            "parameter_id": parameter.get("id"),
+            "parameter": parameter.get("name"),
+            "units": parameter.get("units"),
+            "latitude": coords.get("latitude"),
+            "longitude": coords.get("longitude"),
+            "country": country.get("code"),
+        })
+    return records
+
+
+def write_jsonl_atomic(path, records):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def page_paths(output_dir, key, page):
+    country_dir = os.path.join(output_dir, key)
+    return (os.path.join(country_dir, f"locations_p{page:05d}.jsonl"),
+            os.path.join(country_dir, f"sensors_p{page:05d}.jsonl"))
+
+
+def load_crawl_results(output_dir, country, kind="locations"):
+    """Yield the crawled location (or, with kind="sensors", sensor) records of a country, in page order."""
+    country_dir = os.path.join(output_dir, country_key(country))
+    if not os.path.isdir(country_dir):
+        return
+    for name in sorted(os.listdir(country_dir)):
+        if name.startswith(f"{kind}_p") and name.endswith(".jsonl"):
+            with open(os.path.join(country_dir, name), encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+# -----------------------
+# Crawler
+# -----------------------
+class LocationCrawler:
+    """
+    Crawls /locations page by page for a set of countries. All countries share one thread
+    pool and one rate limiter, so small countries do not serialise the crawl: page 1 of
+    every country is requested up front and the remaining pages are queued as soon as the
+    page count is known.
+
+    When the API reports an exact total (meta.found) every remaining page is queued at
+    once. When it only reports a lower bound (e.g. ">1000"), pages are probed ahead in a
+    window of `workers` pages until a short page marks the end.
+    """
+
+    def __init__(self, output_dir=DEFAULT_OUTPUT_DIR, limiter=None, page_size=PAGE_SIZE, workers=4):
+        self.output_dir = output_dir
+        self.limiter = limiter or RateLimiter(DEFAULT_OPENAQ_RATE)
+        self.page_size = page_size
+        self.workers = workers
+        os.makedirs(output_dir, exist_ok=True)
+        self.checkpoint = CrawlCheckpoint(os.path.join(output_dir, "checkpoint.json"))
+        self._local = threading.local()
+        self._next_probe = {}
+        self.lock = threading.Lock()  # guards requests_made, bumped by the pool threads
+        self.requests_made = 0
+
+    def _session(self):
+        # requests.Session is not thread-safe; keep one per worker thread (connection reuse).
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            self._local.session.headers.update(headers)
+        return self._local.session
+
+    def fetch_page(self, country, page):
+        """Fetch one page of locations for a country. Returns (results, found) or raises on failure."""
+        params = dict(country_params(country), limit=self.page_size, page=page)
+        response = rate_limited_get(LOCATIONS_API_URL, self.limiter, params=params, session=self._session())
+        with self.lock:
+            self.requests_made += 1
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        payload = response.json()
+        return payload.get("results", []), payload.get("meta", {}).get("found")
+
+    def _store_page(self, key, page, results):
+        location_path, sensor_path = page_paths(self.output_dir, key, page)
+        os.makedirs(os.path.dirname(location_path), exist_ok=True)
+        sensors = [s for loc in results for s in flatten_sensors(loc)]
+        write_jsonl_atomic(location_path, results)
+        write_jsonl_atomic(sensor_path, sensors)
+        self.checkpoint.mark_page(key, page, len(results), len(sensors))
+
+    def _pages_to_schedule(self, key):
+        """Pages of a country that still need fetching, given what the checkpoint knows."""
+        entry = self.checkpoint.country(key)
+        done = {int(p) for p in entry["pages"]}
+        if "1" not in entry["pages"]:
+            return [1]
+        total = entry["total_pages"]
+        if total is not None:
+            return [p for p in range(1, total + 1) if p not in done]
+        # Unknown total: probe a window of pages past the last one fetched.
+        start = max(done) + 1
+        self._next_probe[key] = start + self.workers
+        return [p for p in range(start, start + self.workers) if p not in done]
+
+    def _after_page(self, key, page, results, found):
+        """Record page-count knowledge and return any follow-up pages to fetch."""
+        entry = self.checkpoint.country(key)
+        follow_up = []
+        if page == 1:
+            fields = {"found": found}
+            if isinstance(found, int):
+                fields["total_pages"] = max(1, math.ceil(found / self.page_size))
+            elif len(results) < self.page_size:
+                fields["total_pages"] = 1
+            self.checkpoint.update(key, **fields)
+            return self._pages_to_schedule(key)
+
+        if len(results) < self.page_size:
+            # A short page is the last one (probe-ahead pages past it come back empty).
+            if entry["total_pages"] is None or page < entry["total_pages"]:
+                self.checkpoint.update(key, total_pages=page)
+        elif entry["total_pages"] is None:
+            next_page = self._next_probe.get(key, page + 1)
+            self._next_probe[key] = next_page + 1
+            follow_up.append(next_page)
+        return follow_up
+
+    def _is_complete(self, key):
+        entry = self.checkpoint.country(key)
+        total = entry["total_pages"]
+        if total is None or entry["failed_pages"]:
+            return False
+        return all(str(p) in entry["pages"] for p in range(1, total + 1))
+
+    def crawl(self, countries, max_age_s=None):
+        """
+        Crawl every given country (ISO codes or ids). Complete countries are skipped unless
+        they were completed more than max_age_s ago, in which case they are refreshed (see
+        refresh()). Returns the checkpoint entries per country.
+        """
+        started = time.perf_counter()
+        keys = {}
+        stale = []
+        for country in countries:
+            key = country_key(country)
+            entry = self.checkpoint.country(key)
+            if entry["complete"]:
+                age = time.time() - (entry.get("completed_at") or 0)
+                if max_age_s is not None and age >= max_age_s:
+                    stale.append(country)
+                else:
+                    print(f"  {key}: already complete ({entry['locations']} locations), skipping.")
+                continue
+            # Failed pages from an earlier run are simply fetched again.
+            self.checkpoint.update(key, failed_pages=[])
+            keys[key] = country
+
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            def submit(key, page):
+                future = pool.submit(self.fetch_page, keys[key], page)
+                in_flight[future] = (key, page)
+
+            for key in keys:
+                for page in self._pages_to_schedule(key):
+                    submit(key, page)
+
+            while in_flight:
+                finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key, page = in_flight.pop(future)
+                    try:
+                        results, found = future.result()
+                    except Exception as e:
+                        print(f"  {key} page {page}: failed ({e}); will be retried on the next run.")
+                        self.checkpoint.mark_failed(key, page)
+                        continue
+                    self._store_page(key, page, results)
+                    for next_page in self._after_page(key, page, results, found):
+                        scheduled = {p for k, p in in_flight.values() if k == key}
+                        if next_page not in scheduled:
+                            submit(key, next_page)
+
+        summary = {}
+        for key in keys:
+            complete = self._is_complete(key)
+            self.checkpoint.update(key, complete=complete, completed_at=time.time() if complete else None)
+            entry = self.checkpoint.country(key)
+            state = "complete" if complete else f"incomplete (failed pages: {entry['failed_pages']})"
+            print(f"  {key}: {entry['locations']} locations, {entry['sensors']} sensors, "
+                  f"{len(entry['pages'])} page(s) - {state}")
+            summary[key] = entry
+        elapsed = time.perf_counter() - started
+        print(f"Crawl finished in {elapsed:.1f}s with {self.requests_made} request(s); "
+              f"rate limiter waited {self.limiter.waited_s:.1f}s in total.")
+        if stale:
+            summary.update(self.refresh(stale))
+        return summary
+
+    def refresh(self, countries):
+        """
+        Crawl complete countries again into <output>/.refresh/ and swap each one in once its
+        new crawl is complete. Until then (or if it fails) the previous output is kept, and
+        the next run resumes the refresh. Returns the checkpoint entries per country.
+        """
+        print(f"Refreshing {len(countries)} complete country crawl(s)...")
+        staged = LocationCrawler(os.path.join(self.output_dir, REFRESH_DIR), self.limiter, self.page_size,
+                                 self.workers)
+        staged.crawl(countries)
+        summary = {}
+        for country in countries:
+            key = country_key(country)
+            if staged.checkpoint.country(key)["complete"] and self._swap_in(key, staged):
+                print(f"  {key}: refreshed.")
+            else:
+                print(f"  {key}: refresh incomplete; keeping the previous crawl (run again to resume).")
+            summary[key] = self.checkpoint.country(key)
+        self.requests_made += staged.requests_made
+        return summary
+
+    def _swap_in(self, key, staged):
+        """Replace a country's output and checkpoint entry with its completed refresh."""
+        new_dir = os.path.join(staged.output_dir, key)
+        if not os.path.isdir(new_dir):
+            staged.checkpoint.remove(key)
+            return False
+        current_dir = os.path.join(self.output_dir, key)
+        old_dir = os.path.join(staged.output_dir, key + ".old")
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.isdir(current_dir):
+            os.replace(current_dir, old_dir)
+        os.replace(new_dir, current_dir)
+        self.checkpoint.replace(key, staged.checkpoint.remove(key))
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return True
+
+
+def crawl_country(country, output_dir=DEFAULT_OUTPUT_DIR, workers=4, limiter=None, page_size=PAGE_SIZE,
+                  max_age_s=None):
+    """Crawl all locations of one country (refreshing a crawl older than max_age_s) and return its checkpoint entry."""
+    crawler = LocationCrawler(output_dir, limiter, page_size, workers)
+    crawler.crawl([country], max_age_s)
+    return crawler.checkpoint.country(country_key(country))
+
+
+def crawl_all_countries(output_dir=DEFAULT_OUTPUT_DIR, workers=4, limiter=None, page_size=PAGE_SIZE,
+                        max_age_s=None):
+    """Crawl the locations of every country OpenAQ knows about."""
+    limiter = limiter or RateLimiter(DEFAULT_OPENAQ_RATE)
+    countries = fetch_all_countries(limiter=limiter)
+    if not countries:
+        print("No countries returned; nothing to crawl.")
+        return {}
+    print(f"Crawling {len(countries)} countries...")
+    crawler = LocationCrawler(output_dir, limiter, page_size, workers)
+    return crawler.crawl([c.get("code") or c.get("id") for c in countries], max_age_s)
+
+
+# -----------------------
+# Main Workflow
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Crawl all OpenAQ locations of a country (or all countries).")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--country", action="append", help="ISO code or OpenAQ country id (repeatable).")
+    target.add_argument("--all", action="store_true", help="Crawl every country.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=DEFAULT_OPENAQ_RATE, help="Requests per second.")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE)
+    parser.add_argument("--max-age-hours", type=float, default=None,
+                        help="Refresh complete crawls older than this (the old output is kept until the new one is complete).")
+    parser.add_argument("--restart", action="store_true", help="Discard the previous crawl output and checkpoint.")
+    args = parser.parse_args()
+
+    if args.restart and os.path.isdir(args.output):
+        shutil.rmtree(args.output)
+
+    limiter = RateLimiter(args.rate, burst=max(1, args.workers))
+    max_age_s = None if args.max_age_hours is None else args.max_age_hours * 3600
+    if args.all:
+        crawl_all_countries(args.output, args.workers, limiter, args.page_size, max_age_s)
+    else:
+        crawler = LocationCrawler(args.output, limiter, args.page_size, args.workers)
+        crawler.crawl(args.country, max_age_s)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Optional export adapters for the record lists returned by the fetch functions.
+
+The fetch path works on plain lists of dicts; pandas and pyarrow are only imported
+here, and only when a caller explicitly asks for a DataFrame or an Arrow table.
+
+    from export_adapters import to_dataframe
+    df = to_dataframe(get_locations_near(44.4268, 26.1025))
+"""
+
+
+def _flatten(record, prefix="", sep="."):
+    """Flatten nested dicts into dotted keys ({"coordinates": {"latitude": 1}} -> {"coordinates.latitude": 1})."""
+    flat = {}
+    for key, value in record.items():
+        name = f"{prefix}{sep}{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name, sep))
+        else:
+            flat[name] = value
+    return flat
+
+
+def to_dataframe(records, columns=None, flatten=False):
+    """
+    Build a pandas DataFrame from a list of records. pandas is imported lazily, so callers
+    that never export pay nothing for it.
+
+    Parameters:
+        records (list[dict]): Records as returned by the fetch functions.
+        columns (list[str]): Optional subset / ordering of columns.
+        flatten (bool): Expand nested dicts into dotted column names.
+    """
+    try:
+        import pandas as pd
+    except ImportError as e:
+        raise ImportError("to_dataframe() needs pandas: pip install pandas") from e
+
+    rows = [_flatten(r) for r in records] if flatten else records
+    df = pd.DataFrame(rows)
+    if columns:
+        df = df[[c for c in columns if c in df.columns]]
+    return df
+
+
+def to_arrow(records, columns=None, flatten=True):
+    """
+    Build a pyarrow Table from a list of records (nested dicts are flattened by default,
+    since mixed nested structures do not always infer a clean Arrow schema).
+    """
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("to_arrow() needs pyarrow: pip install pyarrow") from e
+
+    rows = [_flatten(r) for r in records] if flatten else list(records)
+    if columns:
+        rows = [{c: r.get(c) for c in columns} for r in rows]
+    return pa.Table.from_pylist(rows)
+
+
+def format_table(records, columns):
+    """
+    Render selected columns of a record list as a fixed-width text table, for console output
+    without pulling in pandas. Nested values can be addressed with dotted names ("country.code").
+    """
+    def cell(record, column):
+        value = record
+        for part in column.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        if isinstance(value, float):
+            return f"{value:.1f}"
+        return "" if value is None else str(value)
+
+    rows = [[cell(r, c) for c in columns] for r in records]
+    widths = [max([len(c)] + [len(row[i]) for row in rows]) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.rjust(w) for c, w in zip(columns, widths))]
+    lines += ["  ".join(v.rjust(w) for v, w in zip(row, widths)) for row in rows]
+    return "\n".join(lines)
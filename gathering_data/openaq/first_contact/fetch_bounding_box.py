@@ -1,8 +1,13 @@
 #!/usr/bin/env python
 import requests
-import pandas as pd
 import os
+import sys
 from dotenv import load_dotenv
+from export_adapters import format_table
+
+# Shared API base URLs live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from api_endpoints import OPENAQ_BASE_URL as BASE_URL
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,7 +16,7 @@ load_dotenv()
 API_KEY = os.getenv("openaq_token")
 
 # OpenAQ API URL for locations
-LOCATIONS_API_URL = "https://api.openaq.org/v3/locations"
+LOCATIONS_API_URL = f"{BASE_URL}/locations"
 
 # Headers required for authentication
 headers = {"X-API-Key": API_KEY}
@@ -29,24 +34,18 @@ def get_locations_in_bbox(bbox, limit=10):
         limit (int): Maximum number of results to return.
 
     Returns:
-        pd.DataFrame: A DataFrame containing the location data.
+        list[dict]: The location records (export_adapters.to_dataframe() converts them if needed).
     """
     url = f"{LOCATIONS_API_URL}?bbox={bbox}&limit={limit}"
     response = requests.get(url, headers=headers)
 
     if response.status_code == 200:
         data = response.json()["results"]
-        df = pd.DataFrame(data)
         print(f"\nLocations inside bounding box {bbox}:")
 
         # Print selected columns. Adjust the column list as needed.
-        try:
-            print(df[["id", "name", "city", "country"]])
-        except KeyError:
-            # In case some of the expected columns are not present, print the full DataFrame.
-            print("Some expected columns are missing. Here's the full DataFrame:")
-            print(df)
-        return df
+        print(format_table(data, ["id", "name", "locality", "country.code"]))
+        return data
     else:
         print("Error fetching locations in bounding box:", response.status_code, response.text)
         return None
@@ -3,9 +3,15 @@
 
 
 import requests
-import pandas as pd
 import os
+import sys
 from dotenv import load_dotenv
+from export_adapters import format_table
+
+# Shared helpers (rate limiter, API base URLs) live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from rate_limiter import rate_limited_get
+from api_endpoints import OPENAQ_BASE_URL as BASE_URL
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,37 +21,51 @@ API_KEY = os.getenv("openaq_token")
 
 
 # OpenAQ API URL for countries
-COUNTRIES_API_URL = "https://api.openaq.org/v3/countries"
+COUNTRIES_API_URL = f"{BASE_URL}/countries"
 
 # Headers required for authentication
 headers = {"X-API-Key": API_KEY}
 
 
-def get_country_list():
-    """Fetch all available countries and their IDs from OpenAQ."""
-    params = {"limit": 200, "page": 1}  # Fetch all countries
-    response = requests.get(COUNTRIES_API_URL, headers=headers, params=params)
+def fetch_all_countries(limiter=None, page_size=200):
+    """
+    Page through /countries until every country has been returned.
+    Returns the list of country records, or None if a page could not be fetched.
+    """
+    countries = []
+    page = 1
+    while True:
+        params = {"limit": page_size, "page": page}
+        response = rate_limited_get(COUNTRIES_API_URL, limiter, headers=headers, params=params)
+        if response.status_code != 200:
+            print("Error fetching country list:", response.status_code, response.text)
+            return None
+        payload = response.json()
+        results = payload.get("results", [])
+        countries.extend(results)
+        found = payload.get("meta", {}).get("found")
+        # "found" is a number, or a string such as ">1000" when the API only knows a lower bound.
+        if len(results) < page_size or (isinstance(found, int) and len(countries) >= found):
+            return countries
+        page += 1
 
-    if response.status_code == 200:
-        countries = response.json()["results"]
-        df = pd.DataFrame(countries)
 
-        # Ensure all rows are displayed
-        pd.set_option("display.max_rows", None)  # Show all rows
-        pd.set_option("display.max_columns", None)  # Show all columns if needed
-        pd.set_option("display.width", 1000)  # Prevent line breaks
+def get_country_list():
+    """Fetch all available countries and their IDs from OpenAQ."""
+    countries = fetch_all_countries()
 
+    if countries is not None:
         print("\nAvailable Countries:")
-        print(df[["id", "code", "name"]])
+        print(format_table(countries, ["id", "code", "name"]))
 
         # Check for the USA explicitly, as it was previously missing
-        usa_data = df[df["code"].str.contains("US", case=False) | df["name"].str.contains("United States", case=False)]
+        usa_data = [c for c in countries
+                    if "us" in (c.get("code") or "").lower() or "united states" in (c.get("name") or "").lower()]
         print("\nUSA Data:")
-        print(usa_data)
+        print(format_table(usa_data, ["id", "code", "name"]))
 
-        return df
+        return countries
     else:
-        print("Error fetching country list:", response.status_code, response.text)
         return None
 
 
@@ -65,17 +85,17 @@ def get_country_info(country_id=74):
 
         # The response payload contains a "results" key with a list of country objects.
         if "results" in data and data["results"]:
-            df = pd.DataFrame(data["results"])
-            print("\nDataFrame Column Names:", df.columns)
+            results = data["results"]
+            print("\nRecord fields:", list(results[0].keys()))
 
             # Display key fields: id, code, and name
-            available_columns = [col for col in ["id", "code", "name"] if col in df.columns]
+            available_columns = [col for col in ["id", "code", "name"] if col in results[0]]
             if available_columns:
                 print("\nCountry information:")
-                print(df[available_columns])
+                print(format_table(results, available_columns))
             else:
                 print("No expected columns found in API response.")
-            return df
+            return results
         else:
             print("No country information found.")
             return None
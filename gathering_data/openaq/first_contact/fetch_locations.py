@@ -1,9 +1,15 @@
 import requests
-import pandas as pd
 import json
 from math import radians, sin, cos, sqrt, atan2
 import os
+import sys
 from dotenv import load_dotenv
+from export_adapters import format_table
+from crawl_locations import crawl_country, load_crawl_results, DEFAULT_OUTPUT_DIR
+
+# Shared API base URLs live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from api_endpoints import OPENAQ_BASE_URL as BASE_URL
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,11 +18,13 @@ load_dotenv()
 API_KEY = os.getenv("openaq_token")
 
 # OpenAQ API URL for locations
-LOCATIONS_API_URL = "https://api.openaq.org/v3/locations"
+LOCATIONS_API_URL = f"{BASE_URL}/locations"
 
 # Headers required for authentication
 headers = {"X-API-Key": API_KEY}
 
+LOCATIONS_MAX_AGE_S = 7 * 86400  # stations are added and retired slowly
+
 
 def haversine(lat1, lon1, lat2, lon2):
     """
@@ -38,42 +46,57 @@ def get_locations_near(lat, lon, radius=12000, limit=10):
     Fetch air quality locations near a given coordinate using a point and radius query.
     Computes the distance (in meters) from the starting coordinates for each location,
     sorts the locations by distance, and saves the result as formatted JSON to a file.
+
+    Returns the location records (list of dicts); use export_adapters.to_dataframe()
+    if a DataFrame is needed.
     """
     url = f"{LOCATIONS_API_URL}?coordinates={lat},{lon}&radius={radius}&limit={limit}"
     response = requests.get(url, headers=headers)
 
     if response.status_code == 200:
-        data = response.json()["results"]
-        df = pd.DataFrame(data)
+        results = response.json()["results"]
 
         # Compute the distance for each location using the Haversine formula.
-        df["distance"] = df["coordinates"].apply(
-            lambda coords: haversine(lat, lon, coords.get("latitude"), coords.get("longitude"))
-        )
+        for loc in results:
+            coords = loc.get("coordinates") or {}
+            loc["distance"] = haversine(lat, lon, coords.get("latitude"), coords.get("longitude"))
 
-        # Sort the DataFrame by the computed distance.
-        df = df.sort_values("distance")
+        # Sort the locations by the computed distance.
+        results.sort(key=lambda loc: loc["distance"])
 
         print(f"\nLocations near {lat}, {lon} (within {radius}m), sorted by distance:")
-        # Print all columns, including the computed distance.
-        print(df.to_string(index=False))
-
-        # Convert the DataFrame to a list of dictionaries.
-        results = df.to_dict(orient="records")
+        print(format_table(results, ["id", "name", "locality", "country.code", "distance"]))
 
         # Save the formatted JSON to a file.
         json_filename = "get_near_locations.json"
         with open(json_filename, "w", encoding="utf-8") as f:
             json.dump(results, f, indent=2, ensure_ascii=False)
 
-
         print(f"Saved formatted JSON to '{json_filename}'")
-        return df
+        return results
     else:
         print("Error fetching locations near coordinates:", response.status_code, response.text)
         return None
 
 
+def get_all_locations_in_country(country, output_dir=DEFAULT_OUTPUT_DIR, workers=4, max_age_s=LOCATIONS_MAX_AGE_S):
+    """
+    Fetch every location of a country (ISO code such as "RO", or OpenAQ country id).
+    Pages are crawled in parallel under the rate limiter and checkpointed in output_dir,
+    so calling this again after an interruption only fetches the missing pages.
+    A complete crawl older than max_age_s (None: never) is refreshed; the previous one is
+    returned if the refresh does not complete. Returns the list of location records.
+    """
+    entry = crawl_country(country, output_dir=output_dir, workers=workers, max_age_s=max_age_s)
+    locations = list(load_crawl_results(output_dir, country))
+    print(f"\nLocations in {country}: {len(locations)} "
+          f"({'complete' if entry.get('complete') else 'incomplete - run again to resume'})")
+    print(format_table(locations[:20], ["id", "name", "locality"]))
+    if len(locations) > 20:
+        print(f"... and {len(locations) - 20} more.")
+    return locations
+
+
 if __name__ == "__main__":
     # Example: Save formatted JSON for locations near Bucharest (44.4268, 26.1025)
     get_locations_near(44.4268, 26.1025)
@@ -1,12 +1,19 @@
 import requests
-import pandas as pd
 import json
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 from math import radians, sin, cos, sqrt, atan2
 
 import os
+import sys
+import numpy as np
 from dotenv import load_dotenv
 
+# The freshness index lives in gathering_data/openaq/, the API base URLs in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from freshness_index import FreshnessIndex
+from api_endpoints import OPENAQ_BASE_URL as BASE_URL
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -14,11 +21,13 @@ load_dotenv()
 API_KEY = os.getenv("openaq_token")
 
 # API URLs and key
-BASE_URL = "https://api.openaq.org/v3"
 LOCATIONS_API_URL = f"{BASE_URL}/locations"
 MEASUREMENTS_API_URL = f"{BASE_URL}/sensors"  # We'll append /{sensor_id}/measurements
 headers = {"X-API-Key": API_KEY}
 
+# Last-update state of every sensor seen so far, shared across locations.
+FRESHNESS = FreshnessIndex()
+
 
 def haversine(lat1, lon1, lat2, lon2):
     """Calculate the great-circle distance between two points on Earth (in meters) using the Haversine formula."""
@@ -41,15 +50,14 @@ def get_locations_near(lat, lon, radius=12000, limit=10):
     response = requests.get(url, headers=headers)
 
     if response.status_code == 200:
-        data = response.json()["results"]
-        df = pd.DataFrame(data)
+        results = response.json()["results"]
         # Compute distance for each location
-        df["distance"] = df["coordinates"].apply(
-            lambda coords: haversine(lat, lon, coords.get("latitude"), coords.get("longitude"))
-        )
+        for loc in results:
+            coords = loc.get("coordinates") or {}
+            loc["distance"] = haversine(lat, lon, coords.get("latitude"), coords.get("longitude"))
         # Sort by computed distance
-        df = df.sort_values("distance")
-        return df.to_dict(orient="records")
+        results.sort(key=lambda loc: loc["distance"])
+        return results
     else:
         print("Error fetching locations near coordinates:", response.status_code, response.text)
         return None
@@ -75,53 +83,32 @@ def get_latest_measurement_for_sensor(sensor_id):
         return None
 
 
-def is_live_measurement(measurement, max_age_minutes=60):
-    """
-    Given a measurement record, determine if its timestamp is within max_age_minutes of the current UTC time.
-    We use the measurement's period.datetimeTo field as the reported timestamp.
+def get_latest_measurements_for_location(location, max_age_minutes=60, index=None):
     """
-    period = measurement.get("period", {})
-    datetime_to_obj = period.get("datetimeTo")
-    datetime_to_str = None
-    if isinstance(datetime_to_obj, dict):
-        datetime_to_str = datetime_to_obj.get("utc")
-    elif isinstance(datetime_to_obj, str):
-        datetime_to_str = datetime_to_obj
-
-    if datetime_to_str:
-        # Replace 'Z' with '+00:00' for proper parsing
-        measurement_time = datetime.fromisoformat(datetime_to_str.replace("Z", "+00:00"))
-        now_utc = datetime.now(timezone.utc)
-        age = now_utc - measurement_time
-        return age <= timedelta(minutes=max_age_minutes), measurement_time, age
-    return False, None, None
-
-
-def get_latest_measurements_for_location(location, max_age_minutes=60):
-    """
-    For a given location (dict), iterate over its sensors and fetch the latest measurement for each sensor.
-    For each measurement, determine if the measurement is "live" (i.e. within max_age_minutes).
+    For a given location (dict), fetch the latest measurement for each of its sensors and record it
+    in the freshness index, which flags every sensor as "live" (within max_age_minutes) in one pass.
     Returns a list of sensor results (each is a dict with sensor metadata, latest_measurement,
-    and a new flag "is_live" along with the measurement timestamp and its age).
+    the "is_live" flag along with the measurement timestamp and its age), live sensors first
+    and each group ordered from freshest to stalest.
     """
+    index = FRESHNESS if index is None else index
+    index.add_location(location)
+    sensors = [sensor for sensor in location.get("sensors", []) if sensor.get("id")]
+    measurements = {sensor["id"]: get_latest_measurement_for_sensor(sensor["id"]) for sensor in sensors}
+    index.update_from_measurements(measurements)
+
+    sensor_ids = [sensor["id"] for sensor in sensors]
+    order, is_live, ages = index.rank(sensor_ids, max_age_minutes)
+    epochs = index.last_epochs[index.rows_for(sensor_ids)]
     sensor_results = []
-    sensors = location.get("sensors", [])
-    for sensor in sensors:
-        sensor_id = sensor.get("id")
-        if sensor_id:
-            meas = get_latest_measurement_for_sensor(sensor_id)
-            is_live = False
-            measurement_time = None
-            age = None
-            if meas:
-                is_live, measurement_time, age = is_live_measurement(meas, max_age_minutes)
-            sensor_info = sensor.copy()  # sensor metadata
-            sensor_info["latest_measurement"] = meas
-            sensor_info["is_live"] = is_live
-            if measurement_time:
-                sensor_info["measurement_time"] = measurement_time.isoformat()
-                sensor_info["measurement_age_minutes"] = age.total_seconds() / 60
-            sensor_results.append(sensor_info)
+    for i in order:
+        sensor_info = sensors[i].copy()  # sensor metadata
+        sensor_info["latest_measurement"] = measurements[sensor_ids[i]]
+        sensor_info["is_live"] = bool(is_live[i])
+        if np.isfinite(ages[i]):
+            sensor_info["measurement_time"] = datetime.fromtimestamp(int(epochs[i]), tz=timezone.utc).isoformat()
+            sensor_info["measurement_age_minutes"] = float(ages[i]) / 60
+        sensor_results.append(sensor_info)
     return sensor_results
 
 
@@ -143,11 +130,8 @@ def main():
             "coordinates": loc.get("coordinates"),
             "sensors": []
         }
-        sensors_data = get_latest_measurements_for_location(loc, max_age_minutes=60)
-        # Prioritize sensors with live measurements.
-        sensors_data = sorted(sensors_data, key=lambda x: (
-        not x.get("is_live", False), x.get("measurement_age_minutes", float('inf'))))
-        loc_entry["sensors"] = sensors_data
+        # Sensors come back ranked: live measurements first.
+        loc_entry["sensors"] = get_latest_measurements_for_location(loc, max_age_minutes=60)
         aggregated_results.append(loc_entry)
 
     # Save the aggregated results to a JSON file.
@@ -157,6 +141,13 @@ def main():
 
     print(f"Saved aggregated live measurement data to '{json_filename}'.")
 
+    # Best live reading near the starting point, straight from the freshness index.
+    for parameter in ("pm25", "pm10", "no2", "o3"):
+        best = FRESHNESS.best_live(lat, lon, parameter, radius_km=12, max_age_minutes=60)
+        if best:
+            print(f"  {parameter}: {best['value']} at {best['distance_m'] / 1000:.1f} km "
+                  f"({best['measurement_age_minutes']:.0f} min old, sensor {best['sensor_id']})")
+
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,14 @@
 import requests
-import pandas as pd
 import json
 from math import radians, sin, cos, sqrt, atan2
 import os
+import sys
 from dotenv import load_dotenv
 
+# Shared API base URLs live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from api_endpoints import OPENAQ_BASE_URL as BASE_URL
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -12,7 +16,6 @@ load_dotenv()
 API_KEY = os.getenv("openaq_token")
 
 # API URLs and key
-BASE_URL = "https://api.openaq.org/v3"
 LOCATIONS_API_URL = f"{BASE_URL}/locations"
 MEASUREMENTS_API_URL = f"{BASE_URL}/sensors"  # We'll append /{sensor_id}/measurements
 
@@ -40,16 +43,14 @@ def get_locations_near(lat, lon, radius=12000, limit=10):
     response = requests.get(url, headers=headers)
 
     if response.status_code == 200:
-        data = response.json()["results"]
-        df = pd.DataFrame(data)
-
+        results = response.json()["results"]
         # Compute distance for each location
-        df["distance"] = df["coordinates"].apply(
-            lambda coords: haversine(lat, lon, coords.get("latitude"), coords.get("longitude"))
-        )
+        for loc in results:
+            coords = loc.get("coordinates") or {}
+            loc["distance"] = haversine(lat, lon, coords.get("latitude"), coords.get("longitude"))
         # Sort by computed distance
-        df = df.sort_values("distance")
-        return df.to_dict(orient="records")
+        results.sort(key=lambda loc: loc["distance"])
+        return results
     else:
         print("Error fetching locations near coordinates:", response.status_code, response.text)
         return None
@@ -0,0 +1,351 @@
+"""
+In-memory freshness index of OpenAQ sensors: where every sensor is and when it last reported.
+
+Per-sensor state lives in flat NumPy arrays (sensor id, location id, latitude, longitude,
+last-update epoch, last value, parameter code), one row per sensor. Rows are bucketed into
+a coarse latitude/longitude grid, so a query such as "all live pm25 sensors within 5 km,
+newer than 90 minutes" only gathers the rows of the few cells around the point and then
+evaluates distance and age for all of them in one vectorized pass:
+
+    index = FreshnessIndex()
+    index.add_location(location)                      # /locations result, registers its sensors
+    index.update_from_measurements({sensor_id: measurement, ...})
+    index.update(sensor_ids, epochs, values)          # or raw arrays, e.g. from a poller
+    live = index.live_near(44.4268, 26.1025, radius_km=5, max_age_minutes=90, parameter="pm25")
+    best = index.best_live(44.4268, 26.1025, "pm25")
+
+Updates are incremental: a reading only moves a sensor's epoch forward, so late or
+duplicate readings never overwrite newer ones.
+
+Run `python freshness_index.py --sensors 200000` to compare against a per-sensor loop.
+"""
+import argparse
+import itertools
+import math
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from hourly_aggregation import parse_utc
+
+NEVER = np.iinfo(np.int64).min  # epoch of a sensor that has not reported yet
+EARTH_RADIUS_M = 6371000.0
+KM_PER_DEGREE = 111.32
+DEFAULT_CELL_DEG = 0.25  # ~28 km of latitude per cell
+
+
+def measurement_time(measurement):
+    """period.datetimeTo.utc of a /measurements or /hours record (string), or None."""
+    period = (measurement or {}).get("period") or {}
+    dt = period.get("datetimeTo")
+    if isinstance(dt, dict):
+        dt = dt.get("utc")
+    return dt
+
+
+def haversine_many(lat, lon, lats, lons):
+    """Great-circle distance in meters from one point to arrays of points."""
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lons - lon)
+    a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+# -----------------------
+# Freshness Index
+# -----------------------
+class FreshnessIndex:
+    """Columnar per-sensor last-update state with a grid for radius queries."""
+
+    def __init__(self, cell_deg=DEFAULT_CELL_DEG, capacity=1024):
+        self.cell_deg = cell_deg
+        self.n_lon_cells = int(math.ceil(360.0 / cell_deg))
+        self.size = 0
+        self.sensor_ids = np.zeros(capacity, dtype=np.int64)
+        self.location_ids = np.zeros(capacity, dtype=np.int64)
+        self.lats = np.zeros(capacity)
+        self.lons = np.zeros(capacity)
+        self.last_epochs = np.full(capacity, NEVER, dtype=np.int64)
+        self.values = np.full(capacity, np.nan)
+        self.parameter_codes = np.zeros(capacity, dtype=np.int32)
+        self.parameters = []  # code -> parameter name
+        self._parameter_codes = {}
+        self._rows = {}  # sensor id -> row
+        self._row_cells = []  # row -> grid cell
+        self._cells = {}  # grid cell -> [rows]
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, sensor_id):
+        return sensor_id in self._rows
+
+    # -----------------------
+    # Registration
+    # -----------------------
+    def _grow(self):
+        capacity = 2 * len(self.sensor_ids)
+        for name in ("sensor_ids", "location_ids", "lats", "lons", "last_epochs", "values", "parameter_codes"):
+            old = getattr(self, name)
+            fill = NEVER if name == "last_epochs" else (np.nan if name == "values" else 0)
+            new = np.full(capacity, fill, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def _cell(self, lat, lon):
+        i = int(math.floor((lat + 90.0) / self.cell_deg))
+        j = int(math.floor((lon + 180.0) / self.cell_deg)) % self.n_lon_cells
+        return i, j
+
+    def _parameter_code(self, parameter):
+        code = self._parameter_codes.get(parameter)
+        if code is None:
+            code = len(self.parameters)
+            self.parameters.append(parameter)
+            self._parameter_codes[parameter] = code
+        return code
+
+    def add_sensor(self, sensor_id, lat, lon, parameter=None, location_id=0):
+        """Register a sensor (or move it if its coordinates changed). Returns its row."""
+        cell = self._cell(lat, lon)
+        row = self._rows.get(sensor_id)
+        if row is None:
+            if self.size == len(self.sensor_ids):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self._rows[sensor_id] = row
+            self._row_cells.append(cell)
+            self._cells.setdefault(cell, []).append(row)
+            self.sensor_ids[row] = sensor_id
+        elif self._row_cells[row] != cell:
+            self._cells[self._row_cells[row]].remove(row)
+            self._cells.setdefault(cell, []).append(row)
+            self._row_cells[row] = cell
+        self.location_ids[row] = location_id or 0
+        self.lats[row] = lat
+        self.lons[row] = lon
+        self.parameter_codes[row] = self._parameter_code(parameter)
+        return row
+
+    def add_location(self, location):
+        """Register every sensor of a /locations result at the location's coordinates."""
+        coords = location.get("coordinates") or {}
+        lat, lon = coords.get("latitude"), coords.get("longitude")
+        if lat is None or lon is None:
+            return 0
+        added = 0
+        for sensor in location.get("sensors", []):
+            if sensor.get("id") is None:
+                continue
+            parameter = (sensor.get("parameter") or {}).get("name")
+            self.add_sensor(sensor["id"], lat, lon, parameter, location.get("id"))
+            added += 1
+        return added
+
+    # -----------------------
+    # Incremental Updates
+    # -----------------------
+    def rows_for(self, sensor_ids):
+        """Rows of the given sensor ids; -1 for sensors that are not registered."""
+        rows = self._rows
+        return np.fromiter((rows.get(s, -1) for s in sensor_ids), dtype=np.int64, count=len(sensor_ids))
+
+    def update(self, sensor_ids, epochs, values=None):
+        """
+        Record new readings (arrays of sensor ids, epoch seconds and optionally values).
+        A sensor's epoch only moves forward; returns the number of sensors that got newer.
+        """
+        rows = self.rows_for(sensor_ids)
+        epochs = np.asarray(epochs, dtype=np.int64)
+        known = rows >= 0
+        rows, epochs = rows[known], epochs[known]
+        if not len(rows):
+            return 0
+        before = self.last_epochs[rows].copy()
+        np.maximum.at(self.last_epochs, rows, epochs)
+        newest = epochs == self.last_epochs[rows]
+        if values is not None:
+            values = np.asarray(values, dtype=np.float64)[known]
+            self.values[rows[newest]] = values[newest]
+        return len(np.unique(rows[newest & (epochs > before)]))
+
+    def update_from_measurements(self, measurements):
+        """Record {sensor_id: latest measurement record} (records may be None)."""
+        ids, times, values = [], [], []
+        for sensor_id, measurement in measurements.items():
+            dt = measurement_time(measurement)
+            if dt:
+                ids.append(sensor_id)
+                times.append(dt)
+                value = measurement.get("value")
+                values.append(np.nan if value is None else value)
+        return self.update(ids, parse_utc(times), values)
+
+    # -----------------------
+    # Queries
+    # -----------------------
+    def ages(self, sensor_ids, now=None):
+        """Age in seconds of each sensor's last reading (inf when unknown or never reported)."""
+        now = time.time() if now is None else now
+        rows = self.rows_for(sensor_ids)
+        epochs = self.last_epochs[np.maximum(rows, 0)]
+        ages = now - epochs.astype(np.float64)
+        ages[(rows < 0) | (epochs == NEVER)] = np.inf
+        return ages
+
+    def rank(self, sensor_ids, max_age_minutes=60, now=None):
+        """(order, is_live, ages): live sensors first, each group from freshest to stalest."""
+        ages = self.ages(sensor_ids, now)
+        is_live = ages <= max_age_minutes * 60
+        return np.lexsort((ages, ~is_live)), is_live, ages
+
+    def _candidates(self, lat, lon, radius_km):
+        """Rows in the grid cells overlapping the query circle."""
+        dlat = radius_km / KM_PER_DEGREE
+        i_lo, _ = self._cell(max(lat - dlat, -90.0), lon)
+        i_hi, _ = self._cell(min(lat + dlat, 90.0), lon)
+        cos_lat = math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+        if cos_lat < 1e-6 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180.0:
+            columns = range(self.n_lon_cells)
+        else:
+            dlon = radius_km / (KM_PER_DEGREE * cos_lat)
+            j_lo = int(math.floor((lon - dlon + 180.0) / self.cell_deg))
+            j_hi = int(math.floor((lon + dlon + 180.0) / self.cell_deg))
+            columns = {j % self.n_lon_cells for j in range(j_lo, j_hi + 1)}
+        cells = self._cells
+        lists = [cells[(i, j)] for i in range(i_lo, i_hi + 1) for j in columns if (i, j) in cells]
+        return np.fromiter(itertools.chain.from_iterable(lists), dtype=np.int64)
+
+    def live_rows(self, lat, lon, radius_km, max_age_minutes=60, parameter=None, now=None):
+        """(rows, distances_m, ages_s) of live sensors within radius_km, nearest first, then freshest."""
+        now = time.time() if now is None else now
+        rows = self._candidates(lat, lon, radius_km)
+        if parameter is not None:
+            code = self._parameter_codes.get(parameter)
+            rows = rows[self.parameter_codes[rows] == code] if code is not None else rows[:0]
+        epochs = self.last_epochs[rows]
+        keep = (epochs != NEVER) & (epochs >= now - max_age_minutes * 60)
+        rows = rows[keep]
+        distances = haversine_many(lat, lon, self.lats[rows], self.lons[rows])
+        near = distances <= radius_km * 1000.0
+        rows, distances = rows[near], distances[near]
+        ages = now - self.last_epochs[rows].astype(np.float64)
+        order = np.lexsort((ages, distances))
+        return rows[order], distances[order], ages[order]
+
+    def describe(self, rows, distances=None, ages=None):
+        """JSON-friendly records for index rows."""
+        records = []
+        for k, row in enumerate(rows):
+            epoch = int(self.last_epochs[row])
+            value = float(self.values[row])
+            record = {
+                "sensor_id": int(self.sensor_ids[row]),
+                "location_id": int(self.location_ids[row]),
+                "parameter": self.parameters[self.parameter_codes[row]],
+                "value": None if np.isnan(value) else value,
+                "measurement_time": None if epoch == NEVER else datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat(),
+            }
+            if distances is not None:
+                record["distance_m"] = round(float(distances[k]), 1)
+            if ages is not None:
+                record["measurement_age_minutes"] = float(ages[k]) / 60
+            records.append(record)
+        return records
+
+    def live_near(self, lat, lon, radius_km, max_age_minutes=60, parameter=None, now=None):
+        """Live sensors within radius_km of (lat, lon) as records, nearest first."""
+        return self.describe(*self.live_rows(lat, lon, radius_km, max_age_minutes, parameter, now))
+
+    def best_live(self, lat, lon, parameter, radius_km=25, max_age_minutes=60, now=None):
+        """The nearest live reading of a parameter (freshest on ties), or None."""
+        rows, distances, ages = self.live_rows(lat, lon, radius_km, max_age_minutes, parameter, now)
+        if not len(rows):
+            return None
+        return self.describe(rows[:1], distances[:1], ages[:1])[0]
+
+    # -----------------------
+    # Persistence
+    # -----------------------
+    def save(self, path):
+        n = self.size
+        np.savez_compressed(path, sensor_ids=self.sensor_ids[:n], location_ids=self.location_ids[:n],
+                            lats=self.lats[:n], lons=self.lons[:n], last_epochs=self.last_epochs[:n],
+                            values=self.values[:n], parameter_codes=self.parameter_codes[:n],
+                            parameters=np.asarray(self.parameters, dtype=object), cell_deg=self.cell_deg)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path, allow_pickle=True)
+        index = cls(cell_deg=float(data["cell_deg"]), capacity=max(len(data["sensor_ids"]), 1))
+        parameters = list(data["parameters"])
+        for k, sensor_id in enumerate(data["sensor_ids"]):
+            index.add_sensor(int(sensor_id), float(data["lats"][k]), float(data["lons"][k]),
+                             parameters[data["parameter_codes"][k]], int(data["location_ids"][k]))
+        index.update(data["sensor_ids"], data["last_epochs"], data["values"])
+        return index
+
+
+# -----------------------
+# Benchmark
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the freshness index against a per-sensor loop.")
+    parser.add_argument("--sensors", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--radius-km", type=float, default=10.0)
+    parser.add_argument("--max-age-minutes", type=float, default=60.0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    n = args.sensors
+    now = time.time()
+    lats = rng.uniform(35, 60, n)
+    lons = rng.uniform(-10, 40, n)
+    epochs = (now - rng.exponential(3 * 3600, n)).astype(np.int64)
+    parameters = ["pm25", "pm10", "no2", "o3"]
+
+    index = FreshnessIndex()
+    t0 = time.perf_counter()
+    for k in range(n):
+        index.add_sensor(k, lats[k], lons[k], parameters[k % 4], k // 4)
+    build = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    index.update(np.arange(n), epochs, rng.uniform(0, 80, n))
+    update = time.perf_counter() - t0
+
+    points = np.column_stack([rng.uniform(40, 55, args.queries), rng.uniform(0, 30, args.queries)])
+    t0 = time.perf_counter()
+    found = 0
+    for lat, lon in points:
+        found += len(index.live_rows(lat, lon, args.radius_km, args.max_age_minutes, "pm25", now)[0])
+    indexed = time.perf_counter() - t0
+
+    stamps = [datetime.fromtimestamp(e, tz=timezone.utc).isoformat() for e in epochs]
+    loop_queries = min(args.queries, 5)
+    t0 = time.perf_counter()
+    for lat, lon in points[:loop_queries]:
+        live = []
+        for k in range(n):
+            if parameters[k % 4] != "pm25":
+                continue
+            age = datetime.now(timezone.utc) - datetime.fromisoformat(stamps[k])
+            if age.total_seconds() <= args.max_age_minutes * 60:
+                d = haversine_many(lat, lon, lats[k:k + 1], lons[k:k + 1])[0]
+                if d <= args.radius_km * 1000:
+                    live.append((d, age))
+        live.sort()
+    loop = (time.perf_counter() - t0) / loop_queries
+
+    print(f"{n} sensors: build {build:.2f}s, bulk update {update * 1000:.1f} ms")
+    print(f"Indexed query: {indexed / args.queries * 1000:.3f} ms/query ({found / args.queries:.1f} live pm25 sensors "
+          f"within {args.radius_km:g} km on average)")
+    print(f"Per-sensor loop: {loop * 1000:.1f} ms/query ({loop / (indexed / args.queries):.0f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
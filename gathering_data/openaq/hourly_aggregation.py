@@ -0,0 +1,324 @@
+"""
+Vectorized temporal aggregation of OpenAQ hourly series (/sensors/{id}/hours).
+
+Hourly records from many sensors are laid out as one dense float64 matrix of shape
+(sensors, hours) on a shared UTC hourly grid that starts and ends at midnight, with NaN
+for missing hours. Every aggregate is then a handful of NumPy passes over that matrix,
+for all sensors at once:
+
+    matrix = HourlyMatrix.from_records({sensor_id: hours_results, ...})
+    daily = daily_means(matrix.values)                          # (sensors, days)
+    mda8 = daily_max(rolling_mean(matrix.values, 8, 6))         # daily max 8-hour mean
+    roll24 = rolling_mean(matrix.values, 24, 18)                # (sensors, hours)
+    p = percentiles(matrix.values, (50, 90, 98))                # (sensors, 3)
+    summary = summarize(matrix)                                 # JSON-friendly per sensor
+
+Coverage rules follow the EU convention: a daily mean needs 18 of 24 hours (75%), and an
+8-hour mean needs 6 of 8 hours.
+
+Run `python hourly_aggregation.py --sensors 1000 --days 365` to time a synthetic year.
+"""
+import argparse
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+HOUR = 3600
+DAY = 86400
+DEFAULT_PERCENTILES = (50, 90, 95, 98)
+
+
+# -----------------------
+# Parsing
+# -----------------------
+def parse_utc(strings):
+    """ISO-8601 UTC timestamps ('2025-02-01T00:00:00Z') -> int64 epoch seconds."""
+    if not len(strings):
+        return np.empty(0, dtype=np.int64)
+    return np.asarray([s[:19] for s in strings], dtype="datetime64[s]").astype(np.int64)
+
+
+def series_from_records(records):
+    """(epochs, values) arrays from /hours results, using period.datetimeFrom.utc and value."""
+    times, values = [], []
+    for record in records:
+        period = record.get("period") or {}
+        dt = period.get("datetimeFrom")
+        if isinstance(dt, dict):
+            dt = dt.get("utc")
+        value = record.get("value")
+        if dt and value is not None:
+            times.append(dt)
+            values.append(value)
+    return parse_utc(times), np.asarray(values, dtype=np.float64)
+
+
+# -----------------------
+# Hourly Matrix
+# -----------------------
+class HourlyMatrix:
+    """Dense (sensors, hours) matrix of hourly values on a midnight-aligned UTC grid."""
+
+    def __init__(self, sensor_ids, start_epoch, values):
+        self.sensor_ids = list(sensor_ids)
+        self.start_epoch = int(start_epoch)
+        self.values = values
+
+    @property
+    def n_hours(self):
+        return self.values.shape[1]
+
+    @property
+    def n_days(self):
+        return self.n_hours // 24
+
+    def hour_epochs(self):
+        return self.start_epoch + HOUR * np.arange(self.n_hours, dtype=np.int64)
+
+    def day_labels(self):
+        return [datetime.fromtimestamp(self.start_epoch + d * DAY, tz=timezone.utc).strftime("%Y-%m-%d")
+                for d in range(self.n_days)]
+
+    @classmethod
+    def from_arrays(cls, sensor_ids, sensor_index, epochs, values, start_epoch=None, end_epoch=None):
+        """
+        Scatter flat (sensor_index, epoch, value) arrays into the matrix. `sensor_index` holds
+        row numbers into `sensor_ids`. The grid covers [start_epoch, end_epoch), widened to whole
+        UTC days; values outside it are dropped and a duplicate hour keeps the last value.
+        """
+        sensor_index = np.asarray(sensor_index, dtype=np.int64)
+        epochs = np.asarray(epochs, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        if start_epoch is None:
+            start_epoch = int(epochs.min()) if epochs.size else 0
+        if end_epoch is None:
+            end_epoch = int(epochs.max()) + HOUR if epochs.size else start_epoch + DAY
+        start = (int(start_epoch) // DAY) * DAY
+        end = -((-int(end_epoch)) // DAY) * DAY
+        n_hours = max(24, (end - start) // HOUR)
+
+        matrix = np.full((len(sensor_ids), n_hours), np.nan)
+        column = (epochs - start) // HOUR
+        keep = (column >= 0) & (column < n_hours) & np.isfinite(values)
+        matrix[sensor_index[keep], column[keep]] = values[keep]
+        return cls(sensor_ids, start, matrix)
+
+    @classmethod
+    def from_records(cls, series_by_sensor, start_date=None, end_date=None):
+        """Build from {sensor_id: [/hours result, ...]}; dates are optional ISO strings."""
+        sensor_ids = list(series_by_sensor)
+        parts_index, parts_epochs, parts_values = [], [], []
+        for row, sensor_id in enumerate(sensor_ids):
+            epochs, values = series_from_records(series_by_sensor[sensor_id])
+            parts_index.append(np.full(epochs.size, row, dtype=np.int64))
+            parts_epochs.append(epochs)
+            parts_values.append(values)
+        if sensor_ids:
+            sensor_index = np.concatenate(parts_index)
+            epochs = np.concatenate(parts_epochs)
+            values = np.concatenate(parts_values)
+        else:
+            sensor_index = epochs = np.empty(0, dtype=np.int64)
+            values = np.empty(0)
+        start_epoch = int(parse_utc([start_date])[0]) if start_date else None
+        end_epoch = int(parse_utc([end_date])[0]) if end_date else None
+        return cls.from_arrays(sensor_ids, sensor_index, epochs, values, start_epoch, end_epoch)
+
+
+# -----------------------
+# Aggregations (all operate on a (sensors, hours) array)
+# -----------------------
+def _windowed_sums(values, window):
+    """Sums and valid-hour counts of every trailing `window`-hour window, NaNs skipped."""
+    valid = np.isfinite(values)
+    n = values.shape[0]
+    csum = np.zeros((n, values.shape[1] + 1))
+    np.cumsum(np.where(valid, values, 0.0), axis=1, out=csum[:, 1:])
+    ccount = np.zeros((n, values.shape[1] + 1), dtype=np.int64)
+    np.cumsum(valid, axis=1, out=ccount[:, 1:])
+    return csum[:, window:] - csum[:, :-window], ccount[:, window:] - ccount[:, :-window]
+
+
+def rolling_mean(values, window, min_periods=None):
+    """
+    Trailing `window`-hour mean ending at each hour (NaN for the first window-1 hours and
+    where fewer than `min_periods` hours are present; default: all of them).
+    """
+    min_periods = window if min_periods is None else min_periods
+    out = np.full(values.shape, np.nan)
+    if values.shape[1] < window:
+        return out
+    sums, counts = _windowed_sums(values, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out[:, window - 1:] = np.where(counts >= min_periods, sums / counts, np.nan)
+    return out
+
+
+def rolling_max(values, window, min_periods=1):
+    """Trailing `window`-hour maximum ending at each hour, NaNs skipped."""
+    out = np.full(values.shape, np.nan)
+    if values.shape[1] < window:
+        return out
+    # Doubling spans: after each pass result[t] is the max over the trailing `span` hours, so a
+    # window needs ~log2(window) passes and O(sensors * hours) memory; a last pass over two
+    # overlapping spans covers windows that are not a power of two.
+    result = values.copy()
+    span = 1
+    while span * 2 <= window:
+        shifted = result[:, :-span].copy()
+        np.fmax(result[:, span:], shifted, out=result[:, span:])
+        span *= 2
+    if span < window:
+        shift = window - span
+        shifted = result[:, :-shift].copy()
+        np.fmax(result[:, shift:], shifted, out=result[:, shift:])
+    if min_periods <= 1:
+        # fmax only yields NaN when the whole window is missing.
+        out[:, window - 1:] = result[:, window - 1:]
+        return out
+    _, counts = _windowed_sums(values, window)
+    out[:, window - 1:] = np.where(counts >= min_periods, result[:, window - 1:], np.nan)
+    return out
+
+
+def _by_day(values):
+    n, hours = values.shape
+    if hours % 24:
+        raise ValueError("the hour axis must cover whole days (use HourlyMatrix)")
+    return values.reshape(n, hours // 24, 24)
+
+
+def daily_means(values, min_hours=18):
+    """(sensors, days) daily means; NaN for days with fewer than `min_hours` valid hours."""
+    days = _by_day(values)
+    valid = np.isfinite(days)
+    counts = valid.sum(axis=2)
+    sums = np.where(valid, days, 0.0).sum(axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts >= min_hours, sums / counts, np.nan)
+
+
+def daily_max(values, min_hours=18):
+    """(sensors, days) daily maxima, e.g. of rolling_mean(values, 8, 6) for the ozone MDA8."""
+    days = _by_day(values)
+    counts = np.isfinite(days).sum(axis=2)
+    return np.where(counts >= min_hours, np.fmax.reduce(days, axis=2), np.nan)
+
+
+def percentiles(values, q=DEFAULT_PERCENTILES):
+    """
+    (sensors, len(q)) percentiles of each row, ignoring NaN, with linear interpolation.
+    Rows are sorted once (NaN sorts last) and indexed in bulk instead of calling
+    np.nanpercentile, which falls back to a per-row Python loop when NaNs are present.
+    """
+    q = np.asarray(q, dtype=np.float64) / 100.0
+    ordered = np.sort(values, axis=1)
+    counts = np.isfinite(ordered).sum(axis=1)
+    position = q[None, :] * np.maximum(counts - 1, 0)[:, None]
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, np.maximum(counts - 1, 0)[:, None])
+    fraction = position - lower
+    low_values = np.take_along_axis(ordered, lower, axis=1)
+    high_values = np.take_along_axis(ordered, upper, axis=1)
+    result = low_values + (high_values - low_values) * fraction
+    result[counts == 0] = np.nan
+    return result
+
+
+def period_means(values, min_coverage=0.0):
+    """Mean of each row over the whole grid, NaN below `min_coverage` (fraction of hours)."""
+    valid = np.isfinite(values)
+    counts = valid.sum(axis=1)
+    sums = np.where(valid, values, 0.0).sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    return np.where(counts >= min_coverage * values.shape[1], means, np.nan)
+
+
+# -----------------------
+# Summaries
+# -----------------------
+def _clean(value):
+    value = float(value)
+    return None if np.isnan(value) else round(value, 3)
+
+
+def summarize(matrix, q=DEFAULT_PERCENTILES):
+    """Per-sensor JSON-friendly aggregates: coverage, mean, max, percentiles, daily series."""
+    values = matrix.values
+    if not matrix.sensor_ids:
+        return {}
+    observed = np.isfinite(values).sum(axis=1)
+    means = period_means(values)
+    maxima = np.fmax.reduce(values, axis=1)
+    pct = percentiles(values, q)
+    daily = daily_means(values)
+    mda8 = daily_max(rolling_mean(values, 8, 6))
+    max24 = np.fmax.reduce(rolling_mean(values, 24, 18), axis=1)
+    labels = matrix.day_labels()
+
+    summary = {}
+    for row, sensor_id in enumerate(matrix.sensor_ids):
+        summary[sensor_id] = {
+            "hours_observed": int(observed[row]),
+            "coverage": round(float(observed[row]) / matrix.n_hours, 3),
+            "mean": _clean(means[row]),
+            "max": _clean(maxima[row]),
+            "percentiles": {f"p{int(p)}": _clean(v) for p, v in zip(q, pct[row])},
+            "max_24h_mean": _clean(max24[row]),
+            "daily": [
+                {"date": label, "mean": _clean(daily[row, d]), "max_8h_mean": _clean(mda8[row, d])}
+                for d, label in enumerate(labels)
+            ],
+        }
+    return summary
+
+
+def summarize_series(series_by_sensor, start_date=None, end_date=None, q=DEFAULT_PERCENTILES):
+    """summarize() straight from {sensor_id: [/hours result, ...]}."""
+    return summarize(HourlyMatrix.from_records(series_by_sensor, start_date, end_date), q)
+
+
+# -----------------------
+# Benchmark
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Time the aggregations on a synthetic hourly dataset.")
+    parser.add_argument("--sensors", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--missing", type=float, default=0.1, help="fraction of hours missing")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    hours = args.days * 24
+    start = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())
+    sensor_index = np.repeat(np.arange(args.sensors), hours)
+    epochs = np.tile(start + HOUR * np.arange(hours), args.sensors)
+    values = rng.gamma(2.0, 10.0, size=sensor_index.size)
+    keep = rng.random(sensor_index.size) >= args.missing
+
+    timings = {}
+    t0 = time.perf_counter()
+    matrix = HourlyMatrix.from_arrays(range(args.sensors), sensor_index[keep], epochs[keep], values[keep])
+    timings["build matrix"] = time.perf_counter() - t0
+    steps = [
+        ("daily means", lambda v: daily_means(v)),
+        ("8-hour rolling max", lambda v: rolling_max(v, 8)),
+        ("daily max 8-hour mean", lambda v: daily_max(rolling_mean(v, 8, 6))),
+        ("24-hour rolling mean", lambda v: rolling_mean(v, 24, 18)),
+        ("percentiles", lambda v: percentiles(v)),
+    ]
+    for name, step in steps:
+        t0 = time.perf_counter()
+        step(matrix.values)
+        timings[name] = time.perf_counter() - t0
+
+    print(f"{args.sensors} sensors x {matrix.n_hours} hours ({int(keep.sum()):,} observations)")
+    for name, seconds in timings.items():
+        print(f"  {name:<24} {seconds * 1000:9.1f} ms")
+    print(f"  {'total':<24} {sum(timings.values()) * 1000:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+Adaptive per-sensor polling for OpenAQ, driven by each sensor's observed update cadence.
+
+Sensors do not all update alike: most publish hourly values with a delay of 0-3 hours,
+some publish one daily average, and some have been dead for months. Polling all of them on
+one fixed interval wastes most requests. This scheduler learns, per sensor:
+
+    cadence   median spacing of its recent readings (from /hours history and new polls)
+    delay     how long after a period ends its value shows up in the API (80th percentile
+              of what the polls observed)
+
+and polls each sensor just after its next value is expected:
+
+    expected = last reading + cadence + delay + margin
+
+A poll that finds nothing new is retried with a growing step (5, 10, 20 min ... capped at
+the cadence). Once a sensor is silent for several cadences it counts as stale and is polled
+with exponential backoff (cadence, 2x, 4x ... up to MAX_BACKOFF_S), so dead sensors fade to
+a poll or two per day and come back on their first new reading.
+
+    scheduler = PollingScheduler()
+    scheduler.add(sensor_id, history_epochs)       # e.g. hourly_aggregation.series_from_records(...)[0]
+    for sensor_id in scheduler.due():
+        latest_epoch, value = poll_sensor(sensor_id)
+        scheduler.record(sensor_id, latest_epoch)
+
+`python polling_scheduler.py --simulate` compares poll volume and detection lag against
+fixed-interval polling on a synthetic sensor population; `--location CJ-3 --near lat,lon`
+polls real sensors (through the shared rate limiter) until interrupted.
+"""
+import argparse
+import heapq
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+# Shared helpers (rate limiter, fast JSON decoding, API base URLs) live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rate_limiter import RateLimiter, rate_limited_get, DEFAULT_OPENAQ_RATE
+from fast_json import compressed_headers, decode
+from hourly_aggregation import parse_utc, series_from_records
+from sensor_metadata_cache import SensorMetadataCache
+from api_endpoints import OPENAQ_BASE_URL as BASE_URL
+
+# Load environment variables from .env file
+load_dotenv()
+
+# API Token from .env
+API_KEY = os.getenv("openaq_token")
+
+headers = {"X-API-Key": API_KEY}
+
+STATE_PATH = os.getenv("openaq_polling_state",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "polling_state.json"))
+DEFAULT_CADENCE_S = 3600
+DEFAULT_DELAY_S = 1800  # until the first observed delays come in
+DELAY_QUANTILE = 80
+DELAY_SAMPLES = 16
+CADENCE_SAMPLES = 48
+MARGIN_S = 120
+RETRY_STEP_S = 300
+STALE_AFTER_CADENCES = 6
+MIN_STALE_AFTER_S = 6 * 3600
+MAX_BACKOFF_S = 24 * 3600
+
+
+# -----------------------
+# Sensor State
+# -----------------------
+def learn_cadence(epochs):
+    """Median spacing (seconds) of the most recent distinct reading epochs, or None."""
+    epochs = np.unique(np.asarray(epochs, dtype=np.int64))[-(CADENCE_SAMPLES + 1):]
+    if len(epochs) < 2:
+        return None
+    return max(int(np.median(np.diff(epochs))), 60)
+
+
+def new_state(cadence=DEFAULT_CADENCE_S, last_epoch=None):
+    return {"cadence": cadence, "delays": [], "recent": [], "last_epoch": last_epoch, "last_poll": None,
+            "misses": 0, "stale_polls": 0, "next_poll": 0.0, "polls": 0, "hits": 0}
+
+
+def expected_delay(state):
+    if not state["delays"]:
+        return DEFAULT_DELAY_S
+    return float(np.percentile(state["delays"], DELAY_QUANTILE))
+
+
+def stale_after(state):
+    return max(STALE_AFTER_CADENCES * state["cadence"], MIN_STALE_AFTER_S)
+
+
+def next_poll_time(state, now):
+    """When to poll a sensor next, given everything it has shown so far."""
+    cadence = state["cadence"]
+    last_epoch = state["last_epoch"]
+    if last_epoch is None:
+        # Never seen a reading: treat like a stale sensor.
+        return now + min(cadence * 2 ** state["stale_polls"], MAX_BACKOFF_S)
+    expected = last_epoch + cadence + expected_delay(state) + MARGIN_S
+    if now < expected:
+        return expected
+    if now - last_epoch > stale_after(state):
+        return now + min(cadence * 2 ** state["stale_polls"], MAX_BACKOFF_S)
+    return now + min(RETRY_STEP_S * 2 ** state["misses"], cadence)
+
+
+# -----------------------
+# Scheduler
+# -----------------------
+class PollingScheduler:
+    """Per-sensor poll times kept in a heap; state persisted to a JSON file."""
+
+    def __init__(self, path=STATE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.states = {}
+        self._heap = []
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.states = {int(k): v for k, v in json.load(f).items()}
+            for state in self.states.values():
+                if state["next_poll"] == float("inf"):
+                    state["next_poll"] = 0.0  # was in flight when saved: poll again
+            self._heap = [(state["next_poll"], sensor_id) for sensor_id, state in self.states.items()]
+            heapq.heapify(self._heap)
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({str(k): v for k, v in self.states.items()}, f)
+            os.replace(tmp_path, self.path)
+
+    def _schedule(self, sensor_id, when):
+        self.states[sensor_id]["next_poll"] = when
+        heapq.heappush(self._heap, (when, sensor_id))
+
+    def add(self, sensor_id, history_epochs=None, now=None):
+        """Track a sensor (no-op if already tracked), learning its cadence from past reading epochs."""
+        now = time.time() if now is None else now
+        with self.lock:
+            if sensor_id in self.states:
+                return self.states[sensor_id]
+            state = new_state()
+            if history_epochs is not None and len(history_epochs):
+                recent = np.unique(np.asarray(history_epochs, dtype=np.int64))[-(CADENCE_SAMPLES + 1):]
+                state["cadence"] = learn_cadence(recent) or DEFAULT_CADENCE_S
+                state["last_epoch"] = int(recent[-1])
+                state["recent"] = recent.tolist()
+            self.states[sensor_id] = state
+            # The first poll happens right away unless the next value is known not to be out yet.
+            self._schedule(sensor_id, now if state["last_epoch"] is None else min(next_poll_time(state, now), now + state["cadence"]))
+            return state
+
+    def due(self, now=None):
+        """Pop and return every sensor whose poll time has come."""
+        now = time.time() if now is None else now
+        sensor_ids = []
+        with self.lock:
+            while self._heap and self._heap[0][0] <= now:
+                when, sensor_id = heapq.heappop(self._heap)
+                state = self.states.get(sensor_id)
+                if state is None or state["next_poll"] != when or state["next_poll"] == float("inf"):
+                    continue  # superseded heap entry
+                state["next_poll"] = float("inf")  # in flight until record()
+                sensor_ids.append(sensor_id)
+        return sensor_ids
+
+    def next_due(self):
+        """Epoch of the earliest scheduled poll, or None."""
+        with self.lock:
+            while self._heap:
+                when, sensor_id = self._heap[0]
+                state = self.states.get(sensor_id)
+                if state is not None and state["next_poll"] == when:
+                    return when
+                heapq.heappop(self._heap)
+        return None
+
+    def record(self, sensor_id, latest_epoch, polled_at=None):
+        """
+        Record a poll result (epoch of the newest reading the API returned, or None when the
+        poll failed or returned nothing) and schedule the next poll. Returns True if new.
+        """
+        now = time.time() if polled_at is None else polled_at
+        with self.lock:
+            state = self.states[sensor_id]
+            state["polls"] += 1
+            previous_poll = state["last_poll"]
+            is_new = latest_epoch is not None and (state["last_epoch"] is None or latest_epoch > state["last_epoch"])
+            if is_new:
+                latest_epoch = int(latest_epoch)
+                # The value appeared between the previous poll and this one.
+                if previous_poll is not None and state["last_epoch"] is not None:
+                    appeared = (max(previous_poll, latest_epoch) + now) / 2
+                    state["delays"] = (state["delays"] + [max(appeared - latest_epoch, 0.0)])[-DELAY_SAMPLES:]
+                state["recent"] = (state["recent"] + [latest_epoch])[-(CADENCE_SAMPLES + 1):]
+                state["cadence"] = learn_cadence(state["recent"]) or state["cadence"]
+                state["last_epoch"] = latest_epoch
+                state["hits"] += 1
+                state["misses"] = 0
+                state["stale_polls"] = 0
+            elif state["last_epoch"] is None or now - state["last_epoch"] > stale_after(state):
+                state["stale_polls"] += 1
+            else:
+                state["misses"] += 1
+            state["last_poll"] = now
+            self._schedule(sensor_id, next_poll_time(state, now))
+            return is_new
+
+    def summary(self):
+        with self.lock:
+            polls = sum(s["polls"] for s in self.states.values())
+            hits = sum(s["hits"] for s in self.states.values())
+            stale = sum(1 for s in self.states.values() if s["stale_polls"])
+        return {"sensors": len(self.states), "polls": polls, "new_readings": hits, "stale_sensors": stale}
+
+
+# -----------------------
+# Polling OpenAQ
+# -----------------------
+def poll_sensor(sensor_id, limiter=None, session=None):
+    """(epoch, value) of a sensor's latest reading from GET /sensors/{id}, or (None, None)."""
+    url = f"{BASE_URL}/sensors/{sensor_id}"
+    try:
+        response = rate_limited_get(url, limiter=limiter, headers=compressed_headers(headers), session=session)
+    except requests.exceptions.RequestException as e:
+        print(f"Error polling sensor {sensor_id}: {e}")
+        return None, None
+    if response.status_code != 200:
+        print(f"Error polling sensor {sensor_id}: {response.status_code} {response.text[:200]}")
+        return None, None
+    results = decode(response.content).get("results") or [{}]
+    latest = results[0].get("latest") or {}
+    dt = latest.get("datetime")
+    if isinstance(dt, dict):
+        dt = dt.get("utc")
+    if not dt:
+        return None, None
+    return int(parse_utc([dt])[0]), latest.get("value")
+
+
+def fetch_history_epochs(sensor_id, hours=72, limiter=None):
+    """Reading epochs of a sensor's recent /hours history, to seed its cadence."""
+    now = time.time()
+    params = {"date_from": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now - hours * 3600)),
+              "date_to": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now)), "limit": 1000}
+    response = rate_limited_get(f"{BASE_URL}/sensors/{sensor_id}/hours", limiter=limiter,
+                                headers=compressed_headers(headers), params=params)
+    if response.status_code != 200:
+        return None
+    return series_from_records(decode(response.content).get("results", []))[0]
+
+
+def run(scheduler, limiter=None, threads=4, on_reading=None, duration=None, save_every=60):
+    """
+    Poll due sensors until interrupted (or for `duration` seconds). `on_reading(sensor_id,
+    epoch, value)` is called for every new reading, e.g. to update a FreshnessIndex.
+    """
+    limiter = limiter or RateLimiter(DEFAULT_OPENAQ_RATE)
+    local = threading.local()
+
+    def poll(sensor_id):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        epoch, value = poll_sensor(sensor_id, limiter, local.session)
+        if scheduler.record(sensor_id, epoch) and on_reading is not None:
+            on_reading(sensor_id, epoch, value)
+
+    started = last_save = time.time()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        try:
+            while duration is None or time.time() - started < duration:
+                sensor_ids = scheduler.due()
+                if sensor_ids:
+                    list(pool.map(poll, sensor_ids))
+                if time.time() - last_save >= save_every:
+                    scheduler.save()
+                    last_save = time.time()
+                next_due = scheduler.next_due()
+                wait = 1.0 if next_due is None else next_due - time.time()
+                if duration is not None:
+                    wait = min(wait, started + duration - time.time())
+                if wait > 0:
+                    time.sleep(min(wait, 60.0))
+        except KeyboardInterrupt:
+            print("Stopping.")
+    scheduler.save()
+    return scheduler.summary()
+
+
+# -----------------------
+# Simulation
+# -----------------------
+def synthetic_population(n, rng, now):
+    """Per-sensor (cadence, delay, last_epoch or None for live): 75% hourly, 10% daily, 15% dead."""
+    sensors = []
+    for _ in range(n):
+        roll = rng.random()
+        jitter = int(rng.uniform(0, 900))
+        if roll < 0.15:
+            sensors.append((3600, 0, now - rng.integers(7, 200) * 86400))
+        elif roll < 0.25:
+            sensors.append((86400, int(rng.uniform(1, 6) * 3600) + jitter, None))
+        else:
+            sensors.append((3600, int(rng.choice([0, 0, 0, 1, 1, 2, 3]) * 3600) + jitter, None))
+    return sensors
+
+
+def visible_epoch(sensor, t):
+    """Newest period end a simulated sensor has published by time t."""
+    cadence, delay, dead_since = sensor
+    epoch = int((t - delay) // cadence * cadence)
+    return epoch if dead_since is None else min(epoch, int(dead_since))
+
+
+def simulate(n_sensors=1000, days=7, fixed_interval_s=900, seed=0):
+    """Poll counts and detection lag: fixed-interval polling vs the adaptive scheduler."""
+    rng = np.random.default_rng(seed)
+    start = 1_700_000_000 // 86400 * 86400
+    end = start + days * 86400
+    sensors = synthetic_population(n_sensors, rng, start)
+
+    # Fixed interval: every sensor every fixed_interval_s; a value waits for the next tick.
+    ticks = np.arange(start, end, fixed_interval_s)
+    fixed_polls = len(ticks) * n_sensors
+    fixed_lags, adaptive_lags = [], []
+
+    scheduler = PollingScheduler(path=None)
+    for sensor_id, sensor in enumerate(sensors):
+        history = np.arange(visible_epoch(sensor, start) - 48 * sensor[0], visible_epoch(sensor, start) + 1, sensor[0])
+        scheduler.add(sensor_id, history, now=start)
+        cadence, delay, dead_since = sensor
+        if dead_since is None:
+            published = np.arange(visible_epoch(sensor, start) + cadence, end - delay, cadence) + delay
+            next_tick = np.ceil((published - start) / fixed_interval_s) * fixed_interval_s + start
+            fixed_lags.extend((next_tick - published).tolist())
+
+    t = start
+    seen = {sensor_id: scheduler.states[sensor_id]["last_epoch"] for sensor_id in range(n_sensors)}
+    adaptive_polls = 0
+    while True:
+        t = scheduler.next_due()
+        if t is None or t >= end:
+            break
+        for sensor_id in scheduler.due(t):
+            adaptive_polls += 1
+            epoch = visible_epoch(sensors[sensor_id], t)
+            if scheduler.record(sensor_id, epoch, t):
+                cadence, delay, _ = sensors[sensor_id]
+                # Every period published since the previous detection was seen late by this much.
+                for e in range(seen[sensor_id] + cadence, epoch + 1, cadence):
+                    adaptive_lags.append(t - (e + delay))
+                seen[sensor_id] = epoch
+    return {
+        "sensors": n_sensors, "days": days,
+        "fixed": {"interval_s": fixed_interval_s, "polls": fixed_polls,
+                  "mean_lag_min": float(np.mean(fixed_lags)) / 60, "p95_lag_min": float(np.percentile(fixed_lags, 95)) / 60},
+        "adaptive": {"polls": adaptive_polls, "mean_lag_min": float(np.mean(adaptive_lags)) / 60,
+                     "p95_lag_min": float(np.percentile(adaptive_lags, 95)) / 60},
+    }
+
+
+# -----------------------
+# Main Workflow
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Adaptive per-sensor OpenAQ polling.")
+    parser.add_argument("--simulate", action="store_true", help="Compare against fixed-interval polling offline.")
+    parser.add_argument("--sensors", type=int, default=1000, help="Simulated sensors.")
+    parser.add_argument("--days", type=int, default=7, help="Simulated days.")
+    parser.add_argument("--fixed-interval", type=int, default=900, help="Fixed polling interval to compare (s).")
+    parser.add_argument("--location", action="append", default=[], help="Location id or name to poll (repeatable).")
+    parser.add_argument("--near", help="lat,lon hint for resolving location names.")
+    parser.add_argument("--sensor", action="append", default=[], help="Sensor id to poll (repeatable).")
+    parser.add_argument("--rate", type=float, default=DEFAULT_OPENAQ_RATE)
+    parser.add_argument("--duration", type=float, default=None, help="Stop after this many seconds.")
+    args = parser.parse_args()
+
+    if args.simulate:
+        result = simulate(args.sensors, args.days, args.fixed_interval)
+        fixed, adaptive = result["fixed"], result["adaptive"]
+        print(f"{result['sensors']} sensors over {result['days']} days")
+        print(f"  fixed every {fixed['interval_s'] // 60} min: {fixed['polls']} polls, "
+              f"lag mean {fixed['mean_lag_min']:.1f} min / p95 {fixed['p95_lag_min']:.1f} min")
+        print(f"  adaptive: {adaptive['polls']} polls ({1 - adaptive['polls'] / fixed['polls']:.0%} fewer), "
+              f"lag mean {adaptive['mean_lag_min']:.1f} min / p95 {adaptive['p95_lag_min']:.1f} min")
+        return
+
+    near = tuple(float(v) for v in args.near.split(",")) if args.near else None
+    sensor_ids = [int(s) for s in args.sensor]
+    if args.location:
+        cache = SensorMetadataCache()
+        for location in args.location:
+            sensor_ids += [s["id"] for s in cache.sensors_for(location, near) if s["id"] not in sensor_ids]
+        cache.close()
+    if not sensor_ids:
+        print("No sensors to poll (use --sensor or --location).")
+        return
+
+    limiter = RateLimiter(args.rate)
+    scheduler = PollingScheduler()
+    for sensor_id in sensor_ids:
+        if sensor_id not in scheduler.states:
+            scheduler.add(sensor_id, fetch_history_epochs(sensor_id, limiter=limiter))
+
+    def on_reading(sensor_id, epoch, value):
+        print(f"  sensor {sensor_id}: {value} at {time.strftime('%Y-%m-%d %H:%M', time.gmtime(epoch))} UTC")
+
+    print(f"Polling {len(sensor_ids)} sensors (Ctrl+C to stop)...")
+    print(run(scheduler, limiter, on_reading=on_reading, duration=args.duration))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Persistent location -> sensors metadata cache for OpenAQ.
+
+Resolves a location id, or a location name, to its sensor list without a metadata round
+trip on the hot path:
+
+    cache = SensorMetadataCache()
+    location = cache.get_location("CJ-3", near=(46.765425, 23.550258))
+    sensors = cache.sensors_for(2163127)
+
+Entries are stored in a JSON file. A cached entry is always answered immediately; when it
+is older than `max_age_s` it is revalidated on a background thread with a conditional
+request (If-None-Match / If-Modified-Since, when the API sent an ETag or Last-Modified),
+so an unchanged location costs a 304 and no payload. Only a location never seen before is
+fetched synchronously.
+
+Name lookups use, in order: the cache's own name index, a station catalog snapshot (if
+given, see station_catalog.py), and a /locations query around the `near` coordinates.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+# Shared helpers (rate limiter, API base URLs) live in gathering_data/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from rate_limiter import rate_limited_get
+from api_endpoints import OPENAQ_BASE_URL as BASE_URL
+
+# Load environment variables from .env file
+load_dotenv()
+
+# API Token from .env
+API_KEY = os.getenv("openaq_token")
+
+LOCATIONS_API_URL = f"{BASE_URL}/locations"
+headers = {"X-API-Key": API_KEY}
+
+CACHE_PATH = os.getenv("openaq_sensor_cache",
+                       os.path.join(os.path.dirname(os.path.abspath(__file__)), "sensor_metadata_cache.json"))
+REVALIDATE_AFTER_S = 24 * 3600  # sensors are added or retired rarely
+NAME_SEARCH_RADIUS = 25000  # largest radius /locations accepts (meters)
+
+
+def slim_location(location):
+    """Keep only the fields the pipeline reads from a /locations record."""
+    country = location.get("country") or {}
+    return {
+        "id": location.get("id"),
+        "name": location.get("name"),
+        "locality": location.get("locality"),
+        "country": country.get("code") if isinstance(country, dict) else country,
+        "coordinates": location.get("coordinates"),
+        "sensors": [
+            {"id": s.get("id"), "name": s.get("name"),
+             "parameter": {k: (s.get("parameter") or {}).get(k) for k in ("id", "name", "units")}}
+            for s in location.get("sensors", [])
+        ],
+    }
+
+
+class SensorMetadataCache:
+    """Thread-safe, file-backed cache of OpenAQ location metadata with background revalidation."""
+
+    def __init__(self, path=CACHE_PATH, max_age_s=REVALIDATE_AFTER_S, catalog_path=None, background=True):
+        self.path = path
+        self.max_age_s = max_age_s
+        self.catalog_path = catalog_path
+        self.background = background
+        self.lock = threading.RLock()
+        self.stats = {"hits": 0, "misses": 0, "revalidated_304": 0, "revalidated_changed": 0, "fetch_errors": 0}
+        self._pending = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="sensor-cache") if background else None
+        self._catalog = None
+        self.entries = {}
+        self.names = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.entries = data.get("locations", {})
+            self.names = data.get("names", {})
+
+    # -----------------------
+    # Persistence
+    # -----------------------
+    def save(self):
+        with self.lock:
+            data = {"locations": self.entries, "names": self.names}
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def _store(self, location, etag=None, last_modified=None, save=True):
+        record = slim_location(location)
+        now = time.time()
+        with self.lock:
+            key = str(record["id"])
+            old = self.entries.get(key)
+            if old and old["location"].get("name") != record.get("name"):
+                self._unindex_name(old["location"].get("name"), key)
+            self.entries[key] = {
+                "location": record,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": now,
+                "validated_at": now,
+            }
+            ids = self.names.setdefault((record.get("name") or "").lower(), [])
+            if key not in ids:
+                ids.append(key)
+            if save:
+                self.save()
+        return record
+
+    def _unindex_name(self, name, key):
+        ids = self.names.get((name or "").lower(), [])
+        if key in ids:
+            ids.remove(key)
+
+    # -----------------------
+    # Network
+    # -----------------------
+    def _fetch(self, location_id, conditional_entry=None):
+        """
+        GET /locations/{id}. With `conditional_entry`, send its validators and return "unchanged"
+        on a 304. Returns the fresh record, "unchanged", or None on failure / unknown id.
+        """
+        request_headers = dict(headers)
+        if conditional_entry:
+            if conditional_entry.get("etag"):
+                request_headers["If-None-Match"] = conditional_entry["etag"]
+            if conditional_entry.get("last_modified"):
+                request_headers["If-Modified-Since"] = conditional_entry["last_modified"]
+        try:
+            response = rate_limited_get(f"{LOCATIONS_API_URL}/{location_id}", headers=request_headers, max_retries=2)
+        except Exception as e:
+            print(f"Error fetching metadata for location {location_id}: {e}")
+            self.stats["fetch_errors"] += 1
+            return None
+        if response.status_code == 304:
+            return "unchanged"
+        if response.status_code == 404:
+            with self.lock:
+                old = self.entries.pop(str(location_id), None)
+                if old:
+                    self._unindex_name(old["location"].get("name"), str(location_id))
+                    self.save()
+            return None
+        if response.status_code != 200:
+            print(f"Error fetching metadata for location {location_id}: {response.status_code} {response.text}")
+            self.stats["fetch_errors"] += 1
+            return None
+        results = response.json().get("results", [])
+        if not results:
+            return None
+        return self._store(results[0], response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+    def _revalidate(self, location_id):
+        key = str(location_id)
+        try:
+            with self.lock:
+                entry = dict(self.entries.get(key) or {})
+            old_sensors = (entry.get("location") or {}).get("sensors")
+            result = self._fetch(location_id, conditional_entry=entry)
+            if result == "unchanged":
+                with self.lock:
+                    if key in self.entries:
+                        self.entries[key]["validated_at"] = time.time()
+                        self.save()
+                self.stats["revalidated_304"] += 1
+            elif result is not None:
+                # Without validators from the API a full response comes back; count it as
+                # changed only if the sensors actually differ.
+                if result["sensors"] != old_sensors:
+                    self.stats["revalidated_changed"] += 1
+                else:
+                    self.stats["revalidated_304"] += 1
+        finally:
+            with self.lock:
+                self._pending.discard(key)
+
+    def _schedule_revalidation(self, location_id):
+        key = str(location_id)
+        with self.lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        if self._executor is not None:
+            self._executor.submit(self._revalidate, location_id)
+        else:
+            self._revalidate(location_id)
+
+    # -----------------------
+    # Name resolution
+    # -----------------------
+    def _ids_from_catalog(self, name):
+        if not self.catalog_path or not os.path.exists(self.catalog_path):
+            return []
+        if self._catalog is None:
+            from station_catalog import StationCatalog
+            self._catalog = StationCatalog.open(self.catalog_path)
+        wanted = name.lower()
+        return [str(s["id"]) for s in self._catalog.iter_stations("openaq") if (s["name"] or "").lower() == wanted]
+
+    def _ids_near(self, name, lat, lon):
+        """Query /locations around (lat, lon), cache everything it returns, and return the ids named `name`."""
+        params = {"coordinates": f"{lat},{lon}", "radius": NAME_SEARCH_RADIUS, "limit": 1000}
+        try:
+            response = rate_limited_get(LOCATIONS_API_URL, headers=headers, params=params, max_retries=2)
+        except Exception as e:
+            print(f"Error searching locations near {lat},{lon}: {e}")
+            return []
+        if response.status_code != 200:
+            print("Error searching locations near coordinates:", response.status_code, response.text)
+            return []
+        wanted = name.lower()
+        matches = []
+        for location in response.json().get("results", []):
+            self._store(location, save=False)
+            if (location.get("name") or "").lower() == wanted:
+                matches.append(str(location.get("id")))
+        self.save()
+        return matches
+
+    def resolve_ids(self, location, near=None):
+        """All location ids matching an id or a name (names are not unique in OpenAQ)."""
+        if isinstance(location, int) or str(location).isdigit():
+            return [str(int(location))]
+        with self.lock:
+            ids = list(self.names.get(str(location).lower(), []))
+        if ids:
+            return ids
+        ids = self._ids_from_catalog(str(location))
+        if not ids and near is not None:
+            ids = self._ids_near(str(location), *near)
+        return ids
+
+    # -----------------------
+    # Public API
+    # -----------------------
+    def get_location(self, location, near=None):
+        """
+        Return the cached location record ({"id", "name", "coordinates", "sensors", ...}) for an
+        id or a name. When a name matches several locations, the one nearest to `near` (if
+        given) is returned, otherwise the first one. Returns None if it cannot be resolved.
+        """
+        ids = self.resolve_ids(location, near)
+        if not ids:
+            print(f"Location '{location}' could not be resolved (pass near=(lat, lon) to search by name).")
+            return None
+        if near is not None and len(ids) > 1:
+            ids = sorted(ids, key=lambda i: self._distance_key(i, near))
+        location_id = ids[0]
+
+        with self.lock:
+            entry = self.entries.get(location_id)
+        if entry is not None:
+            self.stats["hits"] += 1
+            if time.time() - entry.get("validated_at", 0) > self.max_age_s:
+                self._schedule_revalidation(location_id)
+            return entry["location"]
+
+        self.stats["misses"] += 1
+        record = self._fetch(location_id)
+        return record if isinstance(record, dict) else None
+
+    def _distance_key(self, location_id, near):
+        with self.lock:
+            entry = self.entries.get(location_id)
+        coords = (entry or {}).get("location", {}).get("coordinates") or {}
+        if coords.get("latitude") is None:
+            return float("inf")
+        return (coords["latitude"] - near[0]) ** 2 + (coords["longitude"] - near[1]) ** 2
+
+    def sensors_for(self, location, near=None):
+        """Sensor list ([{"id", "name", "parameter"}]) of a location id or name; [] if unknown."""
+        record = self.get_location(location, near)
+        return record["sensors"] if record else []
+
+    def revalidate_all(self, wait=True):
+        """Revalidate every stale entry (e.g. from a nightly job)."""
+        now = time.time()
+        with self.lock:
+            stale = [k for k, e in self.entries.items() if now - e.get("validated_at", 0) > self.max_age_s]
+        for key in stale:
+            self._schedule_revalidation(key)
+        if wait:
+            self.wait()
+        return len(stale)
+
+    def wait(self):
+        """Block until background revalidations have finished."""
+        while True:
+            with self.lock:
+                if not self._pending:
+                    return
+            time.sleep(0.05)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+
+if __name__ == "__main__":
+    cache = SensorMetadataCache()
+    cj3 = cache.get_location("CJ-3", near=(46.765425, 23.550258))
+    if cj3:
+        print(f"{cj3['name']} (ID: {cj3['id']}) has {len(cj3['sensors'])} sensor(s):")
+        for sensor in cj3["sensors"]:
+            print(f"  {sensor['id']}: {sensor['name']}")
+    cache.close()
+    print("Cache stats:", cache.stats)
@@ -0,0 +1,128 @@
+"""
+Shared rate limiting for the OpenAQ and WAQI scripts.
+
+One RateLimiter instance should be shared by every thread that talks to the same API
+key, so concurrent fetchers stay under the provider's quota together. rate_limited_get()
+wraps a GET with the limiter and retries 429s (honouring Retry-After), 5xx replies and
+connection errors with exponential backoff.
+
+Scripts outside gathering_data/ add this directory to sys.path to import it, e.g.:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from rate_limiter import RateLimiter, rate_limited_get
+"""
+import os
+import random
+import threading
+import time
+
+import requests
+
+# Requests per second allowed by default (OpenAQ's free tier allows 60 per minute).
+DEFAULT_OPENAQ_RATE = float(os.getenv("openaq_rate_limit", "1.0"))
+DEFAULT_WAQI_RATE = float(os.getenv("aqi_cn_rate_limit", "5.0"))
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: `rate` requests per second on average, with bursts of up to
+    `burst` requests. A 429 reply can block every caller for a while via penalize().
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.waited_s = 0.0
+        self.acquired = 0
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1):
+        """Block until `tokens` requests may be sent. Returns the time spent waiting (seconds)."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._blocked_until and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    self.acquired += tokens
+                    self.waited_s += waited
+                    return waited
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                else:
+                    wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def penalize(self, seconds):
+        """Stop handing out tokens for `seconds` (e.g. after a 429 with Retry-After) and empty the bucket."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+def _retry_after_seconds(response, default):
+    value = response.headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+    return default
+
+
+def rate_limited_get(url, limiter=None, headers=None, params=None, session=None,
+                     max_retries=5, backoff=1.0, timeout=30):
+    """
+    GET `url` under `limiter`, retrying 429 / 5xx replies and connection errors.
+
+    Returns the final requests.Response (which may still be an error status once the
+    retries are exhausted; callers check status_code as usual). Re-raises the last
+    connection error if no response was ever received.
+    """
+    return rate_limited_request("GET", url, limiter, headers, params, session=session,
+                                max_retries=max_retries, backoff=backoff, timeout=timeout)
+
+
+def rate_limited_request(method, url, limiter=None, headers=None, params=None, json=None, session=None,
+                         max_retries=5, backoff=1.0, timeout=30):
+    """rate_limited_get() for any method, e.g. POST with a `json` body."""
+    http = session or requests
+    last_error = None
+    response = None
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            response = http.request(method, url, headers=headers, params=params, json=json, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            last_error = e
+            response = None
+        else:
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+
+        if attempt == max_retries:
+            break
+        delay = backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+        if response is not None and response.status_code == 429:
+            delay = _retry_after_seconds(response, delay)
+            if limiter is not None:
+                limiter.penalize(delay)
+                continue
+        time.sleep(delay)
+
+    if response is None and last_error is not None:
+        raise last_error
+    return response
@@ -0,0 +1,349 @@
+"""
+Gridded pollutant surfaces interpolated from station readings.
+
+Turns the handful of readings returned by get_near_locations() / get_nearest_aqi_points()
+into a regular lat/lon grid over a bounding box:
+
+    surface = interpolate(lats, lons, values, bbox=(23.50, 46.72, 23.68, 46.82),
+                          resolution_m=100, method="idw", k=8)
+    surface.grid        # (rows, cols) array, row 0 = southernmost latitude
+    surface.value_at(46.77, 23.59)
+
+Methods:
+  * "idw" - inverse distance weighting over the k nearest stations of each cell. Stations
+    are bucketed in a grid index; each tile of cells only measures distances to the stations
+    that can be among the k nearest of any of its cells (exact, not approximate).
+  * "gp"  - Gaussian-process regression (simple kriging with a Gaussian covariance and a
+    constant mean) over all stations, with an optional per-cell standard deviation.
+
+Cells are processed in tiles so memory stays bounded for large grids, and tiles run on a
+thread pool (NumPy releases the GIL inside the distance and reduction kernels).
+Coordinates are projected to a local equirectangular plane in meters, which is accurate at
+city and regional scale.
+
+Run `python spatial_interpolation.py --stations 300 --size-km 20 --resolution 100` to time it.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000.0
+DEFAULT_TILE = 128  # cells per tile side
+
+
+# -----------------------
+# Projection and Grid
+# -----------------------
+def parse_bbox(bbox):
+    """'min_lon,min_lat,max_lon,max_lat' (OpenAQ's bbox format) or a 4-tuple -> floats."""
+    if isinstance(bbox, str):
+        bbox = [float(v) for v in bbox.split(",")]
+    min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox)
+    if min_lon >= max_lon or min_lat >= max_lat:
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+class LocalProjection:
+    """Equirectangular projection (meters) around a reference point."""
+
+    def __init__(self, lat0, lon0):
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.kx = np.radians(1.0) * EARTH_RADIUS_M * np.cos(np.radians(lat0))
+        self.ky = np.radians(1.0) * EARTH_RADIUS_M
+
+    def forward(self, lats, lons):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        return (lons - self.lon0) * self.kx, (lats - self.lat0) * self.ky
+
+
+def make_grid(bbox, resolution_m):
+    """Cell-centre latitudes (rows, south to north) and longitudes (cols) covering `bbox`."""
+    min_lon, min_lat, max_lon, max_lat = parse_bbox(bbox)
+    projection = LocalProjection((min_lat + max_lat) / 2, (min_lon + max_lon) / 2)
+    d_lat = resolution_m / projection.ky
+    d_lon = resolution_m / projection.kx
+    lats = np.arange(min_lat + d_lat / 2, max_lat, d_lat)
+    lons = np.arange(min_lon + d_lon / 2, max_lon, d_lon)
+    return lats, lons, projection
+
+
+# -----------------------
+# Spatial Index
+# -----------------------
+class StationGridIndex:
+    """Uniform bucket grid over projected station coordinates for radius queries."""
+
+    def __init__(self, x, y, bucket_m=None):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        n = self.x.size
+        if bucket_m is None:
+            # About 4 stations per bucket on average.
+            area = max((np.ptp(self.x) + 1.0) * (np.ptp(self.y) + 1.0), 1.0)
+            bucket_m = max(np.sqrt(area * 4.0 / max(n, 1)), 1.0)
+        self.bucket_m = float(bucket_m)
+        self.x0, self.y0 = (self.x.min(), self.y.min()) if n else (0.0, 0.0)
+        bx = ((self.x - self.x0) // self.bucket_m).astype(np.int64)
+        by = ((self.y - self.y0) // self.bucket_m).astype(np.int64)
+        self.nbx = int(bx.max()) + 1 if n else 1
+        self.nby = int(by.max()) + 1 if n else 1
+        keys = by * self.nbx + bx
+        self.order = np.argsort(keys, kind="stable")
+        self.starts = np.searchsorted(keys[self.order], np.arange(self.nbx * self.nby + 1))
+
+    def within(self, cx, cy, radius):
+        """Indices of stations within `radius` meters of (cx, cy)."""
+        bx0 = max(int((cx - radius - self.x0) // self.bucket_m), 0)
+        bx1 = min(int((cx + radius - self.x0) // self.bucket_m), self.nbx - 1)
+        by0 = max(int((cy - radius - self.y0) // self.bucket_m), 0)
+        by1 = min(int((cy + radius - self.y0) // self.bucket_m), self.nby - 1)
+        if bx0 > bx1 or by0 > by1:
+            return np.empty(0, dtype=np.int64)
+        parts = []
+        for by in range(by0, by1 + 1):
+            row = by * self.nbx
+            parts.append(self.order[self.starts[row + bx0]:self.starts[row + bx1 + 1]])
+        candidates = np.concatenate(parts)
+        d2 = (self.x[candidates] - cx) ** 2 + (self.y[candidates] - cy) ** 2
+        return candidates[d2 <= radius * radius]
+
+    def kth_distance(self, cx, cy, k):
+        """Distance to the k-th nearest station, growing the search ring until k are found."""
+        radius = self.bucket_m
+        n = self.x.size
+        while True:
+            found = self.within(cx, cy, radius)
+            if found.size >= min(k, n):
+                d = np.sqrt((self.x[found] - cx) ** 2 + (self.y[found] - cy) ** 2)
+                return float(np.partition(d, min(k, d.size) - 1)[min(k, d.size) - 1])
+            radius *= 2.0
+
+
+# -----------------------
+# Surface
+# -----------------------
+class Surface:
+    """Interpolated grid plus its coordinates."""
+
+    def __init__(self, lats, lons, grid, method, std=None):
+        self.lats = lats
+        self.lons = lons
+        self.grid = grid
+        self.method = method
+        self.std = std
+
+    def value_at(self, lat, lon):
+        """Value of the cell containing (lat, lon), or None outside the grid."""
+        if self.lats.size == 0 or self.lons.size == 0:
+            return None
+        row = int(np.rint((lat - self.lats[0]) / (self.lats[1] - self.lats[0]))) if self.lats.size > 1 else 0
+        col = int(np.rint((lon - self.lons[0]) / (self.lons[1] - self.lons[0]))) if self.lons.size > 1 else 0
+        if 0 <= row < self.lats.size and 0 <= col < self.lons.size:
+            value = float(self.grid[row, col])
+            return None if np.isnan(value) else value
+        return None
+
+    def save(self, path):
+        """Save as .npz (lats, lons, grid[, std])."""
+        arrays = {"lats": self.lats, "lons": self.lons, "grid": self.grid}
+        if self.std is not None:
+            arrays["std"] = self.std
+        np.savez_compressed(path, method=self.method, **arrays)
+
+
+# -----------------------
+# IDW
+# -----------------------
+def _idw_tile(index, sx, sy, values, gx, gy, k, power, max_distance_m):
+    """IDW for the cells gx (cols) x gy (rows) of one tile."""
+    cx, cy = (gx[0] + gx[-1]) / 2, (gy[0] + gy[-1]) / 2
+    half_diagonal = np.hypot(gx[-1] - gx[0], gy[-1] - gy[0]) / 2
+    # Any station among the k nearest of a cell in this tile is within d_k + 2h of the centre.
+    candidates = index.within(cx, cy, index.kth_distance(cx, cy, k) + 2 * half_diagonal)
+    kk = min(k, candidates.size)
+    X, Y = np.meshgrid(gx, gy)
+    px, py = X.ravel(), Y.ravel()
+    d2 = (px[:, None] - sx[candidates][None, :]) ** 2 + (py[:, None] - sy[candidates][None, :]) ** 2
+    if kk < candidates.size:
+        nearest = np.argpartition(d2, kk - 1, axis=1)[:, :kk]
+        d2 = np.take_along_axis(d2, nearest, axis=1)
+        v = values[candidates][nearest]
+    else:
+        v = np.broadcast_to(values[candidates], d2.shape)
+    d = np.sqrt(d2)
+    with np.errstate(divide="ignore"):
+        w = 1.0 / d ** power
+    if max_distance_m is not None:
+        w = np.where(d <= max_distance_m, w, 0.0)
+    exact = d < 1e-6
+    w = np.where(exact.any(axis=1, keepdims=True), exact.astype(np.float64), w)
+    total = w.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = (w * v).sum(axis=1) / total
+    return np.where(total > 0, result, np.nan).reshape(gy.size, gx.size)
+
+
+# -----------------------
+# Gaussian Process
+# -----------------------
+def _gp_fit(sx, sy, values, length_scale_m, noise):
+    mean = float(values.mean())
+    signal = float(values.var()) or 1.0
+    d2 = (sx[:, None] - sx[None, :]) ** 2 + (sy[:, None] - sy[None, :]) ** 2
+    K = signal * np.exp(-0.5 * d2 / length_scale_m ** 2) + (noise * signal + 1e-9) * np.eye(sx.size)
+    K_inv = np.linalg.inv(K)
+    return {"mean": mean, "signal": signal, "alpha": K_inv @ (values - mean), "K_inv": K_inv,
+            "length_scale_m": length_scale_m}
+
+
+def _gp_tile(model, sx, sy, gx, gy, with_std):
+    X, Y = np.meshgrid(gx, gy)
+    px, py = X.ravel(), Y.ravel()
+    d2 = (px[:, None] - sx[None, :]) ** 2 + (py[:, None] - sy[None, :]) ** 2
+    Ks = model["signal"] * np.exp(-0.5 * d2 / model["length_scale_m"] ** 2)
+    mean = (model["mean"] + Ks @ model["alpha"]).reshape(gy.size, gx.size)
+    if not with_std:
+        return mean, None
+    variance = model["signal"] - np.einsum("ij,jk,ik->i", Ks, model["K_inv"], Ks)
+    return mean, np.sqrt(np.clip(variance, 0.0, None)).reshape(gy.size, gx.size)
+
+
+def default_length_scale(sx, sy):
+    """Twice the median nearest-neighbour spacing between stations (at least 500 m)."""
+    if sx.size < 2:
+        return 5000.0
+    d2 = (sx[:, None] - sx[None, :]) ** 2 + (sy[:, None] - sy[None, :]) ** 2
+    np.fill_diagonal(d2, np.inf)
+    return max(2.0 * float(np.median(np.sqrt(d2.min(axis=1)))), 500.0)
+
+
+# -----------------------
+# Public API
+# -----------------------
+def interpolate(lats, lons, values, bbox, resolution_m=100, method="idw", k=8, power=2.0,
+                max_distance_m=None, length_scale_m=None, noise=0.1, with_std=False,
+                tile=DEFAULT_TILE, workers=None):
+    """
+    Interpolate station `values` at (`lats`, `lons`) onto a grid over `bbox`
+    (min_lon, min_lat, max_lon, max_lat) with cells of `resolution_m` meters.
+    Stations with a NaN value are ignored. Returns a Surface.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    keep = np.isfinite(lats) & np.isfinite(lons) & np.isfinite(values)
+    lats, lons, values = lats[keep], lons[keep], values[keep]
+
+    grid_lats, grid_lons, projection = make_grid(bbox, resolution_m)
+    gx, _ = projection.forward(np.full(grid_lons.size, projection.lat0), grid_lons)
+    _, gy = projection.forward(grid_lats, np.full(grid_lats.size, projection.lon0))
+    grid = np.full((grid_lats.size, grid_lons.size), np.nan)
+    std = np.full(grid.shape, np.nan) if (method == "gp" and with_std) else None
+    if values.size == 0 or grid.size == 0:
+        return Surface(grid_lats, grid_lons, grid, method, std)
+
+    sx, sy = projection.forward(lats, lons)
+    if method == "idw":
+        index = StationGridIndex(sx, sy)
+        # Tiles a few station spacings wide keep each tile's candidate set close to k.
+        spacing = np.sqrt((np.ptp(gx) + resolution_m) * (np.ptp(gy) + resolution_m) / values.size)
+        tile = max(8, min(tile, int(4 * spacing / resolution_m)))
+    elif method == "gp":
+        if length_scale_m is None:
+            length_scale_m = default_length_scale(sx, sy)
+        model = _gp_fit(sx, sy, values, length_scale_m, noise)
+        # Keep each tile's (cells x stations) kernel matrix to roughly 32 MB.
+        tile = max(8, min(tile, int(np.sqrt(4_000_000 / max(values.size, 1)))))
+    else:
+        raise ValueError(f"unknown method {method!r}; expected 'idw' or 'gp'")
+
+    tiles = [(r, c) for r in range(0, grid_lats.size, tile) for c in range(0, grid_lons.size, tile)]
+
+    def run(tile_origin):
+        r, c = tile_origin
+        tx, ty = gx[c:c + tile], gy[r:r + tile]
+        if method == "idw":
+            grid[r:r + tile, c:c + tile] = _idw_tile(index, sx, sy, values, tx, ty, k, power, max_distance_m)
+        else:
+            mean, tile_std = _gp_tile(model, sx, sy, tx, ty, with_std)
+            grid[r:r + tile, c:c + tile] = mean
+            if tile_std is not None:
+                std[r:r + tile, c:c + tile] = tile_std
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tiles) == 1:
+        for origin in tiles:
+            run(origin)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, tiles))
+    return Surface(grid_lats, grid_lons, grid, method, std)
+
+
+def readings_from_waqi_points(points, pollutant=None):
+    """(lats, lons, values) from WAQI map/bounds points: the overall `aqi`, or iaqi[pollutant].v."""
+    lats, lons, values = [], [], []
+    for point in points:
+        if pollutant is None:
+            raw = point.get("aqi")
+        else:
+            raw = (point.get("iaqi") or {}).get(pollutant, {}).get("v")
+        try:
+            value = float(raw)
+        except (TypeError, ValueError):
+            continue  # WAQI uses "-" for stations without a current reading
+        lats.append(point.get("lat"))
+        lons.append(point.get("lon"))
+        values.append(value)
+    return np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64), np.asarray(values)
+
+
+def bbox_around(lat, lon, radius_m):
+    """A (min_lon, min_lat, max_lon, max_lat) box of +/- radius_m around a point."""
+    projection = LocalProjection(lat, lon)
+    d_lat, d_lon = radius_m / projection.ky, radius_m / projection.kx
+    return lon - d_lon, lat - d_lat, lon + d_lon, lat + d_lat
+
+
+# -----------------------
+# Benchmark
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Time interpolation on synthetic stations.")
+    parser.add_argument("--stations", type=int, default=300)
+    parser.add_argument("--size-km", type=float, default=20.0)
+    parser.add_argument("--resolution", type=float, default=100.0, help="cell size (meters)")
+    parser.add_argument("--method", choices=("idw", "gp"), default="idw")
+    parser.add_argument("-k", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", help="save the surface as .npz")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lat0, lon0 = 46.77, 23.59  # Cluj-Napoca
+    bbox = bbox_around(lat0, lon0, args.size_km * 500)
+    lats = rng.uniform(bbox[1], bbox[3], args.stations)
+    lons = rng.uniform(bbox[0], bbox[2], args.stations)
+    values = 20 + 15 * np.sin((lats - lat0) * 40) * np.cos((lons - lon0) * 30) + rng.normal(0, 2, args.stations)
+
+    t0 = time.perf_counter()
+    surface = interpolate(lats, lons, values, bbox, resolution_m=args.resolution, method=args.method,
+                          k=args.k, workers=args.workers)
+    elapsed = time.perf_counter() - t0
+    print(f"{args.method}: {surface.grid.shape[0]} x {surface.grid.shape[1]} cells "
+          f"({surface.grid.size:,}) from {args.stations} stations in {elapsed:.2f} s")
+    print(f"  range {np.nanmin(surface.grid):.1f} .. {np.nanmax(surface.grid):.1f}, "
+          f"centre {surface.value_at(lat0, lon0):.1f}")
+    if args.output:
+        surface.save(args.output)
+        print(f"  saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+Compact, memory-mapped snapshot of the OpenAQ and WAQI station / sensor catalog.
+
+Instead of every worker rediscovering stations over the network, the catalog is built
+once (e.g. after the nightly crawl) into a single binary file and then opened with mmap.
+Opening is O(1): the arrays are views straight onto the mapped file, so a hundred worker
+processes on one host share the same physical pages through the OS page cache.
+
+File layout (little-endian):
+    8 bytes   magic  b"AQCAT\\x00v1"
+    4 bytes   length of the JSON directory
+    N bytes   JSON directory: {"counts": {...}, "sections": {name: [offset, dtype, count]}}
+    ...       sections, each 8-byte aligned
+
+Sections:
+    station_id int64, lat float64, lon float64, provider uint8, country S2,
+    name_idx / locality_idx uint32 (into the string table),
+    sensor_start uint32, sensor_count uint16,
+    key_sorted int64 / key_order uint32  (sorted (provider, id) keys for id lookups),
+    sensor_id int64, sensor_station uint32, sensor_param uint8,
+    param_name_idx / param_units_idx uint32,
+    string_offsets uint32, string_data bytes (UTF-8)
+
+Usage:
+    python station_catalog.py build --crawl-output openaq/first_contact/crawl_output \\
+        --waqi aqi_cn/map_data.json --out station_catalog.bin
+    python station_catalog.py info station_catalog.bin
+    python station_catalog.py nearest station_catalog.bin 46.7445 23.4958 --k 5
+"""
+import argparse
+import glob
+import json
+import mmap
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"AQCAT\x00v1"
+ALIGNMENT = 8
+
+PROVIDERS = ["openaq", "waqi"]
+PROVIDER_CODES = {name: code for code, name in enumerate(PROVIDERS)}
+
+# Parameters get stable codes in this order; anything else is appended per file.
+KNOWN_PARAMETERS = ["pm25", "pm10", "o3", "no2", "so2", "co", "bc", "no", "nox", "pm1", "co2",
+                    "t", "h", "p", "w", "dew", "uvi", "temperature", "relativehumidity", "um003"]
+
+EARTH_RADIUS_M = 6371000.0
+
+
+def _key(provider_code, station_id):
+    # Provider in the top byte, id in the low 56 bits.
+    return (int(provider_code) << 56) | (int(station_id) & ((1 << 56) - 1))
+
+
+# -----------------------
+# Building a Snapshot
+# -----------------------
+class _StringTable:
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def add(self, value):
+        value = value or ""
+        if value not in self.index:
+            self.index[value] = len(self.values)
+            self.values.append(value)
+        return self.index[value]
+
+    def encode(self):
+        blobs = [v.encode("utf-8") for v in self.values]
+        offsets = np.zeros(len(blobs) + 1, dtype="<u4")
+        np.cumsum([len(b) for b in blobs], out=offsets[1:])
+        return offsets, b"".join(blobs)
+
+
+def openaq_station(location):
+    """Normalise an OpenAQ /locations record into the builder's station dict."""
+    coords = location.get("coordinates") or {}
+    country = location.get("country") or {}
+    sensors = []
+    for sensor in location.get("sensors", []):
+        parameter = sensor.get("parameter") or {}
+        name = parameter.get("name") or (sensor.get("name") or "").split(" ")[0]
+        sensors.append((sensor.get("id") or 0, name, parameter.get("units") or ""))
+    return {
+        "provider": "openaq",
+        "id": location.get("id"),
+        "lat": coords.get("latitude"),
+        "lon": coords.get("longitude"),
+        "country": country.get("code") or "",
+        "name": location.get("name") or "",
+        "locality": location.get("locality") or "",
+        "sensors": sensors,
+    }
+
+
+def waqi_station(point):
+    """
+    Normalise a WAQI map/bounds point (or feed "data" object) into the builder's station dict.
+    WAQI has no sensor ids; the pollutants listed under "iaqi" (when present) become sensors with id 0.
+    """
+    if "city" in point and "idx" in point:  # feed payload
+        lat, lon = (point["city"].get("geo") or [None, None])[:2]
+        station_id = point.get("idx")
+        name = point["city"].get("name")
+    else:
+        lat, lon = point.get("lat"), point.get("lon")
+        station_id = point.get("uid")
+        name = (point.get("station") or {}).get("name")
+    iaqi = point.get("iaqi") or {}
+    return {
+        "provider": "waqi",
+        "id": station_id,
+        "lat": lat,
+        "lon": lon,
+        "country": point.get("country") or "",
+        "name": name or "",
+        "locality": "",
+        "sensors": [(0, pollutant, "") for pollutant in iaqi],
+    }
+
+
+def build_catalog(stations, path):
+    """
+    Write a snapshot file from an iterable of station dicts (see openaq_station / waqi_station).
+    The file is written to a temporary name and renamed into place, so processes that still
+    have the previous snapshot mapped keep a consistent view.
+    Returns the number of stations and sensors written.
+    """
+    strings = _StringTable()
+    strings.add("")
+    param_codes = {name: code for code, name in enumerate(KNOWN_PARAMETERS)}
+    param_units = {}
+
+    station_id, lat, lon, provider, country = [], [], [], [], []
+    name_idx, locality_idx, sensor_start, sensor_count = [], [], [], []
+    sensor_id, sensor_station, sensor_param = [], [], []
+
+    # The same station can arrive from several sources (e.g. a map/bounds point and its
+    # feed); keep the first record and merge in any sensors the later ones add.
+    merged = {}
+    for station in stations:
+        if station.get("id") is None or station.get("lat") is None or station.get("lon") is None:
+            continue
+        key = (PROVIDER_CODES[station["provider"]], station["id"])
+        if key not in merged:
+            merged[key] = dict(station, sensors=list(station.get("sensors", [])))
+            continue
+        known = set(merged[key]["sensors"])
+        merged[key]["sensors"] += [s for s in station.get("sensors", []) if s not in known]
+
+    for (code, _), station in merged.items():
+        index = len(station_id)
+        station_id.append(station["id"])
+        lat.append(station["lat"])
+        lon.append(station["lon"])
+        provider.append(code)
+        country.append((station.get("country") or "")[:2].encode("ascii", "replace"))
+        name_idx.append(strings.add(station.get("name")))
+        locality_idx.append(strings.add(station.get("locality")))
+        sensor_start.append(len(sensor_id))
+        sensors = station.get("sensors", [])[:65535]
+        sensor_count.append(len(sensors))
+        for sid, parameter, units in sensors:
+            if parameter not in param_codes:
+                param_codes[parameter] = len(param_codes)
+            if units and not param_units.get(parameter):
+                param_units[parameter] = units
+            sensor_id.append(sid)
+            sensor_station.append(index)
+            sensor_param.append(param_codes[parameter])
+
+    if len(param_codes) > 255:
+        raise ValueError("More than 255 distinct parameters do not fit the uint8 parameter code.")
+
+    params_by_code = sorted(param_codes, key=param_codes.get)
+    param_name_idx = [strings.add(p) for p in params_by_code]
+    param_units_idx = [strings.add(param_units.get(p, "")) for p in params_by_code]
+
+    keys = np.array([_key(p, i) for p, i in zip(provider, station_id)], dtype="<i8")
+    key_order = np.argsort(keys, kind="stable").astype("<u4")
+    string_offsets, string_data = strings.encode()
+
+    sections = {
+        "station_id": np.array(station_id, dtype="<i8"),
+        "lat": np.array(lat, dtype="<f8"),
+        "lon": np.array(lon, dtype="<f8"),
+        "provider": np.array(provider, dtype="u1"),
+        "country": np.array(country, dtype="S2"),
+        "name_idx": np.array(name_idx, dtype="<u4"),
+        "locality_idx": np.array(locality_idx, dtype="<u4"),
+        "sensor_start": np.array(sensor_start, dtype="<u4"),
+        "sensor_count": np.array(sensor_count, dtype="<u2"),
+        "key_sorted": keys[key_order],
+        "key_order": key_order,
+        "sensor_id": np.array(sensor_id, dtype="<i8"),
+        "sensor_station": np.array(sensor_station, dtype="<u4"),
+        "sensor_param": np.array(sensor_param, dtype="u1"),
+        "param_name_idx": np.array(param_name_idx, dtype="<u4"),
+        "param_units_idx": np.array(param_units_idx, dtype="<u4"),
+        "string_offsets": string_offsets,
+        "string_data": np.frombuffer(string_data, dtype="u1"),
+    }
+
+    # The directory's size depends on the offsets it contains, so lay out against a
+    # generously padded header size first.
+    directory = {"counts": {"stations": len(station_id), "sensors": len(sensor_id),
+                            "parameters": len(params_by_code), "strings": len(strings.values)},
+                 "created": int(time.time()), "sections": {}}
+    header_size = 4096
+    while True:
+        offset = header_size
+        for name, array in sections.items():
+            directory["sections"][name] = [offset, array.dtype.str, int(array.size)]
+            offset += array.nbytes
+            offset += -offset % ALIGNMENT
+        encoded = json.dumps(directory).encode("utf-8")
+        if len(MAGIC) + 4 + len(encoded) <= header_size:
+            break
+        header_size *= 2
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(encoded)))
+        f.write(encoded)
+        for name, array in sections.items():
+            f.seek(directory["sections"][name][0])
+            f.write(array.tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, path)
+    return len(station_id), len(sensor_id)
+
+
+# -----------------------
+# Reading a Snapshot
+# -----------------------
+class StationCatalog:
+    """
+    Read-only view of a snapshot file. All arrays are zero-copy numpy views onto the mmap,
+    so opening costs a few syscalls regardless of the catalog size.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a station catalog snapshot")
+        (directory_len,) = struct.unpack_from("<I", self._mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        directory = json.loads(self._mm[start:start + directory_len].decode("utf-8"))
+        self.counts = directory["counts"]
+        self.created = directory.get("created")
+        for name, (offset, dtype, count) in directory["sections"].items():
+            setattr(self, name, np.frombuffer(self._mm, dtype=np.dtype(dtype), count=count, offset=offset))
+        self._lat_rad = None
+        self._lon_rad = None
+
+    @classmethod
+    def open(cls, path):
+        return cls(path)
+
+    def __len__(self):
+        return int(self.station_id.size)
+
+    # -----------------------
+    # Strings and parameters
+    # -----------------------
+    def string(self, index):
+        start, end = int(self.string_offsets[index]), int(self.string_offsets[index + 1])
+        return bytes(self.string_data[start:end]).decode("utf-8")
+
+    def parameter_names(self):
+        return [self.string(i) for i in self.param_name_idx]
+
+    def parameter_code(self, name):
+        """Code of a parameter name in this file, or None if no station measures it."""
+        for code, index in enumerate(self.param_name_idx):
+            if self.string(index) == name:
+                return code
+        return None
+
+    # -----------------------
+    # Lookups
+    # -----------------------
+    def index_of(self, provider, station_id):
+        """Row index of a station (provider "openaq" / "waqi"), or None. Binary search on the sorted keys."""
+        key = _key(PROVIDER_CODES[provider], station_id)
+        pos = int(np.searchsorted(self.key_sorted, key))
+        if pos < self.key_sorted.size and int(self.key_sorted[pos]) == key:
+            return int(self.key_order[pos])
+        return None
+
+    def sensors_of(self, index):
+        """List of (sensor_id, parameter, units) for a station row."""
+        start = int(self.sensor_start[index])
+        end = start + int(self.sensor_count[index])
+        result = []
+        for sid, code in zip(self.sensor_id[start:end], self.sensor_param[start:end]):
+            result.append((int(sid), self.string(self.param_name_idx[code]), self.string(self.param_units_idx[code])))
+        return result
+
+    def station(self, index):
+        """
+        A station row as a dict shaped like an OpenAQ /locations record, so it can be passed
+        to the existing process_location() functions unchanged.
+        """
+        sensors = [{"id": sid, "name": f"{param} {units}".strip(),
+                    "parameter": {"name": param, "units": units}}
+                   for sid, param, units in self.sensors_of(index)]
+        return {
+            "id": int(self.station_id[index]),
+            "provider": PROVIDERS[int(self.provider[index])],
+            "name": self.string(self.name_idx[index]),
+            "locality": self.string(self.locality_idx[index]),
+            "country": {"code": self.country[index].decode("ascii")},
+            "coordinates": {"latitude": float(self.lat[index]), "longitude": float(self.lon[index])},
+            "sensors": sensors,
+        }
+
+    def get(self, provider, station_id):
+        index = self.index_of(provider, station_id)
+        return None if index is None else self.station(index)
+
+    def distances_from(self, lat, lon):
+        """Haversine distance (meters) from (lat, lon) to every station, vectorized."""
+        if self._lat_rad is None:
+            self._lat_rad = np.radians(self.lat)
+            self._lon_rad = np.radians(self.lon)
+        phi = np.radians(lat)
+        dphi = self._lat_rad - phi
+        dlmb = self._lon_rad - np.radians(lon)
+        a = np.sin(dphi / 2) ** 2 + np.cos(phi) * np.cos(self._lat_rad) * np.sin(dlmb / 2) ** 2
+        return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+    def nearest(self, lat, lon, k=5, provider=None, parameter=None, max_distance_m=None):
+        """
+        The k nearest stations to (lat, lon) as OpenAQ-shaped dicts with a "distance" field
+        (meters), optionally restricted to a provider and/or to stations measuring a parameter.
+        """
+        distances = self.distances_from(lat, lon)
+        mask = np.ones(distances.size, dtype=bool)
+        if provider is not None:
+            mask &= self.provider == PROVIDER_CODES[provider]
+        if parameter is not None:
+            code = self.parameter_code(parameter)
+            if code is None:
+                return []
+            has_param = np.zeros(distances.size, dtype=bool)
+            has_param[self.sensor_station[self.sensor_param == code]] = True
+            mask &= has_param
+        if max_distance_m is not None:
+            mask &= distances <= max_distance_m
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+        k = min(k, candidates.size)
+        nearest = candidates[np.argpartition(distances[candidates], k - 1)[:k]]
+        nearest = nearest[np.argsort(distances[nearest])]
+        results = []
+        for index in nearest:
+            record = self.station(int(index))
+            record["distance"] = float(distances[index])
+            results.append(record)
+        return results
+
+    def iter_stations(self, provider=None):
+        for index in range(len(self)):
+            if provider is None or self.provider[index] == PROVIDER_CODES[provider]:
+                yield self.station(index)
+
+
+# -----------------------
+# Input Loaders
+# -----------------------
+def load_openaq_locations(crawl_output=None, json_files=()):
+    """Yield OpenAQ location records from a crawler output directory and/or JSON list files."""
+    if crawl_output:
+        for path in sorted(glob.glob(os.path.join(crawl_output, "*", "locations_p*.jsonl"))):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+    for path in json_files:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        yield from (data.get("results", []) if isinstance(data, dict) else data)
+
+
+def load_waqi_points(json_files=()):
+    """Yield WAQI stations from saved map/bounds responses ({"status", "data": [...]}) or plain lists."""
+    for path in json_files:
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+                continue
+            data = json.load(f)
+        points = data.get("data", []) if isinstance(data, dict) else data
+        if isinstance(points, dict):  # a single feed response
+            points = [points]
+        yield from points
+
+
+# -----------------------
+# Main Workflow
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Build or inspect the memory-mapped station catalog.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build")
+    build.add_argument("--crawl-output", help="Output directory of crawl_locations.py.")
+    build.add_argument("--openaq", action="append", default=[], help="JSON file with OpenAQ location records.")
+    build.add_argument("--waqi", action="append", default=[], help="Saved WAQI map/bounds JSON (or JSONL).")
+    build.add_argument("--out", default="station_catalog.bin")
+
+    info = sub.add_parser("info")
+    info.add_argument("path")
+
+    nearest = sub.add_parser("nearest")
+    nearest.add_argument("path")
+    nearest.add_argument("lat", type=float)
+    nearest.add_argument("lon", type=float)
+    nearest.add_argument("--k", type=int, default=5)
+    nearest.add_argument("--provider", choices=PROVIDERS)
+    nearest.add_argument("--parameter")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        t0 = time.perf_counter()
+        stations = [openaq_station(loc) for loc in load_openaq_locations(args.crawl_output, args.openaq)]
+        stations += [waqi_station(p) for p in load_waqi_points(args.waqi)]
+        n_stations, n_sensors = build_catalog(stations, args.out)
+        size_kb = os.path.getsize(args.out) / 1024
+        print(f"Wrote {n_stations} stations and {n_sensors} sensors to '{args.out}' "
+              f"({size_kb:.0f} KB) in {time.perf_counter() - t0:.2f}s")
+    else:
+        t0 = time.perf_counter()
+        catalog = StationCatalog.open(args.path)
+        print(f"Opened '{args.path}' in {(time.perf_counter() - t0) * 1000:.2f} ms: {catalog.counts}")
+        if args.command == "info":
+            for code, name in enumerate(PROVIDERS):
+                print(f"  {name}: {int((catalog.provider == code).sum())} stations")
+            print(f"  parameters: {', '.join(catalog.parameter_names())}")
+        else:
+            for station in catalog.nearest(args.lat, args.lon, args.k, args.provider, args.parameter):
+                params = ", ".join(s["parameter"]["name"] for s in station["sensors"])
+                print(f"  {station['provider']:>6} {station['id']:>9}  {station['distance']:>9.0f} m  "
+                      f"{station['name']}  [{params}]")
+
+
+if __name__ == "__main__":
+    main()
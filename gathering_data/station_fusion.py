@@ -0,0 +1,377 @@
+"""
+Cross-provider station fusion: match OpenAQ locations and WAQI stations that are the same
+physical monitor, keep the matches in a persistent cross-reference table, and decide for
+each pollutant which provider to ask.
+
+    xref = StationXRef()
+    xref.update(openaq_locations, waqi_points)      # spatial join, saved to station_xref.json
+    plan = plan_fetches(openaq_locations, waqi_points, xref)
+    plan["openaq_sensors"]  # [(location_id, sensor_id, pollutant)] still worth fetching
+    plan["waqi_uids"]       # WAQI feeds worth fetching
+    plan["stations"]        # one entry per physical station, with the source of each pollutant
+
+Matching: two stations match when they are within `tolerance_m` of each other and share at
+least `min_overlap` pollutants. A WAQI map/bounds point does not list its pollutants, so
+until a feed has taught the table what the station measures (record_waqi_parameters), it
+matches only within half the tolerance. Matching is one-to-one, closest pairs first.
+
+Serving policy per pollutant of a matched pair: the provider whose data is fresher by more
+than `freshness_tolerance_s` wins; otherwise the cheaper one (WAQI: one feed call returns
+every pollutant, while OpenAQ needs one call per sensor under a tighter rate limit).
+WAQI values are US EPA sub-indices; fused_readings() converts them to µg/m³ so both
+providers can feed the same interpolation without a station being counted twice.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+from math import ceil, cos, radians
+
+import numpy as np
+
+from aqi_engine import POLLUTANTS, concentration_from_sub_index, normalize_parameter
+from station_catalog import EARTH_RADIUS_M, load_openaq_locations, load_waqi_points, openaq_station, waqi_station
+
+XREF_PATH = os.getenv("station_xref", os.path.join(os.path.dirname(os.path.abspath(__file__)), "station_xref.json"))
+DEFAULT_TOLERANCE_M = 250.0
+FRESHNESS_TOLERANCE_S = 90 * 60
+# Relative cost of one upstream call (OpenAQ's default budget is 1 req/s vs 5 req/s for WAQI).
+CALL_COST = {"openaq": 5.0, "waqi": 1.0}
+
+
+# -----------------------
+# Helper Functions
+# -----------------------
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters (scalars or NumPy arrays)."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    a = (np.sin((phi2 - phi1) / 2) ** 2
+         + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def parse_time(value):
+    """Epoch seconds from an ISO string, an OpenAQ {"utc": ...} dict or a WAQI time object."""
+    if isinstance(value, dict):
+        # WAQI's "v" and "s" are local wall-clock times; "iso" / "stime" carry the offset.
+        value = value.get("utc") or value.get("iso") or value.get("stime")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00").replace(" ", "T"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def pollutants_of(station):
+    """Set of pollutants (aqi_engine names) a normalised station dict measures."""
+    found = set()
+    for _, parameter, _ in station.get("sensors", []):
+        name = normalize_parameter(parameter)
+        if name in POLLUTANTS:
+            found.add(name)
+    return found
+
+
+def _openaq_key(location_id):
+    return f"openaq:{location_id}"
+
+
+def _waqi_key(uid):
+    return f"waqi:{uid}"
+
+
+# -----------------------
+# Spatial Join
+# -----------------------
+def spatial_join(openaq_stations, waqi_stations, tolerance_m=DEFAULT_TOLERANCE_M, min_overlap=1,
+                 waqi_parameters=None):
+    """
+    One-to-one matches between normalised OpenAQ and WAQI station dicts (see
+    station_catalog.openaq_station / waqi_station). `waqi_parameters` ({uid: [pollutant, ...]})
+    fills in pollutants learned from earlier feeds. Returns a list of match dicts.
+    """
+    waqi_parameters = waqi_parameters or {}
+    cell_deg = tolerance_m / (radians(1.0) * EARTH_RADIUS_M)
+    buckets = {}
+    for j, station in enumerate(waqi_stations):
+        if station["lat"] is None or station["lon"] is None:
+            continue
+        key = (int(station["lat"] // cell_deg), int(station["lon"] // cell_deg))
+        buckets.setdefault(key, []).append(j)
+
+    waqi_pollutants = []
+    for station in waqi_stations:
+        known = pollutants_of(station) or set(waqi_parameters.get(str(station["id"]), []))
+        waqi_pollutants.append(known)
+
+    candidates = []
+    for i, station in enumerate(openaq_stations):
+        lat, lon = station["lat"], station["lon"]
+        if lat is None or lon is None:
+            continue
+        row, col = int(lat // cell_deg), int(lon // cell_deg)
+        lon_cells = int(ceil(1.0 / max(cos(radians(lat)), 1e-6)))
+        nearby = [j for r in (row - 1, row, row + 1) for c in range(col - lon_cells, col + lon_cells + 1)
+                  for j in buckets.get((r, c), ())]
+        if not nearby:
+            continue
+        own = pollutants_of(station)
+        distances = haversine(lat, lon, np.array([waqi_stations[j]["lat"] for j in nearby]),
+                              np.array([waqi_stations[j]["lon"] for j in nearby]))
+        for j, distance in zip(nearby, distances):
+            if distance > tolerance_m:
+                continue
+            shared = own & waqi_pollutants[j]
+            if waqi_pollutants[j] and own:
+                if len(shared) < min_overlap:
+                    continue
+            elif distance > tolerance_m / 2:
+                continue  # no parameter evidence on one side: only accept very close pairs
+            candidates.append((float(distance), -len(shared), i, j, sorted(shared)))
+
+    candidates.sort()
+    used_openaq, used_waqi, matches = set(), set(), []
+    for distance, _, i, j, shared in candidates:
+        if i in used_openaq or j in used_waqi:
+            continue
+        used_openaq.add(i)
+        used_waqi.add(j)
+        matches.append({
+            "openaq_id": openaq_stations[i]["id"],
+            "waqi_uid": waqi_stations[j]["id"],
+            "distance_m": round(distance, 1),
+            "shared_parameters": shared,
+            "openaq_name": openaq_stations[i]["name"],
+            "waqi_name": waqi_stations[j]["name"],
+        })
+    return matches
+
+
+# -----------------------
+# Cross-reference Table
+# -----------------------
+class StationXRef:
+    """Persistent OpenAQ <-> WAQI station matches (JSON)."""
+
+    def __init__(self, path=XREF_PATH):
+        self.path = path
+        self.matches = {}          # openaq_id (str) -> match dict
+        self.by_waqi = {}          # waqi uid (str) -> openaq_id (str)
+        self.waqi_parameters = {}  # waqi uid (str) -> pollutants seen in its feed
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            for match in data.get("matches", []):
+                self._add(match)
+            self.waqi_parameters = data.get("waqi_parameters", {})
+
+    def _add(self, match):
+        self.matches[str(match["openaq_id"])] = match
+        self.by_waqi[str(match["waqi_uid"])] = str(match["openaq_id"])
+
+    def _remove(self, openaq_id):
+        match = self.matches.pop(str(openaq_id), None)
+        if match:
+            self.by_waqi.pop(str(match["waqi_uid"]), None)
+
+    def __len__(self):
+        return len(self.matches)
+
+    def waqi_for(self, openaq_id):
+        match = self.matches.get(str(openaq_id))
+        return match["waqi_uid"] if match else None
+
+    def openaq_for(self, waqi_uid):
+        openaq_id = self.by_waqi.get(str(waqi_uid))
+        return self.matches[openaq_id]["openaq_id"] if openaq_id else None
+
+    def record_waqi_parameters(self, uid, iaqi):
+        """Remember which pollutants a WAQI station reports (from a feed's `iaqi`)."""
+        pollutants = sorted({normalize_parameter(p) for p in iaqi} & set(POLLUTANTS))
+        if pollutants:
+            self.waqi_parameters[str(uid)] = pollutants
+
+    def update(self, openaq_locations, waqi_points, tolerance_m=DEFAULT_TOLERANCE_M, min_overlap=1, save=True):
+        """
+        Re-match the given stations (raw OpenAQ /locations records and WAQI points or feeds).
+        A previous match is dropped when both of its stations are in this batch (the join has
+        decided again) or when one of them gets a new partner; all other matches are kept, so
+        the table can be grown region by region. Returns (matches found, matches dropped).
+        """
+        openaq_stations = [openaq_station(loc) for loc in openaq_locations]
+        waqi_stations = [waqi_station(p) for p in waqi_points]
+        for point, station in zip(waqi_points, waqi_stations):
+            if point.get("iaqi"):
+                self.record_waqi_parameters(station["id"], point["iaqi"])
+
+        before = {k: m["waqi_uid"] for k, m in self.matches.items()}
+        openaq_ids = {str(s["id"]) for s in openaq_stations}
+        waqi_ids = {str(s["id"]) for s in waqi_stations}
+        for openaq_id, match in list(self.matches.items()):
+            if openaq_id in openaq_ids and str(match["waqi_uid"]) in waqi_ids:
+                self._remove(openaq_id)
+
+        found = spatial_join(openaq_stations, waqi_stations, tolerance_m, min_overlap, self.waqi_parameters)
+        now = time.time()
+        for match in found:
+            self._remove(match["openaq_id"])
+            previous = self.by_waqi.get(str(match["waqi_uid"]))
+            if previous:
+                self._remove(previous)
+            match["matched_at"] = now
+            self._add(match)
+        dropped = sum(1 for k, uid in before.items() if self.matches.get(k, {}).get("waqi_uid") != uid)
+        if save:
+            self.save()
+        return len(found), dropped
+
+    def save(self):
+        data = {"matches": list(self.matches.values()), "waqi_parameters": self.waqi_parameters}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+# -----------------------
+# Serving Policy
+# -----------------------
+def choose_provider(openaq_time, waqi_time, freshness_tolerance_s=FRESHNESS_TOLERANCE_S):
+    """'openaq' or 'waqi' for a pollutant both providers report (times in epoch seconds)."""
+    if openaq_time is not None and waqi_time is not None:
+        if openaq_time - waqi_time > freshness_tolerance_s:
+            return "openaq"
+        if waqi_time - openaq_time > freshness_tolerance_s:
+            return "waqi"
+    elif openaq_time is not None and waqi_time is None:
+        return "openaq"
+    return min(CALL_COST, key=CALL_COST.get)
+
+
+def _waqi_time(point):
+    station = point.get("station") or {}
+    return parse_time(station.get("time") or point.get("time"))
+
+
+def plan_fetches(openaq_locations, waqi_points, xref, pollutants=POLLUTANTS,
+                 freshness_tolerance_s=FRESHNESS_TOLERANCE_S):
+    """
+    Decide which upstream calls to make. Each physical station appears once in
+    plan["stations"] with {"key", "name", "lat", "lon", "sources": {pollutant: (provider, id)}}.
+    plan["calls_saved"] counts the OpenAQ sensor calls avoided because a matched WAQI feed
+    (which is fetched anyway) already covers the pollutant.
+    """
+    wanted = set(pollutants)
+    waqi_by_uid = {str(waqi_station(p)["id"]): p for p in waqi_points}
+    plan = {"openaq_sensors": [], "waqi_uids": [], "stations": [], "calls_saved": 0}
+    matched_waqi = set()
+
+    for location in openaq_locations:
+        station = openaq_station(location)
+        uid = xref.waqi_for(station["id"])
+        point = waqi_by_uid.get(str(uid)) if uid is not None else None
+        openaq_time = parse_time(location.get("datetimeLast"))
+        waqi_time = _waqi_time(point) if point is not None else None
+        waqi_has = set(xref.waqi_parameters.get(str(uid), [])) if point is not None else set()
+        if point is not None:
+            waqi_has |= pollutants_of(waqi_station(point))
+
+        sources = {}
+        for sensor_id, parameter, _ in station["sensors"]:
+            name = normalize_parameter(parameter)
+            if name not in wanted or name in sources:
+                continue
+            if name in waqi_has and choose_provider(openaq_time, waqi_time, freshness_tolerance_s) == "waqi":
+                sources[name] = ("waqi", uid)
+                plan["calls_saved"] += 1
+            else:
+                sources[name] = ("openaq", sensor_id)
+                plan["openaq_sensors"].append((station["id"], sensor_id, name))
+        for name in (waqi_has & wanted) - set(sources):
+            sources[name] = ("waqi", uid)
+
+        if point is not None:
+            matched_waqi.add(str(uid))
+            if any(src == "waqi" for src, _ in sources.values()):
+                plan["waqi_uids"].append(uid)
+        plan["stations"].append({"key": _openaq_key(station["id"]), "name": station["name"],
+                                 "lat": station["lat"], "lon": station["lon"], "waqi_uid": uid,
+                                 "sources": sources})
+
+    for uid, point in waqi_by_uid.items():
+        if uid in matched_waqi:
+            continue
+        station = waqi_station(point)
+        waqi_has = (pollutants_of(station) | set(xref.waqi_parameters.get(uid, []))) & wanted
+        plan["waqi_uids"].append(station["id"])
+        plan["stations"].append({"key": _waqi_key(station["id"]), "name": station["name"],
+                                 "lat": station["lat"], "lon": station["lon"], "waqi_uid": station["id"],
+                                 "sources": {name: ("waqi", station["id"]) for name in sorted(waqi_has)}})
+    return plan
+
+
+def fused_readings(plan, pollutant, openaq_values, waqi_iaqi, units="µg/m³"):
+    """
+    (lats, lons, values) for one pollutant with one value per physical station, ready for
+    spatial_interpolation.interpolate(). `openaq_values` maps sensor id -> concentration in
+    `units`; `waqi_iaqi` maps WAQI uid -> the feed's iaqi dict (sub-indices, converted here).
+    """
+    lats, lons, values = [], [], []
+    for station in plan["stations"]:
+        source = station["sources"].get(pollutant)
+        if source is None:
+            continue
+        provider, source_id = source
+        if provider == "openaq":
+            value = openaq_values.get(source_id)
+        else:
+            sub_index = (waqi_iaqi.get(source_id) or waqi_iaqi.get(str(source_id)) or {}).get(pollutant, {}).get("v")
+            value = None if sub_index is None else float(concentration_from_sub_index(sub_index, pollutant, units))
+        if value is None:
+            continue
+        lats.append(station["lat"])
+        lons.append(station["lon"])
+        values.append(value)
+    return np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64), np.asarray(values, dtype=np.float64)
+
+
+# -----------------------
+# Main Workflow
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Match OpenAQ and WAQI stations and plan deduplicated fetches.")
+    parser.add_argument("--crawl-output", help="Output directory of crawl_locations.py.")
+    parser.add_argument("--openaq", action="append", default=[], help="JSON file with OpenAQ location records.")
+    parser.add_argument("--waqi", action="append", default=[], help="Saved WAQI map/bounds or feed JSON (or JSONL).")
+    parser.add_argument("--xref", default=XREF_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE_M, help="Match distance (meters).")
+    parser.add_argument("--min-overlap", type=int, default=1)
+    args = parser.parse_args()
+
+    locations = list(load_openaq_locations(args.crawl_output, args.openaq))
+    points = list(load_waqi_points(args.waqi))
+    t0 = time.perf_counter()
+    xref = StationXRef(args.xref)
+    found, dropped = xref.update(locations, points, args.tolerance, args.min_overlap)
+    elapsed = time.perf_counter() - t0
+    print(f"Matched {found} of {len(locations)} OpenAQ / {len(points)} WAQI stations in {elapsed:.2f}s "
+          f"({dropped} previous matches changed); table now holds {len(xref)} matches in '{args.xref}'.")
+
+    plan = plan_fetches(locations, points, xref)
+    naive_calls = len(points) + sum(1 for loc in locations for _, parameter, _ in openaq_station(loc)["sensors"]
+                                    if normalize_parameter(parameter) in POLLUTANTS)
+    planned_calls = len(plan["openaq_sensors"]) + len(plan["waqi_uids"])
+    print(f"Physical stations: {len(plan['stations'])} (from {len(locations) + len(points)} provider entries)")
+    print(f"Upstream calls: {planned_calls} planned vs {naive_calls} querying both providers separately "
+          f"({plan['calls_saved']} OpenAQ sensor calls served by WAQI instead)")
+
+
+if __name__ == "__main__":
+    main()
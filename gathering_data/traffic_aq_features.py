@@ -0,0 +1,454 @@
+"""
+Traffic x air-quality feature table: congestion samples joined with nearby sensor readings.
+
+traffic_sampling.py logs one row per station and 15-minute bucket into a columnar table
+(traffic_samples/), and backfill_history.py stores hourly OpenAQ series per sensor. This
+stage joins the two into one training table with a row per (traffic site, hour):
+
+    time       traffic samples are averaged per (site, UTC hour) - the hour of the OpenAQ
+               /hours record that starts at that hour
+    distance   per pollutant, the k nearest sensors within max_distance_m of the site are
+               candidates; the nearest one with a value in that hour is used, and its
+               distance is kept as a feature
+
+    epoch  site_lat  site_lon  hour_of_day  weekday  traffic_samples  delay_ratio  delay_ratio_max
+    heavy_share  moderate_share  congestion  no2  no2_distance_m  pm25  pm25_distance_m  ...
+
+Everything is vectorized: sites and hours are grouped with np.unique / np.bincount, each
+pollutant's readings become one (sensors, hours) matrix (HourlyMatrix), and the join is a
+fancy-indexing gather of (rows, k) candidates, so millions of rows take seconds.
+
+Updates are incremental: the feature table remembers the hour it has joined up to, and a
+run only joins traffic hours after it and older than `settle_s` (OpenAQ hours arrive late),
+appending them as a new part.
+
+    python traffic_aq_features.py update --traffic ../GoogleMapAPI/traffic_samples \\
+        --history openaq/history --catalog station_catalog.bin --out traffic_aq_features
+    python traffic_aq_features.py bench --sites 2000 --hours 720     # synthetic timing
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+from columnar_table import ColumnarTable
+
+# The hourly matrix and the backfill reader live next to the OpenAQ scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "openaq"))
+from hourly_aggregation import HOUR, HourlyMatrix
+
+EARTH_RADIUS_M = 6371000.0
+POLLUTANTS = ("no2", "pm25", "pm10", "o3", "co", "so2")
+DEFAULT_MAX_DISTANCE_M = 2000
+DEFAULT_K = 3
+SETTLE_S = 3 * HOUR  # OpenAQ hourly values are usually published within a few hours
+MODERATE_DELAY, HEAVY_DELAY = 0.2, 0.5  # same thresholds as app.py / traffic_sampling.py
+
+TRAFFIC_SCHEMA = {
+    "epoch": "int64", "lat": "float64", "lon": "float64",
+    "delay_ratio": "float32", "heavy_share": "float32", "moderate_share": "float32",
+    "congestion": "int8", "spokes_measured": "int8",
+}
+BASE_FEATURES = {
+    "epoch": "int64", "site_lat": "float64", "site_lon": "float64",
+    "hour_of_day": "int8", "weekday": "int8", "traffic_samples": "int16",
+    "delay_ratio": "float32", "delay_ratio_max": "float32",
+    "heavy_share": "float32", "moderate_share": "float32", "congestion": "int8",
+}
+
+
+def feature_schema(pollutants=POLLUTANTS):
+    schema = dict(BASE_FEATURES)
+    for pollutant in pollutants:
+        schema[pollutant] = "float32"
+        schema[f"{pollutant}_distance_m"] = "float32"
+    return schema
+
+
+# -----------------------
+# Traffic: samples -> (site, hour)
+# -----------------------
+def site_keys(lats, lons):
+    """int64 key per coordinate, equal for points within ~1 m (5 decimals)."""
+    lat_q = np.round((np.asarray(lats) + 90.0) * 1e5).astype(np.int64)
+    lon_q = np.round((np.asarray(lons) + 180.0) * 1e5).astype(np.int64)
+    return lat_q * 36000001 + lon_q
+
+
+def hourly_traffic(samples):
+    """
+    Average traffic sample columns per (site, UTC hour). Returns (sites, rows): sites holds
+    the site coordinates, rows one array per column with a site_index into them.
+    """
+    keys = site_keys(samples["lat"], samples["lon"])
+    if keys.size:
+        # A bucket re-sampled from the traffic cache is logged again; count it once.
+        e0 = int(samples["epoch"].min())
+        _, unique_rows = np.unique(np.unique(keys, return_inverse=True)[1].astype(np.int64)
+                                   * (int(samples["epoch"].max()) - e0 + 1) + (samples["epoch"] - e0),
+                                   return_index=True)
+        if unique_rows.size < keys.size:
+            samples = {column: np.asarray(values)[unique_rows] for column, values in samples.items()}
+            keys = keys[unique_rows]
+    _, site_first, site_index = np.unique(keys, return_index=True, return_inverse=True)
+    hours = samples["epoch"] // HOUR * HOUR
+    h0 = int(hours.min()) if hours.size else 0
+    group = site_index.astype(np.int64) * (((int(hours.max()) - h0) // HOUR + 1) if hours.size else 1) \
+        + (hours - h0) // HOUR
+    groups, first, inverse = np.unique(group, return_index=True, return_inverse=True)
+    n = groups.size
+    counts = np.bincount(inverse, minlength=n)
+
+    def mean(column):
+        values = np.asarray(samples[column], dtype=np.float64)
+        valid = np.isfinite(values)
+        sums = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=n)
+        numbers = np.bincount(inverse, weights=valid, minlength=n)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / numbers
+
+    delay = np.asarray(samples["delay_ratio"], dtype=np.float64)
+    delay_max = np.full(n, -np.inf)
+    np.maximum.at(delay_max, inverse, np.where(np.isfinite(delay), delay, -np.inf))
+    delay_mean = mean("delay_ratio")
+    congestion = np.select([delay_mean > HEAVY_DELAY, delay_mean > MODERATE_DELAY], [2, 1], 0)
+    rows = {
+        "site_index": site_index[first],
+        "epoch": hours[first],
+        "traffic_samples": counts,
+        "delay_ratio": delay_mean,
+        "delay_ratio_max": np.where(np.isfinite(delay_max), delay_max, np.nan),
+        "heavy_share": mean("heavy_share"),
+        "moderate_share": mean("moderate_share"),
+        "congestion": np.where(np.isfinite(delay_mean), congestion, -1),
+    }
+    sites = {"lat": np.asarray(samples["lat"])[site_first], "lon": np.asarray(samples["lon"])[site_first]}
+    return sites, rows
+
+
+# -----------------------
+# Distance: sites -> nearest sensors
+# -----------------------
+def nearest_candidates(site_lats, site_lons, sensor_lats, sensor_lons, max_distance_m=DEFAULT_MAX_DISTANCE_M,
+                       k=DEFAULT_K, chunk_pairs=4_000_000):
+    """
+    (sites, k) sensor indices (-1 where none) and distances (NaN) of the k nearest sensors
+    within max_distance_m of each site, nearest first. Haversine over chunks of sites.
+    """
+    n_sites, n_sensors = len(site_lats), len(sensor_lats)
+    index = np.full((n_sites, k), -1, dtype=np.int64)
+    distance = np.full((n_sites, k), np.nan)
+    if not n_sites or not n_sensors:
+        return index, distance
+    s_lat = np.radians(np.asarray(sensor_lats, dtype=np.float64))
+    s_lon = np.radians(np.asarray(sensor_lons, dtype=np.float64))
+    kk = min(k, n_sensors)
+    step = max(1, chunk_pairs // n_sensors)
+    for start in range(0, n_sites, step):
+        lat = np.radians(np.asarray(site_lats[start:start + step], dtype=np.float64))[:, None]
+        lon = np.radians(np.asarray(site_lons[start:start + step], dtype=np.float64))[:, None]
+        a = np.sin((s_lat - lat) / 2) ** 2 + np.cos(lat) * np.cos(s_lat) * np.sin((s_lon - lon) / 2) ** 2
+        d = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+        d[d > max_distance_m] = np.inf
+        nearest = np.argpartition(d, kk - 1, axis=1)[:, :kk] if kk < n_sensors else np.tile(np.arange(n_sensors),
+                                                                                            (d.shape[0], 1))
+        nd = np.take_along_axis(d, nearest, axis=1)
+        order = np.argsort(nd, axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        nd = np.take_along_axis(nd, order, axis=1)
+        found = np.isfinite(nd)
+        index[start:start + step, :kk] = np.where(found, nearest, -1)
+        distance[start:start + step, :kk] = np.where(found, nd, np.nan)
+    return index, distance
+
+
+# -----------------------
+# Join
+# -----------------------
+class PollutantReadings:
+    """Hourly readings of one pollutant: sensor coordinates plus a (sensors, hours) HourlyMatrix."""
+
+    def __init__(self, lats, lons, matrix):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.matrix = matrix
+
+    @classmethod
+    def from_arrays(cls, lats, lons, sensor_index, epochs, values, start_epoch=None, end_epoch=None):
+        matrix = HourlyMatrix.from_arrays(list(range(len(lats))), sensor_index, epochs, values,
+                                          start_epoch, end_epoch)
+        return cls(lats, lons, matrix)
+
+
+def join_features(sites, rows, readings, max_distance_m=DEFAULT_MAX_DISTANCE_M, k=DEFAULT_K):
+    """
+    Feature columns for hourly traffic rows (from hourly_traffic) and {pollutant:
+    PollutantReadings}. Pollutants without readings get NaN columns.
+    """
+    site_index = rows["site_index"]
+    epochs = rows["epoch"]
+    n = epochs.size
+    features = {
+        "epoch": epochs,
+        "site_lat": sites["lat"][site_index],
+        "site_lon": sites["lon"][site_index],
+        "hour_of_day": (epochs % 86400) // HOUR,
+        "weekday": (epochs // 86400 + 3) % 7,  # 1970-01-01 was a Thursday; Monday = 0
+    }
+    for column in ("traffic_samples", "delay_ratio", "delay_ratio_max", "heavy_share", "moderate_share",
+                   "congestion"):
+        features[column] = rows[column]
+    for pollutant, source in readings.items():
+        value = np.full(n, np.nan)
+        distance = np.full(n, np.nan)
+        if source is not None and source.lats.size and n:
+            candidates, candidate_distance = nearest_candidates(sites["lat"], sites["lon"], source.lats,
+                                                                source.lons, max_distance_m, k)
+            matrix = source.matrix
+            column = (epochs - matrix.start_epoch) // HOUR
+            in_grid = (column >= 0) & (column < matrix.n_hours)
+            cand = candidates[site_index]  # (rows, k)
+            usable = (cand >= 0) & in_grid[:, None]
+            values = np.full(cand.shape, np.nan)
+            values[usable] = matrix.values[cand[usable], np.broadcast_to(column[:, None], cand.shape)[usable]]
+            finite = np.isfinite(values)
+            pick = finite.argmax(axis=1)
+            has = finite.any(axis=1)
+            rows_idx = np.arange(n)
+            value = np.where(has, values[rows_idx, pick], np.nan)
+            distance = np.where(has, candidate_distance[site_index][rows_idx, pick], np.nan)
+        features[pollutant] = value
+        features[f"{pollutant}_distance_m"] = distance
+    return features
+
+
+# -----------------------
+# Readings from the backfill output
+# -----------------------
+def load_history_readings(history_dir, catalog, pollutants=POLLUTANTS, start_epoch=None, end_epoch=None):
+    """
+    {pollutant: PollutantReadings} from backfill_history.py output (<dir>/<sensor_id>/*.csv),
+    using the station catalog for each sensor's coordinates and parameter.
+    """
+    from backfill_history import load_sensor_history
+
+    order = np.argsort(catalog.sensor_id)
+    sorted_ids = catalog.sensor_id[order]
+    names = catalog.parameter_names()
+    found = {pollutant: {"lats": [], "lons": [], "index": [], "epochs": [], "values": []} for pollutant in pollutants}
+    for entry in sorted(os.listdir(history_dir)) if os.path.isdir(history_dir) else []:
+        if not entry.isdigit():
+            continue
+        sensor_id = int(entry)
+        pos = int(np.searchsorted(sorted_ids, sensor_id))
+        if pos >= sorted_ids.size or sorted_ids[pos] != sensor_id:
+            continue
+        row = int(order[pos])
+        pollutant = names[int(catalog.sensor_param[row])]
+        if pollutant not in found:
+            continue
+        station = int(catalog.sensor_station[row])
+        epochs, values = load_sensor_history(history_dir, sensor_id)
+        if start_epoch is not None:
+            keep = (epochs >= start_epoch) & (epochs < (end_epoch if end_epoch is not None else np.inf))
+            epochs, values = epochs[keep], values[keep]
+        parts = found[pollutant]
+        parts["index"].append(np.full(epochs.size, len(parts["lats"]), dtype=np.int64))
+        parts["lats"].append(float(catalog.lat[station]))
+        parts["lons"].append(float(catalog.lon[station]))
+        parts["epochs"].append(epochs)
+        parts["values"].append(values)
+    readings = {}
+    for pollutant, parts in found.items():
+        if not parts["lats"]:
+            readings[pollutant] = None
+            continue
+        readings[pollutant] = PollutantReadings.from_arrays(
+            parts["lats"], parts["lons"], np.concatenate(parts["index"]), np.concatenate(parts["epochs"]),
+            np.concatenate(parts["values"]), start_epoch, end_epoch)
+    return readings
+
+
+# -----------------------
+# Incremental Pipeline
+# -----------------------
+def open_traffic_table(root):
+    return ColumnarTable(root, schema=TRAFFIC_SCHEMA, time_column="epoch")
+
+
+def open_feature_table(root, pollutants=POLLUTANTS):
+    return ColumnarTable(root, schema=feature_schema(pollutants), time_column="epoch")
+
+
+def update_features(traffic, features, load_readings, pollutants=POLLUTANTS, now=None, settle_s=SETTLE_S,
+                    max_distance_m=DEFAULT_MAX_DISTANCE_M, k=DEFAULT_K):
+    """
+    Join the traffic hours not yet in `features` (older than settle_s) and append them.
+    `load_readings(start_epoch, end_epoch)` returns {pollutant: PollutantReadings} for that
+    range. Returns the number of rows appended.
+    """
+    now = time.time() if now is None else now
+    until = int(now - settle_s) // HOUR * HOUR
+    since = features.meta.get("joined_until")
+    if since is not None and since >= until:
+        return 0
+    samples = traffic.read(start=since, end=until)
+    if not samples["epoch"].size:
+        features.save_meta(joined_until=until)
+        return 0
+    sites, rows = hourly_traffic(samples)
+    start = int(rows["epoch"].min())
+    readings = load_readings(start, until)
+    joined = join_features(sites, rows, {p: readings.get(p) for p in pollutants}, max_distance_m, k)
+    features.append(joined, meta={"joined_until": until})
+    return int(rows["epoch"].size)
+
+
+# -----------------------
+# Benchmark
+# -----------------------
+def synthetic_inputs(n_sites, n_hours, samples_per_hour, n_sensors, start_epoch, seed=0):
+    """Traffic samples around random sites and sensors with NO2/PM readings (with gaps)."""
+    rng = np.random.default_rng(seed)
+    site_lat = 46.0 + rng.random(n_sites) * 2.0
+    site_lon = 23.0 + rng.random(n_sites) * 3.0
+    n = n_sites * n_hours * samples_per_hour
+    site = np.repeat(np.arange(n_sites), n_hours * samples_per_hour)
+    epoch = start_epoch + np.tile(np.arange(n_hours * samples_per_hour) * (HOUR // samples_per_hour), n_sites)
+    hour_of_day = (epoch % 86400) // HOUR
+    rush = np.isin(hour_of_day, (6, 7, 8, 15, 16, 17))
+    delay = np.clip(rng.gamma(2.0, 0.08, n) + 0.3 * rush, 0, None)
+    samples = {
+        "epoch": epoch, "lat": site_lat[site], "lon": site_lon[site], "delay_ratio": delay,
+        "heavy_share": np.clip(delay - 0.3, 0, 1), "moderate_share": np.clip(delay, 0, 1),
+        "congestion": np.select([delay > HEAVY_DELAY, delay > MODERATE_DELAY], [2, 1], 0),
+        "spokes_measured": np.full(n, 8),
+    }
+    sensors = {}
+    for pollutant, base in (("no2", 25.0), ("pm25", 15.0), ("pm10", 30.0)):
+        lats = 46.0 + rng.random(n_sensors) * 2.0
+        lons = 23.0 + rng.random(n_sensors) * 3.0
+        sensor_index = np.repeat(np.arange(n_sensors), n_hours)
+        epochs = start_epoch + np.tile(np.arange(n_hours) * HOUR, n_sensors)
+        values = base * (1 + 0.5 * np.isin((epochs % 86400) // HOUR, (7, 8, 17, 18))) + rng.normal(0, 3, epochs.size)
+        values[rng.random(values.size) < 0.1] = np.nan  # missing hours
+        sensors[pollutant] = (lats, lons, sensor_index, epochs, values)
+    return samples, sensors
+
+
+def naive_join(samples, sensors, max_distance_m, limit):
+    """Per-row reference implementation (first `limit` traffic samples) for comparison."""
+    out = []
+    for i in range(min(limit, samples["epoch"].size)):
+        hour = samples["epoch"][i] // HOUR * HOUR
+        row = {}
+        for pollutant, (lats, lons, sensor_index, epochs, values) in sensors.items():
+            best = None
+            for s in range(lats.size):
+                phi1, phi2 = math.radians(samples["lat"][i]), math.radians(lats[s])
+                a = (math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2)
+                     * math.sin(math.radians(lons[s] - samples["lon"][i]) / 2) ** 2)
+                d = 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+                if d > max_distance_m or (best is not None and d >= best[0]):
+                    continue
+                hit = np.flatnonzero((sensor_index == s) & (epochs == hour))
+                if hit.size and np.isfinite(values[hit[0]]):
+                    best = (d, values[hit[0]])
+            row[pollutant] = None if best is None else best[1]
+        out.append(row)
+    return out
+
+
+def bench(args):
+    import tempfile
+
+    start_epoch = 1735689600  # 2025-01-01T00:00Z
+    t0 = time.perf_counter()
+    samples, sensors = synthetic_inputs(args.sites, args.hours, args.samples_per_hour, args.sensors, start_epoch)
+    print(f"Synthetic: {samples['epoch'].size:,} traffic samples at {args.sites} sites, {args.sensors} sensors per "
+          f"pollutant, {args.hours} hours ({time.perf_counter() - t0:.1f}s)")
+
+    def load_readings(start, end):
+        return {p: PollutantReadings.from_arrays(lats, lons, index, epochs, values, start, end)
+                for p, (lats, lons, index, epochs, values) in sensors.items()}
+
+    with tempfile.TemporaryDirectory() as root:
+        traffic = open_traffic_table(os.path.join(root, "traffic"))
+        features = open_feature_table(os.path.join(root, "features"))
+        half = start_epoch + (args.hours // 2) * HOUR
+        first = samples["epoch"] < half
+        traffic.append({c: v[first] for c, v in samples.items()})
+        t0 = time.perf_counter()
+        rows = update_features(traffic, features, load_readings, now=half, settle_s=0,
+                               max_distance_m=args.max_distance, k=args.k)
+        t1 = time.perf_counter()
+        traffic.append({c: v[~first] for c, v in samples.items()})
+        end = start_epoch + args.hours * HOUR
+        rows2 = update_features(traffic, features, load_readings, now=end, settle_s=0,
+                                max_distance_m=args.max_distance, k=args.k)
+        t2 = time.perf_counter()
+        again = update_features(traffic, features, load_readings, now=end, settle_s=0)
+        table = features.read(["no2", "pm25", "delay_ratio"])
+        total = len(features)
+        print(f"First update: {rows:,} rows in {t1 - t0:.2f}s; incremental update: {rows2:,} rows in {t2 - t1:.2f}s; "
+              f"re-run: {again} rows")
+        print(f"{total:,} rows ({(rows + rows2) / (t2 - t0) / 1e6:.2f} M rows/s), "
+              f"{np.isfinite(table['no2']).mean():.0%} with NO2, {np.isfinite(table['pm25']).mean():.0%} with PM2.5")
+        valid = np.isfinite(table["no2"]) & np.isfinite(table["delay_ratio"])
+        if valid.sum() > 2:
+            print(f"corr(delay_ratio, no2) = {np.corrcoef(table['delay_ratio'][valid], table['no2'][valid])[0, 1]:.2f}")
+
+    limit = 20
+    t0 = time.perf_counter()
+    naive_join(samples, sensors, args.max_distance, limit)
+    per_row = (time.perf_counter() - t0) / limit
+    print(f"Per-row loop: {per_row * 1000:.1f} ms per sample -> {per_row * samples['epoch'].size / 3600:.1f} h "
+          f"for the same input")
+
+
+# -----------------------
+# Main Workflow
+# -----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Join traffic samples with nearby air-quality readings.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    update = sub.add_parser("update", help="Append newly settled hours to the feature table.")
+    update.add_argument("--traffic", required=True, help="Traffic sample table (traffic_sampling.py --log).")
+    update.add_argument("--history", required=True, help="Output directory of backfill_history.py.")
+    update.add_argument("--catalog", required=True, help="Station catalog snapshot (station_catalog.bin).")
+    update.add_argument("--out", default="traffic_aq_features")
+    update.add_argument("--max-distance", type=float, default=DEFAULT_MAX_DISTANCE_M)
+    update.add_argument("--k", type=int, default=DEFAULT_K)
+    update.add_argument("--settle-hours", type=float, default=SETTLE_S / HOUR)
+
+    bench_parser = sub.add_parser("bench", help="Time the join on synthetic data.")
+    bench_parser.add_argument("--sites", type=int, default=2000)
+    bench_parser.add_argument("--hours", type=int, default=720)
+    bench_parser.add_argument("--samples-per-hour", type=int, default=2)
+    bench_parser.add_argument("--sensors", type=int, default=300)
+    bench_parser.add_argument("--max-distance", type=float, default=10000)
+    bench_parser.add_argument("--k", type=int, default=DEFAULT_K)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args)
+        return
+
+    from station_catalog import StationCatalog
+    catalog = StationCatalog.open(args.catalog)
+    traffic = open_traffic_table(args.traffic)
+    features = open_feature_table(args.out)
+    t0 = time.perf_counter()
+    rows = update_features(traffic, features,
+                           lambda start, end: load_history_readings(args.history, catalog, POLLUTANTS, start, end),
+                           settle_s=args.settle_hours * HOUR, max_distance_m=args.max_distance, k=args.k)
+    print(f"📊 Appended {rows:,} rows in {time.perf_counter() - t0:.2f}s; '{args.out}' now has {len(features):,} rows "
+          f"(joined until {features.meta.get('joined_until')}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+WAQI daily forecasts for many stations, kept in a columnar table.
+
+Every WAQI feed (/feed/@{uid}/) carries a few days of daily forecasts for pm10, pm25, o3
+and uvi under "forecast.daily", and a new set is issued about once a day. geolocation.py
+only plotted the PM10 series of one feed; this stores every pollutant of every station,
+one row per (station, forecast day, issue date):
+
+    station  issued  day  lat  lon  pm10_avg  pm10_min  pm10_max  pm25_avg  ...  uvi_max
+
+`issued` and `day` are dates as days since 1970-01-01 (int32); the issue date is the local
+date of the feed's last update ("time.s"). Values are float32 and NaN where a pollutant has
+no forecast for that day. Like the rest of WAQI they are US EPA sub-indices (uvi: the UV
+index), not concentrations.
+
+Ingest is incremental: the table's meta keeps the latest issue date of every station, so
+stations that already hold today's issue are not fetched again, and a feed whose issue
+date is not newer than the stored one writes nothing. Feeds are fetched concurrently under
+the shared WAQI rate limiter and appended in chunks (one table part per chunk).
+
+Queries go through LatestForecasts: the newest issue of every station as one dense
+(stations, days, values) array. Coordinates are matched to stations with the chunked
+haversine search of the traffic feature join (nearest_candidates); per pollutant, the
+nearest of the k candidates with a forecast for that day is used.
+
+    python waqi_forecasts.py ingest --catalog station_catalog.bin --out waqi_forecasts
+    python waqi_forecasts.py ingest --waqi aqi_cn/map_data.json --uid 7659
+    python waqi_forecasts.py at 46.7445 23.4958 --store waqi_forecasts
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+from api_endpoints import WAQI_BASE_URL
+from columnar_table import ColumnarTable
+from fast_json import WAQI_FEED_RESPONSE, compressed_headers, decode_response
+from rate_limiter import DEFAULT_WAQI_RATE, RateLimiter, rate_limited_get
+from traffic_aq_features import nearest_candidates
+
+load_dotenv()
+
+FORECAST_STORE = os.getenv("waqi_forecast_store",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), "waqi_forecasts"))
+
+FORECAST_POLLUTANTS = ("pm10", "pm25", "o3", "uvi")
+STATS = ("avg", "min", "max")
+VALUE_COLUMNS = [f"{pollutant}_{stat}" for pollutant in FORECAST_POLLUTANTS for stat in STATS]
+FORECAST_SCHEMA = {"station": "int64", "issued": "int32", "day": "int32", "lat": "float64", "lon": "float64",
+                   **{column: "float32" for column in VALUE_COLUMNS}}
+DEFAULT_MAX_DISTANCE_M = 50000  # WAQI forecasts are per city, not per street
+DEFAULT_K = 3
+CHUNK_STATIONS = 500
+
+
+# -----------------------
+# Helper Functions
+# -----------------------
+def day_number(text):
+    """Days since 1970-01-01 of a "YYYY-MM-DD..." string."""
+    return int(np.datetime64(text[:10], "D").astype(np.int64))
+
+
+def day_text(number):
+    return str(np.datetime64(int(number), "D"))
+
+
+def utc_today():
+    return day_number(datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+
+
+def forecast_rows(feed):
+    """
+    Rows ({column: list}) for the daily forecast of one feed "data" object, or None when the
+    feed has no forecast, no coordinates or no update time.
+    """
+    daily = (feed.get("forecast") or {}).get("daily") or {}
+    geo = (feed.get("city") or {}).get("geo") or []
+    updated = (feed.get("time") or {}).get("s") or (feed.get("time") or {}).get("iso")
+    if not daily or len(geo) < 2 or not updated or feed.get("idx") is None:
+        return None
+    by_day = {}
+    for pollutant in FORECAST_POLLUTANTS:
+        for entry in daily.get(pollutant) or []:
+            if not entry.get("day"):
+                continue
+            values = by_day.setdefault(entry["day"], {})
+            for stat in STATS:
+                if isinstance(entry.get(stat), (int, float)):
+                    values[f"{pollutant}_{stat}"] = entry[stat]
+    if not by_day:
+        return None
+    days = sorted(by_day)
+    rows = {"station": [int(feed["idx"])] * len(days), "issued": [day_number(updated)] * len(days),
+            "day": [day_number(day) for day in days], "lat": [geo[0]] * len(days), "lon": [geo[1]] * len(days)}
+    for column in VALUE_COLUMNS:
+        rows[column] = [by_day[day].get(column, np.nan) for day in days]
+    return rows
+
+
+# -----------------------
+# Incremental Ingest
+# -----------------------
+def open_forecast_table(root=FORECAST_STORE):
+    return ColumnarTable(root, schema=FORECAST_SCHEMA, time_column="issued")
+
+
+def latest_issues(table):
+    """{station uid: latest stored issue date (day number)}."""
+    return {int(uid): issued for uid, issued in table.meta.get("issued", {}).items()}
+
+
+def store_feeds(table, feeds):
+    """
+    Append the forecasts of already-fetched feed "data" objects whose issue date is newer
+    than the one stored for their station. Returns (stations with a new issue, rows written).
+    """
+    latest = latest_issues(table)
+    parts, issued = [], {}
+    for feed in feeds:
+        rows = forecast_rows(feed) if isinstance(feed, dict) else None
+        if rows is None:
+            continue
+        uid, issue = rows["station"][0], rows["issued"][0]
+        if issue <= max(latest.get(uid, -1), issued.get(uid, -1)):
+            continue
+        parts.append(rows)
+        issued[uid] = issue
+    if not parts:
+        return 0, 0
+    columns = {column: np.concatenate([np.asarray(rows[column], dtype=dtype) for rows in parts])
+               for column, dtype in FORECAST_SCHEMA.items()}
+    latest.update(issued)
+    table.append(columns, meta={"issued": {str(uid): issue for uid, issue in latest.items()}})
+    return len(issued), int(columns["station"].size)
+
+
+def fetch_feed(uid, token, limiter=None):
+    """The "data" object of /feed/@{uid}/, or None."""
+    url = f"{WAQI_BASE_URL}/feed/@{uid}/"
+    try:
+        response = rate_limited_get(url, limiter, headers=compressed_headers(), params={"token": token})
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Feed @{uid}: {e}")
+        return None
+    if response.status_code != 200:
+        print(f"❌ Feed @{uid}: HTTP {response.status_code}")
+        return None
+    payload = decode_response(response, WAQI_FEED_RESPONSE, label=f"Feed @{uid}")
+    if payload.get("status") != "ok" or not isinstance(payload.get("data"), dict):
+        print(f"❌ Feed @{uid}: {payload.get('data', 'Unknown error')}")
+        return None
+    return payload["data"]
+
+
+def ingest(table, uids, token, limiter=None, workers=8, chunk=CHUNK_STATIONS, today=None):
+    """
+    Fetch the feeds of `uids` that do not hold today's issue yet and store their new
+    forecasts, `chunk` stations per table part. Returns a summary dict.
+    """
+    today = utc_today() if today is None else today
+    latest = latest_issues(table)
+    uids = list(dict.fromkeys(int(uid) for uid in uids))
+    todo = [uid for uid in uids if latest.get(uid, -1) < today]
+    summary = {"stations": len(uids), "up_to_date": len(uids) - len(todo), "fetched": 0, "failed": 0,
+               "new_issues": 0, "rows": 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(todo), chunk):
+            feeds = list(pool.map(lambda uid: fetch_feed(uid, token, limiter), todo[start:start + chunk]))
+            summary["fetched"] += sum(feed is not None for feed in feeds)
+            summary["failed"] += sum(feed is None for feed in feeds)
+            stations, rows = store_feeds(table, feeds)
+            summary["new_issues"] += stations
+            summary["rows"] += rows
+    return summary
+
+
+# -----------------------
+# Queries
+# -----------------------
+class LatestForecasts:
+    """The newest issue of every station in a forecast table, as dense arrays."""
+
+    def __init__(self, stations, lats, lons, issued, first_day, values):
+        self.stations = stations  # (n,) uids
+        self.lats = lats
+        self.lons = lons
+        self.issued = issued
+        self.first_day = first_day
+        self.values = values  # (n, days, len(VALUE_COLUMNS)) float32
+
+    @classmethod
+    def from_table(cls, table):
+        latest = latest_issues(table)
+        if not latest:
+            return cls(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0), np.empty(0, dtype=np.int32), 0,
+                       np.empty((0, 0, len(VALUE_COLUMNS)), dtype=np.float32))
+        stations = np.array(sorted(latest), dtype=np.int64)
+        issued = np.array([latest[uid] for uid in stations.tolist()], dtype=np.int32)
+        columns = table.read(start=int(issued.min()))
+        position = np.searchsorted(stations, columns["station"]).clip(0, stations.size - 1)
+        keep = (stations[position] == columns["station"]) & (columns["issued"] == issued[position])
+        position = position[keep]
+        days = columns["day"][keep]
+        first_day = int(days.min()) if days.size else 0
+        n_days = int(days.max()) - first_day + 1 if days.size else 0
+        values = np.full((stations.size, n_days, len(VALUE_COLUMNS)), np.nan, dtype=np.float32)
+        values[position, days - first_day] = np.stack([columns[c][keep] for c in VALUE_COLUMNS], axis=1)
+        lats = np.full(stations.size, np.nan)
+        lons = np.full(stations.size, np.nan)
+        lats[position] = columns["lat"][keep]
+        lons[position] = columns["lon"][keep]
+        return cls(stations, lats, lons, issued, first_day, values)
+
+    def __len__(self):
+        return int(self.stations.size)
+
+    def days(self):
+        return [day_text(self.first_day + i) for i in range(self.values.shape[1])]
+
+    def query(self, lats, lons, day, max_distance_m=DEFAULT_MAX_DISTANCE_M, k=DEFAULT_K):
+        """
+        Forecast for `day` ("YYYY-MM-DD") at many coordinates: {column: array} with the
+        VALUE_COLUMNS plus "<pollutant>_station" (uid, -1 where none) and
+        "<pollutant>_distance_m" for each pollutant.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        n = lats.size
+        candidates, distance = nearest_candidates(lats, lons, self.lats, self.lons, max_distance_m, k)
+        column = day_number(day) - self.first_day
+        gathered = np.full(candidates.shape + (len(VALUE_COLUMNS),), np.nan, dtype=np.float32)
+        if 0 <= column < self.values.shape[1]:
+            found = candidates >= 0
+            gathered[found] = self.values[candidates[found], column]
+        rows = np.arange(n)
+        result = {}
+        for p, pollutant in enumerate(FORECAST_POLLUTANTS):
+            block = gathered[:, :, p * len(STATS):(p + 1) * len(STATS)]  # (n, k, stats)
+            finite = np.isfinite(block[:, :, 0])
+            pick = finite.argmax(axis=1)
+            has = finite.any(axis=1)
+            for s, stat in enumerate(STATS):
+                result[f"{pollutant}_{stat}"] = np.where(has, block[rows, pick, s], np.nan)
+            station = np.where(has, candidates[rows, pick], -1)
+            result[f"{pollutant}_station"] = np.where(station >= 0, self.stations[station], -1)
+            result[f"{pollutant}_distance_m"] = np.where(has, distance[rows, pick], np.nan)
+        return result
+
+    def forecast_at(self, lat, lon, max_distance_m=DEFAULT_MAX_DISTANCE_M, k=DEFAULT_K):
+        """
+        Every forecast day at one coordinate: [{"day", pollutant: {"avg", "min", "max",
+        "station", "distance_m"}}], skipping days without any pollutant.
+        """
+        out = []
+        for day in self.days():
+            columns = self.query([lat], [lon], day, max_distance_m, k)
+            entry = {"day": day}
+            for pollutant in FORECAST_POLLUTANTS:
+                if columns[f"{pollutant}_station"][0] >= 0:
+                    entry[pollutant] = {stat: float(columns[f"{pollutant}_{stat}"][0]) for stat in STATS}
+                    entry[pollutant]["station"] = int(columns[f"{pollutant}_station"][0])
+                    entry[pollutant]["distance_m"] = round(float(columns[f"{pollutant}_distance_m"][0]), 1)
+            if len(entry) > 1:
+                out.append(entry)
+        return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store WAQI daily forecasts and query them by coordinate.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = sub.add_parser("ingest", help="Fetch and store new forecast issues.")
+    ingest_parser.add_argument("--out", default=FORECAST_STORE)
+    ingest_parser.add_argument("--catalog", help="Station catalog snapshot; every WAQI station in it is ingested.")
+    ingest_parser.add_argument("--waqi", action="append", default=[], help="Saved map/bounds JSON (repeatable).")
+    ingest_parser.add_argument("--uid", type=int, action="append", default=[], help="Station uid (repeatable).")
+    ingest_parser.add_argument("--rate", type=float, default=DEFAULT_WAQI_RATE, help="Requests per second.")
+    ingest_parser.add_argument("--workers", type=int, default=8)
+
+    at = sub.add_parser("at", help="Forecast at a coordinate.")
+    at.add_argument("lat", type=float)
+    at.add_argument("lon", type=float)
+    at.add_argument("--store", default=FORECAST_STORE)
+    at.add_argument("--max-distance", type=float, default=DEFAULT_MAX_DISTANCE_M)
+    at.add_argument("--k", type=int, default=DEFAULT_K)
+    args = parser.parse_args()
+
+    if args.command == "at":
+        t0 = time.perf_counter()
+        forecasts = LatestForecasts.from_table(ColumnarTable(args.store))
+        t1 = time.perf_counter()
+        days = forecasts.forecast_at(args.lat, args.lon, args.max_distance, args.k)
+        t2 = time.perf_counter()
+        print(f"📍 Forecast at ({args.lat}, {args.lon}) from {len(forecasts):,} stations "
+              f"(loaded in {(t1 - t0) * 1000:.0f} ms, queried in {(t2 - t1) * 1000:.1f} ms):")
+        if not days:
+            print("No forecast within range.")
+        for entry in days:
+            parts = [f"{p} {entry[p]['avg']:.0f} ({entry[p]['min']:.0f}-{entry[p]['max']:.0f}, @{entry[p]['station']})"
+                     for p in FORECAST_POLLUTANTS if p in entry]
+            print(f"  {entry['day']}: " + ", ".join(parts))
+        return
+
+    token = os.getenv("aqi_cn_token")
+    if not token:
+        raise ValueError("API token not found. Ensure 'aqi_cn_token' is set in the .env file.")
+    uids = list(args.uid)
+    if args.catalog:
+        from station_catalog import PROVIDER_CODES, StationCatalog
+        catalog = StationCatalog.open(args.catalog)
+        uids += catalog.station_id[catalog.provider == PROVIDER_CODES["waqi"]].tolist()
+    if args.waqi:
+        from station_catalog import load_waqi_points
+        uids += [point["uid"] for point in load_waqi_points(args.waqi) if point.get("uid") is not None]
+    if not uids:
+        parser.error("No stations: pass --catalog, --waqi or --uid.")
+
+    table = open_forecast_table(args.out)
+    t0 = time.perf_counter()
+    summary = ingest(table, uids, token, RateLimiter(args.rate), args.workers)
+    print(f"📊 {summary['stations']:,} stations: {summary['up_to_date']:,} already up to date, "
+          f"{summary['fetched']:,} feeds fetched ({summary['failed']:,} failed), "
+          f"{summary['new_issues']:,} new issues, {summary['rows']:,} rows in {time.perf_counter() - t0:.1f}s; "
+          f"'{args.out}' now has {len(table):,} rows.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Complete WAQI station snapshot of a country or continent from tiled map/bounds requests.
+
+A single map/bounds box only returns part of its stations once it holds more than the
+API's result cap, so a region is swept in tiles:
+
+  * the region polygon (a built-in outline from REGIONS or a GeoJSON file) is covered by a
+    grid of `tile_deg` tiles, keeping only the tiles that touch the polygon;
+  * tiles are fetched concurrently under the shared WAQI rate limiter;
+  * a tile whose reply reaches the cap is split into four and its quarters are fetched
+    instead (down to `min_tile_deg`), so dense areas get small tiles and empty ones stay big;
+  * if several tiles stop at the same size below the cap, one is probed and, if it was
+    truncated, the API's real cap is used from then on;
+  * stations are deduplicated by uid and kept when they lie inside the polygon.
+
+The snapshot is written in the saved map/bounds format ({"status": "ok", "data": [...]}),
+so station_catalog.py build --waqi and waqi_forecasts.py ingest --waqi read it as is; a
+"sweep" entry records the region, request count and whether every tile succeeded.
+
+    python waqi_sweep.py romania                        # -> waqi_stations_romania.json
+    python waqi_sweep.py europe --tile-deg 5 --workers 8 --rate 5
+    python waqi_sweep.py borders.geojson --out stations.json
+
+geolocation.py --sweep REGION runs the same sweep.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from dotenv import load_dotenv
+
+from api_endpoints import WAQI_BASE_URL
+from fast_json import WAQI_MAP_RESPONSE, compressed_headers, decode_response
+from rate_limiter import DEFAULT_WAQI_RATE, RateLimiter, rate_limited_get
+
+load_dotenv()
+
+DEFAULT_TILE_DEG = 2.0
+MIN_TILE_DEG = 0.05
+DEFAULT_RESULT_CAP = 400  # a reply with this many stations is assumed to be truncated
+
+# Coarse outlines as (lon, lat) rings - good enough to choose tiles; pass a GeoJSON file
+# for exact borders.
+REGIONS = {
+    "romania": [[[(20.26, 46.12), (21.17, 46.30), (21.60, 46.87), (22.10, 47.64), (22.71, 47.88),
+                  (23.14, 48.10), (24.40, 47.98), (24.87, 47.74), (25.21, 47.89), (26.20, 48.22),
+                  (26.62, 48.22), (27.23, 47.83), (27.55, 47.41), (28.13, 46.81), (28.16, 46.37),
+                  (28.05, 45.94), (28.23, 45.49), (29.60, 45.38), (29.73, 45.04), (29.14, 44.82),
+                  (28.84, 44.91), (28.56, 43.71), (27.97, 43.81), (27.24, 44.18), (26.07, 43.94),
+                  (25.57, 43.69), (24.10, 43.74), (23.33, 43.90), (22.94, 43.82), (22.66, 44.23),
+                  (22.47, 44.41), (22.71, 44.58), (22.46, 44.70), (22.15, 44.48), (21.56, 44.77),
+                  (21.48, 45.18), (20.87, 45.42), (20.76, 45.73)]]],
+    "europe": [[[(-25.0, 62.0), (-11.0, 55.0), (-11.0, 35.8), (-5.6, 35.9), (0.0, 37.6), (9.5, 38.0),
+                 (11.5, 36.4), (15.5, 36.3), (20.0, 36.0), (22.0, 34.7), (27.0, 34.7), (28.3, 36.0),
+                 (27.0, 37.0), (26.2, 40.0), (29.3, 40.9), (29.3, 41.3), (40.0, 43.5), (47.0, 42.0),
+                 (47.5, 45.0), (51.8, 46.9), (55.0, 51.5), (59.5, 51.5), (60.0, 55.0), (59.0, 60.0),
+                 (66.0, 68.0), (69.0, 70.0), (69.0, 81.0), (10.0, 81.0), (-25.0, 71.5)]]],
+}
+
+
+# -----------------------
+# Region Geometry
+# -----------------------
+def load_region(name_or_path):
+    """[[ring, ...], ...] polygons (rings of (lon, lat)) for a REGIONS name or a GeoJSON file."""
+    if name_or_path.lower() in REGIONS:
+        return REGIONS[name_or_path.lower()]
+    with open(name_or_path, encoding="utf-8") as f:
+        geojson = json.load(f)
+    if geojson.get("type") == "FeatureCollection":
+        geometries = [feature["geometry"] for feature in geojson["features"]]
+    elif geojson.get("type") == "Feature":
+        geometries = [geojson["geometry"]]
+    else:
+        geometries = [geojson]
+    polygons = []
+    for geometry in geometries:
+        if geometry["type"] == "Polygon":
+            polygons.append(geometry["coordinates"])
+        elif geometry["type"] == "MultiPolygon":
+            polygons.extend(geometry["coordinates"])
+    if not polygons:
+        raise ValueError(f"No Polygon or MultiPolygon in {name_or_path}")
+    return polygons
+
+
+def region_rings(polygons):
+    """Each polygon's rings as (n, 2) arrays of (lon, lat)."""
+    return [[np.asarray(ring, dtype=np.float64)[:, :2] for ring in polygon] for polygon in polygons]
+
+
+def region_bounds(rings):
+    points = np.concatenate([ring for polygon in rings for ring in polygon])
+    return (float(points[:, 0].min()), float(points[:, 1].min()),
+            float(points[:, 0].max()), float(points[:, 1].max()))
+
+
+def contains(rings, lons, lats, chunk_pairs=2_000_000):
+    """
+    Boolean array: which points lie inside the region. Even-odd ray casting (so holes work),
+    vectorized over (points, edges) in chunks of points.
+    """
+    lons = np.asarray(lons, dtype=np.float64).ravel()
+    lats = np.asarray(lats, dtype=np.float64).ravel()
+    inside_any = np.zeros(lons.shape, dtype=bool)
+    for polygon in rings:
+        inside = np.zeros(lons.shape, dtype=bool)
+        for ring in polygon:
+            x1, y1 = ring[:, 0], ring[:, 1]
+            x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+            sloped = y1 != y2
+            x1, y1, x2, y2 = x1[sloped], y1[sloped], x2[sloped], y2[sloped]
+            step = max(1, chunk_pairs // max(1, x1.size))
+            for start in range(0, lons.size, step):
+                lat = lats[start:start + step, None]
+                lon = lons[start:start + step, None]
+                crosses = (y1 > lat) != (y2 > lat)
+                x_at = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+                inside[start:start + step] ^= (np.count_nonzero(crosses & (lon < x_at), axis=1) % 2).astype(bool)
+        inside_any |= inside
+    return inside_any
+
+
+def _segments_cross(p1, p2, q1, q2):
+    """Whether segments p1-p2 (arrays of points) cross segment q1-q2 (one segment)."""
+    def orient(a, b, c):
+        return np.sign((b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1])
+                       - (b[..., 1] - a[..., 1]) * (c[..., 0] - a[..., 0]))
+    q1 = np.asarray(q1, dtype=np.float64)
+    q2 = np.asarray(q2, dtype=np.float64)
+    return ((orient(p1, p2, q1) != orient(p1, p2, q2)) & (orient(q1, q2, p1) != orient(q1, q2, p2))).any()
+
+
+def tile_touches(rings, tile):
+    """Whether a (min_lon, min_lat, max_lon, max_lat) tile overlaps the region."""
+    min_lon, min_lat, max_lon, max_lat = tile
+    corners = [(min_lon, min_lat), (max_lon, min_lat), (max_lon, max_lat), (min_lon, max_lat)]
+    probe = corners + [((min_lon + max_lon) / 2, (min_lat + max_lat) / 2)]
+    if contains(rings, [p[0] for p in probe], [p[1] for p in probe]).any():
+        return True
+    for polygon in rings:
+        for ring in polygon:
+            if ((ring[:, 0] >= min_lon) & (ring[:, 0] <= max_lon)
+                    & (ring[:, 1] >= min_lat) & (ring[:, 1] <= max_lat)).any():
+                return True
+            following = np.roll(ring, -1, axis=0)
+            for k in range(4):
+                if _segments_cross(ring, following, corners[k], corners[(k + 1) % 4]):
+                    return True
+    return False
+
+
+def cover_tiles(rings, tile_deg=DEFAULT_TILE_DEG):
+    """Grid tiles of tile_deg x tile_deg degrees covering the region (only those touching it)."""
+    min_lon, min_lat, max_lon, max_lat = region_bounds(rings)
+    tiles = []
+    lat = min_lat
+    while lat < max_lat:
+        lon = min_lon
+        while lon < max_lon:
+            tile = (lon, lat, min(lon + tile_deg, max_lon), min(lat + tile_deg, max_lat))
+            if tile_touches(rings, tile):
+                tiles.append(tile)
+            lon += tile_deg
+        lat += tile_deg
+    return tiles
+
+
+def split_tile(tile):
+    min_lon, min_lat, max_lon, max_lat = tile
+    mid_lon, mid_lat = (min_lon + max_lon) / 2, (min_lat + max_lat) / 2
+    return [(min_lon, min_lat, mid_lon, mid_lat), (mid_lon, min_lat, max_lon, mid_lat),
+            (min_lon, mid_lat, mid_lon, max_lat), (mid_lon, mid_lat, max_lon, max_lat)]
+
+
+# -----------------------
+# Sweep
+# -----------------------
+def fetch_tile(tile, token, limiter=None):
+    """The stations of one tile's map/bounds reply (raises on an error reply)."""
+    min_lon, min_lat, max_lon, max_lat = tile
+    params = {"token": token, "latlng": f"{min_lat},{min_lon},{max_lat},{max_lon}", "networks": "all"}
+    response = rate_limited_get(f"{WAQI_BASE_URL}/map/bounds", limiter, headers=compressed_headers(), params=params)
+    if response.status_code != 200:
+        raise Exception(f"HTTP {response.status_code}")
+    payload = decode_response(response, WAQI_MAP_RESPONSE, label=f"Tile {tile}")
+    if payload.get("status") != "ok" or not isinstance(payload.get("data"), list):
+        raise Exception(str(payload.get("data", "Unknown error")))
+    return payload["data"]
+
+
+def sweep(rings, token, limiter=None, workers=8, tile_deg=DEFAULT_TILE_DEG, cap=DEFAULT_RESULT_CAP,
+          min_tile_deg=MIN_TILE_DEG):
+    """
+    Fetch every station of the region. Returns (stations, summary): stations deduplicated
+    by uid and inside the region, summary with request, split and failure counts.
+
+    If several tiles stop at the same largest size below `cap`, the API's cap may be lower
+    than `cap`. One of those tiles is then probed by fetching its quarters: if they hold
+    more distinct stations than the tile did, its reply was truncated, so that size becomes
+    the cap and every tile that reached it is split. Otherwise the tie was a coincidence.
+    """
+    started = time.perf_counter()
+    limiter = limiter or RateLimiter(DEFAULT_WAQI_RATE)
+    leaves = {}  # tile -> stations, for the tiles that were not split
+    summary = {"tiles": 0, "requests": 0, "split": 0, "capped": 0, "failed": 0, "detected_cap": None,
+               "warnings": []}
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(tile):
+            in_flight[pool.submit(fetch_tile, tile, token, limiter)] = tile
+
+        def handle(tile, points):
+            if cap and len(points) >= cap:
+                if tile[2] - tile[0] > min_tile_deg or tile[3] - tile[1] > min_tile_deg:
+                    summary["split"] += 1
+                    for quarter in split_tile(tile):
+                        if tile_touches(rings, quarter):
+                            submit(quarter)
+                    return
+                summary["capped"] += 1  # as small as we go; keep what it returned
+            leaves[tile] = points
+
+        def fetch_quarters(tile):
+            """{quarter: stations} for the tile's quarters that touch the region; None if a fetch failed."""
+            futures = {pool.submit(fetch_tile, quarter, token, limiter): quarter
+                       for quarter in split_tile(tile) if tile_touches(rings, quarter)}
+            replies = {}
+            for future in futures:
+                summary["requests"] += 1
+                try:
+                    replies[futures[future]] = future.result()
+                except Exception as e:
+                    print(f"❌ Cap probe of tile {tuple(round(v, 3) for v in futures[future])}: {e}")
+            return replies if len(replies) == len(futures) else None
+
+        for tile in cover_tiles(rings, tile_deg):
+            summary["tiles"] += 1
+            submit(tile)
+
+        probed = False
+        while True:
+            while in_flight:
+                finished, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    tile = in_flight.pop(future)
+                    summary["requests"] += 1
+                    try:
+                        points = future.result()
+                    except Exception as e:
+                        print(f"❌ Tile {tuple(round(v, 3) for v in tile)}: {e}")
+                        summary["failed"] += 1
+                        continue
+                    handle(tile, points)
+
+            largest = max((len(points) for points in leaves.values()), default=0)
+            tied = [tile for tile, points in leaves.items() if len(points) == largest]
+            if probed or not cap or largest >= cap or largest < 10 or len(tied) < 2:
+                break
+            probed = True
+            quarters = fetch_quarters(tied[0])
+            if quarters is None:
+                summary["warnings"].append(f"{len(tied)} tiles returned exactly {largest} stations and the probe "
+                                           f"failed; the API's cap may be {largest}")
+                break
+            if len({point.get("uid") for points in quarters.values() for point in points}) <= largest:
+                break  # the quarters hold the same stations: the tie was a coincidence
+            cap = summary["detected_cap"] = largest
+            # The probed tile is split into the quarters already fetched; the other tied tiles are split afresh.
+            del leaves[tied[0]]
+            summary["split"] += 1
+            for quarter, points in quarters.items():
+                handle(quarter, points)
+            for tile in tied[1:]:
+                handle(tile, leaves.pop(tile))
+
+    stations = {}
+    for points in leaves.values():
+        for point in points:
+            if point.get("uid") is not None:
+                stations.setdefault(point["uid"], point)
+    points = list(stations.values())
+    inside = contains(rings, [p.get("lon") for p in points], [p.get("lat") for p in points])
+    result = [point for point, keep in zip(points, inside) if keep]
+    summary.update(stations=len(result), outside=len(points) - len(result),
+                   complete=summary["failed"] == 0 and summary["capped"] == 0,
+                   elapsed_s=round(time.perf_counter() - started, 2))
+    return result, summary
+
+
+def write_snapshot(path, stations, summary, region):
+    """Write the stations as a map/bounds-style JSON document (atomically)."""
+    document = {"status": "ok", "data": sorted(stations, key=lambda p: p["uid"]),
+                "sweep": dict(summary, region=region, created=int(time.time()))}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(document, f)
+    os.replace(tmp_path, path)
+
+
+def run_sweep(region, token, out=None, workers=8, rate=DEFAULT_WAQI_RATE, tile_deg=DEFAULT_TILE_DEG,
+              cap=DEFAULT_RESULT_CAP):
+    """Sweep a region, write the snapshot and print a summary. Returns the snapshot path."""
+    rings = region_rings(load_region(region))
+    name = os.path.splitext(os.path.basename(region))[0].lower()
+    out = out or f"waqi_stations_{name}.json"
+    stations, summary = sweep(rings, token, RateLimiter(rate), workers, tile_deg, cap)
+    write_snapshot(out, stations, summary, name)
+    state = "complete" if summary["complete"] else (f"INCOMPLETE ({summary['failed']} failed, "
+                                                    f"{summary['capped']} still capped)")
+    print(f"📍 {name}: {len(stations)} stations from {summary['requests']} requests "
+          f"({summary['tiles']} tiles, {summary['split']} split) in {summary['elapsed_s']:.1f}s - {state}")
+    if summary["detected_cap"]:
+        print(f"⚠️ The API truncates replies at {summary['detected_cap']} stations, below --cap {cap}; "
+              f"tiles were split at that size (pass --cap {summary['detected_cap']} to save the probe).")
+    for warning in summary["warnings"]:
+        print(f"⚠️ {warning}")
+    print(f"Station snapshot saved to {out}")
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep a region with tiled WAQI map/bounds requests.")
+    parser.add_argument("region", help=f"One of {', '.join(REGIONS)} or a GeoJSON file.")
+    parser.add_argument("--out", default=None, help="Snapshot path (default: waqi_stations_<region>.json).")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=DEFAULT_WAQI_RATE, help="Requests per second.")
+    parser.add_argument("--tile-deg", type=float, default=DEFAULT_TILE_DEG)
+    parser.add_argument("--cap", type=int, default=DEFAULT_RESULT_CAP,
+                        help="Reply size treated as truncated (the tile is split).")
+    args = parser.parse_args()
+
+    token = os.getenv("aqi_cn_token")
+    if not token:
+        raise ValueError("API token not found. Ensure 'aqi_cn_token' is set in the .env file.")
+    run_sweep(args.region, token, args.out, args.workers, args.rate, args.tile_deg, args.cap)
+
+
+if __name__ == "__main__":
+    main()